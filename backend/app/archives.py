@@ -0,0 +1,315 @@
+import io
+import os
+import stat
+import tarfile
+import tempfile
+import time
+import zipfile
+import zlib
+from typing import AsyncIterator, BinaryIO, Iterator, List, Optional, Set
+import anyio
+from .file_manager import file_manager
+from .ignore_rules import IgnoreRules, is_ignored
+from .project_usage import QuotaExceeded
+
+
+ARCHIVE_FORMATS = {
+    "tar.gz": "application/gzip",
+    "zip": "application/zip",
+}
+CHUNK_SIZE = 64 * 1024
+# Zip timestamps can't go back further than 1980
+ZIP_EPOCH = 315619200
+IMPORT_MAX_BYTES = int(os.getenv("ARCHIVE_IMPORT_MAX_BYTES", str(10 * 1024 * 1024 * 1024)))
+
+
+class ArchiveError(ValueError):
+    """An uploaded archive that can't be read or extracted"""
+
+
+class _Collector:
+    """Write-only file object whose contents are taken out as they arrive"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class BodyReader(io.RawIOBase):
+    """Blocking file object over an async request body
+
+    Meant for a worker thread started with anyio (e.g. run_in_threadpool):
+    each read that needs more data waits for the next chunk on the event
+    loop, so the body is consumed only as fast as it is processed.
+    """
+
+    def __init__(self, chunks: AsyncIterator[bytes]):
+        self._chunks = chunks
+        self._buffer = b""
+        self._done = False
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._buffer:
+            if self._done:
+                return 0
+            try:
+                self._buffer = anyio.from_thread.run(self._chunks.__anext__)
+            except StopAsyncIteration:
+                self._done = True
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+def stream_archive(project_name: str, archive_format: str, include_ignored: bool = False) -> Iterator[bytes]:
+    """Generate a tar.gz or zip of a project, chunk by chunk
+
+    Nothing is staged: files are read and compressed as the consumer pulls,
+    so memory stays constant whatever the project size.
+    """
+    entries = file_manager.walk(project_name, include_ignored=include_ignored)
+    root = file_manager.get_project_path(project_name)
+    if archive_format == "zip":
+        return _zip_stream(root, entries)
+    return _tar_gz_stream(root, entries)
+
+
+def _tar_gz_stream(root, entries) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for path, st in entries:
+        info = tarfile.TarInfo(path)
+        info.mode = stat.S_IMODE(st.st_mode)
+        info.mtime = int(st.st_mtime)
+        is_dir = stat.S_ISDIR(st.st_mode)
+        info.type = tarfile.DIRTYPE if is_dir else tarfile.REGTYPE
+        info.size = 0 if is_dir else st.st_size
+        if not is_dir:
+            try:
+                source = open(root / path, "rb")
+            except OSError:
+                # Removed since the walk saw it
+                continue
+        yield compressor.compress(info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape"))
+        if is_dir:
+            continue
+        with source:
+            remaining = info.size
+            while remaining > 0:
+                block = source.read(min(CHUNK_SIZE, remaining))
+                if not block:
+                    # The file shrank while being read; keep the header's size
+                    block = b"\0" * min(CHUNK_SIZE, remaining)
+                remaining -= len(block)
+                yield compressor.compress(block)
+        yield compressor.compress(b"\0" * (-info.size % tarfile.BLOCKSIZE))
+    # Two empty blocks end a tar archive
+    yield compressor.compress(b"\0" * (2 * tarfile.BLOCKSIZE)) + compressor.flush()
+
+
+def _zip_stream(root, entries) -> Iterator[bytes]:
+    out = _Collector()
+    # An unseekable target makes zipfile write data descriptors after each file
+    with zipfile.ZipFile(out, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for path, st in entries:
+            is_dir = stat.S_ISDIR(st.st_mode)
+            info = zipfile.ZipInfo(path + "/" if is_dir else path,
+                                   date_time=time.localtime(max(st.st_mtime, ZIP_EPOCH))[:6])
+            info.external_attr = (st.st_mode & 0xFFFF) << 16
+            if is_dir:
+                archive.writestr(info, b"")
+            else:
+                info.compress_type = zipfile.ZIP_DEFLATED
+                try:
+                    source = open(root / path, "rb")
+                except OSError:
+                    continue
+                with source, archive.open(info, "w", force_zip64=st.st_size >= zipfile.ZIP64_LIMIT) as target:
+                    for block in iter(lambda: source.read(CHUNK_SIZE), b""):
+                        target.write(block)
+                        chunk = out.take()
+                        if chunk:
+                            yield chunk
+            chunk = out.take()
+            if chunk:
+                yield chunk
+    # Closing wrote the central directory
+    yield out.take()
+
+
+def extract_archive(project_name: str, source: BinaryIO, ignore: Optional[List[str]] = None,
+                    max_bytes: Optional[int] = IMPORT_MAX_BYTES, quota_bytes: Optional[int] = None) -> dict:
+    """Extract a tar (optionally compressed) or zip archive into a project
+
+    Tar archives are read as a stream; a zip has its directory at the end,
+    so it is spooled to a temp file first. Members that would land outside
+    the project, links and special files are skipped, as are paths matched
+    by FILE_TREE_IGNORE or the extra ignore patterns, and the extracted
+    sizes may add up to at most max_bytes. Going past quota_bytes, the room
+    left in the project's quota, raises QuotaExceeded before the member is
+    written. Each file is written atomically, but an archive that fails
+    midway stays partly extracted.
+    """
+    rules = [file_manager.ignore_rules]
+    if ignore:
+        rules.append(IgnoreRules(ignore))
+    extractor = _Extractor(project_name, rules, max_bytes, quota_bytes)
+
+    if not isinstance(source, io.BufferedIOBase):
+        # A raw stream may return fewer bytes than asked for
+        source = io.BufferedReader(source, CHUNK_SIZE)
+    magic = source.read(4)
+    if magic in (b"PK\x03\x04", b"PK\x05\x06"):
+        with tempfile.TemporaryFile(dir=file_manager.base_path) as spool:
+            spool.write(magic)
+            while True:
+                block = source.read(1024 * 1024)
+                if not block:
+                    break
+                spool.write(block)
+            spool.seek(0)
+            try:
+                with zipfile.ZipFile(spool) as archive:
+                    for info in archive.infolist():
+                        extractor.add_zip_member(archive, info)
+            except zipfile.BadZipFile as e:
+                raise ArchiveError(f"Invalid zip archive: {e}")
+    else:
+        try:
+            with tarfile.open(fileobj=_Prefixed(magic, source), mode="r|*") as archive:
+                for member in archive:
+                    extractor.add_tar_member(archive, member)
+        except (tarfile.TarError, EOFError, zlib.error, OSError) as e:
+            raise ArchiveError(f"Invalid archive: {e}")
+    return extractor.summary()
+
+
+class _Prefixed(io.RawIOBase):
+    """A stream with bytes already read from it put back in front"""
+
+    def __init__(self, prefix: bytes, source: BinaryIO):
+        self._prefix = prefix
+        self._source = source
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if self._prefix:
+            size = min(len(buffer), len(self._prefix))
+            buffer[:size] = self._prefix[:size]
+            self._prefix = self._prefix[size:]
+            return size
+        data = self._source.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class _Extractor:
+    """Checks archive members and writes the acceptable ones into a project"""
+
+    MAX_REPORTED = 1000
+
+    def __init__(self, project_name: str, rules: List[IgnoreRules], max_bytes: Optional[int],
+                 quota_bytes: Optional[int] = None):
+        self.project_name = project_name
+        self.rules = rules
+        self.max_bytes = max_bytes
+        self.quota_bytes = quota_bytes
+        self.files = 0
+        self.directories = 0
+        self.bytes = 0
+        self.skipped: List[str] = []
+        self.skipped_count = 0
+        self._ignored_dirs: Set[str] = set()
+
+    def add_tar_member(self, archive: tarfile.TarFile, member: tarfile.TarInfo):
+        if not (member.isfile() or member.isdir()):
+            self._skip(member.name)
+            return
+        path = self._accept(member.name, member.isdir(), member.size)
+        if path is None:
+            return
+        if member.isdir():
+            self._mkdir(path)
+        else:
+            self._write(path, archive.extractfile(member), member.size)
+
+    def add_zip_member(self, archive: zipfile.ZipFile, info: zipfile.ZipInfo):
+        mode = info.external_attr >> 16
+        if mode and not (stat.S_ISREG(mode) or stat.S_ISDIR(mode)):
+            # Symlinks and the like, as stored by Unix zip tools
+            self._skip(info.filename)
+            return
+        is_dir = info.is_dir()
+        path = self._accept(info.filename, is_dir, info.file_size)
+        if path is None:
+            return
+        if is_dir:
+            self._mkdir(path)
+        else:
+            with archive.open(info) as member:
+                self._write(path, member, info.file_size)
+
+    def summary(self) -> dict:
+        return {
+            "files": self.files,
+            "directories": self.directories,
+            "bytes": self.bytes,
+            "skipped": self.skipped,
+            "skipped_count": self.skipped_count,
+        }
+
+    def _accept(self, name: str, is_dir: bool, size: int) -> Optional[str]:
+        """The project-relative path to extract name to, or None to skip it"""
+        parts = [part for part in name.replace("\\", "/").split("/") if part not in ("", ".")]
+        if not parts or ".." in parts or file_manager.resolve_path(self.project_name, "/".join(parts)) is None:
+            self._skip(name)
+            return None
+        path = "/".join(parts)
+        for depth in range(1, len(parts)):
+            parent = "/".join(parts[:depth])
+            if parent in self._ignored_dirs or is_ignored(self.rules, parent, True):
+                self._ignored_dirs.add(parent)
+                self._skip(name)
+                return None
+        if is_ignored(self.rules, path, is_dir):
+            if is_dir:
+                self._ignored_dirs.add(path)
+            self._skip(name)
+            return None
+        if self.max_bytes is not None and self.bytes + size > self.max_bytes:
+            raise ArchiveError(f"Archive expands to more than {self.max_bytes} bytes")
+        if self.quota_bytes is not None and self.bytes + size > self.quota_bytes:
+            raise QuotaExceeded(self.quota_bytes, self.bytes + size)
+        return path
+
+    def _mkdir(self, path: str):
+        if not file_manager.create_directory(self.project_name, path):
+            raise ArchiveError(f"Failed to create directory {path}")
+        self.directories += 1
+
+    def _write(self, path: str, member: BinaryIO, size: int):
+        if not file_manager.save_upload(self.project_name, path, member):
+            raise ArchiveError(f"Failed to extract {path}")
+        self.files += 1
+        self.bytes += size
+
+    def _skip(self, name: str):
+        self.skipped_count += 1
+        if len(self.skipped) < self.MAX_REPORTED:
+            self.skipped.append(name)
@@ -0,0 +1,758 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import shlex
+import tarfile
+import tempfile
+from typing import Any, AsyncIterator, Callable, Collection, Dict, List, Optional, Set, Tuple
+import yaml
+from starlette.concurrency import run_in_threadpool
+from .deploy_fingerprint import COMPOSE_FILE, dockerignore_rules, walk_context
+from .docker_client import DockerClient, docker_client
+from .docker_http import DockerAPIError
+
+
+# Labels docker-compose puts on what it creates; using them lets the engine
+# take over containers, networks and volumes made by the docker-compose binary
+PROJECT_LABEL = "com.docker.compose.project"
+SERVICE_LABEL = "com.docker.compose.service"
+NUMBER_LABEL = "com.docker.compose.container-number"
+ONEOFF_LABEL = "com.docker.compose.oneoff"
+CONFIG_HASH_LABEL = "com.docker.compose.config-hash"
+NETWORK_LABEL = "com.docker.compose.network"
+VOLUME_LABEL = "com.docker.compose.volume"
+
+TOP_LEVEL_KEYS = {"version", "services", "networks", "volumes"}
+SERVICE_KEYS = {
+    "image", "build", "command", "entrypoint", "environment", "env_file", "ports", "expose", "volumes",
+    "tmpfs", "networks", "network_mode", "depends_on", "restart", "container_name", "labels", "working_dir",
+    "user", "hostname", "tty", "stdin_open", "privileged", "init", "cap_add", "cap_drop", "extra_hosts",
+    "dns", "healthcheck", "mem_limit", "shm_size", "stop_signal", "stop_grace_period",
+}
+BUILD_KEYS = {"context", "dockerfile", "args", "target"}
+NETWORK_KEYS = {"driver", "driver_opts", "external", "name", "labels", "internal", "attachable"}
+VOLUME_KEYS = {"driver", "driver_opts", "external", "name", "labels"}
+CONDITIONS = {"service_started", "service_healthy", "service_completed_successfully"}
+
+INTERPOLATION = re.compile(
+    r"\$(?:(?P<escaped>\$)|\{(?P<braced>[A-Za-z_][A-Za-z0-9_]*)(?:(?P<op>:?[-?])(?P<arg>[^}]*))?\}"
+    r"|(?P<named>[A-Za-z_][A-Za-z0-9_]*))"
+)
+DURATION = re.compile(r"(\d+(?:\.\d+)?)(h|ms|m|s|us|ns)")
+DURATION_UNITS = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 1e-3, "us": 1e-6, "ns": 1e-9}
+SIZE_UNITS = {"b": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}
+
+
+class ComposeError(Exception):
+    """A compose file that is invalid, or a deploy that can't be set up"""
+
+
+class ComposeUnsupported(ComposeError):
+    """A compose file using features the engine doesn't implement"""
+
+
+class Service:
+    """One service of a compose project, ready to turn into a container"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.image: Optional[str] = None
+        self.build: Optional[Dict[str, Any]] = None
+        # Dependency name -> condition
+        self.depends_on: Dict[str, str] = {}
+        # Network key -> extra aliases; empty with a network_mode
+        self.networks: Dict[str, List[str]] = {}
+        self.container_name: Optional[str] = None
+        self.stop_timeout = 10
+        # Container create body, without Image and networking
+        self.config: Dict[str, Any] = {}
+
+
+class ComposeProject:
+    """A parsed docker-compose.yml, with variables interpolated and services in start order"""
+
+    def __init__(self, path: str, name: str):
+        self.path = path
+        self.name = name
+        self.services: Dict[str, Service] = {}
+        self.networks: Dict[str, Dict[str, Any]] = {}
+        self.volumes: Dict[str, Dict[str, Any]] = {}
+
+    def select(self, names: Optional[List[str]] = None) -> List[Service]:
+        """The named services and everything they depend on, dependencies first"""
+        if names is None:
+            return list(self.services.values())
+        wanted: Set[str] = set()
+        pending = list(names)
+        while pending:
+            name = pending.pop()
+            if name not in self.services:
+                raise ComposeError(f"No such service: {name}")
+            if name not in wanted:
+                wanted.add(name)
+                pending.extend(self.services[name].depends_on)
+        return [service for name, service in self.services.items() if name in wanted]
+
+
+def project_name(project_path: str) -> str:
+    """The project name docker-compose would use for a directory"""
+    name = re.sub(r"[^-_a-z0-9]", "", os.path.basename(os.path.realpath(project_path)).lower())
+    return name or "default"
+
+
+def load_project(project_path: str) -> ComposeProject:
+    """Parse a project's docker-compose.yml
+
+    Raises ComposeUnsupported for keys the engine doesn't handle (so the
+    docker-compose binary can deploy the project instead) and ComposeError
+    for an invalid file.
+    """
+    try:
+        with open(os.path.join(project_path, COMPOSE_FILE), "r", encoding="utf-8") as f:
+            config = yaml.safe_load(f)
+    except OSError as e:
+        raise ComposeError(f"Cannot read {COMPOSE_FILE}: {e}")
+    except yaml.YAMLError as e:
+        raise ComposeError(f"Cannot parse {COMPOSE_FILE}: {' '.join(str(e).split())}")
+    if not isinstance(config, dict) or not isinstance(config.get("services"), dict):
+        raise ComposeError(f"{COMPOSE_FILE} has no services")
+    _check_keys(config, TOP_LEVEL_KEYS, "top level")
+
+    variables = read_env_file(os.path.join(project_path, ".env")) or {}
+    variables.update(os.environ)
+    config = _interpolate(config, variables)
+
+    project = ComposeProject(project_path, project_name(project_path))
+    for key, options in (config.get("networks") or {}).items():
+        project.networks[key] = _resource(project.name, key, options, NETWORK_KEYS, "network")
+    project.networks.setdefault("default", _resource(project.name, "default", None, NETWORK_KEYS, "network"))
+    for key, options in (config.get("volumes") or {}).items():
+        project.volumes[key] = _resource(project.name, key, options, VOLUME_KEYS, "volume")
+
+    services = {}
+    for name, options in config["services"].items():
+        if not isinstance(options, dict):
+            raise ComposeError(f"Service {name} must be a mapping")
+        services[str(name)] = _parse_service(project, str(name), options)
+    project.services = {name: services[name] for name in _start_order(services)}
+    return project
+
+
+def read_env_file(path: str) -> Optional[Dict[str, str]]:
+    """KEY=VALUE lines of an env file, or None if it doesn't exist"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        raise ComposeError(f"Cannot read {path}: {e}")
+    values = {}
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#") or "=" not in line:
+            continue
+        key, value = line.split("=", 1)
+        value = value.strip()
+        if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'":
+            value = value[1:-1]
+        values[key.strip()] = value
+    return values
+
+
+def _check_keys(options: dict, allowed: Set[str], where: str):
+    unsupported = [key for key in options if key not in allowed and not str(key).startswith("x-")]
+    if unsupported:
+        raise ComposeUnsupported(f"Unsupported {where} options: {', '.join(map(str, unsupported))}")
+
+
+def _interpolate(value, variables: Dict[str, str]):
+    """Substitute $VAR, ${VAR}, ${VAR:-default}, ${VAR:?error} and $$ in every string value"""
+    if isinstance(value, dict):
+        return {key: _interpolate(item, variables) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_interpolate(item, variables) for item in value]
+    if not isinstance(value, str):
+        return value
+
+    def substitute(match):
+        if match.group("escaped"):
+            return "$"
+        name = match.group("braced") or match.group("named")
+        current = variables.get(name)
+        op = match.group("op")
+        if op is None:
+            return current or ""
+        unset = current is None or (op.startswith(":") and current == "")
+        if not unset:
+            return current
+        if op.endswith("?"):
+            raise ComposeError(f"Variable {name} is required: {match.group('arg')}")
+        return match.group("arg")
+    return INTERPOLATION.sub(substitute, value)
+
+
+def _resource(project: str, key: str, options, allowed: Set[str], kind: str) -> Dict[str, Any]:
+    """Normalize a top-level network or volume definition"""
+    options = options or {}
+    if not isinstance(options, dict):
+        raise ComposeError(f"{kind.capitalize()} {key} must be a mapping")
+    _check_keys(options, allowed, f"{kind} {key}")
+    external = options.get("external") or False
+    if isinstance(external, dict):
+        # The older {external: {name: ...}} form
+        name = external.get("name") or options.get("name") or key
+        external = True
+    else:
+        name = options.get("name") or (key if external else f"{project}_{key}")
+    create = {
+        "Driver": options.get("driver") or ("bridge" if kind == "network" else "local"),
+        "Labels": {**_labels(options.get("labels")), PROJECT_LABEL: project,
+                   NETWORK_LABEL if kind == "network" else VOLUME_LABEL: key},
+    }
+    if options.get("driver_opts"):
+        create["DriverOpts" if kind == "volume" else "Options"] = {k: str(v) for k, v in options["driver_opts"].items()}
+    if kind == "network":
+        create["Internal"] = bool(options.get("internal"))
+        create["Attachable"] = bool(options.get("attachable"))
+    return {"name": name, "external": bool(external), "create": create}
+
+
+def _parse_service(project: ComposeProject, name: str, options: dict) -> Service:
+    _check_keys(options, SERVICE_KEYS, f"service {name}")
+    service = Service(name)
+    service.container_name = options.get("container_name")
+
+    build = options.get("build")
+    if build is not None:
+        if isinstance(build, str):
+            build = {"context": build}
+        _check_keys(build, BUILD_KEYS, f"service {name} build")
+        context = os.path.realpath(os.path.join(project.path, build.get("context") or "."))
+        dockerfile = build.get("dockerfile") or "Dockerfile"
+        if "://" in str(build.get("context", "")) or not os.path.isdir(context):
+            raise ComposeUnsupported(f"Build context of service {name} is not a local directory")
+        if not os.path.realpath(os.path.join(context, dockerfile)).startswith(context + os.sep):
+            raise ComposeUnsupported(f"Dockerfile of service {name} is outside its build context")
+        service.build = {"context": context, "dockerfile": dockerfile,
+                         "args": {k: str(v) for k, v in _mapping(build.get("args")).items() if v is not None},
+                         "target": build.get("target")}
+    service.image = options.get("image") or (f"{project.name}_{name}" if build is not None else None)
+    if service.image is None:
+        raise ComposeError(f"Service {name} has neither an image nor a build section")
+
+    depends_on = options.get("depends_on") or {}
+    if isinstance(depends_on, list):
+        depends_on = {dependency: {} for dependency in depends_on}
+    for dependency, settings in depends_on.items():
+        condition = (settings or {}).get("condition", "service_started")
+        if condition not in CONDITIONS:
+            raise ComposeUnsupported(f"Unsupported depends_on condition {condition} in service {name}")
+        service.depends_on[dependency] = condition
+
+    config: Dict[str, Any] = {"Labels": {**_labels(options.get("labels")), PROJECT_LABEL: project.name,
+                                         SERVICE_LABEL: name, NUMBER_LABEL: "1", ONEOFF_LABEL: "False"}}
+    host: Dict[str, Any] = {}
+    config["HostConfig"] = host
+
+    for key, target in (("command", "Cmd"), ("entrypoint", "Entrypoint")):
+        value = options.get(key)
+        if value is None:
+            continue
+        if isinstance(value, str):
+            config[target] = shlex.split(value)
+        elif isinstance(value, list):
+            config[target] = [str(part) for part in value]
+        else:
+            raise ComposeError(f"{key} of service {name} must be a string or a list")
+
+    environment: Dict[str, str] = {}
+    env_files = options.get("env_file") or []
+    for env_file in env_files if isinstance(env_files, list) else [env_files]:
+        path = os.path.join(project.path, env_file)
+        values = read_env_file(path)
+        if values is None:
+            raise ComposeError(f"env_file {env_file} of service {name} not found")
+        environment.update(values)
+    for key, value in _mapping(options.get("environment"), keep_bare=True).items():
+        if value is None:
+            # A bare name passes the variable through from the environment
+            value = os.environ.get(key)
+            if value is None:
+                continue
+        environment[key] = _scalar(value)
+    if environment:
+        config["Env"] = [f"{key}={value}" for key, value in environment.items()]
+
+    for key, target in (("working_dir", "WorkingDir"), ("user", "User"), ("hostname", "Hostname"),
+                        ("stop_signal", "StopSignal")):
+        if options.get(key) is not None:
+            config[target] = str(options[key])
+    for key, target in (("tty", "Tty"), ("stdin_open", "OpenStdin")):
+        if options.get(key) is not None:
+            config[target] = bool(options[key])
+    for key, target in (("privileged", "Privileged"), ("init", "Init")):
+        if options.get(key) is not None:
+            host[target] = bool(options[key])
+    for key, target in (("cap_add", "CapAdd"), ("cap_drop", "CapDrop"), ("dns", "Dns")):
+        value = options.get(key)
+        if value is not None:
+            host[target] = [value] if isinstance(value, str) else list(value)
+    if options.get("extra_hosts") is not None:
+        extra_hosts = options["extra_hosts"]
+        host["ExtraHosts"] = ([f"{k}:{v}" for k, v in extra_hosts.items()]
+                              if isinstance(extra_hosts, dict) else list(extra_hosts))
+    for key, target in (("mem_limit", "Memory"), ("shm_size", "ShmSize")):
+        if options.get(key) is not None:
+            host[target] = _size(options[key], f"{key} of service {name}")
+    if options.get("stop_grace_period") is not None:
+        service.stop_timeout = int(_duration(options["stop_grace_period"], f"stop_grace_period of service {name}"))
+
+    restart = str(options.get("restart") or "no")
+    policy, _, retries = restart.partition(":")
+    if policy not in ("no", "always", "on-failure", "unless-stopped"):
+        raise ComposeError(f"Invalid restart policy {restart} in service {name}")
+    host["RestartPolicy"] = {"Name": "" if policy == "no" else policy, "MaximumRetryCount": int(retries or 0)}
+
+    exposed: Dict[str, dict] = {}
+    for port in options.get("expose") or []:
+        exposed[_port_key(str(port))] = {}
+    bindings: Dict[str, List[dict]] = {}
+    for port in options.get("ports") or []:
+        key, binding = _port(port, name)
+        exposed[key] = {}
+        bindings.setdefault(key, []).append(binding)
+    if exposed:
+        config["ExposedPorts"] = exposed
+    if bindings:
+        host["PortBindings"] = bindings
+
+    binds, anonymous, tmpfs = [], {}, {}
+    for volume in options.get("volumes") or []:
+        _volume(project, name, volume, binds, anonymous, tmpfs)
+    tmpfs_option = options.get("tmpfs") or []
+    for target in [tmpfs_option] if isinstance(tmpfs_option, str) else tmpfs_option:
+        tmpfs[target] = ""
+    if binds:
+        host["Binds"] = binds
+    if anonymous:
+        config["Volumes"] = anonymous
+    if tmpfs:
+        host["Tmpfs"] = tmpfs
+
+    if options.get("healthcheck") is not None:
+        config["Healthcheck"] = _healthcheck(options["healthcheck"], name)
+
+    network_mode = options.get("network_mode")
+    if network_mode is not None:
+        if options.get("networks"):
+            raise ComposeError(f"Service {name} can't have both network_mode and networks")
+        if network_mode.startswith("service:"):
+            raise ComposeUnsupported(f"network_mode {network_mode} in service {name}")
+        host["NetworkMode"] = network_mode
+    else:
+        networks = options.get("networks") or ["default"]
+        if isinstance(networks, list):
+            networks = {network: None for network in networks}
+        for network, settings in networks.items():
+            if network not in project.networks:
+                raise ComposeError(f"Service {name} uses undefined network {network}")
+            settings = settings or {}
+            _check_keys(settings, {"aliases"}, f"service {name} network {network}")
+            service.networks[network] = list(settings.get("aliases") or [])
+        host["NetworkMode"] = project.networks[next(iter(service.networks))]["name"]
+
+    service.config = config
+    return service
+
+
+def _mapping(value, keep_bare: bool = False) -> Dict[str, Any]:
+    """A dict from a mapping or a list of KEY=VALUE strings"""
+    if value is None:
+        return {}
+    if isinstance(value, dict):
+        return dict(value)
+    result = {}
+    for item in value:
+        key, sep, item_value = str(item).partition("=")
+        result[key] = item_value if sep else (None if keep_bare else "")
+    return result
+
+
+def _labels(value) -> Dict[str, str]:
+    return {key: _scalar(item) for key, item in _mapping(value).items()}
+
+
+def _scalar(value) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return "" if value is None else str(value)
+
+
+def _port_key(port: str) -> str:
+    number, _, protocol = port.partition("/")
+    if "-" in number:
+        raise ComposeUnsupported(f"Port ranges ({port}) are not supported")
+    return f"{number}/{protocol or 'tcp'}"
+
+
+def _port(port, service: str) -> Tuple[str, Dict[str, str]]:
+    """(container port key, host binding) for a short or long port definition"""
+    if isinstance(port, dict):
+        _check_keys(port, {"target", "published", "protocol", "host_ip", "mode"}, f"service {service} port")
+        key = _port_key(f"{port['target']}/{port.get('protocol') or 'tcp'}")
+        return key, {"HostIp": port.get("host_ip") or "", "HostPort": str(port.get("published") or "")}
+    spec = str(port)
+    container_part, _, protocol = spec.partition("/")
+    parts = container_part.rsplit(":", 2)
+    host_ip, host_port = "", ""
+    if len(parts) == 3:
+        host_ip, host_port, container = parts
+    elif len(parts) == 2:
+        host_port, container = parts
+    else:
+        container = parts[0]
+    return _port_key(f"{container}/{protocol}" if protocol else container), {"HostIp": host_ip, "HostPort": host_port}
+
+
+def _volume(project: ComposeProject, service: str, volume, binds: List[str], anonymous: Dict[str, dict],
+            tmpfs: Dict[str, str]):
+    """Add a short or long volume definition to binds, anonymous volumes or tmpfs mounts"""
+    if isinstance(volume, dict):
+        _check_keys(volume, {"type", "source", "target", "read_only"}, f"service {service} volume")
+        kind, source, target = volume.get("type", "volume"), volume.get("source"), volume["target"]
+        mode = "ro" if volume.get("read_only") else None
+        if kind == "tmpfs":
+            tmpfs[target] = ""
+            return
+        if kind not in ("volume", "bind"):
+            raise ComposeUnsupported(f"Volume type {kind} in service {service}")
+    else:
+        parts = str(volume).split(":")
+        if len(parts) == 1:
+            source, target, mode = None, parts[0], None
+        elif len(parts) in (2, 3):
+            source, target, mode = parts[0], parts[1], parts[2] if len(parts) == 3 else None
+        else:
+            raise ComposeError(f"Invalid volume {volume} in service {service}")
+        kind = "bind" if source and source[0] in "./~" else "volume"
+
+    if not source:
+        anonymous[target] = {}
+        return
+    if kind == "bind":
+        source = os.path.normpath(os.path.join(project.path, os.path.expanduser(source)))
+    else:
+        if source not in project.volumes:
+            raise ComposeError(f"Service {service} uses undefined volume {source}")
+        source = project.volumes[source]["name"]
+    binds.append(f"{source}:{target}" + (f":{mode}" if mode else ""))
+
+
+def _healthcheck(options: dict, service: str) -> Dict[str, Any]:
+    _check_keys(options, {"test", "interval", "timeout", "retries", "start_period", "disable"},
+                f"service {service} healthcheck")
+    if options.get("disable"):
+        return {"Test": ["NONE"]}
+    check: Dict[str, Any] = {}
+    test = options.get("test")
+    if test is not None:
+        check["Test"] = ["CMD-SHELL", test] if isinstance(test, str) else [str(part) for part in test]
+    for key, target in (("interval", "Interval"), ("timeout", "Timeout"), ("start_period", "StartPeriod")):
+        if options.get(key) is not None:
+            check[target] = int(_duration(options[key], f"healthcheck {key} of service {service}") * 1e9)
+    if options.get("retries") is not None:
+        check["Retries"] = int(options["retries"])
+    return check
+
+
+def _duration(value, what: str) -> float:
+    """Seconds in a compose duration such as 90, 1m30s or 500ms"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip()
+    matches = DURATION.findall(text)
+    if not matches or "".join(number + unit for number, unit in matches) != text:
+        raise ComposeError(f"Invalid duration {value} for {what}")
+    return sum(float(number) * DURATION_UNITS[unit] for number, unit in matches)
+
+
+def _size(value, what: str) -> int:
+    """Bytes in a compose size such as 512m or 1g"""
+    if isinstance(value, int):
+        return value
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)\s*([bkmg])?b?", str(value).strip().lower())
+    if not match:
+        raise ComposeError(f"Invalid size {value} for {what}")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2) or "b"])
+
+
+def _start_order(services: Dict[str, Service]) -> List[str]:
+    """Service names with every service after its dependencies"""
+    order: List[str] = []
+    state: Dict[str, str] = {}
+
+    def visit(name: str, path: List[str]):
+        if state.get(name) == "done":
+            return
+        if state.get(name) == "visiting":
+            raise ComposeError(f"Circular dependency: {' -> '.join(path + [name])}")
+        state[name] = "visiting"
+        for dependency in services[name].depends_on:
+            if dependency not in services:
+                raise ComposeError(f"Service {name} depends on undefined service {dependency}")
+            visit(dependency, path + [name])
+        state[name] = "done"
+        order.append(name)
+
+    for name in services:
+        visit(name, [])
+    return order
+
+
+class ComposeEngine:
+    """Brings compose projects up through the Docker API
+
+    Does what 'docker-compose up -d' does for the supported subset of the
+    compose file: creates missing networks and volumes, pulls missing
+    images concurrently, builds images, and (re)creates and starts
+    containers. Each service starts as soon as its dependencies are
+    satisfied, so independent services come up in parallel. A container
+    whose configuration and image are unchanged is left running.
+    """
+
+    def __init__(self, client: DockerClient = docker_client, wait_timeout: float = 300.0,
+                 poll_interval: float = 1.0):
+        self.client = client
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+
+    async def up(self, project: ComposeProject, services: Optional[List[str]] = None,
+                 build: Collection[str] = (), log: Optional[Callable[[str, str], None]] = None) -> List[Dict[str, Any]]:
+        """Bring up services (all by default) and their dependencies
+
+        Service images are built when missing, or always for the services
+        named in build. log receives (service, line) progress messages.
+        Returns one result per service: {"service", "status", "container_id",
+        "image", "error"}, with status created, recreated, started, running
+        (left as it was), failed or skipped (a dependency failed).
+        """
+        log = log or (lambda service, text: None)
+        selected = project.select(services)
+        await self._ensure_resources(project, selected)
+
+        images: Dict[str, asyncio.Task] = {}
+        for service in selected:
+            key = ("build", service.name) if service.build is not None else ("pull", service.image)
+            if key not in images:
+                images[key] = asyncio.ensure_future(
+                    self._build(project, service, service.name in build, log) if service.build is not None
+                    else self._pull(service.image, service.name, log)
+                )
+        done: Dict[str, asyncio.Future] = {service.name: asyncio.get_running_loop().create_future()
+                                           for service in selected}
+
+        async def run(service: Service):
+            key = ("build", service.name) if service.build is not None else ("pull", service.image)
+            result = {"service": service.name, "status": "failed", "container_id": None,
+                      "image": service.image, "error": None}
+            try:
+                blocked = await self._wait_for_dependencies(service, done)
+                if blocked:
+                    result.update(status="skipped", error=blocked)
+                else:
+                    image_id = await images[key]
+                    result.update(await self._converge(project, service, image_id, log))
+            except asyncio.CancelledError:
+                raise
+            except (DockerAPIError, ComposeError) as e:
+                result["error"] = str(e)
+            except Exception as e:
+                print(f"Compose engine error in service {service.name}: {e}")
+                result["error"] = str(e)
+            if result["error"]:
+                log(service.name, f"{result['status']}: {result['error']}")
+            else:
+                log(service.name, result["status"])
+            done[service.name].set_result(result)
+            return result
+
+        tasks = [asyncio.ensure_future(run(service)) for service in selected]
+        try:
+            return list(await asyncio.gather(*tasks))
+        finally:
+            for task in tasks + list(images.values()):
+                task.cancel()
+            await asyncio.gather(*tasks, *images.values(), return_exceptions=True)
+
+    async def _ensure_resources(self, project: ComposeProject, selected: List[Service]):
+        """Create the networks and volumes the services need, concurrently"""
+        networks = {key for service in selected for key in service.networks}
+        volumes = set(project.volumes)
+        await asyncio.gather(
+            *[self._ensure(project.networks[key], "network") for key in sorted(networks)],
+            *[self._ensure(project.volumes[key], "volume") for key in sorted(volumes)],
+        )
+
+    async def _ensure(self, resource: Dict[str, Any], kind: str):
+        inspect = self.client.inspect_network if kind == "network" else self.client.inspect_volume
+        try:
+            if await inspect(resource["name"]) is not None:
+                return
+            if resource["external"]:
+                raise ComposeError(f"External {kind} {resource['name']} not found")
+            if kind == "network":
+                await self.client.create_network(resource["name"], resource["create"])
+            else:
+                await self.client.create_volume(resource["name"], resource["create"])
+        except DockerAPIError as e:
+            # Another deploy may have created it in the meantime
+            if e.status != 409:
+                raise ComposeError(f"Failed to create {kind} {resource['name']}: {e.message}")
+
+    async def _pull(self, image: str, service: str, log: Callable[[str, str], None]) -> str:
+        """Pull an image unless it is present; returns its ID"""
+        existing = await self.client.inspect_image(image)
+        if existing is not None:
+            return existing["Id"]
+        log(service, f"Pulling {image}")
+        try:
+            async for message in self.client.pull_image(image):
+                status = message.get("status", "")
+                if status.startswith(("Digest:", "Status:")):
+                    log(service, status)
+        except DockerAPIError as e:
+            raise ComposeError(f"Failed to pull {image}: {e.message}")
+        pulled = await self.client.inspect_image(image)
+        if pulled is None:
+            raise ComposeError(f"Image {image} is missing after pulling it")
+        return pulled["Id"]
+
+    async def _build(self, project: ComposeProject, service: Service, always: bool,
+                     log: Callable[[str, str], None]) -> str:
+        """Build a service's image if it is missing or always is set; returns its ID"""
+        if not always:
+            existing = await self.client.inspect_image(service.image)
+            if existing is not None:
+                return existing["Id"]
+        log(service.name, f"Building {service.image}")
+        context = await run_in_threadpool(_context_archive, service.build["context"], service.build["dockerfile"])
+        try:
+            async for message in self.client.build_image(
+                _read_chunks(context), service.image, dockerfile=service.build["dockerfile"],
+                buildargs=service.build["args"], target=service.build["target"],
+            ):
+                for line in message.get("stream", "").splitlines():
+                    if line.strip():
+                        log(service.name, line.rstrip())
+        except DockerAPIError as e:
+            raise ComposeError(f"Failed to build {service.image}: {e.message}")
+        finally:
+            context.close()
+        built = await self.client.inspect_image(service.image)
+        if built is None:
+            raise ComposeError(f"Image {service.image} is missing after building it")
+        return built["Id"]
+
+    async def _wait_for_dependencies(self, service: Service, done: Dict[str, asyncio.Future]) -> Optional[str]:
+        """Wait until each dependency meets its condition; the reason if one can't"""
+        for dependency, condition in service.depends_on.items():
+            result = await done[dependency]
+            if result["status"] in ("failed", "skipped"):
+                return f"Dependency {dependency} {result['status']}"
+            if condition == "service_started":
+                continue
+            try:
+                reason = await asyncio.wait_for(
+                    self._wait_for_condition(result["container_id"], condition), self.wait_timeout
+                )
+            except asyncio.TimeoutError:
+                reason = f"timed out after {self.wait_timeout:g} seconds"
+            if reason:
+                return f"Dependency {dependency} not {condition.split('_', 1)[1].replace('_', ' ')}: {reason}"
+        return None
+
+    async def _wait_for_condition(self, container_id: str, condition: str) -> Optional[str]:
+        while True:
+            state = (await self.client.inspect_container(container_id)).get("State", {})
+            if condition == "service_healthy":
+                health = (state.get("Health") or {}).get("Status")
+                if health is None:
+                    return "it has no healthcheck"
+                if health == "healthy":
+                    return None
+                if health == "unhealthy":
+                    return "it is unhealthy"
+                if not state.get("Running"):
+                    return "it exited"
+            elif not state.get("Running") and state.get("Status") in ("exited", "dead"):
+                exit_code = state.get("ExitCode")
+                return None if exit_code == 0 else f"it exited with status {exit_code}"
+            await asyncio.sleep(self.poll_interval)
+
+    async def _converge(self, project: ComposeProject, service: Service, image_id: str,
+                        log: Callable[[str, str], None]) -> Dict[str, Any]:
+        """Make the service's container match its configuration and run it"""
+        config = json.loads(json.dumps(service.config))
+        config["Image"] = service.image
+        config_hash = hashlib.sha256(
+            json.dumps([config, service.networks, image_id], sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        config["Labels"][CONFIG_HASH_LABEL] = config_hash
+
+        existing = await self.client.list_container_summaries(all=True, filters={"label": [
+            f"{PROJECT_LABEL}={project.name}", f"{SERVICE_LABEL}={service.name}", f"{ONEOFF_LABEL}=False",
+        ]})
+        if len(existing) == 1 and (existing[0].get("Labels") or {}).get(CONFIG_HASH_LABEL) == config_hash:
+            container_id = existing[0]["Id"]
+            if existing[0].get("State") == "running":
+                return {"status": "running", "container_id": container_id}
+            await self.client.launch_container(container_id)
+            return {"status": "started", "container_id": container_id}
+
+        for container in existing:
+            log(service.name, f"Replacing container {container['Id'][:12]}")
+            await self.client.stop_container(container["Id"], timeout=service.stop_timeout)
+            await self.client.remove_container(container["Id"], force=True)
+
+        networks = list(service.networks.items())
+        if networks:
+            key, aliases = networks[0]
+            config["NetworkingConfig"] = {"EndpointsConfig": {
+                project.networks[key]["name"]: {"Aliases": [service.name] + aliases},
+            }}
+        name = service.container_name or f"{project.name}_{service.name}_1"
+        container_id = await self.client.create_container(name, config)
+        for key, aliases in networks[1:]:
+            await self.client.connect_network(project.networks[key]["name"], container_id, [service.name] + aliases)
+        await self.client.launch_container(container_id)
+        return {"status": "recreated" if existing else "created", "container_id": container_id}
+
+
+def _context_archive(context: str, dockerfile: str):
+    """Tar a build context into a temp file, leaving out what .dockerignore excludes"""
+    # Docker needs these whatever .dockerignore says
+    rules = dockerignore_rules(context, (os.path.normpath(dockerfile).replace(os.sep, "/"), ".dockerignore"))
+    archive = tempfile.TemporaryFile()
+    try:
+        with tarfile.open(fileobj=archive, mode="w") as tar:
+            for relative, path, _ in walk_context(context, rules):
+                tar.add(path, relative, recursive=False)
+    except BaseException:
+        archive.close()
+        raise
+    archive.seek(0)
+    return archive
+
+
+async def _read_chunks(source, size: int = 1024 * 1024) -> AsyncIterator[bytes]:
+    while True:
+        chunk = await run_in_threadpool(source.read, size)
+        if not chunk:
+            return
+        yield chunk
+
+
+compose_engine = ComposeEngine(wait_timeout=float(os.getenv("DEPLOY_WAIT_TIMEOUT", "300")))
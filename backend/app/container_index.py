@@ -0,0 +1,138 @@
+import asyncio
+import os
+import time
+from typing import Dict, List, Optional
+from .docker_client import docker_client
+from .schemas import ContainerInfo
+
+
+class ContainerIndex:
+    """In-memory container index, seeded once and kept current from Docker events"""
+
+    # Container event actions that cannot change what list_containers reports
+    IGNORED_ACTIONS = (
+        "exec_create", "exec_start", "exec_die", "exec_detach",
+        "attach", "detach", "resize", "top", "export", "commit",
+        "copy", "archive-path", "extract-to-dir",
+    )
+    # Image event actions after which a cached image name may be stale
+    IMAGE_ACTIONS = ("tag", "untag", "delete")
+
+    def __init__(self, resync_delay: float = 2.0, max_resync_delay: float = 30.0):
+        self._containers: Dict[str, ContainerInfo] = {}
+        self._image_ids: Dict[str, str] = {}
+        self._ready = False
+        self._task: Optional[asyncio.Task] = None
+        self._resync_delay = resync_delay
+        self._max_resync_delay = max_resync_delay
+
+    @property
+    def ready(self) -> bool:
+        """Whether the index is seeded and following the event stream"""
+        return self._ready
+
+    def start(self):
+        """Start the background task that maintains the index"""
+        if self._task is not None and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop following the event stream"""
+        self._ready = False
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def list(self, all: bool = True) -> Optional[List[ContainerInfo]]:
+        """List containers from memory; None while the index is not usable"""
+        if not self._ready:
+            return None
+        containers = list(self._containers.values())
+        if not all:
+            containers = [c for c in containers if c.status == "running"]
+        return containers
+
+    async def _run(self):
+        """Seed the index and follow events, resyncing whenever the stream drops"""
+        delay = self._resync_delay
+        while True:
+            try:
+                # Replay events from before the seed so nothing is missed in between
+                since = int(time.time())
+                await self._seed()
+                self._ready = True
+                delay = self._resync_delay
+                await self._follow(since)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Container index error: {e}")
+            finally:
+                self._ready = False
+
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self._max_resync_delay)
+
+    async def _seed(self):
+        """Rebuild the index from a full container listing"""
+        containers = {}
+        image_ids = {}
+        for summary in await docker_client.list_container_summaries(all=True):
+            info = await docker_client.to_container_info(summary)
+            containers[info.id] = info
+            image_ids[info.id] = summary.get("ImageID", "")
+        self._containers = containers
+        self._image_ids = image_ids
+
+    async def _follow(self, since: int):
+        """Apply container and image events to the index until the stream ends"""
+        events = docker_client.events(since=since, filters={"type": ["container", "image"]})
+        async for event in events:
+            action = event.get("Action") or event.get("status") or ""
+            actor_id = (event.get("Actor") or {}).get("ID") or event.get("id", "")
+            if event.get("Type") == "image":
+                if action in self.IMAGE_ACTIONS:
+                    await self._refresh_image(actor_id)
+            elif action == "destroy":
+                self._remove(actor_id)
+            elif action.split(":")[0] not in self.IGNORED_ACTIONS:
+                # health_status events carry the status after a colon
+                await self._refresh(actor_id)
+
+    async def _refresh(self, container_id: str):
+        """Re-read a single container after it changed"""
+        summary = await docker_client.get_container_summary(container_id)
+        if summary is None:
+            # Container is gone, e.g. removed right after the event fired
+            self._remove(container_id)
+            return
+        info = await docker_client.to_container_info(summary)
+        self._containers[info.id] = info
+        self._image_ids[info.id] = summary.get("ImageID", "")
+
+    async def _refresh_image(self, image_id: str):
+        """Re-resolve the image name of containers whose image tags changed"""
+        docker_client.forget_image(image_id)
+        affected = [cid for cid, iid in self._image_ids.items() if iid == image_id]
+        if not affected:
+            return
+        name = await docker_client.resolve_image_name(image_id)
+        for container_id in affected:
+            info = self._containers.get(container_id)
+            if info is not None:
+                self._containers[container_id] = info.model_copy(update={"image": name})
+
+    def _remove(self, container_id: str):
+        """Drop a container from the index"""
+        self._containers.pop(container_id, None)
+        self._image_ids.pop(container_id, None)
+
+
+container_index = ContainerIndex(
+    resync_delay=float(os.getenv("CONTAINER_INDEX_RESYNC_DELAY", "2")),
+)
@@ -0,0 +1,67 @@
+from datetime import datetime
+from typing import AsyncIterator, NamedTuple, Optional, Tuple
+from .docker_client import docker_client
+
+
+class LogLine(NamedTuple):
+    """One container log line with the daemon's RFC 3339 timestamp"""
+    timestamp: str
+    stream: str
+    text: str
+
+
+def parse_log_line(stream: str, raw: bytes) -> LogLine:
+    """Split the timestamp the daemon prefixes when asked for timestamps"""
+    line = raw.decode("utf-8", errors="replace")
+    timestamp, sep, text = line.partition(" ")
+    if not sep or not timestamp[:1].isdigit():
+        return LogLine("", stream, line)
+    return LogLine(timestamp, stream, text)
+
+
+def timestamp_key(timestamp: str) -> Tuple[int, int]:
+    """Order RFC 3339 timestamps exactly, as (unix seconds, nanoseconds)
+
+    The daemon trims trailing zeros from the fraction, so the strings do not
+    compare correctly as text, and datetime only keeps microseconds.
+    """
+    timestamp = timestamp.strip()
+    if timestamp.endswith("Z"):
+        timestamp = timestamp[:-1] + "+00:00"
+    offset = ""
+    for sign in ("+", "-"):
+        position = timestamp.rfind(sign)
+        if position > 10:
+            timestamp, offset = timestamp[:position], timestamp[position:]
+            break
+    whole, _, fraction = timestamp.partition(".")
+    seconds = int(datetime.fromisoformat(whole + (offset or "+00:00")).timestamp())
+    return seconds, int((fraction + "000000000")[:9])
+
+
+def since_param(cursor: str) -> str:
+    """Convert a cursor timestamp to the daemon's `since` query format"""
+    seconds, nanos = timestamp_key(cursor)
+    return f"{seconds}.{nanos:09d}"
+
+
+async def read_log_lines(container_id: str, tail: Optional[int] = 100, since: Optional[str] = None,
+                         follow: bool = False) -> AsyncIterator[LogLine]:
+    """Yield log lines strictly after the `since` cursor, if one is given
+
+    The daemon's `since` filter is inclusive, so lines carrying exactly the
+    cursor timestamp, which the caller has already seen, are skipped here.
+    """
+    cursor = timestamp_key(since) if since else None
+    lines = docker_client.stream_container_logs(
+        container_id,
+        tail=tail,
+        follow=follow,
+        since=since_param(since) if since else None,
+        timestamps=True
+    )
+    async for stream, raw in lines:
+        line = parse_log_line(stream, raw)
+        if cursor is not None and line.timestamp and timestamp_key(line.timestamp) <= cursor:
+            continue
+        yield line
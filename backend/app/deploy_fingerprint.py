@@ -0,0 +1,270 @@
+import hashlib
+import json
+import os
+import posixpath
+import re
+import stat
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import yaml
+from .ignore_rules import translate_glob
+
+
+COMPOSE_FILE = "docker-compose.yml"
+# ${VAR}, $VAR and the ${VAR:-default} forms compose interpolates
+VARIABLE_PATTERN = re.compile(r"\$\{?([A-Za-z_][A-Za-z0-9_]*)")
+
+
+class FingerprintError(Exception):
+    """A project whose deploy inputs can't be fingerprinted"""
+
+
+class DeployFingerprinter:
+    """Hashes what a docker-compose deploy of a project depends on
+
+    A fingerprint is {"global": hash, "services": {name: hash or None}}. The
+    global hash covers the compose file outside its services, the project's
+    .env, config and secret files and the environment variables the compose
+    file refers to; each service's hash covers its own definition, its
+    env_file files and its build context. A service gets None when its
+    inputs can't be hashed (a remote build context, or one outside the
+    project), so it is always treated as changed.
+
+    File hashes are cached by path, size, inode and mtime, so a deploy
+    after a small edit stats the build contexts but only re-reads the
+    files that changed.
+    """
+
+    def __init__(self, max_cached_files: int = 200000):
+        self.max_cached_files = max_cached_files
+        self._hashes: Dict[str, Tuple[int, int, int, str]] = {}
+
+    def compute(self, project_path: str) -> Dict[str, Any]:
+        """Fingerprint a project's deploy inputs; raises FingerprintError"""
+        root = os.path.realpath(project_path)
+        try:
+            with open(os.path.join(root, COMPOSE_FILE), "rb") as f:
+                raw = f.read()
+        except OSError as e:
+            raise FingerprintError(f"Cannot read {COMPOSE_FILE}: {e}")
+        try:
+            config = yaml.safe_load(raw)
+        except yaml.YAMLError as e:
+            # YAML errors span several lines, pointing at the problem
+            raise FingerprintError(f"Cannot parse {COMPOSE_FILE}: {' '.join(str(e).split())}")
+        if not isinstance(config, dict) or not isinstance(config.get("services"), dict):
+            raise FingerprintError(f"{COMPOSE_FILE} has no services")
+        if "include" in config:
+            raise FingerprintError(f"{COMPOSE_FILE} includes other compose files")
+
+        rest = {key: value for key, value in config.items() if key != "services"}
+        variables = sorted(set(VARIABLE_PATTERN.findall(raw.decode("utf-8", errors="replace"))))
+        global_parts = [
+            _canonical(rest),
+            self._file_hash(os.path.join(root, ".env")),
+            _canonical({name: os.environ.get(name) for name in variables}),
+        ]
+        for section in ("configs", "secrets"):
+            entries = rest.get(section)
+            if isinstance(entries, dict):
+                for name, entry in sorted(entries.items()):
+                    if isinstance(entry, dict) and isinstance(entry.get("file"), str):
+                        global_parts.append(self._file_hash(os.path.join(root, entry["file"])))
+
+        services = {}
+        for name, service in config["services"].items():
+            services[str(name)] = self._service_hash(root, service if isinstance(service, dict) else {})
+        return {"global": _digest(global_parts), "services": services}
+
+    def _service_hash(self, root: str, service: dict) -> Optional[str]:
+        parts = [_canonical(service)]
+
+        env_files = service.get("env_file") or []
+        if not isinstance(env_files, list):
+            env_files = [env_files]
+        for entry in env_files:
+            path = entry.get("path") if isinstance(entry, dict) else entry
+            if isinstance(path, str):
+                parts.append(self._file_hash(os.path.join(root, path)))
+
+        extends = service.get("extends")
+        if isinstance(extends, dict) and isinstance(extends.get("file"), str):
+            parts.append(self._file_hash(os.path.join(root, extends["file"])))
+
+        build = service.get("build")
+        if build is not None:
+            if isinstance(build, str):
+                build = {"context": build}
+            context = build.get("context", ".") if isinstance(build, dict) else None
+            if not isinstance(context, str) or "://" in context or context.startswith("git@"):
+                return None
+            context_path = os.path.realpath(os.path.join(root, context))
+            if not _is_within(context_path, root) or not os.path.isdir(context_path):
+                return None
+            parts.append(self._tree_hash(context_path))
+            # Hashed on its own too, as it may be outside the context or dockerignored
+            dockerfile = build.get("dockerfile")
+            if not isinstance(dockerfile, str):
+                dockerfile = "Dockerfile"
+            parts.append(self._file_hash(os.path.join(context_path, dockerfile)))
+        return _digest(parts)
+
+    def _tree_hash(self, context_path: str) -> str:
+        """Hash the files docker would send as a build context"""
+        entries = []
+        for relative, path, is_dir in walk_context(context_path, dockerignore_rules(context_path)):
+            if is_dir:
+                continue
+            try:
+                st = os.lstat(path)
+            except OSError:
+                continue
+            if stat.S_ISLNK(st.st_mode):
+                entries.append((relative, "link", os.readlink(path)))
+            elif stat.S_ISREG(st.st_mode):
+                entries.append((relative, st.st_mode & 0o111, self._file_hash(path, st)))
+        return _digest(entries)
+
+    def _file_hash(self, path: str, st: Optional[os.stat_result] = None) -> str:
+        """sha256 of a file, re-read only when its size, inode or mtime changes"""
+        try:
+            if st is None:
+                st = os.stat(path)
+        except OSError:
+            return "missing"
+        key = (st.st_size, st.st_ino, st.st_mtime_ns)
+        cached = self._hashes.get(path)
+        if cached is not None and cached[:3] == key:
+            return cached[3]
+        digest = hashlib.sha256()
+        try:
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(block)
+        except OSError:
+            return "unreadable"
+        if len(self._hashes) >= self.max_cached_files:
+            self._hashes.clear()
+        self._hashes[path] = key + (digest.hexdigest(),)
+        return digest.hexdigest()
+
+
+def changed_services(previous: Optional[Dict[str, Any]], current: Dict[str, Any]) -> Optional[List[str]]:
+    """Services to deploy given the last successful deploy's fingerprint
+
+    None means deploy everything: there is no usable previous fingerprint,
+    something shared by all services changed, or a service was removed. An
+    empty list means nothing changed.
+    """
+    if not previous or previous.get("global") != current["global"]:
+        return None
+    if set(previous.get("services") or {}) - set(current["services"]):
+        return None
+    return changed_inputs(previous, current)
+
+
+def changed_inputs(previous: Optional[Dict[str, Any]], current: Dict[str, Any]) -> List[str]:
+    """Services whose own inputs differ from the last successful deploy's
+
+    These need their images rebuilt, even when every service is deployed.
+    A service hashed as None, or one with no previous hash, has changed.
+    """
+    before = (previous or {}).get("services") or {}
+    return [
+        name for name, digest in current["services"].items()
+        if digest is None or before.get(name) != digest
+    ]
+
+
+class DockerIgnore:
+    """.dockerignore patterns, matched the way Docker matches them
+
+    Patterns are anchored at the context root, and one that matches a
+    directory matches everything in it. The last pattern matching a path
+    or one of its parents wins, so a "!" exception can re-include files in
+    an excluded directory.
+    """
+
+    def __init__(self, patterns: List[str]):
+        self._rules: List[Tuple[re.Pattern, str, bool]] = []
+        for pattern in patterns:
+            pattern = pattern.strip()
+            if not pattern or pattern.startswith("#"):
+                continue
+            negate = pattern.startswith("!")
+            if negate:
+                pattern = pattern[1:].strip()
+            pattern = posixpath.normpath(pattern).lstrip("/")
+            if pattern in ("", "."):
+                continue
+            self._rules.append((re.compile("^" + translate_glob(pattern) + "$"), pattern, negate))
+
+    def excluded(self, path: str) -> bool:
+        """Whether a '/'-separated path relative to the context root is left out"""
+        parts = path.split("/")
+        candidates = ["/".join(parts[:i]) for i in range(1, len(parts) + 1)]
+        excluded = False
+        for regex, _, negate in self._rules:
+            if any(regex.match(candidate) for candidate in candidates):
+                excluded = not negate
+        return excluded
+
+    def may_include_under(self, directory: str) -> bool:
+        """Whether an exception names a path inside an excluded directory
+
+        Docker only walks into an excluded directory in that case.
+        """
+        prefix = directory + "/"
+        return any(negate and (pattern + "/").startswith(prefix) for _, pattern, negate in self._rules)
+
+
+def dockerignore_rules(context_path: str, exceptions: Tuple[str, ...] = ()) -> Optional[DockerIgnore]:
+    """The context's .dockerignore plus "!" exceptions, or None if it has no patterns"""
+    try:
+        with open(os.path.join(context_path, ".dockerignore"), "r", encoding="utf-8", errors="replace") as f:
+            lines = [line.strip() for line in f]
+    except OSError:
+        return None
+    patterns = [line for line in lines if line and not line.startswith("#")]
+    if not patterns:
+        return None
+    return DockerIgnore(patterns + ["!" + path for path in exceptions])
+
+
+def walk_context(context_path: str, rules: Optional[DockerIgnore]) -> Iterator[Tuple[str, str, bool]]:
+    """(relative path, path, is_dir) of what docker would send as a build context
+
+    Directories come before their contents, in sorted order. An excluded
+    directory is only entered when an exception may re-include something
+    in it, and isn't listed itself.
+    """
+    for directory, dirs, files in os.walk(context_path):
+        relative_dir = os.path.relpath(directory, context_path).replace(os.sep, "/")
+        relative_dir = "" if relative_dir == "." else relative_dir + "/"
+        kept = []
+        for name in sorted(dirs):
+            relative = relative_dir + name
+            if rules is None or not rules.excluded(relative):
+                kept.append(name)
+                yield relative, os.path.join(directory, name), True
+            elif rules.may_include_under(relative):
+                kept.append(name)
+        dirs[:] = kept
+        for name in sorted(files):
+            relative = relative_dir + name
+            if rules is None or not rules.excluded(relative):
+                yield relative, os.path.join(directory, name), False
+
+
+def _is_within(path: str, root: str) -> bool:
+    return path == root or path.startswith(root + os.sep)
+
+
+def _canonical(value) -> str:
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+def _digest(parts) -> str:
+    return hashlib.sha256(_canonical(parts).encode("utf-8")).hexdigest()
+
+
+deploy_fingerprinter = DeployFingerprinter()
@@ -0,0 +1,419 @@
+import asyncio
+import json
+import os
+import shlex
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, NamedTuple, Optional, Set, Tuple
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from .compose_engine import ComposeError, ComposeProject, ComposeUnsupported, compose_engine, load_project
+from .deploy_fingerprint import FingerprintError, changed_inputs, changed_services, deploy_fingerprinter
+from .metrics import deploy_durations
+from .models import AsyncSessionLocal, DeployFingerprint, DeployJob, Project
+
+
+FINISHED_STATUSES = ("succeeded", "failed", "cancelled")
+
+
+class DeployLine(NamedTuple):
+    seq: int
+    stream: str
+    text: str
+
+
+def line_to_dict(line: DeployLine) -> Dict[str, Any]:
+    return {"seq": line.seq, "stream": line.stream, "text": line.text}
+
+
+class _Job:
+    """In-memory state of a deploy job that is queued, running or recently finished"""
+
+    def __init__(self, row: DeployJob, project_path: str, log_lines: int, force: bool = False):
+        self.id = row.id
+        self.project_id = row.project_id
+        self.project_path = project_path
+        self.force = force
+        self.status = row.status
+        self.exit_code: Optional[int] = None
+        self.error: Optional[str] = None
+        self.created_at = row.created_at
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        # "native" or "subprocess" once the job has picked how to deploy
+        self.runner: Optional[str] = None
+        self.services: Optional[List[Dict[str, Any]]] = None
+        self.lines: Deque[DeployLine] = deque(maxlen=log_lines)
+        self.next_seq = 0
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.task: Optional[asyncio.Task] = None
+
+
+class DeployScheduler:
+    """Runs compose deploys as background jobs
+
+    A deploy is recorded in the deploy_jobs table and returned straight
+    away; an asyncio task then waits for the project's previous deploy and
+    for one of max_concurrent slots. With the native engine the project is
+    brought up through the Docker API by the compose engine; otherwise, or
+    when the compose file uses features the engine lacks, the compose
+    command runs as a subprocess. Output lines are kept in memory for live
+    subscribers, and the last log_lines of them are saved with the job
+    when it finishes.
+    """
+
+    def __init__(self, command: str = "docker-compose", engine: str = "native", max_concurrent: int = 4,
+                 timeout: float = 300.0, log_lines: int = 2000, keep_finished: int = 100,
+                 subscriber_queue: int = 10000, kill_grace: float = 10.0):
+        self.command = shlex.split(command)
+        self.engine = engine
+        self.max_concurrent = max_concurrent
+        self.timeout = timeout
+        self.log_lines = log_lines
+        self.keep_finished = keep_finished
+        self.subscriber_queue = subscriber_queue
+        self.kill_grace = kill_grace
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._jobs: Dict[int, _Job] = {}
+        self._finished: Deque[int] = deque()
+        self._stopping = False
+        # One lock per project with unfinished jobs, so its deploys run in order
+        self._project_locks: Dict[int, Tuple[asyncio.Lock, int]] = {}
+
+    async def start(self):
+        """Fail jobs that were queued or running when the server last stopped"""
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(DeployJob).where(DeployJob.status.in_(("queued", "running"))).values(
+                    status="failed", error="Interrupted by a server restart", finished_at=datetime.utcnow()
+                )
+            )
+            await db.commit()
+
+    async def stop(self):
+        """Cancel every unfinished job, stopping running deploys"""
+        self._stopping = True
+        tasks = [job.task for job in self._jobs.values() if job.task is not None and not job.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def submit(self, db: AsyncSession, project: Project, force: bool = False) -> Dict[str, Any]:
+        """Queue a deploy of a project and return the new job
+
+        Unless force is set, the job compares the project's deploy inputs
+        with the last successful deploy's, and skips docker-compose or
+        limits it to the changed services.
+        """
+        row = DeployJob(project_id=project.id, status="queued")
+        db.add(row)
+        await db.commit()
+        await db.refresh(row)
+
+        job = _Job(row, project.path, self.log_lines, force)
+        self._jobs[job.id] = job
+        lock, pending = self._project_locks.get(project.id, (asyncio.Lock(), 0))
+        self._project_locks[project.id] = (lock, pending + 1)
+        job.task = asyncio.create_task(self._run(job, lock))
+        return self.describe(job)
+
+    async def get(self, db: AsyncSession, job_id: int) -> Optional[Dict[str, Any]]:
+        """A job with its status, or None if there is no such job"""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return self.describe(job)
+        row = await db.get(DeployJob, job_id)
+        return self.describe(row) if row is not None else None
+
+    async def list(self, db: AsyncSession, project_id: Optional[int] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """Most recent jobs first, optionally for one project"""
+        query = select(DeployJob)
+        if project_id is not None:
+            query = query.where(DeployJob.project_id == project_id)
+        rows = await db.scalars(query.order_by(DeployJob.id.desc()).limit(limit))
+        # Jobs still in memory are more current than their rows
+        return [self.describe(self._jobs.get(row.id, row)) for row in rows]
+
+    def cancel(self, job_id: int) -> bool:
+        """Cancel a queued or running job; False if it is unknown or finished"""
+        job = self._jobs.get(job_id)
+        if job is None or job.status in FINISHED_STATUSES or job.task is None:
+            return False
+        job.task.cancel()
+        return True
+
+    async def output(self, db: AsyncSession, job_id: int) -> Optional[Tuple[List[DeployLine], Optional[asyncio.Queue]]]:
+        """Lines so far and, for an unfinished job, a queue of new ones
+
+        A None in the queue means the job finished; a False means the
+        subscriber fell too far behind and was dropped. Returns None for an
+        unknown job.
+        """
+        job = self._jobs.get(job_id)
+        if job is not None:
+            backlog = list(job.lines)
+            if job.status in FINISHED_STATUSES:
+                return backlog, None
+            queue: asyncio.Queue = asyncio.Queue(maxsize=self.subscriber_queue)
+            job.subscribers.add(queue)
+            return backlog, queue
+        row = await db.get(DeployJob, job_id)
+        if row is None:
+            return None
+        text = row.output or ""
+        return [DeployLine(seq, "output", line) for seq, line in enumerate(text.splitlines())], None
+
+    def unsubscribe(self, job_id: int, queue: asyncio.Queue):
+        job = self._jobs.get(job_id)
+        if job is not None:
+            job.subscribers.discard(queue)
+
+    @staticmethod
+    def describe(job) -> Dict[str, Any]:
+        """Public fields of a job, from its in-memory state or its row"""
+        return {
+            "id": job.id,
+            "project_id": job.project_id,
+            "status": job.status,
+            "exit_code": job.exit_code,
+            "error": job.error,
+            "created_at": job.created_at,
+            "started_at": job.started_at,
+            "finished_at": job.finished_at,
+            # A row keeps them as JSON
+            "services": json.loads(job.services) if isinstance(job.services, str) else job.services,
+        }
+
+    async def _run(self, job: _Job, lock: asyncio.Lock):
+        try:
+            async with lock:
+                async with self._slots:
+                    await self._execute(job)
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            job.error = "Cancelled by server shutdown" if self._stopping else "Cancelled"
+        except Exception as e:
+            print(f"Deploy job {job.id} error: {e}")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            lock, pending = self._project_locks[job.project_id]
+            if pending > 1:
+                self._project_locks[job.project_id] = (lock, pending - 1)
+            else:
+                del self._project_locks[job.project_id]
+            await self._finish(job)
+
+    async def _execute(self, job: _Job):
+        job.status = "running"
+        job.started_at = datetime.utcnow()
+        await self._save(job.id, status=job.status, started_at=job.started_at)
+
+        fingerprint, services, rebuild = await self._plan(job)
+        if services == []:
+            self._emit(job, "info", "Nothing changed since the last successful deploy; skipping it")
+            job.status = "succeeded"
+            return
+
+        if self.engine == "native":
+            try:
+                project = await run_in_threadpool(load_project, job.project_path)
+            except ComposeUnsupported as e:
+                self._emit(job, "info", f"{e}; deploying with {self.command[0]}")
+            except ComposeError as e:
+                job.status = "failed"
+                job.error = str(e)
+                return
+            else:
+                job.runner = "native"
+                await self._execute_native(job, project, fingerprint, services, rebuild)
+                return
+
+        job.runner = "subprocess"
+        # The binary builds every selected service then, not just the changed ones
+        build = ["--build"] if rebuild is None or rebuild else []
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *self.command, "-f", "docker-compose.yml", "up", "-d", *build, *(services or []),
+                cwd=job.project_path,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                limit=1024 * 1024,
+            )
+        except OSError as e:
+            job.status = "failed"
+            job.error = f"Could not run {self.command[0]}: {e}"
+            return
+
+        readers = [
+            asyncio.create_task(self._pump(job, process.stdout, "stdout")),
+            asyncio.create_task(self._pump(job, process.stderr, "stderr")),
+        ]
+        try:
+            await asyncio.wait_for(process.wait(), self.timeout)
+            # Let the readers drain what is left in the pipes
+            await asyncio.wait(readers, timeout=self.kill_grace)
+        except asyncio.TimeoutError:
+            await self._terminate(process)
+            job.status = "failed"
+            job.error = f"Deployment timed out after {self.timeout:g} seconds"
+            return
+        except asyncio.CancelledError:
+            await self._terminate(process)
+            raise
+        finally:
+            for reader in readers:
+                reader.cancel()
+            await asyncio.gather(*readers, return_exceptions=True)
+
+        job.exit_code = process.returncode
+        if process.returncode == 0:
+            job.status = "succeeded"
+            if fingerprint is not None:
+                await self._store_fingerprint(job, fingerprint)
+        else:
+            job.status = "failed"
+            job.error = f"{self.command[0]} exited with status {process.returncode}"
+
+    async def _execute_native(self, job: _Job, project: ComposeProject, fingerprint: Optional[Dict[str, Any]],
+                              services: Optional[List[str]], rebuild: Optional[List[str]]):
+        build = set(project.services) if rebuild is None else set(rebuild)
+        try:
+            results = await asyncio.wait_for(
+                compose_engine.up(project, services, build=build,
+                                  log=lambda service, text: self._emit(job, "stdout", f"{service} | {text}")),
+                self.timeout,
+            )
+        except asyncio.TimeoutError:
+            job.status = "failed"
+            job.error = f"Deployment timed out after {self.timeout:g} seconds"
+            return
+        except ComposeError as e:
+            job.status = "failed"
+            job.error = str(e)
+            return
+
+        job.services = results
+        not_up = [result["service"] for result in results if result["status"] in ("failed", "skipped")]
+        if not_up:
+            job.status = "failed"
+            job.error = f"Services not brought up: {', '.join(not_up)}"
+        else:
+            job.status = "succeeded"
+            if fingerprint is not None:
+                await self._store_fingerprint(job, fingerprint)
+
+    async def _plan(self, job: _Job) -> Tuple[Optional[Dict[str, Any]], Optional[List[str]], Optional[List[str]]]:
+        """The project's fingerprint, the services to deploy and those to rebuild
+
+        None means every service. Services whose inputs changed since the
+        stored fingerprint are rebuilt even on a full deploy, so the
+        fingerprint stored afterwards matches the images that run.
+        """
+        try:
+            fingerprint = await run_in_threadpool(deploy_fingerprinter.compute, job.project_path)
+        except FingerprintError as e:
+            self._emit(job, "info", f"{e}; deploying every service")
+            return None, None, None if job.force else []
+        if job.force:
+            return fingerprint, None, None
+
+        async with AsyncSessionLocal() as db:
+            row = await db.get(DeployFingerprint, job.project_id)
+        try:
+            previous = json.loads(row.fingerprint) if row is not None else None
+        except ValueError:
+            previous = None
+        services = changed_services(previous, fingerprint)
+        if services:
+            self._emit(job, "info", f"Deploying changed services: {', '.join(services)}")
+        return fingerprint, services, changed_inputs(previous, fingerprint)
+
+    async def _store_fingerprint(self, job: _Job, fingerprint: Dict[str, Any]):
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.merge(DeployFingerprint(project_id=job.project_id, job_id=job.id,
+                                                 fingerprint=json.dumps(fingerprint)))
+                await db.commit()
+        except Exception as e:
+            print(f"Error saving deploy fingerprint for project {job.project_id}: {e}")
+
+    async def _pump(self, job: _Job, stream: asyncio.StreamReader, name: str):
+        while True:
+            try:
+                line = await stream.readline()
+            except ValueError:
+                # Longer than the stream limit; that part of it is dropped
+                self._emit(job, name, "[line too long]")
+                continue
+            if not line:
+                return
+            self._emit(job, name, line.decode("utf-8", errors="replace").rstrip("\r\n"))
+
+    async def _terminate(self, process: asyncio.subprocess.Process):
+        if process.returncode is not None:
+            return
+        process.terminate()
+        try:
+            await asyncio.wait_for(process.wait(), self.kill_grace)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+
+    def _emit(self, job: _Job, stream: str, text: str):
+        line = DeployLine(job.next_seq, stream, text)
+        job.next_seq += 1
+        job.lines.append(line)
+        for queue in list(job.subscribers):
+            self._offer(job, queue, line)
+
+    @staticmethod
+    def _offer(job: _Job, queue: asyncio.Queue, item):
+        """Queue item for a subscriber, dropping it if it is too far behind"""
+        if queue.full():
+            job.subscribers.discard(queue)
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(False)
+        else:
+            queue.put_nowait(item)
+
+    async def _finish(self, job: _Job):
+        job.finished_at = datetime.utcnow()
+        if job.started_at is not None:
+            deploy_durations.labels(job.runner or "none", job.status).observe(
+                (job.finished_at - job.started_at).total_seconds()
+            )
+        for queue in list(job.subscribers):
+            self._offer(job, queue, None)
+        job.subscribers.clear()
+        try:
+            await asyncio.shield(self._save(
+                job.id, status=job.status, exit_code=job.exit_code, error=job.error,
+                finished_at=job.finished_at, output="\n".join(line.text for line in job.lines),
+                services=json.dumps(job.services) if job.services is not None else None,
+            ))
+        except Exception as e:
+            print(f"Error saving deploy job {job.id}: {e}")
+
+        # Recent jobs stay in memory so late viewers still get stream names
+        self._finished.append(job.id)
+        while len(self._finished) > self.keep_finished:
+            self._jobs.pop(self._finished.popleft(), None)
+
+    @staticmethod
+    async def _save(job_id: int, **fields):
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(DeployJob).where(DeployJob.id == job_id).values(**fields))
+            await db.commit()
+
+
+deploy_scheduler = DeployScheduler(
+    command=os.getenv("DEPLOY_COMMAND", "docker-compose"),
+    engine=os.getenv("DEPLOY_ENGINE", "native"),
+    max_concurrent=int(os.getenv("DEPLOY_CONCURRENCY", "4")),
+    timeout=float(os.getenv("DEPLOY_TIMEOUT", "300")),
+    log_lines=int(os.getenv("DEPLOY_LOG_LINES", "2000")),
+)
@@ -0,0 +1,221 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import struct
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+
+# inotify(7) constants
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ONLYDIR = 0x1000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class _Inotify:
+    """Non-blocking inotify instance watching directories for entry changes"""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def add_watch(self, path: str) -> Optional[int]:
+        """Watch a directory; None when the kernel refuses, e.g. out of watches"""
+        wd = self._add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        return wd if wd >= 0 else None
+
+    def rm_watch(self, wd: int):
+        self._rm_watch(self.fd, wd)
+
+    def read_events(self) -> List[Tuple[int, int]]:
+        """Pending (watch descriptor, mask) events, without blocking"""
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return events
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+            offset = 0
+            while offset + EVENT_HEADER.size <= len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                events.append((wd, mask))
+                offset += EVENT_HEADER.size + length
+
+
+class _Listing:
+    def __init__(self, entries: List[Tuple[str, bool]], mtime_ns: int, wd: Optional[int]):
+        self.entries = entries
+        self.mtime_ns = mtime_ns
+        self.wd = wd
+
+
+class DirectoryCache:
+    """LRU cache of sorted directory listings, kept fresh by inotify
+
+    Listings are (name, is_directory) pairs sorted by name. Directories the
+    kernel watches are trusted until an event arrives; the rest are checked
+    against the directory mtime on every lookup. The cache holds at most
+    max_names entries across all directories, and only cached listings keep
+    a watch, so invalidated directories don't use up the user's watches.
+    """
+
+    def __init__(self, max_names: int = 200000, use_inotify: bool = True):
+        self.max_names = max_names
+        self._listings: "OrderedDict[str, _Listing]" = OrderedDict()
+        self._names = 0
+        self._watches: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        # In-flight scans and the tick of the last invalidation seen during them
+        self._tick = 0
+        self._scanning: Dict[str, int] = {}
+        self._touched: Dict[str, int] = {}
+        self._inotify: Optional[_Inotify] = None
+        if use_inotify:
+            try:
+                self._inotify = _Inotify()
+            except (OSError, AttributeError, TypeError):
+                self._inotify = None
+
+    def get(self, directory: str) -> List[Tuple[str, bool]]:
+        """Sorted (name, is_directory) entries of a directory
+
+        Raises OSError like os.scandir when the directory can't be read.
+        """
+        with self._lock:
+            self._drain()
+            listing = self._listings.get(directory)
+            if listing is not None and listing.wd is not None:
+                self._listings.move_to_end(directory)
+                return listing.entries
+            self._tick += 1
+            start = self._tick
+            self._scanning[directory] = self._scanning.get(directory, 0) + 1
+
+        try:
+            # Watch before reading, so a change made mid-scan still invalidates
+            wd = listing.wd if listing is not None else self._watch(directory)
+            mtime_ns = os.stat(directory).st_mtime_ns
+            if listing is not None and listing.mtime_ns == mtime_ns:
+                with self._lock:
+                    if directory in self._listings:
+                        self._listings.move_to_end(directory)
+                return listing.entries
+
+            entries = []
+            with os.scandir(directory) as it:
+                for entry in it:
+                    try:
+                        # DirEntry caches the type from the directory read
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    entries.append((entry.name, is_dir))
+            entries.sort()
+        finally:
+            with self._lock:
+                touched = self._touched.get(directory, 0)
+                self._scanning[directory] -= 1
+                if not self._scanning[directory]:
+                    del self._scanning[directory]
+                    self._touched.pop(directory, None)
+
+        with self._lock:
+            if touched < start:
+                self._store(directory, _Listing(entries, mtime_ns, wd))
+            elif wd is not None and listing is None:
+                current = self._listings.get(directory)
+                # A concurrent scan may have cached the same watch
+                if current is None or current.wd != wd:
+                    self._unwatch(wd)
+        return entries
+
+    def invalidate(self, directory: str):
+        """Forget the listing of one directory"""
+        with self._lock:
+            self._invalidate(directory)
+
+    def invalidate_tree(self, directory: str):
+        """Forget a directory and every directory below it"""
+        prefix = directory.rstrip(os.sep) + os.sep
+        with self._lock:
+            self._invalidate(directory)
+            for path in [p for p in self._listings if p.startswith(prefix)]:
+                self._invalidate(path)
+
+    def _watch(self, directory: str) -> Optional[int]:
+        if self._inotify is None:
+            return None
+        wd = self._inotify.add_watch(directory)
+        if wd is not None:
+            with self._lock:
+                self._watches[wd] = directory
+        return wd
+
+    def _store(self, directory: str, listing: _Listing):
+        old = self._listings.pop(directory, None)
+        if old is not None:
+            self._names -= len(old.entries)
+            if old.wd is not None and old.wd != listing.wd:
+                self._unwatch(old.wd)
+        self._listings[directory] = listing
+        self._names += len(listing.entries)
+        while self._names > self.max_names and len(self._listings) > 1:
+            path, evicted = self._listings.popitem(last=False)
+            self._names -= len(evicted.entries)
+            if evicted.wd is not None:
+                self._unwatch(evicted.wd)
+
+    def _unwatch(self, wd: int):
+        # A watch the kernel already dropped is gone from _watches
+        if self._watches.pop(wd, None) is not None and self._inotify is not None:
+            self._inotify.rm_watch(wd)
+
+    def _invalidate(self, directory: str):
+        self._tick += 1
+        if directory in self._scanning:
+            self._touched[directory] = self._tick
+        listing = self._listings.pop(directory, None)
+        if listing is not None:
+            self._names -= len(listing.entries)
+            if listing.wd is not None:
+                self._unwatch(listing.wd)
+
+    def _drain(self):
+        """Apply pending inotify events"""
+        if self._inotify is None:
+            return
+        for wd, mask in self._inotify.read_events():
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost; nothing cached can be trusted
+                for path in list(self._listings):
+                    self._invalidate(path)
+                continue
+            path = self._watches.get(wd)
+            if path is None:
+                continue
+            if mask & IN_IGNORED:
+                # The kernel dropped the watch, e.g. the directory was removed
+                del self._watches[wd]
+            self._invalidate(path)
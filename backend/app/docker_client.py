@@ -1,174 +1,467 @@
-import docker
-from docker import APIClient
-from typing import List, Dict, Any, Optional
+import asyncio
 import os
+import struct
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from .docker_http import DockerAPIError, DockerNotFound, DockerTransport
+from .metrics import docker_operations
 from .schemas import ContainerInfo, ContainerStats
 
 
+# Stream types of the multiplexed stdout/stderr framing used for non-TTY output
+LOG_STREAMS = {0: "stdin", 1: "stdout", 2: "stderr"}
+
+
 class DockerClient:
+    """Async client for the Docker Engine API on the local Unix socket
+
+    Requests use unversioned API paths, so the daemon answers with its own API
+    version; that keeps older daemons (e.g. Docker 1.13 on RHEL 7) working.
+    """
+
     def __init__(self):
-        self._client = None
+        self._transport: Optional[DockerTransport] = None
         self._socket_path = os.getenv("DOCKER_SOCKET", "/var/run/docker.sock")
-    
+        self._timeout = float(os.getenv("DOCKER_API_TIMEOUT", "30"))
+        self._max_connections = int(os.getenv("DOCKER_MAX_CONNECTIONS", "10"))
+        # Image ID -> display name; image tags rarely change, so avoid one
+        # image lookup per container on every listing
+        self._image_names: Dict[str, str] = {}
+
     @property
-    def client(self):
-        """Lazy initialization of Docker client"""
-        if self._client is None:
+    def transport(self) -> DockerTransport:
+        """Lazy initialization of the Docker API transport"""
+        if self._transport is None:
             # Check if socket file exists
             if not os.path.exists(self._socket_path):
                 raise Exception(f"Docker socket not found at {self._socket_path}. Make sure Docker socket is mounted.")
-            
-            # Remove problematic environment variables that interfere with Unix sockets
-            env_vars_to_clear = ["DOCKER_HOST", "DOCKER_TLS_VERIFY", "DOCKER_CERT_PATH"]
-            for key in env_vars_to_clear:
-                if key in os.environ:
-                    os.environ.pop(key)
-            
-            try:
-                # Construct the proper Unix socket URL
-                socket_url = f"unix://{self._socket_path}"
-                print(f"DEBUG: Attempting to connect to {socket_url}")
-                
-                # Initialize the high-level client directly using base_url
-                # This avoids the "unexpected keyword argument 'api'" error
-                self._client = docker.DockerClient(base_url=socket_url)
-                
-                # Verify the connection works
-                self._client.ping()
-                print("DEBUG: Successfully connected to Docker daemon")
-            except Exception as e:
-                error_msg = str(e)
-                print(f"Error connecting to Docker socket at {self._socket_path}: {error_msg}")
-                raise Exception(f"Failed to connect to Docker daemon: {error_msg}")
-        
-        return self._client
-
-    def list_containers(self, all: bool = True) -> List[ContainerInfo]:
+            self._transport = DockerTransport(
+                self._socket_path,
+                max_connections=self._max_connections,
+                timeout=self._timeout
+            )
+        return self._transport
+
+    async def close(self):
+        """Close pooled connections to the daemon"""
+        if self._transport is not None:
+            await self._transport.close()
+
+    async def ping(self) -> bool:
+        """Check that the daemon answers"""
+        try:
+            await self.transport.request("GET", "/_ping", timeout=5)
+            return True
+        except Exception as e:
+            print(f"Error connecting to Docker socket at {self._socket_path}: {e}")
+            return False
+
+    async def list_containers(self, all: bool = True) -> List[ContainerInfo]:
         """List all containers"""
-        containers = self.client.containers.list(all=all)
-        result = []
-        for container in containers:
-            ports = []
-            # Extract port mappings safely
-            network_settings = container.attrs.get("NetworkSettings", {})
-            port_data = network_settings.get("Ports") or {}
-            
-            for container_port, host_ports in port_data.items():
-                if host_ports:
-                    for host_port in host_ports:
-                        ports.append({
-                            "container_port": container_port,
-                            "host_ip": host_port.get("HostIp", ""),
-                            "host_port": host_port.get("HostPort", "")
-                        })
-            
-            # Safely handle image tags
-            image_name = container.image.tags[0] if container.image.tags else container.image.id[:12]
-            
-            result.append(ContainerInfo(
-                id=container.id,
-                name=container.name,
-                image=image_name,
-                status=container.status,
-                created=container.attrs.get("Created", ""),
-                ports=ports
-            ))
-        return result
-
-    def get_container(self, container_id: str):
-        """Get container by ID"""
-        return self.client.containers.get(container_id)
-
-    def stop_container(self, container_id: str) -> bool:
+        return [await self.to_container_info(summary) for summary in await self.list_container_summaries(all=all)]
+
+    @docker_operations.timed("list")
+    async def list_container_summaries(self, all: bool = True,
+                                       filters: Optional[Dict[str, List[str]]] = None) -> List[Dict[str, Any]]:
+        """List the raw container summaries; a single API call for all containers"""
+        response = await self.transport.request(
+            "GET", "/containers/json", params={"all": all, "filters": filters}
+        )
+        return response.json() or []
+
+    async def get_container_summary(self, container_id: str) -> Optional[Dict[str, Any]]:
+        """Get the summary of a single container, or None if it does not exist"""
+        for summary in await self.list_container_summaries(all=True, filters={"id": [container_id]}):
+            if summary.get("Id", "").startswith(container_id):
+                return summary
+        return None
+
+    async def to_container_info(self, summary: Dict[str, Any]) -> ContainerInfo:
+        """Build a ContainerInfo from a container summary"""
+        ports = []
+        # Only published ports have a host side
+        for port in summary.get("Ports") or []:
+            if port.get("PublicPort"):
+                ports.append({
+                    "container_port": f"{port.get('PrivatePort')}/{port.get('Type', 'tcp')}",
+                    "host_ip": port.get("IP", ""),
+                    "host_port": str(port.get("PublicPort"))
+                })
+
+        names = summary.get("Names") or [""]
+        created = summary.get("Created")
+        return ContainerInfo(
+            id=summary.get("Id", ""),
+            name=names[0].lstrip("/"),
+            image=await self.resolve_image_name(summary.get("ImageID", "")),
+            status=summary.get("State", ""),
+            created=datetime.fromtimestamp(created, timezone.utc).isoformat() if created else "",
+            ports=ports
+        )
+
+    async def resolve_image_name(self, image_id: str) -> str:
+        """Resolve an image ID to its first tag, cached by image ID"""
+        name = self._image_names.get(image_id)
+        if name is not None:
+            return name
+
+        short_id = image_id.split(":")[-1][:12]
+        try:
+            response = await self.transport.request("GET", f"/images/{image_id}/json")
+            tags = response.json().get("RepoTags") or []
+            name = tags[0] if tags else short_id
+        except DockerAPIError:
+            # Image may have been removed since the container was created
+            name = short_id
+        self._image_names[image_id] = name
+        return name
+
+    def forget_image(self, image_id: str):
+        """Drop a cached image name, e.g. after the image was tagged or untagged"""
+        self._image_names.pop(image_id, None)
+
+    @docker_operations.timed("inspect")
+    async def inspect_container(self, container_id: str) -> Dict[str, Any]:
+        """Get the raw inspect data for a container"""
+        response = await self.transport.request("GET", f"/containers/{container_id}/json")
+        return response.json()
+
+    @docker_operations.timed("stop", failed=False)
+    async def stop_container(self, container_id: str, timeout: int = 10) -> bool:
         """Stop a container"""
         try:
-            container = self.client.containers.get(container_id)
-            container.stop()
+            # The daemon waits up to `timeout` seconds before killing the container
+            await self.transport.request(
+                "POST", f"/containers/{container_id}/stop",
+                params={"t": timeout}, timeout=self._timeout + timeout
+            )
             return True
         except Exception as e:
             print(f"Error stopping container: {e}")
             return False
 
-    def start_container(self, container_id: str) -> bool:
+    async def start_container(self, container_id: str) -> bool:
         """Start a container"""
         try:
-            container = self.client.containers.get(container_id)
-            container.start()
+            await self.launch_container(container_id)
             return True
         except Exception as e:
             print(f"Error starting container: {e}")
             return False
 
-    def get_container_stats(self, container_id: str) -> Optional[ContainerStats]:
+    # The methods below raise DockerAPIError rather than returning a flag, as
+    # the compose engine reports the daemon's reason for each failure
+
+    @docker_operations.timed("start")
+    async def launch_container(self, container_id: str):
+        """Start a container, raising on errors"""
+        await self.transport.request("POST", f"/containers/{container_id}/start")
+
+    @docker_operations.timed("create")
+    async def create_container(self, name: str, config: Dict[str, Any]) -> str:
+        """Create a container from a create body and return its ID"""
+        response = await self.transport.request("POST", "/containers/create", params={"name": name}, body=config)
+        return response.json()["Id"]
+
+    @docker_operations.timed("remove")
+    async def remove_container(self, container_id: str, force: bool = False):
+        """Remove a container, keeping its anonymous volumes"""
+        await self.transport.request("DELETE", f"/containers/{container_id}", params={"force": force})
+
+    async def inspect_image(self, name: str) -> Optional[Dict[str, Any]]:
+        """Get the raw inspect data for an image, or None if it is not present"""
+        try:
+            response = await self.transport.request("GET", f"/images/{name}/json")
+        except DockerNotFound:
+            return None
+        return response.json()
+
+    async def pull_image(self, image: str) -> AsyncIterator[Dict[str, Any]]:
+        """Pull an image, yielding the daemon's progress messages"""
+        # A digest pins the image; otherwise a tag follows the last colon after the last slash
+        name, tag = image, None
+        if "@" not in image:
+            repository, _, candidate = image.rpartition(":")
+            if repository and "/" not in candidate:
+                name, tag = repository, candidate
+            else:
+                tag = "latest"
+        response = await self.transport.stream("POST", "/images/create", params={"fromImage": name, "tag": tag})
+        try:
+            async for message in self._progress(response):
+                yield message
+        finally:
+            response.close()
+
+    async def build_image(self, context: AsyncIterator[bytes], tag: str, dockerfile: Optional[str] = None,
+                          buildargs: Optional[Dict[str, str]] = None,
+                          target: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Build an image from a tar build context, yielding the daemon's output messages"""
+        response = await self.transport.stream(
+            "POST", "/build",
+            params={"t": tag, "dockerfile": dockerfile, "buildargs": buildargs or None, "target": target, "rm": True},
+            body=context,
+            headers={"Content-Type": "application/x-tar"},
+            # Sending the context is part of the wait for the headers
+            timeout=None,
+        )
+        try:
+            async for message in self._progress(response):
+                yield message
+        finally:
+            response.close()
+
+    @staticmethod
+    async def _progress(response) -> AsyncIterator[Dict[str, Any]]:
+        """JSON messages of a pull or build; a failure arrives as an error message"""
+        async for message in response.iter_json():
+            if message.get("error"):
+                raise DockerAPIError(500, message["error"])
+            yield message
+
+    async def inspect_network(self, name: str) -> Optional[Dict[str, Any]]:
+        """Get the raw inspect data for a network, or None if it does not exist"""
+        try:
+            response = await self.transport.request("GET", f"/networks/{name}")
+        except DockerNotFound:
+            return None
+        return response.json()
+
+    async def create_network(self, name: str, options: Dict[str, Any]) -> str:
+        """Create a network from create options (Driver, Labels, ...) and return its ID"""
+        response = await self.transport.request(
+            "POST", "/networks/create", body={"Name": name, "CheckDuplicate": True, **options}
+        )
+        return response.json()["Id"]
+
+    async def connect_network(self, network: str, container_id: str, aliases: Optional[List[str]] = None):
+        """Attach a container to a further network"""
+        await self.transport.request(
+            "POST", f"/networks/{network}/connect",
+            body={"Container": container_id, "EndpointConfig": {"Aliases": aliases or []}}
+        )
+
+    async def inspect_volume(self, name: str) -> Optional[Dict[str, Any]]:
+        """Get the raw inspect data for a volume, or None if it does not exist"""
+        try:
+            response = await self.transport.request("GET", f"/volumes/{name}")
+        except DockerNotFound:
+            return None
+        return response.json()
+
+    async def create_volume(self, name: str, options: Dict[str, Any]) -> Dict[str, Any]:
+        """Create a volume from create options (Driver, DriverOpts, Labels); existing ones are returned as they are"""
+        response = await self.transport.request("POST", "/volumes/create", body={"Name": name, **options})
+        return response.json()
+
+    @docker_operations.timed("stats", failed=None)
+    async def get_container_stats(self, container_id: str) -> Optional[ContainerStats]:
         """Get container stats"""
         try:
-            container = self.client.containers.get(container_id)
-            stats = container.stats(stream=False)
-            
-            # Calculate CPU percentage
-            cpu_stats = stats.get("cpu_stats", {})
-            precpu_stats = stats.get("precpu_stats", {})
-            
-            cpu_usage = cpu_stats.get("cpu_usage", {}).get("total_usage", 0)
-            precpu_usage = precpu_stats.get("cpu_usage", {}).get("total_usage", 0)
-            
-            system_cpu_usage = cpu_stats.get("system_cpu_usage", 0)
-            pre_system_cpu_usage = precpu_stats.get("system_cpu_usage", 0)
-            
-            cpu_percent = 0.0
-            cpu_delta = cpu_usage - precpu_usage
-            system_delta = system_cpu_usage - pre_system_cpu_usage
-            
-            if system_delta > 0 and cpu_delta > 0:
-                # Number of CPU cores
-                num_cores = len(cpu_stats.get("cpu_usage", {}).get("percpu_usage") or [1])
-                cpu_percent = (cpu_delta / system_delta) * num_cores * 100.0
-
-            # Memory stats
-            mem_stats = stats.get("memory_stats", {})
-            memory_usage = mem_stats.get("usage", 0)
-            memory_limit = mem_stats.get("limit", 0)
-            memory_percent = (memory_usage / memory_limit * 100.0) if memory_limit > 0 else 0.0
-
-            # Network stats
-            network_rx = 0
-            network_tx = 0
-            networks = stats.get("networks", {})
-            for network in networks.values():
-                network_rx += network.get("rx_bytes", 0)
-                network_tx += network.get("tx_bytes", 0)
-
-            return ContainerStats(
-                container_id=container_id,
-                cpu_percent=round(cpu_percent, 2),
-                memory_usage=memory_usage,
-                memory_limit=memory_limit,
-                memory_percent=round(memory_percent, 2),
-                network_rx=network_rx,
-                network_tx=network_tx
+            response = await self.transport.request(
+                "GET", f"/containers/{container_id}/stats", params={"stream": False}
             )
+            return self.parse_stats(container_id, response.json())
         except Exception as e:
             print(f"Error getting container stats: {e}")
             return None
 
-    def get_container_logs(self, container_id: str, tail: int = 100, follow: bool = False):
+    @docker_operations.timed("stats")
+    async def sample_container_stats(self, container_id: str) -> ContainerStats:
+        """Take one stats sample on a dedicated connection, raising on errors
+
+        The daemon holds a one-shot stats request for a sampling interval, so
+        unlike get_container_stats this does not occupy a pooled slot; callers
+        sampling many containers bound their own concurrency.
+        """
+        response = await self.transport.stream(
+            "GET", f"/containers/{container_id}/stats", params={"stream": False}
+        )
+        try:
+            await response.read()
+        finally:
+            response.close()
+        return self.parse_stats(container_id, response.json())
+
+    async def stream_container_stats(self, container_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """Stream raw stats samples, one per second, until the container stops"""
+        response = await self.transport.stream(
+            "GET", f"/containers/{container_id}/stats", params={"stream": True}
+        )
+        try:
+            async for sample in response.iter_json():
+                yield sample
+        finally:
+            response.close()
+
+    @staticmethod
+    def parse_stats(container_id: str, stats: Dict[str, Any]) -> ContainerStats:
+        """Build ContainerStats from a raw Docker stats sample"""
+        # Calculate CPU percentage
+        cpu_stats = stats.get("cpu_stats", {})
+        precpu_stats = stats.get("precpu_stats", {})
+
+        cpu_usage = cpu_stats.get("cpu_usage", {}).get("total_usage", 0)
+        precpu_usage = precpu_stats.get("cpu_usage", {}).get("total_usage", 0)
+
+        system_cpu_usage = cpu_stats.get("system_cpu_usage", 0)
+        pre_system_cpu_usage = precpu_stats.get("system_cpu_usage", 0)
+
+        cpu_percent = 0.0
+        cpu_delta = cpu_usage - precpu_usage
+        system_delta = system_cpu_usage - pre_system_cpu_usage
+
+        # The first sample of a stream has no previous reading to compare against
+        if pre_system_cpu_usage > 0 and system_delta > 0 and cpu_delta > 0:
+            # Number of CPU cores
+            num_cores = len(cpu_stats.get("cpu_usage", {}).get("percpu_usage") or [1])
+            cpu_percent = (cpu_delta / system_delta) * num_cores * 100.0
+
+        # Memory stats
+        mem_stats = stats.get("memory_stats", {})
+        memory_usage = mem_stats.get("usage", 0)
+        memory_limit = mem_stats.get("limit", 0)
+        memory_percent = (memory_usage / memory_limit * 100.0) if memory_limit > 0 else 0.0
+
+        # Network stats
+        network_rx = 0
+        network_tx = 0
+        networks = stats.get("networks", {})
+        for network in networks.values():
+            network_rx += network.get("rx_bytes", 0)
+            network_tx += network.get("tx_bytes", 0)
+
+        return ContainerStats(
+            container_id=container_id,
+            cpu_percent=round(cpu_percent, 2),
+            memory_usage=memory_usage,
+            memory_limit=memory_limit,
+            memory_percent=round(memory_percent, 2),
+            network_rx=network_rx,
+            network_tx=network_tx
+        )
+
+    @docker_operations.timed("logs", failed=None)
+    async def get_container_logs(self, container_id: str, tail: int = 100) -> Optional[str]:
         """Get container logs"""
         try:
-            container = self.client.containers.get(container_id)
-            return container.logs(tail=tail, follow=follow, stream=follow)
+            lines = []
+            async for _, line in self.stream_container_logs(container_id, tail=tail):
+                lines.append(line)
+            return b"".join(lines).decode("utf-8", errors="replace")
         except Exception as e:
             print(f"Error getting container logs: {e}")
             return None
 
-    def exec_command(self, container_id: str, command: str = "/bin/sh"):
-        """Execute command in container"""
+    async def stream_container_logs(self, container_id: str, tail: Optional[int] = 100,
+                                    follow: bool = False, since: Optional[str] = None,
+                                    timestamps: bool = False) -> AsyncIterator[Tuple[str, bytes]]:
+        """Yield (stream, line) pairs of container output, lines keeping their newline"""
+        # TTY containers send raw output; others use the multiplexed framing
+        tty = (await self.inspect_container(container_id)).get("Config", {}).get("Tty", False)
+        response = await self.transport.stream(
+            "GET", f"/containers/{container_id}/logs",
+            params={
+                "stdout": True,
+                "stderr": True,
+                "follow": follow,
+                "timestamps": timestamps,
+                "tail": "all" if tail is None else tail,
+                "since": since,
+            }
+        )
+        pending: Dict[str, bytes] = {}
         try:
-            container = self.client.containers.get(container_id)
-            return container.exec_run(command, stdin=True, stdout=True, stderr=True, tty=True, stream=True, detach=False)
+            async for stream, data in self._read_frames(response, tty):
+                data = pending.pop(stream, b"") + data
+                *lines, rest = data.split(b"\n")
+                for line in lines:
+                    yield stream, line + b"\n"
+                if rest:
+                    pending[stream] = rest
+            for stream, rest in pending.items():
+                yield stream, rest
+        finally:
+            response.close()
+
+    @staticmethod
+    async def _read_frames(response, tty: bool) -> AsyncIterator[Tuple[str, bytes]]:
+        """Split a log or exec body into (stream, data) frames"""
+        if tty:
+            while True:
+                chunk = await response.read_chunk()
+                if not chunk:
+                    return
+                yield "stdout", chunk
+        while True:
+            header = await response.read_exactly(8)
+            if not header:
+                return
+            stream_type, size = struct.unpack(">BxxxL", header)
+            data = await response.read_exactly(size) if size else b""
+            if size and not data:
+                return
+            yield LOG_STREAMS.get(stream_type, "stdout"), data
+
+    @docker_operations.timed("exec", failed=None)
+    async def exec_command(self, container_id: str, command: str = "/bin/sh") -> Optional[str]:
+        """Execute a non-interactive command in a container and return its output"""
+        try:
+            exec_id = await self._create_exec(container_id, command, interactive=False)
+            response = await self.transport.stream(
+                "POST", f"/exec/{exec_id}/start", body={"Detach": False, "Tty": False}
+            )
+            output = []
+            try:
+                async for _, data in self._read_frames(response, tty=False):
+                    output.append(data)
+            finally:
+                response.close()
+            return b"".join(output).decode("utf-8", errors="replace")
         except Exception as e:
             print(f"Error executing command: {e}")
             return None
 
+    @docker_operations.timed("exec")
+    async def open_exec(self, container_id: str, command: str = "/bin/sh") -> Tuple[str, asyncio.StreamReader, asyncio.StreamWriter]:
+        """Start an interactive TTY exec and take over its connection"""
+        exec_id = await self._create_exec(container_id, command, interactive=True)
+        response = await self.transport.stream(
+            "POST", f"/exec/{exec_id}/start",
+            body={"Detach": False, "Tty": True},
+            headers={"Connection": "Upgrade", "Upgrade": "tcp"}
+        )
+        reader, writer = response.detach()
+        return exec_id, reader, writer
+
+    async def _create_exec(self, container_id: str, command: str, interactive: bool) -> str:
+        response = await self.transport.request(
+            "POST", f"/containers/{container_id}/exec",
+            body={
+                "AttachStdin": interactive,
+                "AttachStdout": True,
+                "AttachStderr": True,
+                "Tty": interactive,
+                "Cmd": command.split() if isinstance(command, str) else command,
+            }
+        )
+        return response.json()["Id"]
+
+    @docker_operations.timed("resize")
+    async def resize_exec(self, exec_id: str, rows: int, cols: int):
+        """Resize the TTY of an exec instance"""
+        await self.transport.request("POST", f"/exec/{exec_id}/resize", params={"h": rows, "w": cols})
+
+    async def events(self, since: Optional[int] = None,
+                     filters: Optional[Dict[str, List[str]]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Stream daemon events until the connection drops"""
+        response = await self.transport.stream("GET", "/events", params={"since": since, "filters": filters})
+        try:
+            async for event in response.iter_json():
+                yield event
+        finally:
+            response.close()
+
 
 # Singleton instance
-docker_client = DockerClient()
\ No newline at end of file
+docker_client = DockerClient()
@@ -0,0 +1,361 @@
+import asyncio
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from urllib.parse import quote, urlencode
+
+
+class DockerAPIError(Exception):
+    """Error response from the Docker daemon"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(f"Docker API error {status}: {message}")
+        self.status = status
+        self.message = message
+
+
+class DockerNotFound(DockerAPIError):
+    """The requested Docker object does not exist"""
+
+
+class _Connection:
+    """One HTTP/1.1 connection to the daemon socket"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    @property
+    def usable(self) -> bool:
+        return not self.writer.is_closing() and not self.reader.at_eof()
+
+    def close(self):
+        self.writer.close()
+
+
+class DockerResponse:
+    """A response whose body is read incrementally from its connection"""
+
+    READ_SIZE = 64 * 1024
+
+    def __init__(self, transport: "DockerTransport", conn: _Connection, status: int,
+                 headers: Dict[str, str], has_body: bool):
+        self.status = status
+        self.headers = headers
+        self.content = b""
+        self._transport = transport
+        self._conn: Optional[_Connection] = conn
+        self._buffer = bytearray()
+        self._chunked = "chunked" in headers.get("transfer-encoding", "").lower()
+        length = headers.get("content-length")
+        self._remaining = int(length) if length is not None and not self._chunked else None
+        self._keep_alive = headers.get("connection", "").lower() != "close" and (
+            self._chunked or self._remaining is not None or not has_body
+        )
+        self._done = not has_body or self._remaining == 0
+        # An upgraded (hijacked) connection is kept for detach(), never pooled
+        if status == 101:
+            self._keep_alive = False
+        elif self._done:
+            self._release()
+
+    async def read_chunk(self) -> bytes:
+        """Next piece of the body; b"" once the body is exhausted"""
+        if self._buffer:
+            data = bytes(self._buffer)
+            self._buffer.clear()
+            return data
+        return await self._read_body()
+
+    async def _read_body(self) -> bytes:
+        """Next piece of the body from the connection, bypassing the buffer"""
+        if self._done or self._conn is None:
+            return b""
+        reader = self._conn.reader
+        if self._chunked:
+            size_line = await reader.readline()
+            if not size_line:
+                raise ConnectionResetError("Docker closed the connection mid-response")
+            size = int(size_line.split(b";", 1)[0].strip() or b"0", 16)
+            if size == 0:
+                # Skip trailers up to the terminating blank line
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                self._finish()
+                return b""
+            data = await reader.readexactly(size)
+            await reader.readexactly(2)
+            return data
+        if self._remaining is not None:
+            data = await reader.read(min(self._remaining, self.READ_SIZE))
+            if not data:
+                raise ConnectionResetError("Docker closed the connection mid-response")
+            self._remaining -= len(data)
+            if self._remaining == 0:
+                self._finish()
+            return data
+        # No framing: the body runs until the daemon closes the connection
+        data = await reader.read(self.READ_SIZE)
+        if not data:
+            self._finish()
+        return data
+
+    async def read(self) -> bytes:
+        """Read the rest of the body"""
+        parts = []
+        while True:
+            chunk = await self.read_chunk()
+            if not chunk:
+                break
+            parts.append(chunk)
+        self.content = b"".join(parts)
+        return self.content
+
+    async def read_exactly(self, size: int) -> bytes:
+        """Read exactly size bytes, or b"" if the body ends first"""
+        while len(self._buffer) < size:
+            chunk = await self._read_body()
+            if not chunk:
+                return b""
+            self._buffer += chunk
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def json(self) -> Any:
+        """Decode a fully read JSON body"""
+        return json.loads(self.content) if self.content else None
+
+    async def iter_lines(self) -> AsyncIterator[bytes]:
+        """Yield newline-terminated lines of the body as they arrive"""
+        pending = b""
+        while True:
+            chunk = await self.read_chunk()
+            if not chunk:
+                break
+            pending += chunk
+            *lines, pending = pending.split(b"\n")
+            for line in lines:
+                yield line
+        if pending:
+            yield pending
+
+    async def iter_json(self) -> AsyncIterator[Any]:
+        """Yield the JSON documents of a streaming endpoint (stats, events, pulls)"""
+        async for line in self.iter_lines():
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+    def detach(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        """Take over the raw connection after a hijack (exec attach)"""
+        conn = self._conn
+        self._conn = None
+        self._done = True
+        return conn.reader, conn.writer
+
+    def close(self):
+        """Release the connection, dropping it if the body was not consumed"""
+        if self._conn is None:
+            return
+        if self._done:
+            self._release()
+        else:
+            self._conn.close()
+            self._conn = None
+
+    def _finish(self):
+        self._done = True
+        self._release()
+
+    def _release(self):
+        conn = self._conn
+        self._conn = None
+        if conn is None:
+            return
+        if self._keep_alive:
+            self._transport._put_idle(conn)
+        else:
+            conn.close()
+
+
+class DockerTransport:
+    """Pooled HTTP/1.1 client for the Docker Engine API on a Unix socket"""
+
+    def __init__(self, socket_path: str, max_connections: int = 10, timeout: float = 30.0):
+        self.socket_path = socket_path
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._idle: List[_Connection] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def request(self, method: str, path: str, params: Optional[Dict[str, Any]] = None,
+                      body: Any = None, headers: Optional[Dict[str, str]] = None,
+                      timeout: Optional[float] = -1) -> DockerResponse:
+        """Send a request and read the whole response body
+
+        At most max_connections of these run at once. timeout defaults to the
+        transport timeout; None disables it.
+        """
+        timeout = self.timeout if timeout == -1 else timeout
+        async with self._get_slots():
+            return await asyncio.wait_for(self._buffered(method, path, params, body, headers), timeout)
+
+    async def stream(self, method: str, path: str, params: Optional[Dict[str, Any]] = None,
+                     body: Any = None, headers: Optional[Dict[str, str]] = None,
+                     timeout: Optional[float] = -1) -> DockerResponse:
+        """Send a request and return as soon as the response headers arrive
+
+        Streams are long-lived, so they do not count against max_connections.
+        The caller must close() the response. timeout only bounds the wait for
+        the headers.
+        """
+        timeout = self.timeout if timeout == -1 else timeout
+        response = await asyncio.wait_for(self._send(method, path, params, body, headers), timeout)
+        if response.status >= 400:
+            await self._raise_for_status(response)
+        return response
+
+    async def close(self):
+        """Close idle pooled connections"""
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    async def _buffered(self, method, path, params, body, headers) -> DockerResponse:
+        response = await self._send(method, path, params, body, headers)
+        try:
+            await response.read()
+        finally:
+            response.close()
+        if response.status >= 400:
+            await self._raise_for_status(response)
+        return response
+
+    async def _raise_for_status(self, response: DockerResponse):
+        if not response.content:
+            try:
+                await asyncio.wait_for(response.read(), 5)
+            except Exception:
+                pass
+            finally:
+                response.close()
+        message = response.content.decode("utf-8", errors="replace").strip()
+        try:
+            message = json.loads(message).get("message", message)
+        except (ValueError, AttributeError):
+            pass
+        error = DockerNotFound if response.status == 404 else DockerAPIError
+        raise error(response.status, message)
+
+    async def _send(self, method, path, params, body, headers) -> DockerResponse:
+        """Write the request and parse the status line and headers
+
+        A pooled connection the daemon has silently closed is retried once on
+        a fresh connection.
+        """
+        request_head, payload = self._encode(method, path, params, body, headers)
+        for attempt in range(2):
+            conn, reused = await self._acquire(fresh=attempt > 0)
+            try:
+                conn.writer.write(request_head)
+                if isinstance(payload, (bytes, bytearray)):
+                    conn.writer.write(payload)
+                elif payload is not None:
+                    async for chunk in payload:
+                        if chunk:
+                            conn.writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                            await conn.writer.drain()
+                    conn.writer.write(b"0\r\n\r\n")
+                await conn.writer.drain()
+                status_line = await conn.reader.readline()
+                if not status_line:
+                    raise ConnectionResetError("Docker closed the connection")
+            except (ConnectionError, asyncio.IncompleteReadError):
+                conn.close()
+                if reused and not attempt and (payload is None or isinstance(payload, (bytes, bytearray))):
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            break
+
+        try:
+            status = int(status_line.split(b" ", 2)[1])
+            response_headers: Dict[str, str] = {}
+            while True:
+                line = await conn.reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                response_headers[name.strip().lower()] = value.strip()
+        except BaseException:
+            conn.close()
+            raise
+
+        has_body = method != "HEAD" and status not in (101, 204, 304)
+        return DockerResponse(self, conn, status, response_headers, has_body)
+
+    def _encode(self, method, path, params, body, headers):
+        query = {}
+        for key, value in (params or {}).items():
+            if value is None:
+                continue
+            if isinstance(value, bool):
+                value = "1" if value else "0"
+            elif isinstance(value, (dict, list)):
+                value = json.dumps(value)
+            query[key] = value
+        target = quote(path, safe="/:@")
+        if query:
+            target += "?" + urlencode(query)
+
+        lines = [f"{method} {target} HTTP/1.1", "Host: docker"]
+        extra = dict(headers or {})
+        payload = None
+        if isinstance(body, (dict, list)):
+            payload = json.dumps(body).encode("utf-8")
+            extra.setdefault("Content-Type", "application/json")
+        elif isinstance(body, (bytes, bytearray)):
+            payload = bytes(body)
+        elif body is not None:
+            # Async iterable of bytes, e.g. a build context
+            payload = body
+            extra["Transfer-Encoding"] = "chunked"
+        if isinstance(payload, bytes) or method in ("POST", "PUT"):
+            if "Transfer-Encoding" not in extra:
+                extra["Content-Length"] = str(len(payload or b""))
+        for name, value in extra.items():
+            lines.append(f"{name}: {value}")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"), payload
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        self._check_loop()
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_connections)
+        return self._slots
+
+    def _check_loop(self):
+        # Pooled connections and the semaphore belong to the loop that made them
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._idle = []
+            self._slots = None
+
+    async def _acquire(self, fresh: bool = False) -> Tuple[_Connection, bool]:
+        self._check_loop()
+        while self._idle and not fresh:
+            conn = self._idle.pop()
+            if conn.usable:
+                return conn, True
+            conn.close()
+        reader, writer = await asyncio.open_unix_connection(self.socket_path)
+        return _Connection(reader, writer), False
+
+    def _put_idle(self, conn: _Connection):
+        if conn.usable and len(self._idle) < self.max_connections:
+            self._idle.append(conn)
+        else:
+            conn.close()
@@ -0,0 +1,310 @@
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from .patching import PatchError, apply_unified_diff
+
+
+class BatchError(Exception):
+    """An operation that stops a batch; none of the batch is applied"""
+
+    def __init__(self, index: int, status: int, message: str):
+        super().__init__(message)
+        self.index = index
+        self.status = status
+        self.message = message
+
+
+class BatchPlan:
+    """Checks a batch of file operations against a simulated project
+
+    Each operation is validated against the state the earlier ones leave
+    behind, without touching the disk, and turned into a step for
+    FileManager to execute. Paths are full paths already known to be inside
+    the project. The overlay maps a path to its simulated state: a file with
+    new content, a new directory, a moved tree still on disk under its old
+    path, or None when deleted.
+    """
+
+    def __init__(self):
+        self.steps: List[Tuple] = []
+        self.results: List[dict] = []
+        self._overlay: Dict[str, Tuple[str, object]] = {}
+
+    def add(self, index: int, operation: dict, path: Path, new_path: Optional[Path]):
+        """Validate one operation and plan it, or raise BatchError"""
+        op = operation["op"]
+        key = os.path.normpath(path)
+        result = {"index": index, "op": op, "path": operation["path"], "status": "ok"}
+        if op in ("create", "write"):
+            data = self._new_content(index, operation, key)
+            self._make_parents(index, key)
+            self._overlay[key] = ("file", data)
+            self.steps.append(("write", path, data))
+            result.update(sha256=hashlib.sha256(data).hexdigest(), size=len(data))
+        elif op == "mkdir":
+            kind = self.kind(key)
+            if kind == "file":
+                raise BatchError(index, 409, "A file with that name already exists")
+            if kind is None:
+                self._make_parents(index, key)
+                self._overlay[key] = ("dir", None)
+            self.steps.append(("mkdir", path))
+        elif op == "rename":
+            if new_path is None:
+                raise BatchError(index, 400, "rename needs new_path")
+            target = os.path.normpath(new_path)
+            if self.kind(key) is None:
+                raise BatchError(index, 404, "File not found")
+            if self.kind(target) is not None:
+                raise BatchError(index, 409, "Target already exists")
+            if target.startswith(key + os.sep):
+                raise BatchError(index, 400, "Cannot move a directory into itself")
+            self._make_parents(index, target)
+            self._move(key, target)
+            self.steps.append(("rename", path, new_path))
+            result["new_path"] = operation["new_path"]
+        elif op == "delete":
+            if self.kind(key) is None:
+                raise BatchError(index, 404, "File not found")
+            self._drop_below(key)
+            self._overlay[key] = None
+            self.steps.append(("delete", path))
+        else:
+            raise BatchError(index, 400, f"Unknown operation {op}")
+        self.results.append(result)
+
+    def kind(self, key: str) -> Optional[str]:
+        """'file', 'dir' or None for a path as the planned steps leave it"""
+        planned, disk_path = self._locate(key)
+        if disk_path is None:
+            return planned
+        return "dir" if os.path.isdir(disk_path) else "file" if os.path.lexists(disk_path) else None
+
+    def _new_content(self, index: int, operation: dict, key: str) -> bytes:
+        kind = self.kind(key)
+        if operation["op"] == "create":
+            if kind is not None:
+                raise BatchError(index, 409, "File already exists")
+            return (operation.get("content") or "").encode("utf-8")
+
+        if kind == "dir":
+            raise BatchError(index, 409, "Path is a directory")
+        content, patch = operation.get("content"), operation.get("patch")
+        if (content is None) == (patch is None):
+            raise BatchError(index, 400, "Send either content or patch")
+        current = self._read(key) if kind == "file" else None
+        base_sha256 = operation.get("base_sha256")
+        if base_sha256 is not None:
+            current_hash = hashlib.sha256(current).hexdigest() if current is not None else None
+            if current_hash != base_sha256.lower():
+                raise BatchError(index, 409, "File has changed since it was read")
+        if patch is not None:
+            try:
+                content = apply_unified_diff((current or b"").decode("utf-8"), patch)
+            except UnicodeDecodeError:
+                raise BatchError(index, 422, "Patch does not apply: File is not UTF-8 text")
+            except PatchError as e:
+                raise BatchError(index, 422, f"Patch does not apply: {e}")
+        return content.encode("utf-8")
+
+    def _make_parents(self, index: int, key: str):
+        """Plan the missing parent directories that writing key creates"""
+        missing = []
+        parent = os.path.dirname(key)
+        while True:
+            kind = self.kind(parent)
+            if kind == "dir":
+                break
+            if kind == "file":
+                raise BatchError(index, 409, "A parent of the path is a file")
+            missing.append(parent)
+            parent = os.path.dirname(parent)
+        for directory in missing:
+            self._overlay[directory] = ("dir", None)
+
+    def _move(self, source: str, target: str):
+        """Move source's simulated state, and everything planned below it, to target"""
+        entry = self._overlay.get(source)
+        if entry is None or entry[0] == "tree":
+            # Still (partly) on disk: remember where its contents live
+            self._overlay[target] = ("tree", self._locate(source)[1])
+        else:
+            self._overlay[target] = entry
+        prefix = source + os.sep
+        for key in [key for key in self._overlay if key.startswith(prefix)]:
+            self._overlay[target + key[len(source):]] = self._overlay.pop(key)
+        self._overlay[source] = None
+
+    def _drop_below(self, key: str):
+        prefix = key + os.sep
+        for child in [child for child in self._overlay if child.startswith(prefix)]:
+            del self._overlay[child]
+
+    def _locate(self, key: str) -> Tuple[Optional[str], Optional[str]]:
+        """(planned kind, None) for a path the plan creates, (None, disk path) for one still on disk"""
+        path = key
+        while True:
+            if path in self._overlay:
+                entry = self._overlay[path]
+                if entry is None:
+                    return None, None
+                kind, value = entry
+                if kind == "tree":
+                    return None, value + key[len(path):]
+                if path != key:
+                    # Below a new file or a new, so far empty, directory
+                    return None, None
+                return kind, None
+            parent = os.path.dirname(path)
+            if parent == path:
+                return None, key
+            path = parent
+
+    def _read(self, key: str) -> Optional[bytes]:
+        entry = self._overlay.get(key)
+        if entry is not None and entry[0] == "file":
+            return entry[1]
+        disk_path = self._locate(key)[1]
+        if disk_path is None:
+            return None
+        try:
+            with open(disk_path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+
+class RollbackJournal:
+    """Undo log for a batch being applied
+
+    Replaced files are kept as hard links and removed ones are moved into
+    staging_dir, so rolling back only renames things back into place. Each
+    step is written to staging_dir/journal before it runs, and the file is
+    locked while the batch is applied, so recover() can undo a batch whose
+    process died midway.
+    """
+
+    def __init__(self, staging_dir: Path):
+        self.staging_dir = staging_dir
+        self._undo: List[dict] = []
+        self._saved = 0
+        self._journal = None
+
+    def created(self, path: Path):
+        """path did not exist and is about to be created"""
+        self._record({"created": str(path)})
+
+    def replacing(self, path: Path):
+        """The existing file at path is about to be replaced with a new one"""
+        backup = self._next_staging_path()
+        self._record({"replaced": str(path), "backup": str(backup)})
+        try:
+            os.link(path, backup)
+        except OSError:
+            shutil.copy2(path, backup)
+
+    def move(self, source: Path, target: Path):
+        self._record({"moved": str(source), "to": str(target)})
+        os.rename(source, target)
+
+    def remove(self, path: Path):
+        """Delete path by moving it into staging"""
+        saved = self._next_staging_path()
+        self._record({"removed": str(path), "saved": str(saved)})
+        shutil.move(str(path), str(saved))
+
+    def rollback(self):
+        """Undo everything recorded, newest first"""
+        self._undo_all(self._undo)
+        self.discard()
+
+    def discard(self):
+        """Forget the undo log and the data it kept"""
+        self._undo.clear()
+        if self._journal is not None:
+            # Removing the journal first commits the batch even if the rest of the cleanup doesn't happen
+            os.unlink(self.staging_dir / "journal")
+            self._journal.close()
+            self._journal = None
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+    @classmethod
+    def recover(cls, batches_dir: Path) -> int:
+        """Roll back the batches left in batches_dir by processes that died
+
+        A batch still being applied holds a lock on its journal and is left
+        alone. Returns the number of batches rolled back.
+        """
+        recovered = 0
+        try:
+            entries = list(os.scandir(batches_dir))
+        except FileNotFoundError:
+            return 0
+        for entry in entries:
+            staging_dir = Path(entry.path)
+            try:
+                with open(staging_dir / "journal") as journal:
+                    try:
+                        fcntl.flock(journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        continue
+                    steps = []
+                    for line in journal:
+                        try:
+                            steps.append(json.loads(line))
+                        except ValueError:
+                            # A record cut short by the crash; its step never ran
+                            break
+                    cls._undo_all(steps)
+                    os.unlink(staging_dir / "journal")
+                recovered += 1
+            except FileNotFoundError:
+                # Committed, or not yet started: its own process cleans up
+                continue
+            except OSError as e:
+                print(f"Error recovering file batch {entry.name}: {e}")
+                continue
+            shutil.rmtree(staging_dir, ignore_errors=True)
+        return recovered
+
+    @staticmethod
+    def _undo_all(steps: List[dict]):
+        # A step is recorded before it runs, so each undo checks it actually happened
+        for step in reversed(steps):
+            try:
+                if "created" in step:
+                    path = step["created"]
+                    if os.path.isdir(path) and not os.path.islink(path):
+                        shutil.rmtree(path)
+                    elif os.path.lexists(path):
+                        os.unlink(path)
+                elif "replaced" in step:
+                    if os.path.lexists(step["backup"]):
+                        os.replace(step["backup"], step["replaced"])
+                elif "moved" in step:
+                    if os.path.lexists(step["to"]) and not os.path.lexists(step["moved"]):
+                        os.rename(step["to"], step["moved"])
+                elif "removed" in step:
+                    if os.path.lexists(step["saved"]):
+                        shutil.move(step["saved"], step["removed"])
+            except Exception as e:
+                print(f"Error rolling back file batch: {e}")
+
+    def _record(self, step: dict):
+        if self._journal is None:
+            self.staging_dir.mkdir(parents=True, exist_ok=True)
+            self._journal = open(self.staging_dir / "journal", "a")
+            fcntl.flock(self._journal, fcntl.LOCK_EX)
+        self._journal.write(json.dumps(step) + "\n")
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        self._undo.append(step)
+
+    def _next_staging_path(self) -> Path:
+        self.staging_dir.mkdir(parents=True, exist_ok=True)
+        self._saved += 1
+        return self.staging_dir / str(self._saved)
@@ -1,62 +1,293 @@
+import bisect
+import errno
+import hashlib
+import io
 import os
+import shutil
+import stat
+import tempfile
+import threading
+import uuid
+from contextlib import contextmanager
+from itertools import islice
 from pathlib import Path
-from typing import List, Optional
-from .schemas import FileTreeItem
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+from .dir_cache import DirectoryCache
+from .file_batch import BatchError, BatchPlan, RollbackJournal
+from .ignore_rules import IgnoreRules, ancestor_rules, default_rules, is_ignored, load_gitignore
+from .metrics import file_operations
+from .patching import PatchError, apply_unified_diff
+
+
+class FileConflictError(Exception):
+    """A write based on a version of the file that is no longer current"""
+
+    def __init__(self, current_sha256: Optional[str]):
+        super().__init__("File has changed since it was read")
+        self.current_sha256 = current_sha256
 
 
 class FileManager:
-    def __init__(self, base_path: str = "/app/projects"):
+    def __init__(self, base_path: str = "/app/projects", cache_names: int = 200000):
         self.base_path = Path(base_path)
         self.base_path.mkdir(parents=True, exist_ok=True)
+        self.ignore_rules = default_rules()
+        self.listings = DirectoryCache(max_names=cache_names)
+        self._write_locks = [threading.Lock() for _ in range(64)]
+        self._listeners: List[Callable[[str, str], None]] = []
+        self._usage_listeners: List[Callable[[str, int, int], None]] = []
+        # Resolved project directories, so path checks don't resolve the root each time
+        self._roots: Dict[str, Path] = {}
+
+    def add_change_listener(self, listener: Callable[[str, str], None]):
+        """Call listener(project_name, path) after a file or directory changes
+
+        path is relative to the project root and may name a whole directory
+        that was created, renamed or removed.
+        """
+        self._listeners.append(listener)
+
+    def add_usage_listener(self, listener: Callable[[str, int, int], None]):
+        """Call listener(project_name, bytes_delta, files_delta) when a change resizes a project
+
+        Only regular files count. Changes are measured by statting the
+        affected paths before and after, so a directory that is deleted or
+        overwritten by a batch is walked.
+        """
+        self._usage_listeners.append(listener)
+
+    @file_operations.timed("usage")
+    def disk_usage(self, project_name: str) -> Tuple[int, int]:
+        """Bytes and number of regular files in a project, by walking it"""
+        return self._tree_usage(str(self.get_project_path(project_name)))
 
     def get_project_path(self, project_name: str) -> Path:
         """Get the path for a project"""
         return self.base_path / project_name
 
+    def project_root(self, project_name: str) -> Path:
+        """The project directory with symlinks resolved, remembered per project"""
+        root = self._roots.get(project_name)
+        if root is None:
+            root = self._roots[project_name] = self.get_project_path(project_name).resolve()
+        return root
+
+    def forget_project(self, project_name: str):
+        """Drop what project_root remembers, e.g. once the project is deleted"""
+        self._roots.pop(project_name, None)
+
     def create_project_directory(self, project_name: str) -> Path:
         """Create a project directory"""
         project_path = self.get_project_path(project_name)
         project_path.mkdir(parents=True, exist_ok=True)
         return project_path
 
-    def list_files(self, project_name: str, subpath: str = "") -> List[FileTreeItem]:
-        """List files in a project directory"""
+    @file_operations.timed("list")
+    def list_files(self, project_name: str, subpath: str = "", depth: int = 1, cursor: Optional[str] = None,
+                   limit: Optional[int] = None, include_ignored: bool = False) -> Tuple[List[dict], Optional[str]]:
+        """List files in a project directory, descending depth levels
+
+        Entries are sorted by name and returned as plain dicts shaped like
+        FileTreeItem. With a limit, each directory lists at most limit entries:
+        the returned cursor continues the top directory, and nested directories
+        that were cut short carry their own next_cursor.
+        """
         project_path = self.get_project_path(project_name)
         target_path = project_path / subpath if subpath else project_path
-        
-        if not target_path.exists():
-            return []
-        
+
+        # Security check: ensure directory is within project directory
+        try:
+            target_path.resolve().relative_to(self.project_root(project_name))
+        except ValueError:
+            return [], None
+
         if not target_path.is_dir():
-            return []
+            return [], None
+
+        relative = os.path.normpath(subpath).replace(os.sep, "/") if subpath else ""
+        relative = "" if relative == "." else relative
+        rules = None if include_ignored else self._ancestor_rules(project_path, relative)
+        return self._list_directory(str(target_path), relative, rules, depth, cursor, limit)
+
+    def _ancestor_rules(self, project_path: Path, relative: str) -> List[IgnoreRules]:
+        """Ignore rules in force for a directory, from its parents' .gitignore files"""
+        return ancestor_rules(self.ignore_rules, str(project_path), relative)
+
+    def _list_directory(self, directory: str, relative: str, rules: Optional[List[IgnoreRules]], depth: int,
+                        cursor: Optional[str], limit: Optional[int]) -> Tuple[List[dict], Optional[str]]:
+        """One page of a directory listing, served from the listing cache"""
+        try:
+            entries = self.listings.get(directory)
+        except OSError:
+            return [], None
 
+        if rules is not None:
+            position = bisect.bisect_left(entries, (".gitignore", False))
+            if position < len(entries) and entries[position][0] == ".gitignore":
+                gitignore = load_gitignore(directory, relative)
+                if gitignore is not None:
+                    rules = rules + [gitignore]
+
+        # Entries are sorted by name, so a page starts right after the cursor
+        start = bisect.bisect_right(entries, (cursor, True)) if cursor is not None else 0
         items = []
-        for item in sorted(target_path.iterdir()):
-            relative_path = str(item.relative_to(project_path))
-            items.append(FileTreeItem(
-                name=item.name,
-                path=relative_path,
-                is_directory=item.is_dir(),
-                children=self._get_children(item, project_path) if item.is_dir() else None
-            ))
-        return items
-
-    def _get_children(self, directory: Path, base_path: Path) -> List[FileTreeItem]:
-        """Recursively get children for directory tree"""
-        children = []
-        try:
-            for item in sorted(directory.iterdir()):
-                relative_path = str(item.relative_to(base_path))
-                children.append(FileTreeItem(
-                    name=item.name,
-                    path=relative_path,
-                    is_directory=item.is_dir(),
-                    children=self._get_children(item, base_path) if item.is_dir() else None
-                ))
-        except PermissionError:
-            pass
-        return children
+        next_cursor = None
+        for name, is_dir in islice(entries, start, None):
+            path = f"{relative}/{name}" if relative else name
+            if rules is not None and is_ignored(rules, path, is_dir):
+                continue
+            if limit is not None and len(items) == limit:
+                next_cursor = items[-1]["name"]
+                break
+            children, children_cursor = None, None
+            if is_dir and depth > 1:
+                children, children_cursor = self._list_directory(
+                    os.path.join(directory, name), path, rules, depth - 1, None, limit
+                )
+            items.append({
+                "name": name,
+                "path": path,
+                "is_directory": is_dir,
+                "children": children,
+                "next_cursor": children_cursor,
+            })
+        return items, next_cursor
+
+    def walk(self, project_name: str, subpath: str = "",
+             include_ignored: bool = False) -> Iterator[Tuple[str, os.stat_result]]:
+        """(relative path, lstat) of directories and regular files at or below subpath
+
+        Files come before the subdirectories beside them, and each
+        directory right before its contents. subpath itself is included
+        only when it is a file. Symlinks and special files are skipped, so
+        a walk never leaves the project.
+        """
+        project_path = self.get_project_path(project_name)
+        top = self.resolve_path(project_name, subpath)
+        if top is None:
+            return
+        relative = os.path.normpath(subpath).replace(os.sep, "/") if subpath else ""
+        relative = "" if relative == "." else relative
+        rules = None if include_ignored else self._ancestor_rules(project_path, relative)
+        try:
+            st = os.lstat(top)
+        except OSError:
+            return
+        if stat.S_ISREG(st.st_mode):
+            if rules is None or not is_ignored(rules, relative, False):
+                yield relative, st
+            return
+        if not stat.S_ISDIR(st.st_mode) or (relative and rules is not None and is_ignored(rules, relative, True)):
+            return
+
+        stack = [(str(top), relative, rules, None)]
+        while stack:
+            directory, directory_relative, rules, directory_stat = stack.pop()
+            if directory_stat is not None:
+                yield directory_relative, directory_stat
+            if rules is not None:
+                gitignore = load_gitignore(directory, directory_relative)
+                if gitignore is not None:
+                    rules = rules + [gitignore]
+            try:
+                with os.scandir(directory) as it:
+                    entries = sorted(it, key=lambda entry: entry.name)
+            except OSError:
+                continue
+            subdirectories = []
+            for entry in entries:
+                path = f"{directory_relative}/{entry.name}" if directory_relative else entry.name
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                    # Temp files of in-flight atomic writes are skipped too
+                    if not (is_dir or entry.is_file(follow_symlinks=False)) or entry.name.startswith(".snappods-"):
+                        continue
+                    if rules is not None and is_ignored(rules, path, is_dir):
+                        continue
+                    if is_dir:
+                        subdirectories.append((entry.path, path, rules, entry.stat(follow_symlinks=False)))
+                    else:
+                        yield path, entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+            stack.extend(reversed(subdirectories))
 
+    def _changed(self, full_path: Path, created_from: Optional[Path] = None):
+        """Drop cached listings that a change to full_path makes stale, and tell listeners
+
+        created_from is the first directory a mkdir(parents=True) created, if any.
+        """
+        self.listings.invalidate(str((created_from or full_path).parent))
+        self.listings.invalidate_tree(str(full_path))
+        if self._listeners:
+            relative = os.path.normpath(os.path.relpath(full_path, self.base_path)).replace(os.sep, "/")
+            project_name, _, path = relative.partition("/")
+            for listener in self._listeners:
+                listener(project_name, path)
+
+    @contextmanager
+    def _accounted(self, project_name: str, paths: List[Path]):
+        """Tell usage listeners how much the files at paths grew or shrank meanwhile"""
+        if not self._usage_listeners:
+            yield
+            return
+        # Paths inside another of the paths would be counted twice
+        outermost: List[str] = []
+        for path in sorted({os.path.normpath(path) for path in paths}, key=lambda path: path.split(os.sep)):
+            if not outermost or not path.startswith(outermost[-1] + os.sep):
+                outermost.append(path)
+        before = [self._tree_usage(path) for path in outermost]
+        try:
+            yield
+        finally:
+            after = [self._tree_usage(path) for path in outermost]
+            bytes_delta = sum(size for size, _ in after) - sum(size for size, _ in before)
+            files_delta = sum(files for _, files in after) - sum(files for _, files in before)
+            if bytes_delta or files_delta:
+                for listener in self._usage_listeners:
+                    listener(project_name, bytes_delta, files_delta)
+
+    @staticmethod
+    def _tree_usage(path: str) -> Tuple[int, int]:
+        """Bytes and number of regular files at path, a file or a directory"""
+        try:
+            st = os.lstat(path)
+        except OSError:
+            return 0, 0
+        if stat.S_ISREG(st.st_mode):
+            return st.st_size, 1
+        if not stat.S_ISDIR(st.st_mode):
+            return 0, 0
+        size = files = 0
+        stack = [path]
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as entries:
+                    entries = list(entries)
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    # Temp files of in-flight atomic writes are counted once they land
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False) and not entry.name.startswith(".snappods-"):
+                        size += entry.stat(follow_symlinks=False).st_size
+                        files += 1
+                except OSError:
+                    continue
+        return size, files
+
+    @staticmethod
+    def _first_missing(path: Path) -> Optional[Path]:
+        """Outermost ancestor (or path itself) that does not exist yet"""
+        missing = None
+        while not path.exists():
+            missing = path
+            path = path.parent
+        return missing
+
+    @file_operations.timed("read")
     def read_file(self, project_name: str, file_path: str) -> Optional[str]:
         """Read file content"""
         project_path = self.get_project_path(project_name)
@@ -64,7 +295,7 @@ class FileManager:
         
         # Security check: ensure file is within project directory
         try:
-            full_path.resolve().relative_to(project_path.resolve())
+            full_path.resolve().relative_to(self.project_root(project_name))
         except ValueError:
             return None
         
@@ -78,26 +309,148 @@ class FileManager:
             print(f"Error reading file: {e}")
             return None
 
+    @file_operations.timed("read_text")
+    def read_text(self, project_name: str, file_path: str, offset: Optional[int] = None,
+                  length: Optional[int] = None) -> Optional[dict]:
+        """Read a file as text, whole or as a window of about length bytes
+
+        A whole file must be valid UTF-8. A window is cut at character
+        boundaries and undecodable bytes are replaced; next_offset, when set,
+        is where the following window starts. sha256 identifies the version
+        read, for update_file, whenever the whole file was returned.
+        """
+        full_path = self.resolve_path(project_name, file_path)
+        if full_path is None:
+            return None
+
+        try:
+            with open(full_path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if offset is None:
+                    data = f.read()
+                    return {
+                        "content": data.decode('utf-8'),
+                        "size": size,
+                        "offset": 0,
+                        "next_offset": None,
+                        "sha256": hashlib.sha256(data).hexdigest(),
+                    }
+
+                f.seek(offset)
+                data = f.read(length)
+                # Skip the tail of a character cut by the window start
+                skipped = 0
+                while offset > 0 and skipped < 3 and skipped < len(data) and data[skipped] & 0xC0 == 0x80:
+                    skipped += 1
+                data = data[skipped:]
+                if offset + skipped + len(data) < size:
+                    data = data[:len(data) - self._partial_tail(data)]
+                end = offset + skipped + len(data)
+                whole = offset == 0 and end >= size
+                return {
+                    "content": data.decode('utf-8', errors='replace'),
+                    "size": size,
+                    "offset": offset + skipped,
+                    "next_offset": end if end < size else None,
+                    # Only a window holding the whole file can be a base for writes
+                    "sha256": hashlib.sha256(data).hexdigest() if whole else None,
+                }
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+            return None
+        except Exception as e:
+            print(f"Error reading file: {e}")
+            return None
+
+    @staticmethod
+    def _partial_tail(data: bytes) -> int:
+        """Bytes at the end of data that begin an incomplete UTF-8 character"""
+        for back in range(1, min(4, len(data)) + 1):
+            byte = data[-back]
+            if byte & 0xC0 == 0x80:
+                continue
+            if byte >= 0xF0:
+                needed = 4
+            elif byte >= 0xE0:
+                needed = 3
+            elif byte >= 0xC0:
+                needed = 2
+            else:
+                needed = 1
+            return back if back < needed else 0
+        return 0
+
+    def open_file(self, project_name: str, file_path: str) -> Optional[BinaryIO]:
+        """Open a regular file in a project for binary reading"""
+        full_path = self.resolve_path(project_name, file_path)
+        if full_path is None:
+            return None
+
+        try:
+            f = open(full_path, 'rb')
+        except OSError:
+            return None
+        if not stat.S_ISREG(os.fstat(f.fileno()).st_mode):
+            f.close()
+            return None
+        return f
+
+    @file_operations.timed("write", failed=False)
     def write_file(self, project_name: str, file_path: str, content: str) -> bool:
         """Write file content"""
-        project_path = self.get_project_path(project_name)
-        full_path = project_path / file_path
-        
-        # Security check: ensure file is within project directory
-        try:
-            full_path.resolve().relative_to(project_path.resolve())
-        except ValueError:
+        full_path = self.resolve_path(project_name, file_path)
+        if full_path is None:
             return False
-        
+
         try:
-            full_path.parent.mkdir(parents=True, exist_ok=True)
-            with open(full_path, 'w', encoding='utf-8') as f:
-                f.write(content)
+            data = content.encode('utf-8')
+            # The same stripe as update_file and apply_batch, so their writes can't interleave
+            with self._write_locks[hash(str(full_path)) % len(self._write_locks)]:
+                with self._accounted(project_name, [full_path]):
+                    self._replace_with(full_path, lambda f: f.write(data))
             return True
         except Exception as e:
             print(f"Error writing file: {e}")
             return False
 
+    @file_operations.timed("update")
+    def update_file(self, project_name: str, file_path: str, content: Optional[str] = None,
+                    patch: Optional[str] = None, base_sha256: Optional[str] = None) -> dict:
+        """Atomically replace a file with content, or with the result of a unified diff
+
+        With base_sha256 the write only happens while the file still has that
+        hash; FileConflictError is raised otherwise. PatchError means the patch
+        doesn't apply, and ValueError that the path is invalid.
+        """
+        full_path = self.resolve_path(project_name, file_path)
+        if full_path is None:
+            raise ValueError("Invalid file path")
+
+        # Writers of the same file take turns between the hash check and the rename
+        with self._write_locks[hash(str(full_path)) % len(self._write_locks)]:
+            try:
+                with open(full_path, 'rb') as f:
+                    current = f.read()
+            except FileNotFoundError:
+                current = None
+
+            if base_sha256 is not None:
+                current_hash = hashlib.sha256(current).hexdigest() if current is not None else None
+                if current_hash != base_sha256.lower():
+                    raise FileConflictError(current_hash)
+
+            if patch is not None:
+                try:
+                    text = (current or b"").decode('utf-8')
+                except UnicodeDecodeError:
+                    raise PatchError("File is not UTF-8 text")
+                content = apply_unified_diff(text, patch)
+
+            data = (content or "").encode('utf-8')
+            with self._accounted(project_name, [full_path]):
+                self._replace_with(full_path, lambda f: f.write(data))
+        return {"sha256": hashlib.sha256(data).hexdigest(), "size": len(data)}
+
+    @file_operations.timed("mkdir", failed=False)
     def create_directory(self, project_name: str, dir_path: str) -> bool:
         """Create a directory"""
         project_path = self.get_project_path(project_name)
@@ -105,17 +458,21 @@ class FileManager:
         
         # Security check
         try:
-            full_path.resolve().relative_to(project_path.resolve())
+            full_path.resolve().relative_to(self.project_root(project_name))
         except ValueError:
             return False
         
         try:
+            created_from = self._first_missing(full_path)
             full_path.mkdir(parents=True, exist_ok=True)
+            if created_from is not None:
+                self._changed(full_path, created_from)
             return True
         except Exception as e:
             print(f"Error creating directory: {e}")
             return False
 
+    @file_operations.timed("delete", failed=False)
     def delete_file(self, project_name: str, file_path: str) -> bool:
         """Delete a file or directory"""
         project_path = self.get_project_path(project_name)
@@ -123,7 +480,7 @@ class FileManager:
         
         # Security check
         try:
-            full_path.resolve().relative_to(project_path.resolve())
+            full_path.resolve().relative_to(self.project_root(project_name))
         except ValueError:
             return False
         
@@ -131,16 +488,18 @@ class FileManager:
             return False
         
         try:
-            if full_path.is_dir():
-                import shutil
-                shutil.rmtree(full_path)
-            else:
-                full_path.unlink()
+            with self._accounted(project_name, [full_path]):
+                if full_path.is_dir():
+                    shutil.rmtree(full_path)
+                else:
+                    full_path.unlink()
+            self._changed(full_path)
             return True
         except Exception as e:
             print(f"Error deleting file: {e}")
             return False
 
+    @file_operations.timed("info")
     def get_file_info(self, project_name: str, file_path: str) -> Optional[dict]:
         """Get file information"""
         project_path = self.get_project_path(project_name)
@@ -148,7 +507,7 @@ class FileManager:
         
         # Security check
         try:
-            full_path.resolve().relative_to(project_path.resolve())
+            full_path.resolve().relative_to(self.project_root(project_name))
         except ValueError:
             return None
         
@@ -167,6 +526,7 @@ class FileManager:
             print(f"Error getting file info: {e}")
             return None
 
+    @file_operations.timed("rename", failed=False)
     def rename_file(self, project_name: str, old_path: str, new_path: str) -> bool:
         """Rename a file or directory"""
         project_path = self.get_project_path(project_name)
@@ -175,8 +535,8 @@ class FileManager:
         
         # Security checks
         try:
-            old_full_path.resolve().relative_to(project_path.resolve())
-            new_full_path.resolve().relative_to(project_path.resolve())
+            old_full_path.resolve().relative_to(self.project_root(project_name))
+            new_full_path.resolve().relative_to(self.project_root(project_name))
         except ValueError:
             return False
         
@@ -188,6 +548,8 @@ class FileManager:
         
         try:
             old_full_path.rename(new_full_path)
+            self._changed(old_full_path)
+            self._changed(new_full_path)
             return True
         except Exception as e:
             print(f"Error renaming file: {e}")
@@ -195,24 +557,184 @@ class FileManager:
 
     def upload_file(self, project_name: str, file_path: str, file_content: bytes) -> bool:
         """Upload a file (write binary content)"""
-        project_path = self.get_project_path(project_name)
-        full_path = project_path / file_path
-        
-        # Security check
+        return self.save_upload(project_name, file_path, io.BytesIO(file_content))
+
+    @file_operations.timed("upload", failed=False)
+    def save_upload(self, project_name: str, file_path: str, source: BinaryIO,
+                    chunk_size: int = 1024 * 1024) -> bool:
+        """Stream an upload into place, chunk_size bytes at a time
+
+        Readers never see a partial file: the data goes to a temp file beside
+        the target, which is renamed over it once complete.
+        """
+        full_path = self.resolve_path(project_name, file_path)
+        if full_path is None:
+            return False
+
         try:
-            full_path.resolve().relative_to(project_path.resolve())
-        except ValueError:
+            with self._accounted(project_name, [full_path]):
+                self._replace_with(full_path, lambda f: shutil.copyfileobj(source, f, chunk_size))
+            return True
+        except Exception as e:
+            print(f"Error uploading file: {e}")
             return False
-        
+
+    @file_operations.timed("install", failed=False)
+    def install_file(self, project_name: str, file_path: str, staged_path: Path) -> bool:
+        """Move a completely staged file into place atomically"""
+        full_path = self.resolve_path(project_name, file_path)
+        if full_path is None:
+            return False
+
         try:
+            created_from = self._first_missing(full_path)
             full_path.parent.mkdir(parents=True, exist_ok=True)
-            with open(full_path, 'wb') as f:
-                f.write(file_content)
+            with self._accounted(project_name, [full_path]):
+                try:
+                    os.chmod(staged_path, self._file_mode(full_path))
+                    os.replace(staged_path, full_path)
+                except OSError as e:
+                    if e.errno != errno.EXDEV:
+                        raise
+                    # Staging is on another filesystem; copy beside the target first
+                    with open(staged_path, 'rb') as source:
+                        self._replace_with(full_path, lambda f: shutil.copyfileobj(source, f, 1024 * 1024))
+                    os.unlink(staged_path)
+            self._changed(full_path, created_from)
             return True
         except Exception as e:
-            print(f"Error uploading file: {e}")
+            print(f"Error installing uploaded file: {e}")
             return False
 
+    @file_operations.timed("batch")
+    def apply_batch(self, project_name: str, operations: List[dict]) -> List[dict]:
+        """Apply create/write/mkdir/rename/delete operations in order, all or nothing
+
+        Every operation is checked against the state the earlier ones leave
+        before anything is touched; if one fails then, or the disk fails
+        midway, BatchError names it and the project is left as it was.
+        Returns a result per operation.
+        """
+        project_root = os.path.normpath(self.get_project_path(project_name))
+        targets: List[Tuple[Path, Optional[Path]]] = []
+        for index, operation in enumerate(operations):
+            full_path = self.resolve_path(project_name, operation["path"])
+            new_full_path = None
+            if operation.get("new_path") is not None:
+                new_full_path = self.resolve_path(project_name, operation["new_path"])
+                if new_full_path is None or os.path.normpath(new_full_path) == project_root:
+                    raise BatchError(index, 400, "Invalid file path")
+            if full_path is None or os.path.normpath(full_path) == project_root:
+                raise BatchError(index, 400, "Invalid file path")
+            targets.append((full_path, new_full_path))
+
+        # Take the same stripes as update_file, in a fixed order, so the
+        # checks below still hold when the steps run
+        lock_keys = {hash(str(path)) % len(self._write_locks) for pair in targets for path in pair if path}
+        locks = [self._write_locks[key] for key in sorted(lock_keys)]
+        for lock in locks:
+            lock.acquire()
+        journal = RollbackJournal(self._batches_dir() / uuid.uuid4().hex)
+        touched: List[Path] = []
+        try:
+            plan = BatchPlan()
+            for index, (operation, (full_path, new_full_path)) in enumerate(zip(operations, targets)):
+                plan.add(index, operation, full_path, new_full_path)
+            with self._accounted(project_name, [path for pair in targets for path in pair if path]):
+                for index, step in enumerate(plan.steps):
+                    try:
+                        self._apply_step(step, journal, touched)
+                    except Exception as e:
+                        print(f"Error applying file batch: {e}")
+                        journal.rollback()
+                        raise BatchError(index, 500, "Failed to apply operation; the batch was rolled back")
+            journal.discard()
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+            for full_path in touched:
+                self._changed(full_path)
+        return plan.results
+
+    def recover_batches(self) -> int:
+        """Roll back batches that were interrupted by a crash, before serving requests"""
+        recovered = RollbackJournal.recover(self._batches_dir())
+        if recovered:
+            print(f"Rolled back {recovered} interrupted file batches")
+        return recovered
+
+    def _batches_dir(self) -> Path:
+        return self.base_path / ".snappods" / "batches"
+
+    def _apply_step(self, step: Tuple, journal: RollbackJournal, touched: List[Path]):
+        action, full_path = step[0], step[1]
+        touched.append(full_path)
+        if action == "write":
+            missing = self._first_missing(full_path)
+            if missing is not None:
+                journal.created(missing)
+                touched.append(missing)
+            else:
+                journal.replacing(full_path)
+            self._replace_with(full_path, lambda f: f.write(step[2]))
+        elif action == "mkdir":
+            missing = self._first_missing(full_path)
+            if missing is not None:
+                journal.created(missing)
+                touched.append(missing)
+                full_path.mkdir(parents=True)
+        elif action == "rename":
+            new_full_path = step[2]
+            touched.append(new_full_path)
+            missing = self._first_missing(new_full_path.parent)
+            if missing is not None:
+                journal.created(missing)
+                touched.append(missing)
+                new_full_path.parent.mkdir(parents=True)
+            journal.move(full_path, new_full_path)
+        elif action == "delete":
+            journal.remove(full_path)
+
+    def resolve_path(self, project_name: str, file_path: str) -> Optional[Path]:
+        """Path of a file in a project, or None if it would escape the project"""
+        project_path = self.get_project_path(project_name)
+        full_path = project_path / file_path
+
+        # Security check: ensure file is within project directory
+        try:
+            full_path.resolve().relative_to(self.project_root(project_name))
+        except ValueError:
+            return None
+        return full_path
+
+    def _replace_with(self, full_path: Path, fill: Callable[[BinaryIO], Any]):
+        """Atomically replace full_path with what fill writes to a file object"""
+        created_from = self._first_missing(full_path)
+        full_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=full_path.parent, prefix=".snappods-")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                fill(f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(temp_path, self._file_mode(full_path))
+            os.replace(temp_path, full_path)
+        except BaseException:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+        self._changed(full_path, created_from)
+
+    @staticmethod
+    def _file_mode(full_path: Path) -> int:
+        """Keep an existing file's permissions; new files get rw-r--r--"""
+        try:
+            return stat.S_IMODE(os.stat(full_path).st_mode)
+        except OSError:
+            return 0o644
+
 
-file_manager = FileManager()
+file_manager = FileManager(cache_names=int(os.getenv("FILE_TREE_CACHE_NAMES", "200000")))
 
@@ -0,0 +1,125 @@
+import os
+import re
+from typing import Iterable, List, Optional, Tuple
+
+
+# Ignored everywhere unless FILE_TREE_IGNORE says otherwise
+DEFAULT_IGNORE_PATTERNS = [".git", "node_modules"]
+
+
+def translate_glob(glob: str) -> str:
+    """Translate a gitignore glob to a regex over '/'-separated paths"""
+    parts = []
+    i = 0
+    while i < len(glob):
+        char = glob[i]
+        if glob.startswith("**/", i):
+            parts.append("(?:.*/)?")
+            i += 3
+            continue
+        if glob.startswith("**", i):
+            parts.append(".*")
+            i += 2
+            continue
+        if char == "*":
+            parts.append("[^/]*")
+        elif char == "?":
+            parts.append("[^/]")
+        elif char == "[":
+            end = glob.find("]", i + 1)
+            if end == -1:
+                parts.append(re.escape(char))
+            else:
+                body = glob[i + 1:end]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                parts.append("[" + body.replace("\\", "\\\\") + "]")
+                i = end
+        elif char == "\\" and i + 1 < len(glob):
+            i += 1
+            parts.append(re.escape(glob[i]))
+        else:
+            parts.append(re.escape(char))
+        i += 1
+    return "".join(parts)
+
+
+class IgnoreRules:
+    """Compiled gitignore-style patterns, relative to one directory of a project"""
+
+    def __init__(self, patterns: Iterable[str], base: str = ""):
+        self.base = base.strip("/")
+        self._rules: List[Tuple[re.Pattern, bool, bool]] = []
+        for line in patterns:
+            line = line.rstrip("\n\r")
+            if not line.strip() or line.startswith("#"):
+                continue
+            line = line.rstrip(" ")
+            negate = line.startswith("!")
+            if negate:
+                line = line[1:]
+            elif line.startswith("\\"):
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            if not line:
+                continue
+            # A slash anywhere but the end anchors the pattern to the base
+            if "/" in line:
+                regex = "^" + translate_glob(line.lstrip("/")) + "$"
+            else:
+                regex = "(?:^|/)" + translate_glob(line) + "$"
+            self._rules.append((re.compile(regex), negate, dir_only))
+
+    def match(self, path: str, is_dir: bool) -> Optional[bool]:
+        """True if ignored, False if re-included, None if no pattern applies
+
+        path is relative to the project root. The last matching pattern wins.
+        """
+        if self.base:
+            if not path.startswith(self.base + "/"):
+                return None
+            path = path[len(self.base) + 1:]
+        for regex, negate, dir_only in reversed(self._rules):
+            if dir_only and not is_dir:
+                continue
+            if regex.search(path):
+                return not negate
+        return None
+
+
+def is_ignored(rules: List[IgnoreRules], path: str, is_dir: bool) -> bool:
+    """Apply rule sets ordered from outermost to innermost; inner ones win"""
+    for rule_set in reversed(rules):
+        result = rule_set.match(path, is_dir)
+        if result is not None:
+            return result
+    return False
+
+
+def load_gitignore(directory: str, relative_dir: str) -> Optional[IgnoreRules]:
+    """Rules from directory/.gitignore, if the file exists"""
+    try:
+        with open(os.path.join(directory, ".gitignore"), "r", encoding="utf-8", errors="replace") as f:
+            return IgnoreRules(f.readlines(), relative_dir)
+    except OSError:
+        return None
+
+
+def ancestor_rules(base: IgnoreRules, project_path: str, relative: str) -> List[IgnoreRules]:
+    """Rules in force for a path, from base and its parents' .gitignore files"""
+    rules = [base]
+    parts = relative.split("/") if relative else []
+    for i in range(len(parts)):
+        parent = "/".join(parts[:i])
+        gitignore = load_gitignore(os.path.join(project_path, parent), parent)
+        if gitignore is not None:
+            rules.append(gitignore)
+    return rules
+
+
+def default_rules() -> IgnoreRules:
+    """Project-independent rules from FILE_TREE_IGNORE"""
+    configured = os.getenv("FILE_TREE_IGNORE")
+    patterns = configured.split(",") if configured is not None else DEFAULT_IGNORE_PATTERNS
+    return IgnoreRules([pattern.strip() for pattern in patterns])
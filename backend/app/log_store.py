@@ -0,0 +1,300 @@
+import asyncio
+import json
+import os
+import re
+import time
+from collections import deque
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Any, Deque, Dict, List, NamedTuple, Optional, Set, Tuple
+from starlette.concurrency import run_in_threadpool
+from .container_logs import LogLine, read_log_lines, timestamp_key
+
+
+# Rough per-line overhead of the tuple, strings and deque slot, in bytes
+ENTRY_OVERHEAD = 200
+
+# JSON keys commonly holding the log level, and spellings normalized to one name
+LEVEL_KEYS = ("level", "lvl", "severity", "log.level", "levelname", "loglevel")
+LEVEL_ALIASES = {
+    "trace": "trace", "debug": "debug", "dbg": "debug",
+    "info": "info", "information": "info", "notice": "info",
+    "warn": "warn", "warning": "warn",
+    "error": "error", "err": "error",
+    "fatal": "fatal", "critical": "fatal", "crit": "fatal", "panic": "fatal", "emergency": "fatal",
+}
+
+
+class LogEntry(NamedTuple):
+    """A buffered log line; seq increases by one per line of a container"""
+    seq: int
+    key: Tuple[int, int]
+    timestamp: str
+    stream: str
+    text: str
+    level: Optional[str]
+    size: int
+
+
+class LogQuery(NamedTuple):
+    """Filters for searching a container's buffered logs"""
+    pattern: Optional[re.Pattern] = None
+    substring: Optional[str] = None
+    ignore_case: bool = False
+    since: Optional[Tuple[int, int]] = None
+    until: Optional[Tuple[int, int]] = None
+    stream: Optional[str] = None
+    levels: Optional[Set[str]] = None
+    before: Optional[int] = None
+    limit: int = 100
+
+
+def detect_level(text: str) -> Optional[str]:
+    """Level of a JSON-formatted log line, if it has one"""
+    text = text.strip()
+    if not text.startswith("{"):
+        return None
+    try:
+        record = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(record, dict):
+        return None
+    for key in LEVEL_KEYS:
+        value = record.get(key)
+        if value is None and "." in key:
+            outer, inner = key.split(".", 1)
+            value = (record.get(outer) or {}).get(inner) if isinstance(record.get(outer), dict) else None
+        if isinstance(value, str):
+            return LEVEL_ALIASES.get(value.lower(), value.lower())
+        if isinstance(value, int):
+            # Numeric levels as used by pino/bunyan
+            return {10: "trace", 20: "debug", 30: "info", 40: "warn", 50: "error", 60: "fatal"}.get(value)
+    return None
+
+
+def entry_to_dict(entry: LogEntry) -> Dict[str, Any]:
+    """JSON form of a buffered line"""
+    return {
+        "seq": entry.seq,
+        "timestamp": entry.timestamp,
+        "stream": entry.stream,
+        "text": entry.text,
+        "level": entry.level,
+    }
+
+
+class _ContainerLog:
+    """Ring buffer of one container's recent log lines and its live followers"""
+
+    def __init__(self, container_id: str):
+        self.container_id = container_id
+        self.entries: Deque[LogEntry] = deque()
+        self.bytes = 0
+        self.next_seq = 1
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.task: Optional[asyncio.Task] = None
+        self.ready = asyncio.Event()
+        self.error: Optional[Exception] = None
+        self.lease_until = 0.0
+
+
+class LogStore:
+    """Memory-capped log buffers per followed container, fed by one follow stream each
+
+    Buffers exist while a container has websocket subscribers, and for
+    idle_seconds after its last search, and share max_bytes evenly. A
+    buffer is trimmed to its share as it grows, and once their total goes
+    over max_bytes (more buffers, so smaller shares) every buffer is.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, seed_lines: int = 10000,
+                 idle_seconds: float = 600.0, subscriber_queue: int = 10000):
+        self.max_bytes = max_bytes
+        self.seed_lines = seed_lines
+        self.idle_seconds = idle_seconds
+        self.subscriber_queue = subscriber_queue
+        self._logs: Dict[str, _ContainerLog] = {}
+        self._bytes = 0
+
+    async def subscribe(self, container_id: str, tail: int = 100,
+                        since: Optional[str] = None) -> Tuple[List[LogEntry], asyncio.Queue]:
+        """Return buffered lines to replay and a queue of new ones
+
+        The backlog is the last `tail` lines, or every buffered line after the
+        `since` cursor. A None in the queue means the stream ended; a False
+        means the subscriber fell too far behind and was dropped.
+        """
+        log = await self._ensure(container_id)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.subscriber_queue)
+        if since:
+            cursor = timestamp_key(since)
+            backlog = [entry for entry in log.entries if entry.key > cursor]
+        else:
+            backlog = list(islice(log.entries, max(len(log.entries) - tail, 0), None)) if tail > 0 else []
+        log.subscribers.add(queue)
+        if log.task is None or log.task.done():
+            queue.put_nowait(None)
+        return backlog, queue
+
+    def unsubscribe(self, container_id: str, queue: asyncio.Queue):
+        """Drop a subscriber; the buffer goes once nothing else holds it"""
+        log = self._logs.get(container_id)
+        if log is None:
+            return
+        log.subscribers.discard(queue)
+        self._release_if_idle(log)
+
+    async def search(self, container_id: str, query: LogQuery) -> Dict[str, Any]:
+        """Search a container's buffer, newest lines first, one page at a time"""
+        log = await self._ensure(container_id)
+        log.lease_until = time.monotonic() + self.idle_seconds
+        asyncio.get_running_loop().call_later(self.idle_seconds + 1, self._release_if_idle, log)
+
+        # Scan a snapshot in a worker thread so big buffers don't stall the loop
+        entries = list(log.entries)
+        matches, next_cursor = await run_in_threadpool(self._scan, entries, query)
+        return {
+            "lines": [entry_to_dict(entry) for entry in matches],
+            "next_cursor": next_cursor,
+            "buffered_lines": len(entries),
+            "buffered_bytes": log.bytes,
+            "oldest": entries[0].timestamp if entries else None,
+        }
+
+    @staticmethod
+    def _scan(entries: List[LogEntry], query: LogQuery) -> Tuple[List[LogEntry], Optional[int]]:
+        substring = query.substring
+        if substring is not None and query.ignore_case:
+            substring = substring.lower()
+        start = len(entries)
+        if query.before is not None and entries:
+            # seq is contiguous within a buffer, so the cursor maps to an index
+            start = min(max(query.before - entries[0].seq, 0), len(entries))
+
+        matches: List[LogEntry] = []
+        for index in range(start - 1, -1, -1):
+            entry = entries[index]
+            # stdout and stderr lines may interleave slightly out of order,
+            # so time filters skip rather than stop the scan
+            if query.since is not None and entry.key < query.since:
+                continue
+            if query.until is not None and entry.key > query.until:
+                continue
+            if query.stream is not None and entry.stream != query.stream:
+                continue
+            if query.levels is not None and entry.level not in query.levels:
+                continue
+            if substring is not None:
+                text = entry.text.lower() if query.ignore_case else entry.text
+                if substring not in text:
+                    continue
+            if query.pattern is not None and not query.pattern.search(entry.text):
+                continue
+            matches.append(entry)
+            if len(matches) == query.limit:
+                return matches, entry.seq if index > 0 else None
+        return matches, None
+
+    async def _ensure(self, container_id: str) -> _ContainerLog:
+        """Start following a container if needed and wait for its backlog"""
+        log = self._logs.get(container_id)
+        if log is None:
+            log = _ContainerLog(container_id)
+            self._logs[container_id] = log
+        if log.task is None or log.task.done():
+            log.ready.clear()
+            log.error = None
+            log.task = asyncio.create_task(self._follow(log))
+        await log.ready.wait()
+        if log.error is not None:
+            self._remove(log)
+            raise log.error
+        return log
+
+    async def _follow(self, log: _ContainerLog):
+        """Seed the buffer from the daemon, then append lines as they are written"""
+        try:
+            started = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+            if not log.entries:
+                async for line in read_log_lines(log.container_id, tail=self.seed_lines):
+                    self._append(log, line)
+            log.ready.set()
+            # Resume after the newest buffered line so nothing is missed or doubled
+            since = log.entries[-1].timestamp if log.entries else started
+            async for line in read_log_lines(log.container_id, tail=None, since=since, follow=True):
+                self._append(log, line)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if not log.ready.is_set():
+                log.error = e
+                log.ready.set()
+                return
+            print(f"Error following container logs: {e}")
+        # The container stopped; subscribers are told the stream ended
+        for queue in list(log.subscribers):
+            self._offer(log, queue, None)
+
+    def _append(self, log: _ContainerLog, line: LogLine):
+        key = timestamp_key(line.timestamp) if line.timestamp else (log.entries[-1].key if log.entries else (0, 0))
+        entry = LogEntry(
+            seq=log.next_seq,
+            key=key,
+            timestamp=line.timestamp,
+            stream=line.stream,
+            text=line.text,
+            level=detect_level(line.text),
+            size=len(line.text.encode("utf-8", errors="replace")) + len(line.timestamp) + ENTRY_OVERHEAD,
+        )
+        log.next_seq += 1
+        log.entries.append(entry)
+        log.bytes += entry.size
+        self._bytes += entry.size
+
+        # Buffers share the global budget evenly
+        budget = self.max_bytes // max(len(self._logs), 1)
+        self._trim(log, budget)
+        if self._bytes > self.max_bytes:
+            for other in self._logs.values():
+                self._trim(other, budget)
+
+        for queue in list(log.subscribers):
+            self._offer(log, queue, entry)
+
+    def _trim(self, log: _ContainerLog, budget: int):
+        """Drop a buffer's oldest lines until it fits budget, keeping the newest"""
+        while log.bytes > budget and len(log.entries) > 1:
+            size = log.entries.popleft().size
+            log.bytes -= size
+            self._bytes -= size
+
+    def _remove(self, log: _ContainerLog):
+        if self._logs.get(log.container_id) is log:
+            del self._logs[log.container_id]
+            self._bytes -= log.bytes
+
+    def _offer(self, log: _ContainerLog, queue: asyncio.Queue, item):
+        if queue.full():
+            # Too far behind to catch up from the live stream; the client can
+            # reconnect with a since cursor and replay from the buffer
+            log.subscribers.discard(queue)
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(False)
+            return
+        queue.put_nowait(item)
+
+    def _release_if_idle(self, log: _ContainerLog):
+        if log.subscribers or time.monotonic() < log.lease_until:
+            return
+        self._remove(log)
+        if log.task is not None:
+            log.task.cancel()
+
+
+log_store = LogStore(
+    max_bytes=int(os.getenv("LOG_BUFFER_MAX_BYTES", str(256 * 1024 * 1024))),
+    seed_lines=int(os.getenv("LOG_BUFFER_SEED_LINES", "10000")),
+    idle_seconds=float(os.getenv("LOG_BUFFER_IDLE_SECONDS", "600")),
+)
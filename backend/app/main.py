@@ -1,9 +1,16 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse
 import os
-from .models import init_db
+from .metrics import MetricsMiddleware, registry
+from .models import async_engine, init_db
+from .container_index import container_index
+from .deploy_jobs import deploy_scheduler
+from .project_usage import usage_tracker
+from .docker_client import docker_client
+from .file_manager import file_manager
+from .stats_collector import stats_collector
 from .routes import projects, files, containers, websocket
 
 app = FastAPI(title="SnapPods", version="1.0.0")
@@ -15,7 +22,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Content-Range", "Content-Disposition"],
 )
+# Request latency, in-flight requests and open WebSockets, for /metrics
+app.add_middleware(MetricsMiddleware)
 
 # Initialize database
 init_db()
@@ -27,6 +37,27 @@ app.include_router(containers.router)
 app.include_router(websocket.router)
 
 
+@app.on_event("startup")
+async def start_background_services():
+    """Start services that keep Docker state in memory"""
+    file_manager.recover_batches()
+    container_index.start()
+    stats_collector.start()
+    await deploy_scheduler.start()
+    usage_tracker.start()
+
+
+@app.on_event("shutdown")
+async def stop_background_services():
+    """Stop background services"""
+    await deploy_scheduler.stop()
+    await usage_tracker.stop()
+    await stats_collector.stop()
+    await container_index.stop()
+    await docker_client.close()
+    await async_engine.dispose()
+
+
 @app.get("/")
 async def root():
     """Root endpoint - serve frontend"""
@@ -42,6 +73,12 @@ async def health():
     return {"status": "healthy"}
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
 # Mount static files for frontend
 frontend_dist = os.path.join(os.path.dirname(__file__), "..", "..", "frontend", "dist")
 if os.path.exists(frontend_dist):
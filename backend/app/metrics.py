@@ -0,0 +1,347 @@
+import functools
+import inspect
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Prometheus' default latency buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_UNSET = object()
+
+
+class _Shards:
+    """Per-thread arrays of numbers, summed when read
+
+    Each thread only ever writes its own array, so updates need no lock
+    and can't be lost to another thread's read-modify-write; the lock is
+    taken once per thread, when its array is created. A read may see one
+    array mid-update, which is fine for monitoring.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._local = threading.local()
+        self._arrays: List[List[float]] = []
+        self._lock = threading.Lock()
+
+    def mine(self) -> List[float]:
+        try:
+            return self._local.array
+        except AttributeError:
+            array = self._local.array = [0] * self.size
+            with self._lock:
+                self._arrays.append(array)
+            return array
+
+    def total(self) -> List[float]:
+        with self._lock:
+            arrays = list(self._arrays)
+        return [sum(values) for values in zip(*arrays)] if arrays else [0] * self.size
+
+
+class CounterChild:
+    def __init__(self):
+        self._shards = _Shards(1)
+
+    def inc(self, amount: float = 1):
+        self._shards.mine()[0] += amount
+
+    def value(self) -> float:
+        return self._shards.total()[0]
+
+
+class GaugeChild(CounterChild):
+    def dec(self, amount: float = 1):
+        self._shards.mine()[0] -= amount
+
+
+class HistogramChild:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        # One count per bucket, one for +Inf, then the sum
+        self._shards = _Shards(len(buckets) + 2)
+
+    def observe(self, value: float):
+        array = self._shards.mine()
+        array[bisect_left(self.buckets, value)] += 1
+        array[-1] += value
+
+    def snapshot(self) -> Tuple[List[float], float]:
+        """Cumulative bucket counts, ending with +Inf, and the sum"""
+        totals = self._shards.total()
+        cumulative = []
+        running = 0
+        for count in totals[:-1]:
+            running += count
+            cumulative.append(running)
+        return cumulative, totals[-1]
+
+
+class Metric:
+    """A named metric with a fixed set of label names; labels() picks one series"""
+
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _label_text(self, values: Tuple[str, ...], le: Optional[str] = None) -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, values)]
+        if le is not None:
+            pairs.append(f'le="{le}"')
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values, child) -> List[str]:
+        return [f"{self.name}{self._label_text(values)} {_number(child.value())}"]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def _new_child(self):
+        return CounterChild()
+
+
+class Gauge(Metric):
+    """A gauge set by inc() and dec(), or read from function when it is given"""
+
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 function: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def _new_child(self):
+        return GaugeChild()
+
+    def render(self) -> List[str]:
+        if self.function is None:
+            return super().render()
+        try:
+            value = self.function()
+        except Exception as e:
+            print(f"Error reading metric {self.name}: {e}")
+            return []
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge",
+                f"{self.name} {_number(value)}"]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return HistogramChild(self.buckets)
+
+    def _render_child(self, values, child) -> List[str]:
+        cumulative, total = child.snapshot()
+        bounds = [_number(bound) for bound in self.buckets] + ["+Inf"]
+        lines = [
+            f"{self.name}_bucket{self._label_text(values, bound)} {_number(count)}"
+            for bound, count in zip(bounds, cumulative)
+        ]
+        lines.append(f"{self.name}_sum{self._label_text(values)} {_number(total)}")
+        lines.append(f"{self.name}_count{self._label_text(values)} {_number(cumulative[-1])}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Every metric in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class OperationMetrics:
+    """Duration histogram and error counter for the calls of one component
+
+    timed(operation) wraps a method, sync or async: every call is timed,
+    and one that raises, or returns the failed value when one is given, is
+    also counted as an error. Series are created when the method is
+    decorated, so a call costs two clock reads and a few additions.
+    """
+
+    def __init__(self, registry: Registry, prefix: str, component: str,
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.durations = registry.register(Histogram(
+            f"{prefix}_duration_seconds", f"Duration of {component} operations", ["operation"], buckets
+        ))
+        self.errors = registry.register(Counter(
+            f"{prefix}_errors_total", f"{component} operations that failed", ["operation"]
+        ))
+
+    def timed(self, operation: str, failed=_UNSET):
+        durations = self.durations.labels(operation)
+        errors = self.errors.labels(operation)
+
+        def decorate(function):
+            if inspect.iscoroutinefunction(function):
+                @functools.wraps(function)
+                async def wrapper(*args, **kwargs):
+                    started = time.perf_counter()
+                    try:
+                        result = await function(*args, **kwargs)
+                    except Exception:
+                        errors.inc()
+                        raise
+                    finally:
+                        durations.observe(time.perf_counter() - started)
+                    if failed is not _UNSET and result is failed:
+                        errors.inc()
+                    return result
+            else:
+                @functools.wraps(function)
+                def wrapper(*args, **kwargs):
+                    started = time.perf_counter()
+                    try:
+                        result = function(*args, **kwargs)
+                    except Exception:
+                        errors.inc()
+                        raise
+                    finally:
+                        durations.observe(time.perf_counter() - started)
+                    if failed is not _UNSET and result is failed:
+                        errors.inc()
+                    return result
+            return wrapper
+        return decorate
+
+
+def _threadpool_statistic(name: str) -> Callable[[], float]:
+    """Read the threadpool that run_in_threadpool uses; only valid on the event loop"""
+    def read() -> float:
+        import anyio.to_thread
+        limiter = anyio.to_thread.current_default_thread_limiter()
+        if name == "total_tokens":
+            return limiter.total_tokens
+        return getattr(limiter.statistics(), name)
+    return read
+
+
+registry = Registry()
+
+http_requests = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ["method", "route", "status"]
+))
+http_in_flight = registry.register(Gauge("http_requests_in_flight", "HTTP requests being served"))
+websocket_connections = registry.register(Gauge(
+    "websocket_connections", "Open WebSocket connections by route", ["route"]
+))
+registry.register(Gauge("threadpool_threads_busy", "Worker threads running blocking calls",
+                        function=_threadpool_statistic("borrowed_tokens")))
+registry.register(Gauge("threadpool_threads_max", "Size of the worker threadpool",
+                        function=_threadpool_statistic("total_tokens")))
+registry.register(Gauge("threadpool_tasks_waiting", "Blocking calls queued for a free worker thread",
+                        function=_threadpool_statistic("tasks_waiting")))
+
+docker_operations = OperationMetrics(registry, "docker_operation", "Docker Engine API")
+file_operations = OperationMetrics(registry, "file_operation", "FileManager")
+deploy_durations = registry.register(Histogram(
+    "deploy_duration_seconds", "Deploy job run time by runner and outcome", ["runner", "status"],
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600),
+))
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing HTTP requests and counting open WebSockets
+
+    Requests are labelled with the matched route's path template rather
+    than the URL, so ids in paths don't create a series each.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._in_flight = http_in_flight.labels()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            await self._http(scope, receive, send)
+        elif scope["type"] == "websocket":
+            await self._websocket(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+
+    async def _http(self, scope, receive, send):
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        self._in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self._in_flight.dec()
+            http_requests.labels(scope["method"], _route(scope), str(status)).observe(time.perf_counter() - started)
+
+    async def _websocket(self, scope, receive, send):
+        gauge = None
+
+        async def send_wrapper(message):
+            nonlocal gauge
+            if message["type"] == "websocket.accept":
+                gauge = websocket_connections.labels(_route(scope))
+                gauge.inc()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if gauge is not None:
+                gauge.dec()
+
+
+def _route(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
@@ -1,16 +1,72 @@
-from sqlalchemy import Column, Integer, String, DateTime, create_engine
+from sqlalchemy import BigInteger, Column, Integer, String, Text, DateTime, create_engine, event, inspect, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from datetime import datetime
 import os
 
 Base = declarative_base()
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./data/snappods.db")
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL").upper()
+if SQLITE_SYNCHRONOUS not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+    raise ValueError(f"Invalid SQLITE_SYNCHRONOUS: {SQLITE_SYNCHRONOUS}")
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {})
+
+def async_database_url(url: str) -> str:
+    """The same database with an async driver: aiosqlite or asyncpg"""
+    scheme, separator, rest = url.partition("://")
+    dialect = scheme.split("+")[0]
+    if dialect == "sqlite":
+        return f"sqlite+aiosqlite://{rest}"
+    if dialect in ("postgresql", "postgres"):
+        return f"postgresql+asyncpg://{rest}"
+    return url
+
+
+def pool_options(asynchronous: bool = False) -> dict:
+    """Connection pool sizing from the environment
+
+    In-memory SQLite keeps a single connection, so it takes no sizing.
+    """
+    if IS_SQLITE and (DATABASE_URL.rstrip("/") == "sqlite:" or ":memory:" in DATABASE_URL):
+        return {}
+    options = {
+        "pool_size": int(os.getenv("DATABASE_POOL_SIZE", "10")),
+        "max_overflow": int(os.getenv("DATABASE_MAX_OVERFLOW", "20")),
+        "pool_timeout": float(os.getenv("DATABASE_POOL_TIMEOUT", "30")),
+    }
+    if IS_SQLITE and asynchronous:
+        # SQLAlchemy before 2.0.38 opens an unpooled connection per session for aiosqlite
+        options["poolclass"] = AsyncAdaptedQueuePool
+    return options
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Let readers run alongside a writer, and wait out a busy database instead of failing"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.close()
+
+
+# The sync engine serves startup, file routes and worker threads; request handlers use the async one
+engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False} if IS_SQLITE else {},
+                       **pool_options())
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(async_database_url(DATABASE_URL), **pool_options(asynchronous=True))
+# Rows stay readable after commit, for response models to serialize
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+if IS_SQLITE:
+    event.listen(engine, "connect", set_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", set_sqlite_pragmas)
+
 
 class Project(Base):
     __tablename__ = "projects"
@@ -19,15 +75,73 @@ class Project(Base):
     name = Column(String, unique=True, index=True, nullable=False)
     path = Column(String, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Disk usage, kept current by project_usage; null until the first scan
+    usage_bytes = Column(BigInteger, nullable=True)
+    usage_files = Column(Integer, nullable=True)
+    usage_scanned_at = Column(DateTime, nullable=True)
+    # Overrides PROJECT_QUOTA_BYTES when set
+    quota_bytes = Column(BigInteger, nullable=True)
 
     def __repr__(self):
         return f"<Project(id={self.id}, name='{self.name}', path='{self.path}')>"
 
 
+class DeployJob(Base):
+    __tablename__ = "deploy_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    project_id = Column(Integer, index=True, nullable=False)
+    # queued, running, succeeded, failed or cancelled
+    status = Column(String, nullable=False, default="queued")
+    exit_code = Column(Integer, nullable=True)
+    error = Column(String, nullable=True)
+    # The last lines of output, kept once the job has finished
+    output = Column(Text, nullable=True)
+    # JSON list of per-service results from the compose engine
+    services = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<DeployJob(id={self.id}, project_id={self.project_id}, status='{self.status}')>"
+
+
+class DeployFingerprint(Base):
+    __tablename__ = "deploy_fingerprints"
+
+    project_id = Column(Integer, primary_key=True)
+    # The deploy job that last succeeded with these inputs
+    job_id = Column(Integer, nullable=False)
+    # JSON from DeployFingerprinter.compute
+    fingerprint = Column(Text, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
 def init_db():
     """Initialize database and create tables"""
-    os.makedirs(os.path.dirname(DATABASE_URL.replace("sqlite:///", "")), exist_ok=True)
+    if IS_SQLITE:
+        os.makedirs(os.path.dirname(DATABASE_URL.replace("sqlite:///", "")), exist_ok=True)
     Base.metadata.create_all(bind=engine)
+    add_missing_columns()
+
+
+def add_missing_columns():
+    """Add columns that models have gained to tables an older version created
+
+    create_all only creates missing tables. New columns must be nullable
+    or have a server default for this to work.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
 
 
 def get_db():
@@ -38,3 +152,9 @@ def get_db():
     finally:
         db.close()
 
+
+async def get_async_db():
+    """Dependency for getting an async database session"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
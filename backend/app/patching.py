@@ -0,0 +1,88 @@
+import re
+from typing import List
+
+
+HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+NO_NEWLINE = "\\ No newline at end of file"
+# Lines end at "\n" only, as the editor splits them; str.splitlines also
+# breaks on form feeds, lone carriage returns and other separators
+LINE = re.compile(r"[^\n]*\n|[^\n]+$")
+
+
+class PatchError(ValueError):
+    """A patch that is malformed or does not apply to the text"""
+
+
+def apply_unified_diff(original: str, patch: str) -> str:
+    """Apply a unified diff to text
+
+    Hunks must apply exactly where their headers say; callers check a base
+    hash first, so there is no fuzzy matching. File headers (---/+++) are
+    optional.
+    """
+    source = LINE.findall(original)
+    lines = LINE.findall(patch)
+    result: List[str] = []
+    position = 0
+    seen_hunk = False
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        i += 1
+        match = HUNK_HEADER.match(line)
+        if not match:
+            if not seen_hunk or not line.strip():
+                # File headers before the first hunk, or trailing blank lines
+                continue
+            raise PatchError(f"Unexpected line {i} in patch")
+        seen_hunk = True
+        old_start = int(match.group(1))
+        old_count = int(match.group(2)) if match.group(2) is not None else 1
+        new_count = int(match.group(4)) if match.group(4) is not None else 1
+        # A zero-length range names the line before the hunk
+        start = old_start - 1 if old_count else old_start
+        if start < position or start > len(source):
+            raise PatchError(f"Hunk at line {old_start} is out of order or past the end")
+        result.extend(source[position:start])
+        position = start
+
+        removed = added = 0
+        last_tag = None
+        while i < len(lines):
+            body = lines[i]
+            if _strip(body) == NO_NEWLINE:
+                i += 1
+                # The line before has no newline in the version(s) it belongs to
+                if last_tag in (" ", "+") and result:
+                    result[-1] = _strip(result[-1])
+                continue
+            if removed == old_count and added == new_count:
+                break
+            i += 1
+            tag, text = body[:1], body[1:]
+            if body in ("\n", "\r\n"):
+                # Some tools drop the space of an empty context line
+                tag, text = " ", body
+            if tag in (" ", "-"):
+                if position >= len(source) or _strip(source[position]) != _strip(text):
+                    raise PatchError(f"Patch does not match line {position + 1}")
+                if tag == " ":
+                    result.append(source[position])
+                    added += 1
+                position += 1
+                removed += 1
+            elif tag == "+":
+                result.append(text)
+                added += 1
+            else:
+                raise PatchError(f"Unexpected line {i} in patch")
+            last_tag = tag
+        if removed != old_count or added != new_count:
+            raise PatchError(f"Hunk at line {old_start} is truncated")
+
+    result.extend(source[position:])
+    return "".join(result)
+
+
+def _strip(line: str) -> str:
+    return line.rstrip("\r\n")
@@ -0,0 +1,98 @@
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional, Tuple
+from sqlalchemy.orm import Session
+from .file_manager import file_manager
+from .models import Project
+
+
+class CachedProject(NamedTuple):
+    id: int
+    name: str
+    # The project directory, resolved
+    path: Path
+
+
+class ProjectCache:
+    """Project id to name and directory, without a query per file request
+
+    Entries live for ttl seconds. Creating or deleting a project rewrites a
+    stamp file next to the projects, and a lookup that finds the stamp
+    replaced drops every entry, so other worker processes notice within a
+    stat call rather than only when the TTL runs out. Unknown ids are not
+    cached.
+    """
+
+    def __init__(self, ttl: float = 30.0):
+        self.ttl = ttl
+        self._entries: Dict[int, Tuple[CachedProject, float]] = {}
+        self._lock = threading.Lock()
+        # Bumped on every invalidation, so a lookup racing one doesn't store a stale entry
+        self._generation = 0
+        self._stamp: Optional[Tuple[int, int]] = None
+
+    def get(self, db: Session, project_id: int) -> Optional[CachedProject]:
+        """The project with this id, querying the database only on a miss"""
+        self._check_stamp()
+        entry = self._entries.get(project_id)
+        if entry is not None and entry[1] > time.monotonic():
+            return entry[0]
+
+        generation = self._generation
+        project = db.query(Project.id, Project.name).filter(Project.id == project_id).first()
+        if project is None:
+            return None
+        cached = CachedProject(project.id, project.name, file_manager.project_root(project.name))
+        with self._lock:
+            if generation == self._generation:
+                self._entries[project_id] = (cached, time.monotonic() + self.ttl)
+        return cached
+
+    def invalidate(self, project_id: Optional[int] = None):
+        """Forget one project, or every project, here and in other workers"""
+        with self._lock:
+            self._generation += 1
+            if project_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(project_id, None)
+        self._write_stamp()
+
+    def _stamp_path(self) -> Path:
+        return file_manager.base_path / ".snappods" / "projects.stamp"
+
+    def _read_stamp(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self._stamp_path())
+        except OSError:
+            return None
+        return st.st_ino, st.st_mtime_ns
+
+    def _check_stamp(self):
+        stamp = self._read_stamp()
+        if stamp == self._stamp:
+            return
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._stamp = stamp
+
+    def _write_stamp(self):
+        """Replace the stamp file, giving it a new inode other workers will see"""
+        path = self._stamp_path()
+        temp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path.write_text(uuid.uuid4().hex)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Error writing project cache stamp: {e}")
+            return
+        with self._lock:
+            self._stamp = self._read_stamp()
+
+
+project_cache = ProjectCache(ttl=float(os.getenv("PROJECT_CACHE_TTL", "30")))
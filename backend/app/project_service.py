@@ -1,15 +1,22 @@
-from sqlalchemy.orm import Session
-from .models import Project
+import shutil
+from datetime import datetime
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from .models import DeployFingerprint, Project
 from .file_manager import file_manager
+from .project_cache import project_cache
+from .project_usage import usage_tracker
+from .search_index import search_index
 from typing import List, Optional
 
 
 class ProjectService:
     @staticmethod
-    def create_project(db: Session, name: str) -> Optional[Project]:
+    async def create_project(db: AsyncSession, name: str) -> Optional[Project]:
         """Create a new project"""
         # Check if project already exists
-        existing = db.query(Project).filter(Project.name == name).first()
+        existing = await ProjectService.get_project_by_name(db, name)
         if existing:
             return None
         
@@ -17,44 +24,63 @@ class ProjectService:
         project_path = file_manager.create_project_directory(name)
         
         # Create database record
-        project = Project(name=name, path=str(project_path))
+        project = Project(name=name, path=str(project_path), usage_bytes=0, usage_files=0,
+                          usage_scanned_at=datetime.utcnow())
         db.add(project)
-        db.commit()
-        db.refresh(project)
+        await db.commit()
+        await db.refresh(project)
+        usage_tracker.add_project(name)
+        # Workers may have looked the new id up before it existed
+        project_cache.invalidate(project.id)
         return project
 
     @staticmethod
-    def get_project(db: Session, project_id: int) -> Optional[Project]:
+    async def get_project(db: AsyncSession, project_id: int) -> Optional[Project]:
         """Get project by ID"""
-        return db.query(Project).filter(Project.id == project_id).first()
+        return await db.get(Project, project_id)
 
     @staticmethod
-    def get_project_by_name(db: Session, name: str) -> Optional[Project]:
+    async def get_project_by_name(db: AsyncSession, name: str) -> Optional[Project]:
         """Get project by name"""
-        return db.query(Project).filter(Project.name == name).first()
+        return await db.scalar(select(Project).where(Project.name == name))
 
     @staticmethod
-    def list_projects(db: Session) -> List[Project]:
+    async def list_projects(db: AsyncSession) -> List[Project]:
         """List all projects"""
-        return db.query(Project).all()
+        return list(await db.scalars(select(Project)))
 
     @staticmethod
-    def delete_project(db: Session, project_id: int) -> bool:
+    async def set_quota(db: AsyncSession, project_id: int, quota_bytes: Optional[int]) -> bool:
+        """Set a project's disk quota; None falls back to the default"""
+        project = await db.get(Project, project_id)
+        if not project:
+            return False
+        project.quota_bytes = quota_bytes
+        await db.commit()
+        usage_tracker.set_quota(project.name, quota_bytes)
+        return True
+
+    @staticmethod
+    async def delete_project(db: AsyncSession, project_id: int) -> bool:
         """Delete a project"""
-        project = db.query(Project).filter(Project.id == project_id).first()
+        project = await db.get(Project, project_id)
         if not project:
             return False
         
-        # Delete project directory
-        import shutil
+        # Delete project directory, which may be large, off the event loop
         project_path = file_manager.get_project_path(project.name)
         if project_path.exists():
-            shutil.rmtree(project_path)
+            await run_in_threadpool(shutil.rmtree, project_path)
+        await run_in_threadpool(search_index.drop, project.name)
+        file_manager.forget_project(project.name)
+        usage_tracker.forget(project.name)
+        # Project ids can be reused, and a new project must not inherit this one's last deploy
+        await db.execute(delete(DeployFingerprint).where(DeployFingerprint.project_id == project.id))
         
-        db.delete(project)
-        db.commit()
+        await db.delete(project)
+        await db.commit()
+        project_cache.invalidate(project.id)
         return True
 
 
 project_service = ProjectService()
-
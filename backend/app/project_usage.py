@@ -0,0 +1,240 @@
+import asyncio
+import os
+import stat
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import or_, select, update
+from starlette.concurrency import run_in_threadpool
+from .file_manager import file_manager
+from .models import AsyncSessionLocal, Project
+
+
+class QuotaExceeded(Exception):
+    """A write that would take a project past its disk quota"""
+
+    def __init__(self, quota: int, needed: int):
+        super().__init__(f"Project quota of {quota} bytes exceeded: {needed} bytes would be used")
+        self.quota = quota
+        self.needed = needed
+
+
+class UsageTracker:
+    """Per-project disk usage, kept current from FileManager's changes
+
+    Totals are stored on the projects table. Every flush_interval seconds a
+    worker adds the changes it saw since its last flush to them, as an
+    UPDATE of the column plus the delta, then reloads every project's
+    totals to pick up other workers' changes. Every reconcile_interval
+    seconds each project is walked and its exact totals stored, which
+    corrects drift from changes made outside the API or writes that raced;
+    projects that have never been walked are scanned at startup.
+
+    A walk stores the time it started as usage_scanned_at, and a flush only
+    adds changes to totals stored before its first change, so changes a
+    walk has already counted aren't added again by another worker.
+    """
+
+    def __init__(self, default_quota: Optional[int] = None, flush_interval: float = 5.0,
+                 reconcile_interval: float = 3600.0):
+        self.default_quota = default_quota
+        self.flush_interval = flush_interval
+        self.reconcile_interval = reconcile_interval
+        # [bytes, files] per project; None while a project has not been scanned
+        self._totals: Dict[str, Optional[List[int]]] = {}
+        self._pending: Dict[str, List[int]] = {}
+        # When each project's first pending change was seen
+        self._pending_since: Dict[str, datetime] = {}
+        self._quotas: Dict[str, Optional[int]] = {}
+        self._scanned_at: Dict[str, Optional[datetime]] = {}
+        # record is called from threadpool threads
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, project_name: str, bytes_delta: int, files_delta: int):
+        """Note a change in a project's size; a FileManager usage listener"""
+        with self._lock:
+            pending = self._pending.get(project_name)
+            if pending is None:
+                pending = self._pending[project_name] = [0, 0]
+                self._pending_since[project_name] = datetime.utcnow()
+            pending[0] += bytes_delta
+            pending[1] += files_delta
+
+    def usage(self, project_name: str) -> Optional[Tuple[int, int]]:
+        """Bytes and files a project uses, or None before its first scan"""
+        with self._lock:
+            totals = self._totals.get(project_name)
+            if totals is None:
+                return None
+            pending = self._pending.get(project_name, (0, 0))
+            return totals[0] + pending[0], totals[1] + pending[1]
+
+    def quota(self, project_name: str) -> Optional[int]:
+        """The project's quota in bytes, or None for no limit"""
+        quota = self._quotas.get(project_name)
+        return quota if quota is not None else self.default_quota
+
+    def scanned_at(self, project_name: str) -> Optional[datetime]:
+        return self._scanned_at.get(project_name)
+
+    def remaining(self, project_name: str) -> Optional[int]:
+        """Bytes a project may still grow by, or None if that is unlimited or unknown"""
+        quota = self.quota(project_name)
+        usage = self.usage(project_name)
+        if quota is None or usage is None:
+            return None
+        return max(quota - usage[0], 0)
+
+    def check(self, project_name: str, file_path: str, size: int):
+        """Raise QuotaExceeded if writing size bytes to file_path would exceed the quota"""
+        quota = self.quota(project_name)
+        usage = self.usage(project_name)
+        if quota is None or usage is None:
+            return
+        replaced = 0
+        full_path = file_manager.resolve_path(project_name, file_path)
+        if full_path is not None:
+            try:
+                st = os.lstat(full_path)
+                if stat.S_ISREG(st.st_mode):
+                    replaced = st.st_size
+            except OSError:
+                pass
+        needed = usage[0] - replaced + size
+        if needed > quota:
+            raise QuotaExceeded(quota, needed)
+
+    def add_project(self, project_name: str):
+        """Start a new, empty project at zero usage"""
+        with self._lock:
+            self._totals[project_name] = [0, 0]
+            self._pending.pop(project_name, None)
+            self._pending_since.pop(project_name, None)
+            self._quotas.pop(project_name, None)
+            self._scanned_at[project_name] = datetime.utcnow()
+
+    def forget(self, project_name: str):
+        """Drop a deleted project"""
+        with self._lock:
+            self._totals.pop(project_name, None)
+            self._pending.pop(project_name, None)
+            self._pending_since.pop(project_name, None)
+            self._quotas.pop(project_name, None)
+            self._scanned_at.pop(project_name, None)
+
+    def set_quota(self, project_name: str, quota: Optional[int]):
+        self._quotas[project_name] = quota
+
+    def start(self):
+        """Start the background task that flushes and reconciles usage"""
+        if self._task is not None and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background task, saving changes not yet flushed"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            print(f"Error saving project usage: {e}")
+
+    async def _run(self):
+        await self.reload()
+        # Projects created before usage was tracked have never been scanned
+        unscanned = [name for name, totals in self._totals.items() if totals is None]
+        await self.reconcile(unscanned)
+        last_reconcile = time.monotonic()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                if time.monotonic() - last_reconcile >= self.reconcile_interval:
+                    last_reconcile = time.monotonic()
+                    await self.reconcile()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error updating project usage: {e}")
+
+    async def flush(self):
+        """Add the changes seen since the last flush to the stored totals, then reload them"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            since, self._pending_since = self._pending_since, {}
+            # Counted in the totals straight away, so usage doesn't dip until the reload
+            for name, (bytes_delta, files_delta) in pending.items():
+                totals = self._totals.get(name)
+                if totals is not None:
+                    totals[0] += bytes_delta
+                    totals[1] += files_delta
+        if pending:
+            async with AsyncSessionLocal() as db:
+                for name, (bytes_delta, files_delta) in pending.items():
+                    # A walk that started after these changes began has counted them
+                    await db.execute(
+                        update(Project).where(
+                            Project.name == name,
+                            or_(Project.usage_scanned_at.is_(None), Project.usage_scanned_at < since[name]),
+                        ).values(
+                            usage_bytes=Project.usage_bytes + bytes_delta,
+                            usage_files=Project.usage_files + files_delta,
+                        )
+                    )
+                await db.commit()
+        await self.reload()
+
+    async def reload(self):
+        """Read every project's totals and quota from the database"""
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(select(
+                Project.name, Project.usage_bytes, Project.usage_files, Project.usage_scanned_at, Project.quota_bytes
+            ))).all()
+        with self._lock:
+            self._totals = {
+                row.name: [row.usage_bytes, row.usage_files] if row.usage_bytes is not None else None
+                for row in rows
+            }
+            self._scanned_at = {row.name: row.usage_scanned_at for row in rows}
+            self._quotas = {row.name: row.quota_bytes for row in rows}
+
+    async def reconcile(self, project_names: Optional[List[str]] = None):
+        """Walk projects (all of them by default) and store their exact totals
+
+        A write that lands while its project is being walked may be left
+        out; the next reconciliation picks it up.
+        """
+        if project_names is None:
+            project_names = list(self._totals)
+        for name in project_names:
+            scanned_at = datetime.utcnow()
+            size, files = await run_in_threadpool(file_manager.disk_usage, name)
+            with self._lock:
+                # The walk saw the changes this worker hadn't flushed yet
+                self._pending.pop(name, None)
+                self._pending_since.pop(name, None)
+                self._totals[name] = [size, files]
+                self._scanned_at[name] = scanned_at
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(Project).where(Project.name == name).values(
+                        usage_bytes=size, usage_files=files, usage_scanned_at=scanned_at
+                    )
+                )
+                await db.commit()
+
+
+usage_tracker = UsageTracker(
+    default_quota=int(os.getenv("PROJECT_QUOTA_BYTES", "0")) or None,
+    flush_interval=float(os.getenv("USAGE_FLUSH_INTERVAL", "5")),
+    reconcile_interval=float(os.getenv("USAGE_RECONCILE_INTERVAL", "3600")),
+)
+file_manager.add_usage_listener(usage_tracker.record)
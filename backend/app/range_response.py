@@ -0,0 +1,149 @@
+import mimetypes
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from typing import BinaryIO, Optional, Tuple
+from urllib.parse import quote
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+
+def file_etag(stat_result: os.stat_result) -> str:
+    """Strong validator from inode, size and nanosecond mtime"""
+    return f'"{stat_result.st_ino:x}-{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """First byte and length of a single-range Range header
+
+    Returns None when the header should be ignored (not bytes, malformed or
+    several ranges) and raises ValueError when it can't be satisfied.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    start_text, dash, end_text = (part.strip() for part in spec.strip().partition("-"))
+    if not dash or not (start_text or end_text):
+        return None
+    if (start_text and not start_text.isdigit()) or (end_text and not end_text.isdigit()):
+        return None
+
+    if not start_text:
+        # Suffix range: the last N bytes
+        suffix = int(end_text)
+        if suffix == 0 or size == 0:
+            raise ValueError("Unsatisfiable suffix range")
+        return max(size - suffix, 0), min(suffix, size)
+    start = int(start_text)
+    if start >= size:
+        raise ValueError("Range starts past the end of the file")
+    end = int(end_text) if end_text else size - 1
+    if end < start:
+        return None
+    return start, min(end, size - 1) - start + 1
+
+
+class RangeFileResponse(Response):
+    """Serve an open file with conditional GET and single byte-range support
+
+    The file is sent from the descriptor the route opened, so the headers and
+    body describe the same file even if it is replaced in between. When the
+    ASGI server offers the zero-copy send extension, the kernel copies the
+    bytes; otherwise they are streamed in chunks from a worker thread.
+    """
+
+    chunk_size = 64 * 1024
+
+    def __init__(self, file: BinaryIO, request_headers: Headers, filename: Optional[str] = None,
+                 media_type: Optional[str] = None, inline: bool = False):
+        self.file = file
+        self.background = None
+        stat_result = os.fstat(file.fileno())
+        size = stat_result.st_size
+        etag = file_etag(stat_result)
+        last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+
+        if media_type is None:
+            media_type = (mimetypes.guess_type(filename)[0] if filename else None) or "application/octet-stream"
+        self.media_type = media_type
+
+        headers = {
+            "accept-ranges": "bytes",
+            "etag": etag,
+            "last-modified": last_modified,
+        }
+        if filename:
+            disposition = "inline" if inline else "attachment"
+            headers["content-disposition"] = f"{disposition}; filename*=utf-8''{quote(filename)}"
+
+        self.offset, self.length = 0, size
+        if self._not_modified(request_headers, etag, stat_result.st_mtime):
+            self.status_code = 304
+            self.length = 0
+        else:
+            self.status_code = 200
+            range_header = request_headers.get("range")
+            if range_header and self._if_range_holds(request_headers.get("if-range"), etag, last_modified):
+                try:
+                    byte_range = parse_range(range_header, size)
+                except ValueError:
+                    self.status_code = 416
+                    self.length = 0
+                    headers["content-range"] = f"bytes */{size}"
+                    byte_range = None
+                if byte_range is not None:
+                    self.status_code = 206
+                    self.offset, self.length = byte_range
+                    headers["content-range"] = f"bytes {self.offset}-{self.offset + self.length - 1}/{size}"
+            headers["content-length"] = str(self.length)
+        self.init_headers(headers)
+
+    @staticmethod
+    def _not_modified(request_headers: Headers, etag: str, mtime: float) -> bool:
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            candidates = [value.strip() for value in if_none_match.split(",")]
+            return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+        if_modified_since = request_headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    @staticmethod
+    def _if_range_holds(if_range: Optional[str], etag: str, last_modified: str) -> bool:
+        """A Range applies unless If-Range names a different version"""
+        if if_range is None:
+            return True
+        return if_range.strip() in (etag, last_modified)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        try:
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            if scope["method"].upper() == "HEAD" or self.length == 0:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+            elif "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": self.file.fileno(),
+                    "offset": self.offset,
+                    "count": self.length,
+                    "more_body": False,
+                })
+            else:
+                await anyio.to_thread.run_sync(self.file.seek, self.offset)
+                remaining = self.length
+                while remaining > 0:
+                    chunk = await anyio.to_thread.run_sync(self.file.read, min(self.chunk_size, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+                if remaining > 0:
+                    # The file shrank while sending; end the body
+                    await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            self.file.close()
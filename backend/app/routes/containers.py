@@ -1,103 +1,203 @@
-from fastapi import APIRouter, HTTPException, Response
-from typing import List
-from ..schemas import ContainerInfo, ContainerStats, DeployRequest
+from fastapi import APIRouter, HTTPException, Query, Response
+from typing import List, Optional
+from ..schemas import ContainerInfo, ContainerStats, DeployJobResponse, DeployRequest
 from ..docker_client import docker_client
-from ..models import Project, get_db
-from sqlalchemy.orm import Session
+from ..container_index import container_index
+from ..container_logs import read_log_lines, timestamp_key
+from ..deploy_jobs import deploy_scheduler
+from ..log_store import LogQuery, log_store
+from ..stats_history import stats_history
+from ..stats_hub import stats_hub
+from ..docker_http import DockerNotFound
+from ..models import Project, get_async_db
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import Depends
-import subprocess
 import os
+import re
 
 router = APIRouter(prefix="/api/containers", tags=["containers"])
 
 
 @router.get("/", response_model=List[ContainerInfo])
-def list_containers(all: bool = True):
+async def list_containers(all: bool = True):
     """List all containers"""
-    return docker_client.list_containers(all=all)
+    # Served from the event-driven index; query the daemon only while it resyncs
+    containers = container_index.list(all=all)
+    if containers is None:
+        containers = await docker_client.list_containers(all=all)
+    return containers
+
+
+@router.get("/stats", response_model=List[ContainerStats])
+async def get_all_container_stats(ids: Optional[str] = None, max_age: float = Query(5.0, ge=0)):
+    """Get stats for every running container, or a comma-separated list of ids
+
+    Containers are sampled concurrently; recent streamed samples younger than
+    max_age seconds are reused, and containers that fail to report are omitted.
+    """
+    if ids:
+        container_ids = [value.strip() for value in ids.split(",") if value.strip()]
+    else:
+        containers = container_index.list(all=False)
+        if containers is None:
+            containers = await docker_client.list_containers(all=False)
+        container_ids = [container.id for container in containers]
+    return await stats_hub.sample(container_ids, max_age=max_age)
 
 
 @router.get("/{container_id}/stats", response_model=ContainerStats)
-def get_container_stats(container_id: str):
+async def get_container_stats(container_id: str):
     """Get container stats"""
-    stats = docker_client.get_container_stats(container_id)
+    stats = await docker_client.get_container_stats(container_id)
     if not stats:
         raise HTTPException(status_code=404, detail="Container not found or stats unavailable")
     return stats
 
 
+@router.get("/{container_id}/stats/history")
+async def get_container_stats_history(
+    container_id: str,
+    range_seconds: int = Query(3600, alias="range", ge=1, le=86400),
+    step: Optional[int] = Query(None, ge=1)
+):
+    """Get recorded container stats downsampled to one point per step seconds
+
+    Each metric comes back as parallel min/avg/max arrays aligned with
+    timestamps. Without a step, the range is split into about 300 points.
+    """
+    history = stats_history.query(container_id, range_seconds, step or max(range_seconds // 300, 1))
+    if history is None:
+        raise HTTPException(status_code=404, detail="No stats recorded for container")
+    return history
+
+
 @router.post("/{container_id}/stop")
-def stop_container(container_id: str):
+async def stop_container(container_id: str):
     """Stop a container"""
-    success = docker_client.stop_container(container_id)
+    success = await docker_client.stop_container(container_id)
     if not success:
         raise HTTPException(status_code=404, detail="Container not found")
     return {"message": "Container stopped successfully"}
 
 
 @router.post("/{container_id}/start")
-def start_container(container_id: str):
+async def start_container(container_id: str):
     """Start a container"""
-    success = docker_client.start_container(container_id)
+    success = await docker_client.start_container(container_id)
     if not success:
         raise HTTPException(status_code=404, detail="Container not found")
     return {"message": "Container started successfully"}
 
 
 @router.get("/{container_id}/logs")
-def get_container_logs(container_id: str, tail: int = 100, follow: bool = False):
-    """Get container logs"""
-    logs = docker_client.get_container_logs(container_id, tail=tail, follow=follow)
-    if logs is None:
+async def get_container_logs(container_id: str, tail: int = 100, since: Optional[str] = None):
+    """Get container logs
+
+    Pass the returned cursor back as `since` to get every line written after
+    it, whatever `tail` is; live tailing is served by the /ws/logs websocket.
+    """
+    lines = []
+    cursor = since
+    try:
+        # A tail would drop lines between the cursor and the newest ones
+        async for line in read_log_lines(container_id, tail=None if since else tail, since=since):
+            lines.append(line.text)
+            cursor = line.timestamp or cursor
+    except DockerNotFound:
         raise HTTPException(status_code=404, detail="Container not found")
-    
-    # Decode logs if bytes
-    if isinstance(logs, bytes):
-        logs = logs.decode('utf-8', errors='replace')
-    
-    return {"logs": logs}
-
-
-@router.post("/deploy")
-def deploy_container(deploy_request: DeployRequest, db: Session = Depends(get_db)):
-    """Deploy container using docker-compose"""
-    project = db.query(Project).filter(Project.id == deploy_request.project_id).first()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid since cursor")
+    except Exception as e:
+        print(f"Error getting container logs: {e}")
+        raise HTTPException(status_code=404, detail="Container not found")
+
+    return {"logs": "".join(lines), "cursor": cursor}
+
+
+@router.get("/{container_id}/logs/search")
+async def search_container_logs(
+    container_id: str,
+    q: Optional[str] = None,
+    regex: bool = False,
+    ignore_case: bool = False,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    stream: Optional[str] = Query(None, pattern="^(stdout|stderr)$"),
+    level: Optional[str] = None,
+    cursor: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=1000)
+):
+    """Search the server-side buffer of a container's recent logs
+
+    Results are newest first; pass next_cursor back as cursor for the next
+    page. level takes a comma-separated list of levels detected from JSON logs.
+    """
+    try:
+        query = LogQuery(
+            pattern=re.compile(q, re.IGNORECASE if ignore_case else 0) if q and regex else None,
+            substring=q if q and not regex else None,
+            ignore_case=ignore_case,
+            since=timestamp_key(since) if since else None,
+            until=timestamp_key(until) if until else None,
+            stream=stream,
+            levels={value.strip().lower() for value in level.split(",")} if level else None,
+            before=cursor,
+            limit=limit
+        )
+    except re.error as e:
+        raise HTTPException(status_code=400, detail=f"Invalid regex: {e}")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid since or until timestamp")
+
+    try:
+        return await log_store.search(container_id, query)
+    except DockerNotFound:
+        raise HTTPException(status_code=404, detail="Container not found")
+
+
+@router.post("/deploy", response_model=DeployJobResponse, status_code=202)
+async def deploy_container(deploy_request: DeployRequest, db: AsyncSession = Depends(get_async_db)):
+    """Queue a docker-compose deploy of a project
+
+    Returns the job straight away; follow it on /ws/deploy/{job_id} or poll
+    /deploy/jobs/{job_id}. Unless force is set, only services whose inputs
+    changed since the last successful deploy are brought up.
+    """
+    project = await db.get(Project, deploy_request.project_id)
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
-    
-    project_path = project.path
-    
+
     # Check if docker-compose.yml exists
-    compose_file = os.path.join(project_path, "docker-compose.yml")
+    compose_file = os.path.join(project.path, "docker-compose.yml")
     if not os.path.exists(compose_file):
         raise HTTPException(status_code=400, detail="docker-compose.yml not found in project")
-    
-    try:
-        # Run docker-compose up -d
-        # Use shell=True for better compatibility with older docker-compose versions (RHEL 7)
-        # For older docker-compose, we change to the directory and run from there
-        cmd = f"cd {project_path} && docker-compose -f docker-compose.yml up -d"
-        result = subprocess.run(
-            cmd,
-            shell=True,
-            cwd=project_path,
-            capture_output=True,
-            text=True,
-            timeout=300
-        )
-        
-        if result.returncode != 0:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Deployment failed: {result.stderr}"
-            )
-        
-        return {
-            "message": "Deployment started successfully",
-            "output": result.stdout
-        }
-    except subprocess.TimeoutExpired:
-        raise HTTPException(status_code=500, detail="Deployment timeout")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Deployment error: {str(e)}")
+
+    return await deploy_scheduler.submit(db, project, force=deploy_request.force)
+
+
+@router.get("/deploy/jobs", response_model=List[DeployJobResponse])
+async def list_deploy_jobs(project_id: Optional[int] = None, limit: int = Query(50, ge=1, le=500),
+                           db: AsyncSession = Depends(get_async_db)):
+    """List deploy jobs, newest first"""
+    return await deploy_scheduler.list(db, project_id=project_id, limit=limit)
+
+
+@router.get("/deploy/jobs/{job_id}", response_model=DeployJobResponse)
+async def get_deploy_job(job_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Get the status of a deploy job"""
+    job = await deploy_scheduler.get(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Deploy job not found")
+    return job
+
+
+@router.post("/deploy/jobs/{job_id}/cancel", response_model=DeployJobResponse)
+async def cancel_deploy_job(job_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Cancel a queued or running deploy job"""
+    job = await deploy_scheduler.get(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Deploy job not found")
+    if not deploy_scheduler.cancel(job_id):
+        raise HTTPException(status_code=409, detail=f"Deploy job is already {job['status']}")
+    return job
 
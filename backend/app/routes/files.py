@@ -1,53 +1,189 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, Query, Header, Request, Response
 from sqlalchemy.orm import Session
-from typing import List
-from ..models import get_db, Project
-from ..schemas import FileCreate, FileResponse, FileTreeItem
-from ..file_manager import file_manager
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import UploadFile
+from typing import List, Optional
+from urllib.parse import quote
+import hashlib
+import json
+import os
+from ..models import get_db
+from ..schemas import FileBatch, FileCreate, FileResponse, FileTreeItem, FileWrite, UploadCommit, UploadCreate
+from ..file_batch import BatchError
+from ..file_manager import FileConflictError, file_manager
+from ..patching import PatchError
+from ..project_cache import CachedProject, project_cache
+from ..project_usage import QuotaExceeded, usage_tracker
+from ..range_response import RangeFileResponse
+from ..search_index import search_index
+from ..uploads import UploadError, upload_manager
 
 router = APIRouter(prefix="/api/files", tags=["files"])
 
 
-def get_project_by_id(db: Session, project_id: int) -> Project:
-    """Helper to get project and verify it exists"""
-    project = db.query(Project).filter(Project.id == project_id).first()
+def get_project_by_id(db: Session, project_id: int) -> CachedProject:
+    """Helper to get project and verify it exists
+
+    Served from the project cache; the session only connects on a miss.
+    """
+    project = project_cache.get(db, project_id)
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     return project
 
 
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header covers the given strong ETag"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as RFC 9110 prescribes for If-None-Match
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    return etag in candidates or f"W/{etag}" in candidates
+
+
 @router.get("/project/{project_id}/tree", response_model=List[FileTreeItem])
-def list_files(project_id: int, subpath: str = "", db: Session = Depends(get_db)):
-    """List files in a project"""
+def list_files(
+    project_id: int,
+    subpath: str = "",
+    depth: int = Query(1, ge=1, le=32),
+    cursor: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=10000),
+    include_ignored: bool = False,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """List files in a project
+
+    Directories deeper than depth come back with children set to null. When
+    a directory has more than limit entries, the URL-encoded X-Next-Cursor
+    header holds the cursor for the next page. The ETag changes whenever the
+    listing does, and If-None-Match is answered with 304.
+    """
     project = get_project_by_id(db, project_id)
-    return file_manager.list_files(project.name, subpath)
+    items, next_cursor = file_manager.list_files(
+        project.name, subpath, depth=depth, cursor=cursor, limit=limit, include_ignored=include_ignored
+    )
+    # The walker already builds plain JSON, so skip re-validating every node
+    body = json.dumps(items, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    digest = hashlib.blake2b(body, digest_size=16)
+    digest.update((next_cursor or "").encode("utf-8"))
+    etag = f'"{digest.hexdigest()}"'
+    # no-cache lets browsers keep the listing but revalidate it every time
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if next_cursor:
+        headers["X-Next-Cursor"] = quote(next_cursor)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 
 @router.get("/project/{project_id}/read")
-def read_file(project_id: int, file_path: str, db: Session = Depends(get_db)):
-    """Read a file"""
+def read_file(
+    project_id: int,
+    file_path: str,
+    offset: Optional[int] = Query(None, ge=0),
+    length: Optional[int] = Query(None, ge=1, le=16 * 1024 * 1024),
+    db: Session = Depends(get_db)
+):
+    """Read a file
+
+    With offset or length, only a window of the file is returned (1 MiB by
+    default); next_offset is where the next window starts, or null at the end.
+    """
     project = get_project_by_id(db, project_id)
-    content = file_manager.read_file(project.name, file_path)
-    if content is None:
+    windowed = offset is not None or length is not None
+    result = file_manager.read_text(
+        project.name, file_path,
+        offset=(offset or 0) if windowed else None,
+        length=(length or 1024 * 1024) if windowed else None
+    )
+    if result is None:
         raise HTTPException(status_code=404, detail="File not found")
-    
-    file_info = file_manager.get_file_info(project.name, file_path)
+
     return {
         "path": file_path,
-        "content": content,
         "is_directory": False,
-        "size": file_info.get("size") if file_info else None
+        **result
     }
 
 
+@router.get("/project/{project_id}/search")
+def search_files(
+    project_id: int,
+    q: str = Query(..., min_length=1, max_length=1000),
+    regex: bool = False,
+    case_sensitive: bool = False,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db)
+):
+    """Search file contents for a literal string or a regular expression
+
+    The first search of a project starts building its index; until it is
+    built, searches read every file, which is slower for large projects.
+    Pass next_cursor back as cursor for more hits.
+    """
+    project = get_project_by_id(db, project_id)
+    try:
+        return search_index.search(
+            project.name, q, regex=regex, case_sensitive=case_sensitive, cursor=cursor, limit=limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.api_route("/project/{project_id}/download", methods=["GET", "HEAD"])
+def download_file(project_id: int, file_path: str, request: Request, inline: bool = False,
+                  db: Session = Depends(get_db)):
+    """Download a file's raw bytes
+
+    Supports single byte ranges, ETag and Last-Modified validators, and
+    conditional requests.
+    """
+    project = get_project_by_id(db, project_id)
+    f = file_manager.open_file(project.name, file_path)
+    if f is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    return RangeFileResponse(f, request.headers, filename=os.path.basename(file_path), inline=inline)
+
+
 @router.post("/project/{project_id}/write")
-def write_file(project_id: int, file_path: str, content: str, db: Session = Depends(get_db)):
-    """Write a file"""
+def write_file(
+    project_id: int,
+    file_path: str,
+    content: Optional[str] = None,
+    body: Optional[FileWrite] = None,
+    db: Session = Depends(get_db)
+):
+    """Write a file
+
+    The JSON body holds either the new content or a unified diff as patch.
+    With base_sha256, the sha256 returned by /read, the write is refused
+    with 409 if the file changed since. The content query parameter is still
+    accepted from older clients.
+    """
     project = get_project_by_id(db, project_id)
-    success = file_manager.write_file(project.name, file_path, content)
-    if not success:
+    if body is None:
+        body = FileWrite(content=content)
+    if (body.content is None) == (body.patch is None):
+        raise HTTPException(status_code=400, detail="Send either content or patch")
+
+    try:
+        result = file_manager.update_file(
+            project.name, file_path, content=body.content, patch=body.patch, base_sha256=body.base_sha256
+        )
+    except FileConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except PatchError as e:
+        raise HTTPException(status_code=422, detail=f"Patch does not apply: {e}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"Error writing file: {e}")
         raise HTTPException(status_code=400, detail="Failed to write file")
-    return {"message": "File written successfully"}
+    return {"message": "File written successfully", **result}
 
 
 @router.post("/project/{project_id}/create")
@@ -90,21 +226,130 @@ def rename_file(project_id: int, old_path: str, new_path: str, db: Session = Dep
     return {"message": "File renamed successfully"}
 
 
-@router.post("/project/{project_id}/upload")
-async def upload_file(
+@router.post("/project/{project_id}/batch")
+def apply_batch(project_id: int, batch: FileBatch, db: Session = Depends(get_db)):
+    """Apply several file operations in order, all or nothing
+
+    Operations are create (fails if the file exists), write (content or
+    patch, optionally with base_sha256), mkdir, rename (to new_path) and
+    delete. If any of them fails, none is applied and the error detail
+    holds the index of the failing operation.
+    """
+    project = get_project_by_id(db, project_id)
+    try:
+        results = file_manager.apply_batch(
+            project.name, [operation.model_dump() for operation in batch.operations]
+        )
+    except BatchError as e:
+        raise HTTPException(status_code=e.status, detail={"index": e.index, "message": e.message})
+    return {"results": results}
+
+
+@router.post(
+    "/project/{project_id}/upload",
+    openapi_extra={"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+        "type": "object", "required": ["file"], "properties": {"file": {"type": "string", "format": "binary"}},
+    }}}}},
+)
+async def upload_file(project_id: int, file_path: str, request: Request, db: Session = Depends(get_db)):
+    """Upload a file, sent as the multipart field "file"
+
+    The form is parsed here rather than by FastAPI so that a request whose
+    Content-Length would take the project past its quota is refused with
+    413 before any of the body is read. The multipart body is spooled to
+    disk by the form parser and copied into place in chunks; large files
+    should use the resumable upload API.
+    """
+    project = await run_in_threadpool(get_project_by_id, db, project_id)
+    length = request.headers.get("content-length", "")
+    try:
+        if length.isdigit():
+            # The multipart framing counts too, so this errs by a few hundred bytes
+            usage_tracker.check(project.name, file_path, int(length))
+    except QuotaExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    form = await request.form()
+    try:
+        file = form.get("file")
+        if not isinstance(file, UploadFile):
+            raise HTTPException(status_code=422, detail='Expected the file in a multipart field named "file"')
+        try:
+            # Requests without a Content-Length are checked once the body is in
+            usage_tracker.check(project.name, file_path, file.size or 0)
+        except QuotaExceeded as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        success = await run_in_threadpool(file_manager.save_upload, project.name, file_path, file.file)
+    finally:
+        await form.close()
+    if not success:
+        raise HTTPException(status_code=400, detail="Failed to upload file")
+    return {"message": "File uploaded successfully", "filename": file.filename}
+
+
+@router.post("/project/{project_id}/uploads")
+def create_upload(project_id: int, upload: UploadCreate, db: Session = Depends(get_db)):
+    """Start a resumable upload
+
+    PUT the file's bytes to the returned upload in chunks of about
+    chunk_size, each at the current offset, then commit it.
+    """
+    project = get_project_by_id(db, project_id)
+    try:
+        return upload_manager.create(project.name, upload.path, upload.size, upload.sha256)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status, detail=e.message)
+
+
+@router.get("/project/{project_id}/uploads/{upload_id}")
+def get_upload(project_id: int, upload_id: str, db: Session = Depends(get_db)):
+    """Get a resumable upload, including how many bytes the server has"""
+    project = get_project_by_id(db, project_id)
+    try:
+        return upload_manager.status(project.name, upload_id)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status, detail=e.message)
+
+
+@router.put("/project/{project_id}/uploads/{upload_id}")
+async def put_upload_chunk(
     project_id: int,
-    file_path: str,
-    file: UploadFile = File(...),
+    upload_id: str,
+    request: Request,
+    offset: int = Query(..., ge=0),
+    x_chunk_sha256: Optional[str] = Header(None),
     db: Session = Depends(get_db)
 ):
-    """Upload a file"""
-    project = get_project_by_id(db, project_id)
+    """Write the request body at offset
+
+    The body is streamed to disk as it arrives. An optional X-Chunk-SHA256
+    header is checked before the chunk is accepted.
+    """
+    # A cache miss queries the database, which mustn't block the event loop
+    project = await run_in_threadpool(get_project_by_id, db, project_id)
     try:
-        file_content = await file.read()
-        success = file_manager.upload_file(project.name, file_path, file_content)
-        if not success:
-            raise HTTPException(status_code=400, detail="Failed to upload file")
-        return {"message": "File uploaded successfully", "filename": file.filename}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Upload error: {str(e)}")
+        return await upload_manager.write_chunk(project.name, upload_id, offset, request.stream(), x_chunk_sha256)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status, detail=e.message)
+
+
+@router.post("/project/{project_id}/uploads/{upload_id}/commit")
+async def commit_upload(project_id: int, upload_id: str, commit: UploadCommit, db: Session = Depends(get_db)):
+    """Verify a complete upload's size and SHA-256 and move it into the project"""
+    project = await run_in_threadpool(get_project_by_id, db, project_id)
+    try:
+        result = await upload_manager.commit(project.name, upload_id, commit.sha256)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status, detail=e.message)
+    return {"message": "File uploaded successfully", **result}
+
 
+@router.delete("/project/{project_id}/uploads/{upload_id}")
+def abort_upload(project_id: int, upload_id: str, db: Session = Depends(get_db)):
+    """Abandon a resumable upload"""
+    project = get_project_by_id(db, project_id)
+    try:
+        upload_manager.abort(project.name, upload_id)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status, detail=e.message)
+    return {"message": "Upload aborted"}
@@ -1,42 +1,122 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
-from ..models import get_db
-from ..schemas import ProjectCreate, ProjectResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional
+from urllib.parse import quote
+from ..archives import ARCHIVE_FORMATS, ArchiveError, BodyReader, extract_archive, stream_archive
+from ..models import get_async_db
+from ..schemas import ProjectCreate, ProjectQuota, ProjectResponse, ProjectUsage
 from ..project_service import project_service
+from ..project_usage import QuotaExceeded, usage_tracker
 
 router = APIRouter(prefix="/api/projects", tags=["projects"])
 
 
 @router.post("/", response_model=ProjectResponse)
-def create_project(project: ProjectCreate, db: Session = Depends(get_db)):
+async def create_project(project: ProjectCreate, db: AsyncSession = Depends(get_async_db)):
     """Create a new project"""
-    created_project = project_service.create_project(db, project.name)
+    created_project = await project_service.create_project(db, project.name)
     if not created_project:
         raise HTTPException(status_code=400, detail="Project with this name already exists")
     return created_project
 
 
 @router.get("/", response_model=List[ProjectResponse])
-def list_projects(db: Session = Depends(get_db)):
+async def list_projects(db: AsyncSession = Depends(get_async_db)):
     """List all projects"""
-    return project_service.list_projects(db)
+    return await project_service.list_projects(db)
 
 
 @router.get("/{project_id}", response_model=ProjectResponse)
-def get_project(project_id: int, db: Session = Depends(get_db)):
+async def get_project(project_id: int, db: AsyncSession = Depends(get_async_db)):
     """Get project by ID"""
-    project = project_service.get_project(db, project_id)
+    project = await project_service.get_project(db, project_id)
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     return project
 
 
 @router.delete("/{project_id}")
-def delete_project(project_id: int, db: Session = Depends(get_db)):
+async def delete_project(project_id: int, db: AsyncSession = Depends(get_async_db)):
     """Delete a project"""
-    success = project_service.delete_project(db, project_id)
+    success = await project_service.delete_project(db, project_id)
     if not success:
         raise HTTPException(status_code=404, detail="Project not found")
     return {"message": "Project deleted successfully"}
 
+
+@router.get("/{project_id}/archive")
+async def export_project(
+    project_id: int,
+    archive_format: str = Query("tar.gz", alias="format", pattern=r"^(tar\.gz|zip)$"),
+    include_ignored: bool = False,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Download the project as a tar.gz or zip archive, generated as it is sent"""
+    project = await project_service.get_project(db, project_id)
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    filename = f"{project.name}.{archive_format}"
+    return StreamingResponse(
+        stream_archive(project.name, archive_format, include_ignored=include_ignored),
+        media_type=ARCHIVE_FORMATS[archive_format],
+        headers={"Content-Disposition": f"attachment; filename*=utf-8''{quote(filename)}"}
+    )
+
+
+@router.post("/{project_id}/archive")
+async def import_project(project_id: int, request: Request, ignore: Optional[str] = None,
+                         db: AsyncSession = Depends(get_async_db)):
+    """Extract an archive sent as the raw request body into the project
+
+    tar, tar.gz, tar.bz2, tar.xz and zip are accepted. ignore takes extra
+    comma-separated gitignore patterns to leave out.
+    """
+    project = await project_service.get_project(db, project_id)
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    patterns = [pattern.strip() for pattern in ignore.split(",") if pattern.strip()] if ignore else None
+    try:
+        return await run_in_threadpool(extract_archive, project.name, BodyReader(request.stream()), patterns,
+                                       quota_bytes=usage_tracker.remaining(project.name))
+    except ArchiveError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except QuotaExceeded:
+        quota = usage_tracker.quota(project.name)
+        raise HTTPException(status_code=413, detail=f"Archive would take the project past its quota of {quota} bytes")
+
+
+@router.get("/{project_id}/usage", response_model=ProjectUsage)
+async def get_project_usage(project_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Get the bytes and files a project uses, and its quota
+
+    Usage is tracked as files change, so this doesn't walk the project,
+    except the first time for a project that has never been scanned.
+    """
+    project = await project_service.get_project(db, project_id)
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    usage = usage_tracker.usage(project.name)
+    if usage is None:
+        await usage_tracker.reconcile([project.name])
+        usage = usage_tracker.usage(project.name)
+    return {
+        "project_id": project.id,
+        "bytes": usage[0],
+        "files": usage[1],
+        "quota_bytes": usage_tracker.quota(project.name),
+        "scanned_at": usage_tracker.scanned_at(project.name),
+    }
+
+
+@router.put("/{project_id}/quota", response_model=ProjectUsage)
+async def set_project_quota(project_id: int, quota: ProjectQuota, db: AsyncSession = Depends(get_async_db)):
+    """Set the project's disk quota in bytes; null uses the server default
+
+    The quota applies to uploads and archive imports from then on; a
+    project already over it keeps its files.
+    """
+    if not await project_service.set_quota(db, project_id, quota.quota_bytes):
+        raise HTTPException(status_code=404, detail="Project not found")
+    return await get_project_usage(project_id, db)
@@ -1,104 +1,184 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException
-from ..docker_client import docker_client
-import json
+from fastapi import APIRouter, WebSocket, HTTPException
+from fastapi.encoders import jsonable_encoder
+from typing import Optional
 import asyncio
-import docker
+from ..deploy_jobs import deploy_scheduler, line_to_dict
+from ..docker_client import docker_client
+from ..log_store import entry_to_dict, log_store
+from ..models import AsyncSessionLocal
+from ..stats_hub import stats_hub
+from ..terminal_bridge import TerminalBridge
 
 
 router = APIRouter()
 
+# Most log lines sent in one websocket message
+LOG_BATCH_SIZE = 500
+
 
 @router.websocket("/ws/terminal/{container_id}")
 async def websocket_terminal(websocket: WebSocket, container_id: str):
     """WebSocket endpoint for container terminal access"""
     await websocket.accept()
-    
+
     try:
-        container = docker_client.get_container(container_id)
-        if not container:
-            await websocket.close(code=1008, reason="Container not found")
-            return
-        
-        # Create exec instance with proper configuration
-        exec_id = container.exec_create(
-            cmd="/bin/sh",
-            stdin=True,
-            stdout=True,
-            stderr=True,
-            tty=True
-        )
-        
-        # Start exec with socket for bidirectional communication
-        exec_socket = container.exec_start(
-            exec_id=exec_id['Id'],
-            socket=True,
-            tty=True
-        )
-        
-        # Start reading from container stdout/stderr in a separate task
-        async def read_output():
-            try:
-                while True:
-                    try:
-                        data = exec_socket.recv(4096)
-                        if data:
-                            await websocket.send_text(data.decode('utf-8', errors='replace'))
-                        else:
-                            break
-                    except Exception as e:
-                        if "not a socket" not in str(e).lower():
-                            print(f"Error reading output: {e}")
-                        break
-            except Exception as e:
-                print(f"Read output error: {e}")
-        
-        # Start reading task
-        read_task = asyncio.create_task(read_output())
-        
-        # Handle incoming messages (stdin)
-        try:
-            while True:
-                data = await websocket.receive_text()
-                # Send data to container stdin via socket
-                try:
-                    exec_socket.sendall(data.encode('utf-8'))
-                except Exception as e:
-                    print(f"Error sending to container: {e}")
-                    break
-        except WebSocketDisconnect:
-            read_task.cancel()
-            try:
-                exec_socket.close()
-            except:
-                pass
+        exec_id, reader, writer = await docker_client.open_exec(container_id)
     except Exception as e:
         print(f"Terminal error: {e}")
         try:
-            await websocket.close(code=1011, reason=str(e))
+            await websocket.close(code=1008, reason="Container not found or not running")
         except:
             pass
+        return
+
+    await TerminalBridge(websocket, exec_id, reader, writer).run()
+    try:
+        await websocket.close()
+    except:
+        pass
 
 
 @router.websocket("/ws/stats/{container_id}")
 async def websocket_stats(websocket: WebSocket, container_id: str):
     """WebSocket endpoint for live container stats"""
     await websocket.accept()
-    
+
+    # All viewers of a container share one daemon stats stream
+    queue = stats_hub.subscribe(container_id)
+
+    async def send_stats():
+        while True:
+            stats = await queue.get()
+            if stats is None:
+                await websocket.close(code=1011, reason="Container not found or stats unavailable")
+                return
+            await websocket.send_json(stats.model_dump())
+
     try:
-        container = docker_client.get_container(container_id)
-        if not container:
-            await websocket.close(code=1008, reason="Container not found")
-            return
-        
+        await run_until_disconnect(websocket, send_stats())
+    except Exception as e:
+        print(f"Stats error: {e}")
         try:
-            while True:
-                stats = docker_client.get_container_stats(container_id)
-                if stats:
-                    await websocket.send_json(stats.dict())
-                await asyncio.sleep(1)  # Update every second
-        except WebSocketDisconnect:
+            await websocket.close(code=1011, reason=str(e))
+        except:
             pass
+    finally:
+        stats_hub.unsubscribe(container_id, queue)
+
+
+@router.websocket("/ws/logs/{container_id}")
+async def websocket_logs(websocket: WebSocket, container_id: str, tail: int = 100, since: Optional[str] = None):
+    """WebSocket endpoint for following container logs
+
+    Each message is {"lines": [{"seq", "timestamp", "stream", "text", "level"}, ...]},
+    batching whatever arrived since the previous message. Close code 1013
+    means the client fell behind and should reconnect with a since cursor.
+    """
+    await websocket.accept()
+
+    # Every viewer of a container shares one follow stream and its buffer
+    try:
+        backlog, queue = await log_store.subscribe(container_id, tail=tail, since=since)
     except Exception as e:
-        print(f"Stats error: {e}")
-        await websocket.close(code=1011, reason=str(e))
+        print(f"Logs error: {e}")
+        await websocket.close(code=1011, reason="Container not found or logs unavailable")
+        return
+
+    async def send_logs():
+        for start in range(0, len(backlog), LOG_BATCH_SIZE):
+            await websocket.send_json({"lines": [entry_to_dict(e) for e in backlog[start:start + LOG_BATCH_SIZE]]})
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < LOG_BATCH_SIZE and not queue.empty():
+                batch.append(queue.get_nowait())
+            lines = [entry_to_dict(entry) for entry in batch if entry]
+            if lines:
+                await websocket.send_json({"lines": lines})
+            if batch[-1] is None:
+                await websocket.close(code=1000)
+                return
+            if batch[-1] is False:
+                await websocket.close(code=1013, reason="Client fell behind; reconnect with since")
+                return
+
+    try:
+        await run_until_disconnect(websocket, send_logs())
+    except Exception as e:
+        print(f"Logs error: {e}")
+        try:
+            await websocket.close(code=1011, reason=str(e))
+        except:
+            pass
+    finally:
+        log_store.unsubscribe(container_id, queue)
+
+
+@router.websocket("/ws/deploy/{job_id}")
+async def websocket_deploy(websocket: WebSocket, job_id: int):
+    """WebSocket endpoint for following a deploy job's output
+
+    Each message is {"lines": [{"seq", "stream", "text"}, ...]}; the last
+    one is {"job": {...}} with the finished job, after which the socket
+    closes with 1000. Close code 1013 means the client fell behind.
+    """
+    await websocket.accept()
+
+    async with AsyncSessionLocal() as db:
+        output = await deploy_scheduler.output(db, job_id)
+    if output is None:
+        await websocket.close(code=1008, reason="Deploy job not found")
+        return
+    backlog, queue = output
+
+    async def send_output():
+        for start in range(0, len(backlog), LOG_BATCH_SIZE):
+            await websocket.send_json({"lines": [line_to_dict(line) for line in backlog[start:start + LOG_BATCH_SIZE]]})
+        while queue is not None:
+            batch = [await queue.get()]
+            while len(batch) < LOG_BATCH_SIZE and not queue.empty():
+                batch.append(queue.get_nowait())
+            lines = [line_to_dict(line) for line in batch if line]
+            if lines:
+                await websocket.send_json({"lines": lines})
+            if batch[-1] is False:
+                await websocket.close(code=1013, reason="Client fell behind; poll the job instead")
+                return
+            if batch[-1] is None:
+                break
+        async with AsyncSessionLocal() as db:
+            job = await deploy_scheduler.get(db, job_id)
+        await websocket.send_json({"job": jsonable_encoder(job)})
+        await websocket.close(code=1000)
 
+    try:
+        await run_until_disconnect(websocket, send_output())
+    except Exception as e:
+        print(f"Deploy output error: {e}")
+        try:
+            await websocket.close(code=1011, reason=str(e))
+        except:
+            pass
+    finally:
+        if queue is not None:
+            deploy_scheduler.unsubscribe(job_id, queue)
+
+
+async def run_until_disconnect(websocket: WebSocket, sender):
+    """Run a send loop until it finishes or the client disconnects
+
+    Send-only endpoints would otherwise only notice a vanished client on
+    their next send.
+    """
+    async def wait_for_disconnect():
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    tasks = [asyncio.create_task(sender), asyncio.create_task(wait_for_disconnect())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -1,6 +1,6 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Literal
 
 
 class ProjectCreate(BaseModel):
@@ -17,6 +17,21 @@ class ProjectResponse(BaseModel):
         from_attributes = True
 
 
+class ProjectUsage(BaseModel):
+    project_id: int
+    bytes: int
+    files: int
+    # None means no quota
+    quota_bytes: Optional[int] = None
+    # When the project was last walked to correct its totals
+    scanned_at: Optional[datetime] = None
+
+
+class ProjectQuota(BaseModel):
+    # None falls back to the server-wide PROJECT_QUOTA_BYTES
+    quota_bytes: Optional[int] = Field(None, ge=0)
+
+
 class FileCreate(BaseModel):
     path: str
     content: Optional[str] = ""
@@ -29,11 +44,41 @@ class FileResponse(BaseModel):
     size: Optional[int] = None
 
 
+class FileWrite(BaseModel):
+    content: Optional[str] = None
+    patch: Optional[str] = None
+    base_sha256: Optional[str] = None
+
+
+class BatchOperation(BaseModel):
+    op: Literal["create", "write", "mkdir", "rename", "delete"]
+    path: str
+    new_path: Optional[str] = None
+    content: Optional[str] = None
+    patch: Optional[str] = None
+    base_sha256: Optional[str] = None
+
+
+class FileBatch(BaseModel):
+    operations: List[BatchOperation]
+
+
+class UploadCreate(BaseModel):
+    path: str
+    size: int
+    sha256: Optional[str] = None
+
+
+class UploadCommit(BaseModel):
+    sha256: Optional[str] = None
+
+
 class FileTreeItem(BaseModel):
     name: str
     path: str
     is_directory: bool
     children: Optional[List["FileTreeItem"]] = None
+    next_cursor: Optional[str] = None
 
 
 class ContainerInfo(BaseModel):
@@ -57,6 +102,24 @@ class ContainerStats(BaseModel):
 
 class DeployRequest(BaseModel):
     project_id: int
+    # Run docker-compose even if nothing changed since the last successful deploy
+    force: bool = False
+
+
+class DeployJobResponse(BaseModel):
+    id: int
+    project_id: int
+    status: str
+    exit_code: Optional[int] = None
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    # Per-service results of a deploy run by the compose engine
+    services: Optional[List[Dict[str, Any]]] = None
+
+    class Config:
+        from_attributes = True
 
 
 class LogsRequest(BaseModel):
@@ -0,0 +1,484 @@
+import os
+import re
+import sqlite3
+import stat
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+from .file_manager import file_manager
+
+
+# content is contentless: it holds only the trigrams, and bodies are read
+# from the files. It can't remove a row's trigrams without the old body,
+# so a changed file gets a new id and the old row is left behind, counted
+# in state as stale until a rebuild clears them.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT NOT NULL UNIQUE,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    indexed INTEGER NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS content USING fts5(body, tokenize='trigram', detail='none', content='');
+CREATE TABLE IF NOT EXISTS dirty (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+# Stored in PRAGMA user_version once a full scan has finished
+BUILT_VERSION = 2
+# Stale rows past which, and past the live ones, the index is rebuilt
+COMPACT_MIN_STALE = 10000
+SNIPPET_CHARS = 200
+# The rest of a {m,n} repeat, after the brace
+QUANTIFIER = re.compile(r"\d*(?:,\d*)?\}")
+
+
+def _required_literals(pattern: str) -> List[str]:
+    """Literal strings that every match of a regex must contain
+
+    Deliberately conservative: anything inside groups, classes or
+    alternations is skipped, so the result may be empty but never wrong.
+    """
+    if "|" in pattern or re.compile(pattern).flags & re.VERBOSE:
+        return []
+    runs = []
+    current = ""
+    depth = 0
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        i += 1
+        if depth:
+            if char == "\\":
+                i += 1
+            elif char == "(":
+                depth += 1
+            elif char == ")":
+                depth -= 1
+            continue
+        if char == "\\" and i < len(pattern):
+            escaped = pattern[i]
+            i += 1
+            if not escaped.isalnum() and not escaped.isspace():
+                current += escaped
+                continue
+        elif char == "[":
+            # Skip the class; a ] right after [ or [^ is a literal
+            if pattern[i:i + 1] == "^":
+                i += 1
+            if pattern[i:i + 1] == "]":
+                i += 1
+            while i < len(pattern) and pattern[i] != "]":
+                i += 2 if pattern[i] == "\\" else 1
+            i += 1
+        elif char == "(":
+            depth = 1
+        elif char in "*?" or (char == "{" and QUANTIFIER.match(pattern, i)):
+            # The previous character may occur zero times
+            current = current[:-1]
+            if char == "{":
+                i = QUANTIFIER.match(pattern, i).end()
+        elif char == "+":
+            # Repeated, so what follows needn't come right after it
+            pass
+        elif char not in ".^$)":
+            current += char
+            continue
+        runs.append(current)
+        current = ""
+    runs.append(current)
+    return [run for run in runs if run]
+
+
+def _trigram_query(terms: List[str]) -> str:
+    """An FTS5 query for the rows holding every trigram of every term
+
+    The index keeps no positions, so a term can't be matched as a phrase;
+    the rows found are candidates for the exact match.
+    """
+    trigrams = {term[i:i + 3] for term in terms for i in range(len(term) - 2)}
+    return " AND ".join('"' + trigram.replace('"', '""') + '"' for trigram in sorted(trigrams))
+
+
+class _ProjectIndex:
+    """The trigram index of one project, in its own SQLite file"""
+
+    def __init__(self, db_path: str, project_name: str):
+        self.project_name = project_name
+        self.root = str(file_manager.get_project_path(project_name))
+        self.db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        old = self.db.execute("SELECT sql FROM sqlite_master WHERE name = 'content'").fetchone()
+        if old is not None and "content=''" not in old[0]:
+            # Built by a version that kept a copy of every file
+            self.db.executescript("DROP TABLE IF EXISTS content; DROP TABLE IF EXISTS files;"
+                                  " PRAGMA user_version = 0; VACUUM;")
+        self.db.executescript(SCHEMA)
+        # lock guards the connection; sync_lock lets one query at a time catch up
+        self.lock = threading.Lock()
+        self.sync_lock = threading.Lock()
+        self.state_lock = threading.Lock()
+        # An index opened from disk may have missed changes, so rescan it soon
+        self.checked = float("-inf")
+        self.rescanning = False
+        self.closed = False
+
+    def built(self) -> bool:
+        with self.lock:
+            return self.db.execute("PRAGMA user_version").fetchone()[0] == BUILT_VERSION
+
+
+class SearchIndex:
+    """Per-project trigram indexes for searching file contents
+
+    Each project gets an FTS5 table with the trigram tokenizer, in a sidecar
+    SQLite file under index_dir. Queries use the index to find candidate
+    files holding the literal parts of the search and match only those.
+    The first search starts building the index in a background thread;
+    until it is built, searches read every file instead. It is kept
+    current from FileManager change notifications. They are queued in the index file,
+    so a change made through any worker process is applied before the
+    next query in every worker. Edits made outside FileManager are picked
+    up by a background rescan at most every recheck_seconds. Ignored paths, binary files and
+    files over max_file_bytes are not indexed.
+    """
+
+    def __init__(self, index_dir: Path, max_file_bytes: int = 1024 * 1024, recheck_seconds: float = 300.0,
+                 batch_bytes: int = 8 * 1024 * 1024, fetch_rows: int = 64):
+        self.index_dir = index_dir
+        self.max_file_bytes = max_file_bytes
+        self.recheck_seconds = recheck_seconds
+        self.batch_bytes = batch_bytes
+        self.fetch_rows = fetch_rows
+        self._indexes: Dict[str, _ProjectIndex] = {}
+        self._lock = threading.Lock()
+
+    def search(self, project_name: str, query: str, regex: bool = False, case_sensitive: bool = False,
+               cursor: Optional[str] = None, limit: int = 100) -> dict:
+        """Up to limit matches of query in a project's text files
+
+        Hits are ordered by file, then by position. Lines and columns count
+        from 1, columns in characters; highlight is the match's span in the
+        snippet. Pass next_cursor back to get the following page. Raises
+        ValueError for an invalid regex or cursor.
+        """
+        flags = re.MULTILINE if case_sensitive else re.MULTILINE | re.IGNORECASE
+        try:
+            matcher = re.compile(query if regex else re.escape(query), flags)
+            # The trigram index can only narrow the search by strings of 3+ characters
+            terms = [term for term in (_required_literals(query) if regex else [query]) if len(term) >= 3]
+        except re.error as e:
+            raise ValueError(f"Invalid regular expression: {e}")
+        scan, file_id, position = self._parse_cursor(cursor)
+
+        index = self._index(project_name)
+        if not self._refresh(index) or scan:
+            # A cursor from the index can't be followed by a scan, which starts over
+            return self._scan(index, matcher, file_id if scan else 0, position if scan else 0, limit)
+        match = _trigram_query(terms)
+        hits = []
+        while True:
+            with index.lock:
+                if match:
+                    rows = index.db.execute(
+                        "SELECT files.id, files.path FROM content JOIN files ON files.id = content.rowid"
+                        " WHERE content MATCH ? AND content.rowid >= ? ORDER BY content.rowid LIMIT ?",
+                        (match, file_id, self.fetch_rows)
+                    ).fetchall()
+                else:
+                    rows = index.db.execute(
+                        "SELECT id, path FROM files WHERE indexed AND id >= ? ORDER BY id LIMIT ?",
+                        (file_id, self.fetch_rows)
+                    ).fetchall()
+            if not rows:
+                return {"hits": hits, "next_cursor": None}
+            for row_id, path in rows:
+                read = self._read(os.path.join(index.root, path))
+                if read is None or read[1] is None:
+                    continue
+                start = position if row_id == file_id else 0
+                for match_start, hit in self._matches(matcher, path, read[1], start):
+                    if len(hits) == limit:
+                        return {"hits": hits, "next_cursor": f"{row_id}:{match_start}"}
+                    hits.append(hit)
+            file_id, position = rows[-1][0] + 1, 0
+
+    def _scan(self, index: _ProjectIndex, matcher: re.Pattern, file_number: int, position: int,
+              limit: int) -> dict:
+        """Search by reading every file, without the index; cursors number files in walk order"""
+        hits = []
+        number = -1
+        for path, st in file_manager.walk(index.project_name, ""):
+            if not stat.S_ISREG(st.st_mode):
+                continue
+            number += 1
+            if number < file_number:
+                continue
+            read = self._read(os.path.join(index.root, path))
+            if read is None or read[1] is None:
+                continue
+            start = position if number == file_number else 0
+            for match_start, hit in self._matches(matcher, path, read[1], start):
+                if len(hits) == limit:
+                    return {"hits": hits, "next_cursor": f"s{number}:{match_start}"}
+                hits.append(hit)
+        return {"hits": hits, "next_cursor": None}
+
+    def notify(self, project_name: str, path: str):
+        """FileManager change listener: re-index path before the next search"""
+        index = self._indexes.get(project_name)
+        if index is None:
+            # Another worker may have built it
+            if not os.path.exists(self._db_path(project_name)):
+                return
+            index = self._index(project_name)
+        if os.path.basename(path) == ".gitignore":
+            # Ignore rules changed for the whole directory
+            path = os.path.dirname(path)
+        try:
+            with index.lock:
+                if not index.closed:
+                    # A new seq, so a query applying the old one doesn't clear it
+                    index.db.execute("INSERT OR REPLACE INTO dirty (path) VALUES (?)", (path,))
+        except sqlite3.Error as e:
+            print(f"Error queueing search index change: {e}")
+
+    def drop(self, project_name: str):
+        """Delete a project's index"""
+        with self._lock:
+            index = self._indexes.pop(project_name, None)
+        if index is not None:
+            with index.lock:
+                index.closed = True
+                index.db.close()
+        db_path = self._db_path(project_name)
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.unlink(db_path + suffix)
+            except FileNotFoundError:
+                pass
+
+    def _index(self, project_name: str) -> _ProjectIndex:
+        with self._lock:
+            index = self._indexes.get(project_name)
+            if index is None:
+                self.index_dir.mkdir(parents=True, exist_ok=True)
+                index = _ProjectIndex(self._db_path(project_name), project_name)
+                self._indexes[project_name] = index
+            return index
+
+    def _db_path(self, project_name: str) -> str:
+        return str(self.index_dir / f"{project_name}.db")
+
+    def _refresh(self, index: _ProjectIndex) -> bool:
+        """Apply the changes queued since the last query; False while the index isn't built"""
+        if not index.built():
+            self._start_rescan(index)
+            return False
+        with index.sync_lock:
+            with index.lock:
+                dirty = index.db.execute("SELECT seq, path FROM dirty ORDER BY seq").fetchall()
+            synced: List[str] = []
+            for path in sorted({path for _, path in dirty}):
+                # A directory's sync covers everything below it
+                if any(path == done or path.startswith(done + "/") or not done for done in synced):
+                    continue
+                self._sync(index, path)
+                synced.append(path)
+            if dirty:
+                with index.lock:
+                    index.db.execute("DELETE FROM dirty WHERE seq <= ?", (dirty[-1][0],))
+
+        if time.monotonic() - index.checked >= self.recheck_seconds:
+            self._start_rescan(index)
+        return True
+
+    def _start_rescan(self, index: _ProjectIndex):
+        with index.state_lock:
+            if index.rescanning:
+                return
+            index.rescanning = True
+        threading.Thread(target=self._rescan, args=(index,), daemon=True).start()
+
+    def _rescan(self, index: _ProjectIndex):
+        """Sync the whole project, which builds the index, rebuilding it when it is mostly stale rows"""
+        try:
+            self._compact_if_stale(index)
+            self._sync(index, "")
+            with index.lock:
+                index.db.execute(f"PRAGMA user_version = {BUILT_VERSION}")
+            index.checked = time.monotonic()
+        except Exception as e:
+            if not index.closed:
+                print(f"Error rescanning search index: {e}")
+        finally:
+            index.rescanning = False
+
+    def _compact_if_stale(self, index: _ProjectIndex):
+        with index.lock:
+            db = index.db
+            row = db.execute("SELECT value FROM state WHERE key = 'stale'").fetchone()
+            stale = row[0] if row else 0
+            if stale <= COMPACT_MIN_STALE or stale <= db.execute("SELECT count(*) FROM files").fetchone()[0]:
+                return
+            # Searches scan the files until the rescan has rebuilt it
+            db.execute("BEGIN")
+            try:
+                db.execute("INSERT INTO content (content) VALUES ('delete-all')")
+                db.execute("DELETE FROM files")
+                db.execute("DELETE FROM state WHERE key = 'stale'")
+                db.execute("PRAGMA user_version = 0")
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    def _sync(self, index: _ProjectIndex, relative: str):
+        """Bring the rows for a file, a directory or (with "") the whole project up to date
+
+        Files are read without holding the connection, so each row is only
+        written if it still has the version the scan started from; a newer
+        change always has its own sync coming.
+        """
+        with index.lock:
+            if relative:
+                rows = index.db.execute(
+                    "SELECT path, size, mtime_ns FROM files WHERE path = ? OR (path >= ? AND path < ?)",
+                    # Everything below relative/ sorts before relative0
+                    (relative, relative + "/", relative + "0")
+                ).fetchall()
+            else:
+                rows = index.db.execute("SELECT path, size, mtime_ns FROM files").fetchall()
+        known = {path: (size, mtime_ns) for path, size, mtime_ns in rows}
+
+        batch = []
+        batch_bytes = 0
+        for path, st in file_manager.walk(index.project_name, relative):
+            if not stat.S_ISREG(st.st_mode):
+                continue
+            previous = known.pop(path, None)
+            if previous == (st.st_size, st.st_mtime_ns):
+                continue
+            read = self._read(os.path.join(index.root, path))
+            if read is None:
+                continue
+            current, body = read
+            batch.append((path, previous, current, body))
+            batch_bytes += len(body) if body else 0
+            if batch_bytes >= self.batch_bytes:
+                self._apply(index, batch, {})
+                batch, batch_bytes = [], 0
+        self._apply(index, batch, known)
+
+    def _apply(self, index: _ProjectIndex, batch: list, removed: Dict[str, Tuple[int, int]]):
+        with index.lock:
+            db = index.db
+            stale = 0
+            db.execute("BEGIN")
+            try:
+                for path, previous, (size, mtime_ns), body in batch:
+                    row = db.execute(
+                        "SELECT id, size, mtime_ns, indexed FROM files WHERE path = ?", (path,)
+                    ).fetchone()
+                    if (row[1:3] if row else None) != previous:
+                        continue
+                    if row:
+                        db.execute("DELETE FROM files WHERE id = ?", (row[0],))
+                        stale += row[3]
+                    row_id = db.execute(
+                        "INSERT INTO files (path, size, mtime_ns, indexed) VALUES (?, ?, ?, ?)",
+                        (path, size, mtime_ns, body is not None)
+                    ).lastrowid
+                    if body is not None:
+                        db.execute("INSERT INTO content (rowid, body) VALUES (?, ?)", (row_id, body))
+                for path, (size, mtime_ns) in removed.items():
+                    row = db.execute(
+                        "SELECT id, indexed FROM files WHERE path = ? AND size = ? AND mtime_ns = ?",
+                        (path, size, mtime_ns)
+                    ).fetchone()
+                    if row:
+                        db.execute("DELETE FROM files WHERE id = ?", (row[0],))
+                        stale += row[1]
+                if stale:
+                    db.execute(
+                        "INSERT INTO state (key, value) VALUES ('stale', ?)"
+                        " ON CONFLICT (key) DO UPDATE SET value = value + excluded.value", (stale,)
+                    )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    def _read(self, full_path: str) -> Optional[Tuple[Tuple[int, int], Optional[str]]]:
+        """(size, mtime_ns) of a file and its text, or None text when it isn't indexed"""
+        try:
+            fd = os.open(full_path, os.O_RDONLY | os.O_NONBLOCK | os.O_NOFOLLOW)
+        except OSError:
+            return None
+        with os.fdopen(fd, "rb") as f:
+            st = os.fstat(fd)
+            current = (st.st_size, st.st_mtime_ns)
+            if not stat.S_ISREG(st.st_mode) or st.st_size > self.max_file_bytes:
+                return current, None
+            try:
+                data = f.read(self.max_file_bytes + 1)
+            except OSError:
+                return None
+        if len(data) > self.max_file_bytes or b"\0" in data[:8192]:
+            return current, None
+        return current, data.decode("utf-8", errors="replace")
+
+    @staticmethod
+    def _matches(matcher: re.Pattern, path: str, body: str, start: int) -> Iterator[Tuple[int, dict]]:
+        """(offset, hit) for each non-empty match in body from start on"""
+        line = 1
+        counted = 0
+        for match in matcher.finditer(body, start):
+            if match.end() == match.start():
+                continue
+            offset = match.start()
+            line += body.count("\n", counted, offset)
+            counted = offset
+            line_start = body.rfind("\n", 0, offset) + 1
+            line_end = body.find("\n", offset)
+            if line_end == -1:
+                line_end = len(body)
+            text = body[line_start:line_end].rstrip("\r")
+            column = offset - line_start
+            match_end = min(match.end() - line_start, len(text))
+            # Long lines are cut to a window around the match
+            snippet_start = max(0, min(column - SNIPPET_CHARS // 4, len(text) - SNIPPET_CHARS))
+            yield offset, {
+                "path": path,
+                "line": line,
+                "column": column + 1,
+                "snippet": text[snippet_start:snippet_start + SNIPPET_CHARS],
+                "highlight": [column - snippet_start, min(match_end, snippet_start + SNIPPET_CHARS) - snippet_start],
+            }
+
+    @staticmethod
+    def _parse_cursor(cursor: Optional[str]) -> Tuple[bool, int, int]:
+        """(from a scan, file, position); file is a row id, or a file's number in a scan"""
+        if not cursor:
+            return False, 0, 0
+        scan = cursor.startswith("s")
+        file_id, _, position = cursor[1 if scan else 0:].partition(":")
+        if not file_id.isdigit() or not position.isdigit():
+            raise ValueError("Invalid cursor")
+        return scan, int(file_id), int(position)
+
+
+search_index = SearchIndex(
+    file_manager.base_path / ".snappods" / "index",
+    max_file_bytes=int(os.getenv("SEARCH_INDEX_MAX_FILE_BYTES", str(1024 * 1024))),
+    recheck_seconds=float(os.getenv("SEARCH_INDEX_RECHECK_SECONDS", "300")),
+)
+file_manager.add_change_listener(search_index.notify)
@@ -0,0 +1,74 @@
+import asyncio
+import os
+from typing import Dict, Optional
+from .container_index import container_index
+from .docker_client import docker_client
+from .stats_history import stats_history
+from .stats_hub import stats_hub
+
+
+class StatsCollector:
+    """Keep a stats hub subscription open for every running container
+
+    The hub records each sample into stats_history, so holding a subscription
+    is all it takes to build history, and websocket viewers share the stream.
+    """
+
+    def __init__(self, scan_interval: float = 10.0):
+        self.scan_interval = scan_interval
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start the background task that tracks running containers"""
+        if self._task is not None and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop collecting and release every subscription"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for container_id, queue in list(self._queues.items()):
+            stats_hub.unsubscribe(container_id, queue)
+        self._queues.clear()
+
+    async def _run(self):
+        while True:
+            try:
+                await self._scan()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error collecting container stats: {e}")
+            await asyncio.sleep(self.scan_interval)
+
+    async def _scan(self):
+        """Subscribe to new running containers and drop ones that went away"""
+        containers = container_index.list(all=False)
+        if containers is None:
+            containers = await docker_client.list_containers(all=False)
+        running = {container.id for container in containers}
+
+        for container_id in list(self._queues):
+            if container_id not in running:
+                stats_hub.unsubscribe(container_id, self._queues.pop(container_id))
+        for container_id in running:
+            queue = self._queues.get(container_id)
+            if queue is not None and stats_hub.is_streaming(container_id):
+                continue
+            # The stream ended (e.g. the container restarted); open a new one
+            if queue is not None:
+                stats_hub.unsubscribe(container_id, queue)
+            self._queues[container_id] = stats_hub.subscribe(container_id)
+        stats_history.prune()
+
+
+stats_collector = StatsCollector(
+    scan_interval=float(os.getenv("STATS_COLLECTOR_INTERVAL", "10")),
+)
@@ -0,0 +1,237 @@
+import math
+import os
+import time
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+from .schemas import ContainerStats
+
+
+# Metric columns, in storage order
+METRICS = ("cpu_percent", "memory_usage", "network_rx", "network_tx")
+
+
+class _Ring:
+    """Fixed-capacity columnar ring buffer of (timestamp, value columns) rows"""
+
+    def __init__(self, capacity: int, columns: int, typecode: str):
+        self.capacity = capacity
+        self.timestamps = array("d", bytes(8 * capacity))
+        self.columns = [array(typecode, bytes(array(typecode).itemsize * capacity)) for _ in range(columns)]
+        self.head = 0
+        self.size = 0
+
+    def append(self, timestamp: float, values):
+        self.timestamps[self.head] = timestamp
+        for column, value in zip(self.columns, values):
+            column[self.head] = value
+        self.head = (self.head + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def indices(self, start: float):
+        """Row indices from the first row at or after start, oldest first"""
+        first = (self.head - self.size) % self.capacity
+        # Rows are in time order, so binary search the logical positions
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if self.timestamps[(first + middle) % self.capacity] < start:
+                low = middle + 1
+            else:
+                high = middle
+        for position in range(low, self.size):
+            yield (first + position) % self.capacity
+
+    @property
+    def nbytes(self) -> int:
+        return self.timestamps.itemsize * self.capacity + sum(c.itemsize * self.capacity for c in self.columns)
+
+
+class _Rollup:
+    """Min/avg/max of each metric over fixed-width time buckets"""
+
+    def __init__(self, step: int, retention: int):
+        self.step = step
+        # min, avg, max per metric; float32 halves the footprint and is plenty for charts
+        self.ring = _Ring(max(retention // step, 1), 3 * len(METRICS), "f")
+        self.bucket: Optional[float] = None
+        self.count = 0
+        self.low = [0.0] * len(METRICS)
+        self.total = [0.0] * len(METRICS)
+        self.high = [0.0] * len(METRICS)
+
+    def add(self, timestamp: float, values: Tuple[float, ...]):
+        bucket = timestamp - timestamp % self.step
+        if self.bucket is not None and bucket != self.bucket:
+            self.flush()
+        if self.count == 0:
+            self.bucket = bucket
+            self.low = list(values)
+            self.total = list(values)
+            self.high = list(values)
+        else:
+            for i, value in enumerate(values):
+                self.low[i] = min(self.low[i], value)
+                self.total[i] += value
+                self.high[i] = max(self.high[i], value)
+        self.count += 1
+
+    def flush(self):
+        if self.count == 0:
+            return
+        row = []
+        for i in range(len(METRICS)):
+            row.extend((self.low[i], self.total[i] / self.count, self.high[i]))
+        self.ring.append(self.bucket, row)
+        self.count = 0
+        self.bucket = None
+
+
+class _ContainerHistory:
+    """Raw samples plus 10 s and 1 min rollups for one container"""
+
+    def __init__(self, raw_retention: int, rollups: List[Tuple[int, int]]):
+        self.raw = _Ring(raw_retention, len(METRICS), "d")
+        self.rollups = [_Rollup(step, retention) for step, retention in rollups]
+        self.memory_limit = 0
+        self.updated = 0.0
+
+    def record(self, timestamp: float, stats: ContainerStats):
+        values = (float(stats.cpu_percent), float(stats.memory_usage), float(stats.network_rx), float(stats.network_tx))
+        self.raw.append(timestamp, values)
+        for rollup in self.rollups:
+            rollup.add(timestamp, values)
+        self.memory_limit = stats.memory_limit
+        self.updated = timestamp
+
+    @property
+    def nbytes(self) -> int:
+        return self.raw.nbytes + sum(rollup.ring.nbytes for rollup in self.rollups)
+
+
+class StatsHistory:
+    """Bounded in-memory stats time series for every sampled container
+
+    Each container costs a fixed amount of memory decided at startup: raw
+    1 s samples for raw_retention seconds, and min/avg/max rollups per
+    (step, retention) pair.
+    """
+
+    def __init__(self, raw_retention: int = 600, rollups: Optional[List[Tuple[int, int]]] = None,
+                 forget_after: float = 86400.0):
+        self.raw_retention = raw_retention
+        self.rollup_specs = rollups or [(10, 3600), (60, 86400)]
+        self.forget_after = forget_after
+        self._containers: Dict[str, _ContainerHistory] = {}
+
+    def record(self, stats: ContainerStats, timestamp: Optional[float] = None):
+        """Add one sample for a container"""
+        history = self._containers.get(stats.container_id)
+        if history is None:
+            history = _ContainerHistory(self.raw_retention, self.rollup_specs)
+            self._containers[stats.container_id] = history
+        history.record(time.time() if timestamp is None else timestamp, stats)
+
+    def prune(self):
+        """Forget containers that have not reported for forget_after seconds"""
+        cutoff = time.time() - self.forget_after
+        for container_id in [cid for cid, h in self._containers.items() if h.updated < cutoff]:
+            del self._containers[container_id]
+
+    def bytes_per_container(self) -> int:
+        """Memory one container's history occupies"""
+        return _ContainerHistory(self.raw_retention, self.rollup_specs).nbytes
+
+    def query(self, container_id: str, range_seconds: int, step: int) -> Optional[Dict[str, Any]]:
+        """Downsampled columnar series covering the last range_seconds"""
+        history = self._find(container_id)
+        if history is None:
+            return None
+
+        start = time.time() - range_seconds
+        step = max(int(step), 1)
+        resolution, rollup = self._pick_source(history, range_seconds, step)
+
+        # Align buckets to multiples of step so repeated queries line up
+        first_bucket = start - start % step
+        bucket_count = max(math.ceil(range_seconds / step), 1) + 1
+        columns = len(METRICS)
+        low = [[math.inf] * bucket_count for _ in range(columns)]
+        total = [[0.0] * bucket_count for _ in range(columns)]
+        high = [[-math.inf] * bucket_count for _ in range(columns)]
+        counts = [0] * bucket_count
+
+        def merge(timestamp: float, row):
+            slot = int((timestamp - first_bucket) // step)
+            if not 0 <= slot < bucket_count:
+                return
+            counts[slot] += 1
+            for c in range(columns):
+                row_low, row_avg, row_high = row(c)
+                if row_low < low[c][slot]:
+                    low[c][slot] = row_low
+                total[c][slot] += row_avg
+                if row_high > high[c][slot]:
+                    high[c][slot] = row_high
+
+        if rollup is None:
+            ring = history.raw
+            for index in ring.indices(start):
+                merge(ring.timestamps[index], lambda c: (ring.columns[c][index],) * 3)
+        else:
+            ring = rollup.ring
+            for index in ring.indices(start):
+                merge(ring.timestamps[index], lambda c: (
+                    ring.columns[3 * c][index], ring.columns[3 * c + 1][index], ring.columns[3 * c + 2][index]
+                ))
+            # Include the bucket still being filled
+            if rollup.count and rollup.bucket >= start:
+                merge(rollup.bucket, lambda c: (rollup.low[c], rollup.total[c] / rollup.count, rollup.high[c]))
+
+        filled = [slot for slot in range(bucket_count) if counts[slot]]
+        result: Dict[str, Any] = {
+            "container_id": container_id,
+            "step": step,
+            "resolution": resolution,
+            "memory_limit": history.memory_limit,
+            "timestamps": [first_bucket + slot * step for slot in filled],
+        }
+        for c, name in enumerate(METRICS):
+            result[name] = {
+                "min": [low[c][slot] for slot in filled],
+                "avg": [total[c][slot] / counts[slot] for slot in filled],
+                "max": [high[c][slot] for slot in filled],
+            }
+        return result
+
+    def _find(self, container_id: str) -> Optional[_ContainerHistory]:
+        """History by full id, or by an unambiguous id prefix"""
+        history = self._containers.get(container_id)
+        if history is None:
+            matches = [h for cid, h in self._containers.items() if cid.startswith(container_id)]
+            history = matches[0] if len(matches) == 1 else None
+        return history
+
+    def _pick_source(self, history: _ContainerHistory, range_seconds: int, step: int):
+        """Coarsest tier no coarser than step, among those covering the range"""
+        candidates = [(1, self.raw_retention, None)] + [
+            (rollup.step, rollup.step * rollup.ring.capacity, rollup) for rollup in history.rollups
+        ]
+        covering = [c for c in candidates if c[1] >= range_seconds] or [candidates[-1]]
+        suitable = [c for c in covering if c[0] <= step] or [covering[0]]
+        resolution, _, rollup = suitable[-1]
+        return resolution, rollup
+
+
+def _parse_rollups(spec: str) -> List[Tuple[int, int]]:
+    """Parse "10:3600,60:86400" into (step, retention) pairs"""
+    rollups = []
+    for part in spec.split(","):
+        step, _, retention = part.partition(":")
+        rollups.append((int(step), int(retention)))
+    return rollups
+
+
+stats_history = StatsHistory(
+    raw_retention=int(os.getenv("STATS_HISTORY_RAW_SECONDS", "600")),
+    rollups=_parse_rollups(os.getenv("STATS_HISTORY_ROLLUPS", "10:3600,60:86400")),
+)
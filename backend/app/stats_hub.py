@@ -0,0 +1,122 @@
+import asyncio
+import os
+import time
+from typing import Dict, List, Optional, Set
+from .docker_client import docker_client
+from .schemas import ContainerStats
+from .stats_history import stats_history
+
+
+class _StatsStream:
+    """One streaming stats subscription to the daemon and its subscribers"""
+
+    def __init__(self, container_id: str):
+        self.container_id = container_id
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.latest: Optional[ContainerStats] = None
+        self.updated = 0.0
+        self.task: Optional[asyncio.Task] = None
+
+
+class StatsHub:
+    """Fan out a single stats stream per container to every subscriber"""
+
+    def __init__(self, sample_concurrency: int = 32, sample_timeout: float = 5.0):
+        self.sample_concurrency = sample_concurrency
+        self.sample_timeout = sample_timeout
+        self._streams: Dict[str, _StatsStream] = {}
+
+    def subscribe(self, container_id: str) -> asyncio.Queue:
+        """Subscribe to stats samples; a None sample means the stream ended"""
+        # Slow subscribers only ever see the most recent sample
+        queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+        stream = self._streams.get(container_id)
+        if stream is None:
+            stream = _StatsStream(container_id)
+            self._streams[container_id] = stream
+            stream.task = asyncio.create_task(self._produce(stream))
+        elif stream.latest is not None:
+            queue.put_nowait(stream.latest)
+        stream.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, container_id: str, queue: asyncio.Queue):
+        """Drop a subscriber, tearing the stream down after the last one leaves"""
+        stream = self._streams.get(container_id)
+        if stream is None:
+            return
+        stream.subscribers.discard(queue)
+        if not stream.subscribers:
+            del self._streams[container_id]
+            stream.task.cancel()
+
+    def latest(self, container_id: str, max_age: Optional[float] = None) -> Optional[ContainerStats]:
+        """Most recent sample of a container that currently has subscribers"""
+        stream = self._streams.get(container_id)
+        if stream is None:
+            return None
+        if max_age is not None and time.monotonic() - stream.updated > max_age:
+            return None
+        return stream.latest
+
+    async def sample(self, container_ids: List[str], max_age: float = 5.0) -> List[ContainerStats]:
+        """Stats for many containers at once, in the order given
+
+        Streamed samples no older than max_age are reused; the rest are taken
+        concurrently, at most sample_concurrency at a time. Containers that
+        fail or time out are left out.
+        """
+        slots = asyncio.Semaphore(self.sample_concurrency)
+
+        async def take(container_id: str) -> Optional[ContainerStats]:
+            stats = self.latest(container_id, max_age)
+            if stats is not None:
+                return stats
+            async with slots:
+                try:
+                    return await asyncio.wait_for(
+                        docker_client.sample_container_stats(container_id), self.sample_timeout
+                    )
+                except asyncio.TimeoutError:
+                    print(f"Timed out sampling stats for container {container_id}")
+                except Exception as e:
+                    print(f"Error sampling container stats: {e}")
+                return None
+
+        results = await asyncio.gather(*(take(container_id) for container_id in container_ids))
+        return [stats for stats in results if stats is not None]
+
+    def is_streaming(self, container_id: str) -> bool:
+        """Whether a stats stream for the container is running"""
+        return container_id in self._streams
+
+    async def _produce(self, stream: _StatsStream):
+        """Read the daemon stats stream and publish each parsed sample"""
+        try:
+            async for raw in docker_client.stream_container_stats(stream.container_id):
+                self._publish(stream, docker_client.parse_stats(stream.container_id, raw))
+        except asyncio.CancelledError:
+            return
+        except Exception as e:
+            print(f"Error streaming container stats: {e}")
+        # The stream ended on its own, e.g. the container stopped
+        if self._streams.get(stream.container_id) is stream:
+            del self._streams[stream.container_id]
+        self._publish(stream, None)
+
+    def _publish(self, stream: _StatsStream, stats: Optional[ContainerStats]):
+        """Hand a sample to every subscriber, replacing any unread one"""
+        if stats is not None:
+            stream.latest = stats
+            stream.updated = time.monotonic()
+            stats_history.record(stats)
+        for queue in stream.subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(stats)
+
+
+stats_hub = StatsHub(
+    sample_concurrency=int(os.getenv("STATS_SAMPLE_CONCURRENCY", "32")),
+    sample_timeout=float(os.getenv("STATS_SAMPLE_TIMEOUT", "5")),
+)
@@ -0,0 +1,120 @@
+import asyncio
+import json
+from typing import Optional
+from fastapi import WebSocket
+from .docker_client import docker_client
+
+
+class TerminalBridge:
+    """Relay an exec TTY connection and a WebSocket without blocking the event loop
+
+    Container output is sent as binary frames. Client binary frames are stdin;
+    text frames are either JSON control messages such as
+    {"type": "resize", "cols": 80, "rows": 24} or, for older clients, stdin.
+    """
+
+    def __init__(self, websocket: WebSocket, exec_id: str, reader: asyncio.StreamReader,
+                 writer: asyncio.StreamWriter, read_size: int = 64 * 1024,
+                 max_pending: int = 32, max_frame: int = 256 * 1024):
+        self.websocket = websocket
+        self.exec_id = exec_id
+        self.reader = reader
+        self.writer = writer
+        self.read_size = read_size
+        self.max_frame = max_frame
+        # Bounded so a slow client stops reads from the daemon instead of growing
+        # memory; the socket buffer then fills and the process in the container blocks
+        self._output: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+
+    async def run(self):
+        """Bridge until either side closes
+
+        When the exec ends, the sender finishes only after the queued output
+        has gone out, so the last thing the shell printed is not lost.
+        """
+        read_output = asyncio.create_task(self._read_output())
+        send_output = asyncio.create_task(self._send_output())
+        read_input = asyncio.create_task(self._read_input())
+        tasks = [read_output, send_output, read_input]
+        try:
+            # The output reader ends by queueing None, which lets the sender drain and finish
+            done, _ = await asyncio.wait([send_output, read_input], return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if not task.cancelled() and task.exception() is not None:
+                    print(f"Terminal bridge error: {task.exception()}")
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.writer.close()
+
+    async def _read_output(self):
+        """Read container output as it arrives, ending it with None"""
+        try:
+            while True:
+                data = await self.reader.read(self.read_size)
+                if not data:
+                    break
+                await self._output.put(data)
+        except Exception as e:
+            print(f"Terminal output error: {e}")
+        await self._output.put(None)
+
+    async def _send_output(self):
+        """Send queued output, coalescing whatever is pending into one frame"""
+        while True:
+            chunk = await self._output.get()
+            if chunk is None:
+                return
+            frame = bytearray(chunk)
+            while len(frame) < self.max_frame and not self._output.empty():
+                chunk = self._output.get_nowait()
+                if chunk is None:
+                    await self.websocket.send_bytes(bytes(frame))
+                    return
+                frame += chunk
+            await self.websocket.send_bytes(bytes(frame))
+
+    async def _read_input(self):
+        """Forward client keystrokes and apply control messages"""
+        while True:
+            message = await self.websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            data = message.get("bytes")
+            if data is None:
+                text = message.get("text") or ""
+                if await self._handle_control(text):
+                    continue
+                data = text.encode("utf-8")
+            if data:
+                self.writer.write(data)
+                await self.writer.drain()
+
+    async def _handle_control(self, text: str) -> bool:
+        """Apply a JSON control message; False if the text is plain stdin"""
+        if not text.startswith("{"):
+            return False
+        try:
+            control = json.loads(text)
+        except ValueError:
+            return False
+        if not isinstance(control, dict) or control.get("type") != "resize":
+            return False
+        rows = _positive_int(control.get("rows"))
+        cols = _positive_int(control.get("cols"))
+        if rows and cols:
+            try:
+                await docker_client.resize_exec(self.exec_id, rows, cols)
+            except Exception as e:
+                print(f"Error resizing terminal: {e}")
+        return True
+
+
+def _positive_int(value) -> Optional[int]:
+    """Coerce a control message dimension, rejecting nonsense values"""
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    return value if 0 < value < 10000 else None
@@ -0,0 +1,252 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+import aiofiles
+from starlette.concurrency import run_in_threadpool
+from .file_manager import file_manager
+from .project_usage import QuotaExceeded, usage_tracker
+
+
+class UploadError(Exception):
+    """A resumable upload request that cannot be applied"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class UploadManager:
+    """Resumable chunked uploads, staged on disk until committed
+
+    A session is created for a project path and declared size. Chunks are
+    PUT in order, each at the offset the server has so far; a client that
+    lost a response asks for the session and resumes from its offset.
+    Commit verifies the size and SHA-256 and renames the staged file into
+    the project. Sessions live on disk, so they survive restarts, and
+    expire after expire_seconds.
+    """
+
+    def __init__(self, staging_dir: Path, chunk_size: int = 8 * 1024 * 1024,
+                 expire_seconds: float = 86400.0, write_buffer: int = 1024 * 1024):
+        self.staging_dir = staging_dir
+        self.chunk_size = chunk_size
+        self.expire_seconds = expire_seconds
+        self.write_buffer = write_buffer
+        # Running SHA-256 of each staged file and the offset it covers
+        self._hashers: Dict[str, Tuple[Any, int]] = {}
+        self._busy: Dict[str, asyncio.Lock] = {}
+
+    def create(self, project_name: str, file_path: str, size: int, sha256: Optional[str] = None) -> dict:
+        """Start an upload session for a file of a known size"""
+        if file_manager.resolve_path(project_name, file_path) is None:
+            raise UploadError(400, "Invalid file path")
+        if size < 0:
+            raise UploadError(400, "Invalid size")
+        self._check_quota(project_name, file_path, size)
+        self.staging_dir.mkdir(parents=True, exist_ok=True)
+        self.expire()
+
+        upload_id = uuid.uuid4().hex
+        meta = {
+            "upload_id": upload_id,
+            "project": project_name,
+            "path": file_path,
+            "size": size,
+            "sha256": sha256.lower() if sha256 else None,
+            "created": time.time(),
+        }
+        self._data_path(upload_id).touch()
+        with open(self._meta_path(upload_id), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        self._hashers[upload_id] = (hashlib.sha256(), 0)
+        return self._describe(meta)
+
+    def status(self, project_name: str, upload_id: str) -> dict:
+        """A session with the number of bytes received so far"""
+        return self._describe(self._load(project_name, upload_id))
+
+    async def write_chunk(self, project_name: str, upload_id: str, offset: int, body: AsyncIterator[bytes],
+                          sha256: Optional[str] = None) -> dict:
+        """Write a chunk at offset, streaming it to disk as it arrives
+
+        offset must equal the bytes received so far. A chunk that fails
+        midway, or doesn't match sha256 when given, is discarded whole.
+        """
+        meta = self._load(project_name, upload_id)
+        lock = self._busy.setdefault(upload_id, asyncio.Lock())
+        if lock.locked():
+            raise UploadError(409, "Another chunk of this upload is being written")
+
+        try:
+            async with lock:
+                await self._write(meta, offset, body, sha256)
+        finally:
+            self._busy.pop(upload_id, None)
+        return self.status(project_name, upload_id)
+
+    async def _write(self, meta: dict, offset: int, body: AsyncIterator[bytes], sha256: Optional[str]):
+        upload_id = meta["upload_id"]
+        data_path = self._data_path(upload_id)
+        received = os.path.getsize(data_path)
+        if offset != received:
+            raise UploadError(409, f"Expected offset {received}")
+
+        hasher, hashed = self._hashers.get(upload_id, (None, -1))
+        if hashed != offset:
+            # The running hash was lost, e.g. by a restart; commit rehashes
+            hasher = None
+        chunk_hash = hashlib.sha256() if sha256 else None
+        position = offset
+        try:
+            async with aiofiles.open(data_path, "r+b") as f:
+                await f.seek(offset)
+                pending = []
+                pending_size = 0
+                async for piece in body:
+                    if position + len(piece) > meta["size"]:
+                        raise UploadError(413, "Chunk extends past the declared upload size")
+                    position += len(piece)
+                    if hasher is not None:
+                        hasher.update(piece)
+                    if chunk_hash is not None:
+                        chunk_hash.update(piece)
+                    pending.append(piece)
+                    pending_size += len(piece)
+                    # Batch small network reads into fewer disk writes
+                    if pending_size >= self.write_buffer:
+                        await f.write(b"".join(pending))
+                        pending, pending_size = [], 0
+                if pending:
+                    await f.write(b"".join(pending))
+                if chunk_hash is not None and chunk_hash.hexdigest() != sha256.lower():
+                    raise UploadError(422, "Chunk checksum mismatch")
+        except BaseException:
+            # Drop the partial chunk so the client can resend it from offset
+            await run_in_threadpool(os.truncate, data_path, offset)
+            self._hashers.pop(upload_id, None)
+            raise
+
+        if hasher is not None:
+            self._hashers[upload_id] = (hasher, position)
+        else:
+            self._hashers.pop(upload_id, None)
+        os.utime(self._meta_path(upload_id))
+
+    async def commit(self, project_name: str, upload_id: str, sha256: Optional[str] = None) -> dict:
+        """Verify a complete upload and move it into the project"""
+        meta = self._load(project_name, upload_id)
+        if upload_id in self._busy:
+            raise UploadError(409, "A chunk of this upload is still being written")
+        data_path = self._data_path(upload_id)
+        received = os.path.getsize(data_path)
+        if received != meta["size"]:
+            raise UploadError(409, f"Upload incomplete: {received} of {meta['size']} bytes received")
+
+        expected = (sha256 or meta["sha256"] or "").lower()
+        if expected:
+            hasher, hashed = self._hashers.get(upload_id, (None, -1))
+            if hasher is not None and hashed == received:
+                digest = hasher.hexdigest()
+            else:
+                # The running hash was lost (restart or rewritten chunk); rehash
+                digest = await run_in_threadpool(self._hash_file, data_path)
+            if digest != expected:
+                self.abort(project_name, upload_id)
+                raise UploadError(422, "Upload checksum mismatch")
+        # The project may have grown since the upload started
+        self._check_quota(project_name, meta["path"], received)
+
+        installed = await run_in_threadpool(file_manager.install_file, project_name, meta["path"], data_path)
+        if not installed:
+            raise UploadError(500, "Failed to move upload into place")
+        self._forget(upload_id)
+        return {"path": meta["path"], "size": received}
+
+    @staticmethod
+    def _check_quota(project_name: str, file_path: str, size: int):
+        try:
+            usage_tracker.check(project_name, file_path, size)
+        except QuotaExceeded as e:
+            raise UploadError(413, str(e))
+
+    def abort(self, project_name: str, upload_id: str):
+        """Discard a session and its staged data"""
+        self._load(project_name, upload_id)
+        self._forget(upload_id)
+
+    def expire(self):
+        """Remove sessions that have not received data for expire_seconds"""
+        cutoff = time.time() - self.expire_seconds
+        try:
+            names = os.listdir(self.staging_dir)
+        except OSError:
+            return
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            upload_id = name[:-len(".json")]
+            try:
+                if os.path.getmtime(self._meta_path(upload_id)) < cutoff and upload_id not in self._busy:
+                    self._forget(upload_id)
+            except OSError:
+                pass
+
+    def _load(self, project_name: str, upload_id: str) -> dict:
+        # Session ids are generated hex strings; anything else can't name a file here
+        if not upload_id.isalnum():
+            raise UploadError(404, "Upload not found")
+        try:
+            with open(self._meta_path(upload_id), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            raise UploadError(404, "Upload not found")
+        if meta.get("project") != project_name:
+            raise UploadError(404, "Upload not found")
+        return meta
+
+    def _describe(self, meta: dict, offset: Optional[int] = None) -> dict:
+        if offset is None:
+            offset = os.path.getsize(self._data_path(meta["upload_id"]))
+        return {
+            "upload_id": meta["upload_id"],
+            "path": meta["path"],
+            "size": meta["size"],
+            "offset": offset,
+            "chunk_size": self.chunk_size,
+        }
+
+    def _forget(self, upload_id: str):
+        self._hashers.pop(upload_id, None)
+        self._busy.pop(upload_id, None)
+        for path in (self._data_path(upload_id), self._meta_path(upload_id)):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def _data_path(self, upload_id: str) -> Path:
+        return self.staging_dir / f"{upload_id}.part"
+
+    def _meta_path(self, upload_id: str) -> Path:
+        return self.staging_dir / f"{upload_id}.json"
+
+    @staticmethod
+    def _hash_file(path: Path) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+
+upload_manager = UploadManager(
+    file_manager.base_path / ".snappods" / "uploads",
+    chunk_size=int(os.getenv("UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024))),
+    expire_seconds=float(os.getenv("UPLOAD_EXPIRE_SECONDS", "86400")),
+)
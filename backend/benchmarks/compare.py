@@ -0,0 +1,63 @@
+import argparse
+import json
+import sys
+from typing import Any, Dict, Tuple
+
+
+def key(result: Dict[str, Any]) -> Tuple[str, str]:
+    return result["name"], json.dumps(result["params"], sort_keys=True)
+
+
+def metric(result: Dict[str, Any]) -> Tuple[str, float]:
+    """The name and value compared: median time, or ops_per_s for throughput runs"""
+    if "median_ms" in result:
+        return "median_ms", result["median_ms"]
+    return "ops_per_s", result["ops_per_s"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline", help="Results of the older commit")
+    parser.add_argument("candidate", help="Results of the newer commit")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Relative change reported as a regression or improvement (default 0.10)")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    print(f"baseline  {baseline['meta'].get('commit')}  ({baseline['meta'].get('profile')})")
+    print(f"candidate {candidate['meta'].get('commit')}  ({candidate['meta'].get('profile')})")
+    print()
+
+    before = {key(result): result for result in baseline["results"]}
+    regressions = 0
+    for result in candidate["results"]:
+        old = before.pop(key(result), None)
+        label = f"{result['name']} {result['params']}"
+        if old is None:
+            print(f"  new        {label}")
+            continue
+        name, new_value = metric(result)
+        _, old_value = metric(old)
+        if not old_value:
+            continue
+        change = (new_value - old_value) / old_value
+        # For throughput, higher is better
+        worse = change > args.threshold if name == "median_ms" else change < -args.threshold
+        better = change < -args.threshold if name == "median_ms" else change > args.threshold
+        status = "REGRESSED" if worse else "improved" if better else ""
+        regressions += worse
+        print(f"  {change:+8.1%}  {old_value:>12} -> {new_value:<12} {name:<10} {label}  {status}")
+    for result in before.values():
+        print(f"  missing    {result['name']} {result['params']}")
+
+    if regressions:
+        print(f"\n{regressions} result(s) regressed by more than {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
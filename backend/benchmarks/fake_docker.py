@@ -0,0 +1,493 @@
+import argparse
+import asyncio
+import hashlib
+import io
+import json
+import os
+import struct
+import tarfile
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+
+class FakeDockerDaemon:
+    """Just enough of the Docker Engine API, on a Unix socket, to drive DockerClient
+
+    Serves a fixed set of containers: listing, inspect, one-shot and
+    streamed stats, multiplexed logs, image inspect, ping and an events
+    stream that stays open. Every response waits latency seconds first, to
+    stand in for a busy daemon. Responses are built from seeded data, so
+    two runs with the same settings serve the same bytes; followed logs
+    are the exception, writing log_rate lines a second stamped with the
+    current time. Interactive execs get a tiny shell on the upgraded
+    connection: it echoes keystrokes like a TTY, and understands
+    `echo ...`, `flood <bytes>` and `exit`.
+
+    It also keeps what the compose engine needs: networks, volumes,
+    pulled and built images, and containers that can be created, started,
+    stopped and removed. Pulls of images under missing/ fail. A container
+    with a healthcheck reports starting on its first inspect, then
+    unhealthy if its test mentions "false" and healthy otherwise. calls
+    records each request as "METHOD /path", and builds the file names of
+    each build context received.
+    """
+
+    def __init__(self, containers: int = 100, latency: float = 0.0, images: int = 20,
+                 log_line_bytes: int = 120, stats_interval: float = 1.0, log_rate: float = 10.0):
+        self.latency = latency
+        self.log_line_bytes = log_line_bytes
+        self.stats_interval = stats_interval
+        self.log_rate = log_rate
+        self.images = [f"sha256:{index:064x}" for index in range(1, images + 1)]
+        self.containers = [self._container(index) for index in range(containers)]
+        self._by_id = {container["Id"]: container for container in self.containers}
+        self._logs: Dict[int, bytes] = {}
+        self._execs = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.tags: Dict[str, str] = {}
+        self.networks: Dict[str, dict] = {}
+        self.volumes: Dict[str, dict] = {}
+        self.builds: List[Tuple[str, List[str]]] = []
+        self.calls: List[str] = []
+        self._created = 0
+
+    def _container(self, index: int) -> dict:
+        container_id = f"{index + 1:08x}" * 8
+        return {
+            "Id": container_id,
+            "Names": [f"/bench_{index}"],
+            "Image": f"bench/image-{index % len(self.images)}:latest",
+            "ImageID": self.images[index % len(self.images)],
+            "Command": "/entrypoint.sh",
+            "Created": 1700000000 + index,
+            "State": "running" if index % 4 else "exited",
+            "Status": "Up 2 hours" if index % 4 else "Exited (0) 1 hour ago",
+            "Ports": [
+                {"PrivatePort": 80, "PublicPort": 20000 + index, "Type": "tcp", "IP": "0.0.0.0"},
+                {"PrivatePort": 443, "Type": "tcp"},
+            ],
+            "Labels": {
+                "com.docker.compose.project": f"bench{index % 10}",
+                "com.docker.compose.service": f"service{index}",
+            },
+        }
+
+    async def start(self, socket_path: str):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        self._server = await asyncio.start_unix_server(self._handle, socket_path)
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def serve_forever(self, socket_path: str):
+        await self.start(socket_path)
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    return
+                method, target, headers, body = request
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                if headers.get("upgrade") and target.startswith("/exec/"):
+                    # The connection now belongs to the exec
+                    await self._shell(reader, writer)
+                    return
+                await self._respond(method, target, writer, body)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+        line = await reader.readline()
+        if not line:
+            return None
+        method, target, _ = line.decode("latin-1").split(" ", 2)
+        headers = {}
+        while True:
+            header = await reader.readline()
+            if header in (b"\r\n", b""):
+                break
+            name, _, value = header.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length", 0))
+        chunked = "chunked" in headers.get("transfer-encoding", "").lower()
+        body = b""
+        if chunked:
+            while True:
+                size = int((await reader.readline()).strip(), 16)
+                body += (await reader.readexactly(size + 2))[:size]
+                if size == 0:
+                    break
+        elif length:
+            body = await reader.readexactly(length)
+        return method, target, headers, body
+
+    async def _respond(self, method: str, target: str, writer: asyncio.StreamWriter, body: bytes = b""):
+        url = urlsplit(target)
+        query = {name: values[0] for name, values in parse_qs(url.query).items()}
+        parts = unquote(url.path).strip("/").split("/")
+        self.calls.append(f"{method} {unquote(url.path)}")
+
+        if await self._respond_compose(method, parts, query, body, writer):
+            pass
+        elif parts == ["_ping"]:
+            await self._send(writer, 200, b"OK", "text/plain")
+        elif parts == ["version"]:
+            await self._send_json(writer, 200, {"Version": "24.0.0", "ApiVersion": "1.43"})
+        elif parts == ["containers", "json"]:
+            await self._send_json(writer, 200, self._list(query))
+        elif parts[0] == "containers" and len(parts) == 3:
+            container = self._by_id.get(parts[1]) or self._find(parts[1])
+            if container is None:
+                await self._send_json(writer, 404, {"message": f"No such container: {parts[1]}"})
+            elif parts[2] == "json":
+                await self._send_json(writer, 200, self._inspect(container))
+            elif parts[2] == "stats":
+                await self._stats(writer, container, query.get("stream", "true").lower() in ("1", "true"))
+            elif parts[2] == "logs" and query.get("follow", "false").lower() in ("1", "true"):
+                await self._follow_logs(writer)
+            elif parts[2] == "logs":
+                await self._send_stream(writer, self._log_frames(query.get("tail", "100")),
+                                        "application/vnd.docker.raw-stream")
+            elif parts[2] == "exec" and method == "POST":
+                self._execs += 1
+                await self._send_json(writer, 201, {"Id": f"{self._execs:064x}"})
+            else:
+                await self._send_json(writer, 404, {"message": "page not found"})
+        elif parts[0] == "exec" and len(parts) == 3 and parts[2] == "resize":
+            await self._send(writer, 201, b"", "text/plain")
+        elif parts[0] == "exec" and len(parts) == 3 and parts[2] == "start":
+            # A non-interactive exec that prints nothing
+            await self._send_stream(writer, b"", "application/vnd.docker.raw-stream")
+        elif parts[0] == "images" and parts[-1] == "json":
+            image_id = "/".join(parts[1:-1])
+            image_id = self.tags.get(image_id, self.tags.get(f"{image_id}:latest", image_id))
+            if image_id in self.tags.values():
+                await self._send_json(writer, 200, {"Id": image_id, "RepoTags": [
+                    tag for tag, tagged in self.tags.items() if tagged == image_id
+                ]})
+            elif image_id in self.images:
+                index = self.images.index(image_id)
+                await self._send_json(writer, 200, {"Id": image_id, "RepoTags": [f"bench/image-{index}:latest"]})
+            else:
+                await self._send_json(writer, 404, {"message": f"No such image: {image_id}"})
+        elif parts == ["events"]:
+            await self._events(writer)
+        else:
+            await self._send_json(writer, 404, {"message": f"page not found: {method} {url.path}"})
+
+    async def _respond_compose(self, method: str, parts: List[str], query: Dict[str, str], body: bytes,
+                               writer: asyncio.StreamWriter) -> bool:
+        """Answer the requests that create and change resources; False for any other"""
+        if method == "POST" and parts == ["images", "create"]:
+            image = f"{query['fromImage']}:{query.get('tag') or 'latest'}"
+            if image.startswith("missing/"):
+                messages = [{"error": f"pull access denied for {query['fromImage']}"}]
+            else:
+                self.tags[image] = "sha256:" + hashlib.sha256(image.encode()).hexdigest()
+                messages = [{"status": "Pulling from library"}, {"status": f"Status: Downloaded newer image for {image}"}]
+            await self._send_stream(writer, b"".join(json.dumps(m).encode() + b"\r\n" for m in messages),
+                                    "application/json")
+        elif method == "POST" and parts == ["build"]:
+            with tarfile.open(fileobj=io.BytesIO(body)) as tar:
+                names = tar.getnames()
+            tag = query["t"] if ":" in query["t"].rpartition("/")[2] else query["t"] + ":latest"
+            self.builds.append((tag, names))
+            # Every build makes a new image
+            self.tags[tag] = "sha256:" + hashlib.sha256(f"{tag} {len(self.builds)}".encode()).hexdigest()
+            await self._send_stream(writer, json.dumps({"stream": f"Successfully tagged {tag}\n"}).encode(),
+                                    "application/json")
+        elif parts[0] in ("networks", "volumes") and len(parts) == 2 and method == "POST" and parts[1] == "create":
+            options = json.loads(body)
+            resources = self.networks if parts[0] == "networks" else self.volumes
+            resources[options["Name"]] = options
+            await self._send_json(writer, 201, {"Id": options["Name"], **options})
+        elif parts[0] in ("networks", "volumes") and len(parts) == 2 and method == "GET":
+            resource = (self.networks if parts[0] == "networks" else self.volumes).get(parts[1])
+            if resource is None:
+                await self._send_json(writer, 404, {"message": f"{parts[0][:-1]} {parts[1]} not found"})
+            else:
+                await self._send_json(writer, 200, resource)
+        elif parts[0] == "networks" and len(parts) == 3 and parts[2] == "connect":
+            await self._send(writer, 200, b"", "text/plain")
+        elif method == "POST" and parts == ["containers", "create"]:
+            await self._create(json.loads(body), query["name"], writer)
+        elif parts[0] == "containers" and len(parts) in (2, 3) and method in ("POST", "DELETE"):
+            container = self._by_id.get(parts[1]) or self._find(parts[1])
+            action = parts[2] if len(parts) == 3 else "delete"
+            if container is None:
+                await self._send_json(writer, 404, {"message": f"No such container: {parts[1]}"})
+                return True
+            if action == "start":
+                container.update(State="running", Status="Up 1 second")
+            elif action == "stop":
+                container.update(State="exited", Status="Exited (0) 1 second ago")
+            elif action == "delete":
+                self.containers.remove(container)
+                del self._by_id[container["Id"]]
+            else:
+                return False
+            await self._send(writer, 204, b"", "text/plain")
+        else:
+            return False
+        return True
+
+    async def _create(self, config: dict, name: str, writer: asyncio.StreamWriter):
+        if self._find(name) is not None:
+            await self._send_json(writer, 409, {"message": f"Conflict. The container name /{name} is already in use"})
+            return
+        image = config["Image"] if ":" in config["Image"].rpartition("/")[2] else config["Image"] + ":latest"
+        if image not in self.tags:
+            await self._send_json(writer, 404, {"message": f"No such image: {config['Image']}"})
+            return
+        self._created += 1
+        container = {
+            "Id": hashlib.sha256(f"{name} {self._created}".encode()).hexdigest(),
+            "Names": [f"/{name}"],
+            "Image": config["Image"],
+            "ImageID": self.tags[image],
+            "Command": " ".join(config.get("Cmd") or []),
+            "Created": 1700000000 + self._created,
+            "State": "created",
+            "Status": "Created",
+            "Ports": [],
+            "Labels": config.get("Labels") or {},
+            "Config": config,
+        }
+        self.containers.append(container)
+        self._by_id[container["Id"]] = container
+        await self._send_json(writer, 201, {"Id": container["Id"], "Warnings": []})
+
+    def _find(self, prefix: str) -> Optional[dict]:
+        for container in self.containers:
+            if container["Id"].startswith(prefix) or container["Names"][0] == "/" + prefix:
+                return container
+        return None
+
+    def _list(self, query: Dict[str, str]) -> List[dict]:
+        containers = self.containers
+        if query.get("all", "false").lower() not in ("1", "true"):
+            containers = [container for container in containers if container["State"] == "running"]
+        filters = json.loads(query.get("filters") or "{}") or {}
+        ids = filters.get("id")
+        if ids:
+            containers = [container for container in containers
+                          if any(container["Id"].startswith(prefix) for prefix in ids)]
+        for label in filters.get("label") or []:
+            key, _, value = label.partition("=")
+            containers = [container for container in containers if container["Labels"].get(key) == value]
+        return containers
+
+    @staticmethod
+    def _inspect(container: dict) -> dict:
+        running = container["State"] == "running"
+        state = {"Status": container["State"], "Running": running, "ExitCode": 0}
+        test = (container.get("Config") or {}).get("Healthcheck", {}).get("Test")
+        if running and test and test != ["NONE"]:
+            if not container.get("Inspected"):
+                container["Inspected"] = True
+                state["Health"] = {"Status": "starting"}
+            else:
+                state["Health"] = {"Status": "unhealthy" if "false" in " ".join(test) else "healthy"}
+        return {
+            "Id": container["Id"],
+            "Name": container["Names"][0],
+            "Image": container["ImageID"],
+            "Config": {"Image": container["Image"], "Tty": False, "Labels": container["Labels"]},
+            "State": state,
+        }
+
+    @staticmethod
+    def _stats_sample(container: dict, tick: int) -> dict:
+        seed = int(container["Id"][:8], 16)
+        system = 10 ** 12 + tick * 8 * 10 ** 9
+        usage = seed * 10 ** 6 + tick * (seed % 7 + 1) * 10 ** 8
+        return {
+            "read": "2024-01-01T00:00:00Z",
+            "cpu_stats": {
+                "cpu_usage": {"total_usage": usage, "percpu_usage": [usage // 8] * 8},
+                "system_cpu_usage": system,
+                "online_cpus": 8,
+            },
+            "precpu_stats": {
+                "cpu_usage": {"total_usage": usage - (seed % 7 + 1) * 10 ** 8, "percpu_usage": [usage // 8] * 8},
+                "system_cpu_usage": system - 8 * 10 ** 9,
+                "online_cpus": 8,
+            },
+            "memory_stats": {
+                "usage": (seed % 512 + 64) * 2 ** 20,
+                "limit": 8 * 2 ** 30,
+                "stats": {"cache": 2 ** 20, "rss": (seed % 512) * 2 ** 20},
+            },
+            "networks": {
+                "eth0": {"rx_bytes": seed * 1000 + tick, "tx_bytes": seed * 500 + tick},
+                "eth1": {"rx_bytes": seed, "tx_bytes": seed},
+            },
+            "blkio_stats": {"io_service_bytes_recursive": []},
+        }
+
+    async def _stats(self, writer: asyncio.StreamWriter, container: dict, stream: bool):
+        if not stream:
+            await self._send_json(writer, 200, self._stats_sample(container, 1))
+            return
+        await self._start_chunked(writer, "application/json")
+        tick = 1
+        # Like the daemon, stream until the client hangs up
+        while True:
+            await self._write_chunk(writer, json.dumps(self._stats_sample(container, tick)).encode() + b"\n")
+            tick += 1
+            await asyncio.sleep(self.stats_interval)
+
+    def _log_frames(self, tail: str) -> bytes:
+        count = 10000 if tail == "all" else int(tail)
+        frames = self._logs.get(count)
+        if frames is None:
+            pieces = []
+            filler = "x" * max(self.log_line_bytes - 40, 0)
+            for index in range(count):
+                line = f"2024-01-01T00:00:{index % 60:02d}Z line {index} {filler}\n".encode()
+                pieces.append(struct.pack(">BxxxL", 2 if index % 10 == 0 else 1, len(line)) + line)
+            frames = self._logs[count] = b"".join(pieces)
+        return frames
+
+    async def _follow_logs(self, writer: asyncio.StreamWriter, tick: float = 0.01):
+        """Write new lines at log_rate a second until the client hangs up"""
+        await self._start_chunked(writer, "application/vnd.docker.raw-stream")
+        filler = "x" * max(self.log_line_bytes - 60, 0)
+        started = time.monotonic()
+        written = 0
+        while True:
+            await asyncio.sleep(tick)
+            due = int((time.monotonic() - started) * self.log_rate) - written
+            if due <= 0:
+                continue
+            # Stamped with the wall clock, so a reader can tell how long a line took to reach it
+            now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f000Z")
+            pieces = []
+            for index in range(written, written + due):
+                line = f"{now} line {index} {filler}\n".encode()
+                pieces.append(struct.pack(">BxxxL", 1, len(line)) + line)
+            written += due
+            await self._write_chunk(writer, b"".join(pieces))
+
+    async def _shell(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Act as a shell on a raw TTY stream"""
+        writer.write(b"HTTP/1.1 101 UPGRADED\r\nContent-Type: application/vnd.docker.raw-stream\r\n"
+                     b"Connection: Upgrade\r\nUpgrade: tcp\r\n\r\n$ ")
+        await writer.drain()
+        line = bytearray()
+        while True:
+            data = await reader.read(64 * 1024)
+            if not data:
+                return
+            # The TTY echoes input, turning carriage returns into new lines
+            writer.write(data.replace(b"\r", b"\r\n"))
+            line += data
+            while True:
+                end = min((i for i in (line.find(b"\r"), line.find(b"\n")) if i >= 0), default=-1)
+                if end < 0:
+                    break
+                command = line[:end].decode("utf-8", errors="replace").split()
+                del line[:end + 1]
+                if not command:
+                    pass
+                elif command[0] == "exit":
+                    await writer.drain()
+                    return
+                elif command[0] == "echo":
+                    writer.write(" ".join(command[1:]).encode() + b"\r\n")
+                elif command[0] == "flood" and len(command) > 1 and command[1].isdigit():
+                    await self._flood(writer, int(command[1]))
+                else:
+                    writer.write(f"sh: {command[0]}: not found\r\n".encode())
+                writer.write(b"$ ")
+            await writer.drain()
+
+    @staticmethod
+    async def _flood(writer: asyncio.StreamWriter, size: int):
+        """Write size bytes of output, waiting on the reader like a process writing to a TTY"""
+        row = b"x" * 78 + b"\r\n"
+        block = row * (64 * 1024 // len(row))
+        while size > 0:
+            writer.write(block[:size])
+            size -= len(block)
+            await writer.drain()
+
+    async def _events(self, writer: asyncio.StreamWriter):
+        await self._start_chunked(writer, "application/json")
+        # Nothing happens here; hold the stream open like an idle daemon
+        while True:
+            await asyncio.sleep(3600)
+
+    @staticmethod
+    async def _send(writer: asyncio.StreamWriter, status: int, body: bytes, content_type: str):
+        writer.write(
+            f"HTTP/1.1 {status} {'OK' if status < 400 else 'Error'}\r\n"
+            f"Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+            f"Api-Version: 1.43\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+
+    async def _send_json(self, writer: asyncio.StreamWriter, status: int, payload):
+        await self._send(writer, status, json.dumps(payload).encode(), "application/json")
+
+    @staticmethod
+    async def _start_chunked(writer: asyncio.StreamWriter, content_type: str):
+        writer.write(
+            f"HTTP/1.1 200 OK\r\nContent-Type: {content_type}\r\n"
+            f"Transfer-Encoding: chunked\r\nApi-Version: 1.43\r\n\r\n".encode()
+        )
+        await writer.drain()
+
+    @staticmethod
+    async def _write_chunk(writer: asyncio.StreamWriter, data: bytes):
+        writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+        await writer.drain()
+
+    async def _send_stream(self, writer: asyncio.StreamWriter, body: bytes, content_type: str,
+                           chunk_size: int = 64 * 1024):
+        await self._start_chunked(writer, content_type)
+        for start in range(0, len(body), chunk_size):
+            await self._write_chunk(writer, body[start:start + chunk_size])
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a fake Docker Engine API on a Unix socket")
+    parser.add_argument("socket", help="Path of the Unix socket to listen on")
+    parser.add_argument("--containers", type=int, default=100, help="Number of containers to serve")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Delay before every response")
+    parser.add_argument("--images", type=int, default=20, help="Number of distinct images")
+    parser.add_argument("--log-line-bytes", type=int, default=120, help="Length of each log line")
+    parser.add_argument("--stats-interval-ms", type=float, default=1000.0, help="Gap between streamed stats samples")
+    parser.add_argument("--log-rate", type=float, default=10.0, help="Lines a second written to followed logs")
+    args = parser.parse_args()
+
+    daemon = FakeDockerDaemon(containers=args.containers, latency=args.latency_ms / 1000,
+                              images=args.images, log_line_bytes=args.log_line_bytes,
+                              stats_interval=args.stats_interval_ms / 1000, log_rate=args.log_rate)
+    started = time.time()
+    try:
+        asyncio.run(daemon.serve_forever(args.socket))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"Fake Docker daemon on {args.socket} stopped after {time.time() - started:.0f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,394 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+MB = 1024 * 1024
+
+# Sizes for each profile; "quick" is meant for every commit, "full" for releases
+PROFILES: Dict[str, Dict[str, Any]] = {
+    "quick": {
+        "containers": [100],
+        "latency_ms": [0.0],
+        "tree_files": [10000],
+        "file_sizes": [1 * MB, 16 * MB],
+        "projects": 50,
+    },
+    "default": {
+        "containers": [100, 1000],
+        "latency_ms": [0.0, 2.0],
+        "tree_files": [10000, 100000],
+        "file_sizes": [1 * MB, 16 * MB, 128 * MB],
+        "projects": 200,
+    },
+    "full": {
+        "containers": [100, 1000, 5000],
+        "latency_ms": [0.0, 2.0, 10.0],
+        "tree_files": [10000, 100000],
+        "file_sizes": [1 * MB, 16 * MB, 128 * MB, 1024 * MB],
+        "projects": 500,
+    },
+}
+
+
+def summarize(name: str, params: Dict[str, Any], samples: List[float], **extra) -> Dict[str, Any]:
+    """One result: timings of each iteration in seconds, reduced to milliseconds"""
+    ordered = sorted(samples)
+    total = sum(samples)
+    result = {
+        "name": name,
+        "params": params,
+        "iterations": len(samples),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 4),
+        "median_ms": round(statistics.median(samples) * 1000, 4),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 4),
+        "min_ms": round(ordered[0] * 1000, 4),
+        "max_ms": round(ordered[-1] * 1000, 4),
+        "stdev_ms": round(statistics.stdev(samples) * 1000, 4) if len(samples) > 1 else 0.0,
+        "ops_per_s": round(len(samples) / total, 2) if total else None,
+    }
+    result.update(extra)
+    print(f"  {name} {params}: median {result['median_ms']} ms, p95 {result['p95_ms']} ms", file=sys.stderr)
+    return result
+
+
+def measure(fn: Callable[[], Any], iterations: int, warmup: int = 1,
+            setup: Optional[Callable[[], Any]] = None) -> List[float]:
+    """Time fn iterations times after warmup untimed calls; setup runs untimed before each"""
+    samples = []
+    for index in range(warmup + iterations):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        if index >= warmup:
+            samples.append(elapsed)
+    return samples
+
+
+async def measure_async(fn: Callable[[], Awaitable[Any]], iterations: int, warmup: int = 1) -> List[float]:
+    samples = []
+    for index in range(warmup + iterations):
+        started = time.perf_counter()
+        await fn()
+        elapsed = time.perf_counter() - started
+        if index >= warmup:
+            samples.append(elapsed)
+    return samples
+
+
+class FakeDaemonProcess:
+    """The fake Docker daemon in a child process, so it doesn't share the client's event loop"""
+
+    def __init__(self, socket_path: str, containers: int, latency_ms: float):
+        self.socket_path = socket_path
+        self.args = [sys.executable, "-m", "benchmarks.fake_docker", socket_path,
+                     "--containers", str(containers), "--latency-ms", str(latency_ms)]
+        self.process: Optional[subprocess.Popen] = None
+
+    def __enter__(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.process = subprocess.Popen(self.args, cwd=backend, stdout=subprocess.DEVNULL)
+        deadline = time.monotonic() + 30
+        while not os.path.exists(self.socket_path):
+            if self.process.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError("Fake Docker daemon did not start")
+            time.sleep(0.02)
+        return self
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        self.process.wait(10)
+
+
+async def bench_docker(profile: Dict[str, Any], workdir: str) -> List[Dict[str, Any]]:
+    from app.docker_client import DockerClient
+
+    results = []
+    socket_path = os.path.join(workdir, "docker.sock")
+    for containers in profile["containers"]:
+        for latency_ms in profile["latency_ms"]:
+            params = {"containers": containers, "latency_ms": latency_ms}
+            with FakeDaemonProcess(socket_path, containers, latency_ms):
+                client = DockerClient()
+                client._socket_path = socket_path
+                try:
+                    # The first listing also fills the image name cache
+                    samples = await measure_async(lambda: client.list_containers(all=True), 20)
+                    results.append(summarize("docker.list_containers", params, samples))
+
+                    summaries = await client.list_container_summaries(all=True)
+                    container_id = summaries[0]["Id"]
+                    samples = await measure_async(lambda: client.get_container_stats(container_id), 200)
+                    results.append(summarize("docker.get_container_stats", params, samples))
+
+                    for tail in (100, 10000):
+                        samples = await measure_async(lambda: client.get_container_logs(container_id, tail=tail), 20)
+                        results.append(summarize("docker.get_container_logs", {**params, "tail": tail}, samples))
+                finally:
+                    await client.close()
+
+    # Parsing alone, without the round trip
+    from benchmarks.fake_docker import FakeDockerDaemon
+    daemon = FakeDockerDaemon(containers=1)
+    sample = json.loads(json.dumps(daemon._stats_sample(daemon.containers[0], 2)))
+    container_id = daemon.containers[0]["Id"]
+    samples = measure(lambda: DockerClient.parse_stats(container_id, sample), 10000, warmup=100)
+    results.append(summarize("docker.parse_stats", {}, samples))
+    return results
+
+
+def make_tree(root: str, files: int, per_directory: int = 100) -> str:
+    """files empty-ish files spread over directories of per_directory each"""
+    for index in range(files):
+        directory = os.path.join(root, f"dir{index // per_directory:05d}")
+        if index % per_directory == 0:
+            os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"file{index % per_directory:03d}.txt"), "w") as f:
+            f.write(f"file {index}\n")
+    return root
+
+
+def make_deep_tree(root: str, depth: int = 64, files_per_level: int = 10) -> str:
+    directory = root
+    for level in range(depth):
+        directory = os.path.join(directory, f"level{level:02d}")
+        os.makedirs(directory, exist_ok=True)
+        for index in range(files_per_level):
+            with open(os.path.join(directory, f"file{index}.txt"), "w") as f:
+                f.write(f"level {level} file {index}\n")
+    return root
+
+
+async def bench_file_tree(profile: Dict[str, Any], workdir: str) -> List[Dict[str, Any]]:
+    from app.file_manager import FileManager
+
+    base = os.path.join(workdir, "projects")
+    manager = FileManager(base_path=base)
+    results = []
+
+    def cold(project: str):
+        # Drop cached listings; the kernel's dentry cache stays warm
+        return lambda: manager.listings.invalidate_tree(os.path.join(base, project))
+
+    for files in profile["tree_files"]:
+        project = f"tree{files}"
+        print(f"  creating {files} files", file=sys.stderr)
+        make_tree(os.path.join(base, project), files)
+        params = {"files": files, "directories": (files + 99) // 100}
+        for depth in (1, 2):
+            run = lambda: manager.list_files(project, "", depth=depth)
+            results.append(summarize("files.list_files", {**params, "depth": depth, "cache": "cold"},
+                                     measure(run, 10, setup=cold(project))))
+            results.append(summarize("files.list_files", {**params, "depth": depth, "cache": "warm"},
+                                     measure(run, 10)))
+        run = lambda: manager.list_files(project, "", depth=2, limit=1000)
+        results.append(summarize("files.list_files", {**params, "depth": 2, "limit": 1000, "cache": "warm"},
+                                 measure(run, 10)))
+
+    make_deep_tree(os.path.join(base, "deep"))
+    params = {"depth": 64, "files_per_level": 10}
+    run = lambda: manager.list_files("deep", "", depth=32)
+    results.append(summarize("files.list_files", {**params, "list_depth": 32, "cache": "cold"},
+                             measure(run, 10, setup=cold("deep"))))
+    results.append(summarize("files.list_files", {**params, "list_depth": 32, "cache": "warm"}, measure(run, 10)))
+    deepest = "/".join(f"level{level:02d}" for level in range(64))
+    run = lambda: manager.list_files("deep", deepest, depth=1)
+    results.append(summarize("files.list_files", {**params, "subpath_depth": 64, "cache": "warm"}, measure(run, 50)))
+    return results
+
+
+def make_text_file(path: str, size: int) -> str:
+    """A UTF-8 text file of exactly size bytes, written a block at a time"""
+    line = b"The quick brown fox jumps over the lazy dog 0123456789\n"
+    block = line * (MB // len(line)) + line[:MB % len(line)]
+    with open(path, "wb") as f:
+        remaining = size
+        while remaining > 0:
+            f.write(block[:remaining])
+            remaining -= len(block)
+    return path
+
+
+async def bench_file_io(profile: Dict[str, Any], workdir: str) -> List[Dict[str, Any]]:
+    from app.file_manager import FileManager
+
+    base = os.path.join(workdir, "projects")
+    manager = FileManager(base_path=base)
+    manager.create_project_directory("io")
+    results = []
+    for size in profile["file_sizes"]:
+        source = make_text_file(os.path.join(workdir, f"source{size}"), size)
+        # Enough iterations for small files without making 1 GB runs take minutes
+        iterations = max(3, min(20, (256 * MB) // size))
+        params = {"bytes": size}
+
+        def upload():
+            with open(source, "rb") as f:
+                if not manager.save_upload("io", f"upload{size}.txt", f):
+                    raise RuntimeError("Upload failed")
+        samples = measure(upload, iterations)
+        results.append(summarize("files.upload_file", params, samples,
+                                 mb_per_s=round(size / MB / statistics.median(samples), 2)))
+
+        if size <= 16 * MB:
+            # upload_file takes the whole body in memory, as the old route did
+            data = open(source, "rb").read()
+            samples = measure(lambda: manager.upload_file("io", f"buffered{size}.txt", data), iterations)
+            results.append(summarize("files.upload_file", {**params, "buffered": True}, samples,
+                                     mb_per_s=round(size / MB / statistics.median(samples), 2)))
+            del data
+
+        samples = measure(lambda: manager.read_file("io", f"upload{size}.txt"), iterations)
+        results.append(summarize("files.read_file", params, samples,
+                                 mb_per_s=round(size / MB / statistics.median(samples), 2)))
+
+        samples = measure(lambda: manager.read_text("io", f"upload{size}.txt", offset=0, length=MB), iterations)
+        results.append(summarize("files.read_text", {**params, "window": MB}, samples))
+        os.unlink(source)
+        for name in os.listdir(os.path.join(base, "io")):
+            os.unlink(os.path.join(base, "io", name))
+    return results
+
+
+async def bench_projects(profile: Dict[str, Any], workdir: str) -> List[Dict[str, Any]]:
+    import httpx
+    from app.file_manager import file_manager
+    from app.main import app
+    from app.models import async_engine
+
+    file_manager.base_path = __import__("pathlib").Path(workdir) / "api-projects"
+    file_manager.base_path.mkdir(parents=True, exist_ok=True)
+    count = profile["projects"]
+    results = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def request(method: str, url: str, **kwargs):
+            response = await client.request(method, url, **kwargs)
+            if response.status_code >= 400:
+                raise RuntimeError(f"{method} {url} failed with {response.status_code}: {response.text}")
+            return response
+
+        ids: List[int] = []
+        names = iter(range(count * 2))
+
+        async def create():
+            response = await request("POST", "/api/projects/", json={"name": f"bench{next(names)}"})
+            ids.append(response.json()["id"])
+        samples = await measure_async(create, count)
+        results.append(summarize("projects.create", {"projects": count}, samples))
+
+        samples = await measure_async(lambda: request("GET", "/api/projects/"), 50)
+        results.append(summarize("projects.list", {"projects": len(ids)}, samples))
+
+        positions = iter(range(10 ** 9))
+        samples = await measure_async(
+            lambda: request("GET", f"/api/projects/{ids[next(positions) % len(ids)]}"), 200
+        )
+        results.append(summarize("projects.get", {"projects": len(ids)}, samples))
+
+        for concurrency in (1, 10, 50):
+            total = 500
+            started = time.perf_counter()
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def one():
+                async with semaphore:
+                    await request("GET", "/api/projects/")
+            await asyncio.gather(*(one() for _ in range(total)))
+            elapsed = time.perf_counter() - started
+            results.append({
+                "name": "projects.list_concurrent",
+                "params": {"projects": len(ids), "concurrency": concurrency, "requests": total},
+                "total_s": round(elapsed, 4),
+                "ops_per_s": round(total / elapsed, 2),
+            })
+            print(f"  projects.list_concurrent x{concurrency}: {total / elapsed:.0f} req/s", file=sys.stderr)
+
+        remaining = iter(list(ids))
+        samples = await measure_async(lambda: request("DELETE", f"/api/projects/{next(remaining)}"),
+                                      len(ids) - 1)
+        results.append(summarize("projects.delete", {"projects": count}, samples))
+    await async_engine.dispose()
+    return results
+
+
+BENCHMARKS: Dict[str, Callable[[Dict[str, Any], str], Awaitable[List[Dict[str, Any]]]]] = {
+    "docker": bench_docker,
+    "files.tree": bench_file_tree,
+    "files.io": bench_file_io,
+    "projects": bench_projects,
+}
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(groups: List[str], profile_name: str, workdir: str) -> Dict[str, Any]:
+    profile = PROFILES[profile_name]
+    results = []
+    for group in groups:
+        print(f"{group}:", file=sys.stderr)
+        results.extend(await BENCHMARKS[group](profile, workdir))
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "profile": profile_name,
+            "groups": groups,
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the backend's hot paths offline")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="default")
+    parser.add_argument("--only", action="append", choices=sorted(BENCHMARKS),
+                        help="Run only this group; may be repeated")
+    parser.add_argument("--output", help="Write the JSON results here instead of stdout")
+    parser.add_argument("--workdir", help="Directory for synthetic data (default: a temp directory)")
+    parser.add_argument("--keep", action="store_true", help="Keep the synthetic data afterwards")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="snappods-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    # Set before the app is imported, which reads them at import time
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["DOCKER_SOCKET"] = os.path.join(workdir, "docker.sock")
+    try:
+        report = asyncio.run(run(args.only or list(BENCHMARKS), args.profile, workdir))
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
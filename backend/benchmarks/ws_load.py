@@ -0,0 +1,525 @@
+import argparse
+import asyncio
+import json
+import os
+import resource
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+import websockets
+
+from .run import git_commit
+
+
+def distribution(samples_ms: List[float]) -> Dict[str, Any]:
+    """Percentiles of a list of milliseconds"""
+    if not samples_ms:
+        return {"count": 0}
+    ordered = sorted(samples_ms)
+
+    def percentile(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))], 3)
+    return {
+        "count": len(ordered),
+        "mean": round(statistics.fmean(ordered), 3),
+        "p50": percentile(0.50),
+        "p90": percentile(0.90),
+        "p99": percentile(0.99),
+        "max": round(ordered[-1], 3),
+    }
+
+
+def epoch(timestamp: str) -> float:
+    """Seconds since the epoch of an RFC 3339 UTC timestamp with up to nanoseconds"""
+    base, _, fraction = timestamp.strip().rstrip("Z").partition(".")
+    seconds = datetime.fromisoformat(base).replace(tzinfo=timezone.utc).timestamp()
+    return seconds + float("0." + (fraction or "0"))
+
+
+def rss_bytes(pid: int) -> Optional[int]:
+    """Resident memory of a process, from /proc; None where that isn't available"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class SessionClosed(Exception):
+    """The server ended a session before the load test did"""
+
+
+class Results:
+    """What every session reports, gathered in one place"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.echo_ms: List[float] = []
+        self.flood_ms: List[float] = []
+        self.flood_bytes = 0
+        self.terminal_bytes = 0
+        self.stats_messages = 0
+        self.stats_gap_ms: List[float] = []
+        self.log_lines = 0
+        self.log_delay_ms: List[float] = []
+        self.probe_ms: List[float] = []
+        self.client_lag_ms: List[float] = []
+        self.connect_ms: List[float] = []
+        self.open = 0
+        self.peak_open = 0
+        self.errors: Dict[str, int] = {}
+
+    def error(self, kind: str, detail: Any = None):
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+        if self.errors[kind] == 1:
+            print(f"  first {kind}: {detail}", file=sys.stderr)
+
+    def opened(self, connect_seconds: float):
+        self.connect_ms.append(connect_seconds * 1000)
+        self.open += 1
+        self.peak_open = max(self.peak_open, self.open)
+
+
+class Session:
+    """One WebSocket client; subclasses drive and measure a kind of stream"""
+
+    kind = ""
+
+    def __init__(self, index: int, url: str, results: Results, stop: asyncio.Event, options):
+        self.index = index
+        self.url = url
+        self.results = results
+        self.stop = stop
+        self.options = options
+
+    async def run(self):
+        started = time.perf_counter()
+        try:
+            connection = await websockets.connect(self.url, max_size=None, open_timeout=30, ping_interval=None)
+        except Exception as e:
+            self.results.error(f"{self.kind}.connect", e)
+            return
+        self.results.opened(time.perf_counter() - started)
+        try:
+            await self.drive(connection)
+        except (websockets.ConnectionClosed, SessionClosed):
+            if not self.stop.is_set():
+                self.results.error(f"{self.kind}.closed", f"code {connection.close_code} {connection.close_reason}")
+        except Exception as e:
+            self.results.error(f"{self.kind}.error", repr(e))
+        finally:
+            self.results.open -= 1
+            await connection.close()
+
+    async def drive(self, connection):
+        raise NotImplementedError
+
+    async def until_stopped(self, receiver):
+        """Run receiver until the load test ends or it fails"""
+        task = asyncio.ensure_future(receiver)
+        stopping = asyncio.create_task(self.stop.wait())
+        try:
+            done, _ = await asyncio.wait([task, stopping], return_when=asyncio.FIRST_COMPLETED)
+            if task in done:
+                task.result()
+        finally:
+            task.cancel()
+            stopping.cancel()
+            await asyncio.gather(task, stopping, return_exceptions=True)
+
+
+class TerminalSession(Session):
+    """Types commands a key at a time, timing each echo, and now and then floods output
+
+    Every keystroke goes out as its own binary frame, as the browser
+    terminal sends them. The echo time is from the last key of a marker
+    word to that word coming back, which works against the fake daemon's
+    shell and a real TTY alike.
+    """
+
+    kind = "terminal"
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self._seen = bytearray()
+        self._received = 0
+        self._changed = asyncio.Event()
+
+    async def drive(self, connection):
+        await connection.send(json.dumps({"type": "resize", "cols": 120, "rows": 40}))
+        await self.until_stopped(asyncio.gather(self._receive(connection), self._type(connection)))
+
+    async def _receive(self, connection):
+        async for message in connection:
+            data = message if isinstance(message, bytes) else message.encode()
+            self._received += len(data)
+            self.results.terminal_bytes += len(data)
+            # Only the tail matters for finding the next marker
+            self._seen += data
+            del self._seen[:-4096]
+            self._changed.set()
+        raise SessionClosed()
+
+    async def _wait_for(self, condition, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while not condition():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                return False
+        return True
+
+    async def _type(self, connection):
+        options = self.options
+        round_number = 0
+        while True:
+            round_number += 1
+            if options.flood_every and round_number % options.flood_every == 0:
+                await self._flood(connection)
+                continue
+            marker = f"k{self.index:05d}r{round_number:07d}".encode()
+            self._seen.clear()
+            keys = b"echo " + marker
+            for key in keys[:-1]:
+                await connection.send(bytes([key]))
+                await asyncio.sleep(options.keystroke_interval / 1000)
+            await connection.send(keys[-1:])
+            sent = time.perf_counter()
+            if await self._wait_for(lambda: marker in self._seen, options.timeout):
+                self.results.echo_ms.append((time.perf_counter() - sent) * 1000)
+            else:
+                self.results.error("terminal.echo_timeout", marker.decode())
+            await connection.send(b"\r")
+            await asyncio.sleep(options.think_time / 1000)
+
+    async def _flood(self, connection):
+        size = self.options.flood_bytes
+        expected = self._received + size
+        sent = time.perf_counter()
+        await connection.send(self.options.flood_command.format(bytes=size).encode() + b"\r")
+        if await self._wait_for(lambda: self._received >= expected, self.options.timeout + size / 1e6):
+            elapsed = time.perf_counter() - sent
+            self.results.flood_ms.append(elapsed * 1000)
+            self.results.flood_bytes += size
+        else:
+            self.results.error("terminal.flood_timeout", f"{self._received - expected + size} of {size} bytes")
+
+
+class StatsSession(Session):
+    """Reads live stats, timing the gaps between samples"""
+
+    kind = "stats"
+
+    async def drive(self, connection):
+        async def receive():
+            last = None
+            async for _ in connection:
+                now = time.perf_counter()
+                self.results.stats_messages += 1
+                if last is not None:
+                    self.results.stats_gap_ms.append((now - last) * 1000)
+                last = now
+            raise SessionClosed()
+        await self.until_stopped(receive())
+
+
+class LogsSession(Session):
+    """Follows logs, timing each line from its daemon timestamp to arrival"""
+
+    kind = "logs"
+
+    async def drive(self, connection):
+        async def receive():
+            started = time.time()
+            async for message in connection:
+                now = time.time()
+                for line in json.loads(message).get("lines", []):
+                    self.results.log_lines += 1
+                    try:
+                        written = epoch(line["timestamp"])
+                    except (KeyError, TypeError, ValueError):
+                        continue
+                    # Backlog lines predate the session and say nothing about delivery
+                    if written >= started:
+                        self.results.log_delay_ms.append((now - written) * 1000)
+            raise SessionClosed()
+        await self.until_stopped(receive())
+
+
+async def probe_health(base_url: str, results: Results, stop: asyncio.Event, interval: float):
+    """Time GET /health on one kept-alive connection
+
+    The handler does no work, so its response time is mostly how long the
+    request waited for the server's event loop.
+    """
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                response = await client.get("/health")
+                response.raise_for_status()
+                results.probe_ms.append((time.perf_counter() - started) * 1000)
+            except Exception as e:
+                results.error("probe.error", repr(e))
+            await asyncio.sleep(interval)
+
+
+async def watch_client_lag(results: Results, stop: asyncio.Event, interval: float = 0.05):
+    """This process's own event loop lag; when high, the client is the bottleneck"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        results.client_lag_ms.append(max(time.perf_counter() - started - interval, 0) * 1000)
+
+
+async def pick_containers(base_url: str, wanted: Optional[List[str]]) -> List[str]:
+    if wanted:
+        return wanted
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+        response = await client.get("/api/containers/", params={"all": False})
+        response.raise_for_status()
+        containers = [container["id"] for container in response.json()]
+    if not containers:
+        raise SystemExit("No running containers to connect to; pass --container")
+    return containers
+
+
+async def load(options, base_url: str, server_pid: Optional[int]) -> Dict[str, Any]:
+    containers = await pick_containers(base_url, options.container)
+    ws_base = "ws" + base_url[len("http"):]
+    results = Results()
+    stop = asyncio.Event()
+    plan = ([(TerminalSession, "terminal")] * options.terminals + [(StatsSession, "stats")] * options.stats
+            + [(LogsSession, "logs")] * options.logs)
+    total = len(plan)
+    print(f"{total} sessions over {len(containers)} containers; ramp {options.ramp}s, hold {options.duration}s",
+          file=sys.stderr)
+
+    baseline_rss = rss_bytes(server_pid) if server_pid else None
+    watchers = [
+        asyncio.create_task(probe_health(base_url, results, stop, options.probe_interval / 1000)),
+        asyncio.create_task(watch_client_lag(results, stop)),
+    ]
+    sessions = []
+    for index, (session_class, path) in enumerate(plan):
+        container = containers[index % len(containers)]
+        url = f"{ws_base}/ws/{path}/{container}" + ("?tail=0" if path == "logs" else "")
+        session = session_class(index, url, results, stop, options)
+        sessions.append(asyncio.create_task(session.run()))
+        if options.ramp and total:
+            await asyncio.sleep(options.ramp / total)
+
+    rss_samples = []
+    held_until = time.monotonic() + options.duration
+    while time.monotonic() < held_until:
+        await asyncio.sleep(min(1.0, max(held_until - time.monotonic(), 0)))
+        if server_pid:
+            rss = rss_bytes(server_pid)
+            if rss is not None:
+                rss_samples.append(rss)
+        print(f"  {results.open} open, {sum(results.errors.values())} errors, "
+              f"{len(results.echo_ms)} echoes", file=sys.stderr)
+    connected = results.open
+    elapsed = time.monotonic() - results.started
+
+    stop.set()
+    await asyncio.gather(*sessions, *watchers, return_exceptions=True)
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    report: Dict[str, Any] = {
+        "sessions": {"planned": total, "terminal": options.terminals, "stats": options.stats, "logs": options.logs,
+                     "peak_open": results.peak_open, "open_at_end": connected},
+        "connect_ms": distribution(results.connect_ms),
+        "terminal": {
+            "echo_ms": distribution(results.echo_ms),
+            "flood_ms": distribution(results.flood_ms),
+            "flood_mb_per_s": round(results.flood_bytes / 1e6 / (sum(results.flood_ms) / 1000), 2)
+            if results.flood_ms else None,
+            "bytes_per_s": round(results.terminal_bytes / elapsed, 1),
+        },
+        "stats": {
+            "messages_per_s": round(results.stats_messages / elapsed, 2),
+            "gap_ms": distribution(results.stats_gap_ms),
+        },
+        "logs": {
+            "lines_per_s": round(results.log_lines / elapsed, 2),
+            "delay_ms": distribution(results.log_delay_ms),
+        },
+        "server": {
+            "probe_ms": distribution(results.probe_ms),
+            "rss_baseline_bytes": baseline_rss,
+            "rss_peak_bytes": max(rss_samples) if rss_samples else None,
+            "rss_per_connection_bytes": round((max(rss_samples) - baseline_rss) / connected)
+            if rss_samples and baseline_rss and connected else None,
+        },
+        "client": {
+            "loop_lag_ms": distribution(results.client_lag_ms),
+            "cpu_s": round(usage.ru_utime + usage.ru_stime, 2),
+            "elapsed_s": round(elapsed, 2),
+        },
+        "errors": results.errors,
+    }
+    return report
+
+
+def check(report: Dict[str, Any], options) -> List[str]:
+    """Limits the run broke, for gating changes"""
+    failures = []
+    errors = sum(report["errors"].values())
+    if errors > options.max_errors:
+        failures.append(f"{errors} errors, more than {options.max_errors}")
+    limits = [
+        (options.max_echo_p99_ms, report["terminal"]["echo_ms"].get("p99"), "terminal echo p99 ms"),
+        (options.max_log_delay_p99_ms, report["logs"]["delay_ms"].get("p99"), "log delay p99 ms"),
+        (options.max_probe_p99_ms, report["server"]["probe_ms"].get("p99"), "health probe p99 ms"),
+        (options.max_rss_per_connection_kb, (report["server"]["rss_per_connection_bytes"] or 0) / 1024,
+         "server RSS per connection KiB"),
+    ]
+    for limit, value, label in limits:
+        if limit is not None and value is not None and value > limit:
+            failures.append(f"{label} {value:.1f} over the limit of {limit}")
+    if report["client"]["loop_lag_ms"].get("p99", 0) > 50:
+        print("Warning: the load generator itself lagged; run fewer sessions per process", file=sys.stderr)
+    return failures
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until(condition, process: subprocess.Popen, what: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if process.poll() is not None or time.monotonic() > deadline:
+            raise RuntimeError(f"{what} did not start")
+        time.sleep(0.05)
+
+
+def spawn(options, workdir: str) -> Tuple[str, int, List[subprocess.Popen]]:
+    """Start the fake daemon and one uvicorn worker serving the app against it"""
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    socket_path = os.path.join(workdir, "docker.sock")
+    daemon = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.fake_docker", socket_path, "--containers", str(options.containers),
+         "--stats-interval-ms", str(options.stats_interval_ms), "--log-rate", str(options.log_rate)],
+        cwd=backend, stdout=subprocess.DEVNULL,
+    )
+    wait_until(lambda: os.path.exists(socket_path), daemon, "Fake Docker daemon")
+
+    port = free_port()
+    env = dict(os.environ, DOCKER_SOCKET=socket_path,
+               DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'load.db')}")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=backend, env=env,
+    )
+
+    def healthy():
+        try:
+            return httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200
+        except httpx.HTTPError:
+            return False
+    wait_until(healthy, server, "SnapPods")
+    return f"http://127.0.0.1:{port}", server.pid, [server, daemon]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the terminal, stats and log WebSockets")
+    target = parser.add_argument_group("target")
+    target.add_argument("--url", help="A running SnapPods, e.g. http://localhost:8080 (default: start one)")
+    target.add_argument("--server-pid", type=int, help="PID of that server's worker, to measure its memory")
+    target.add_argument("--container", action="append",
+                        help="Container to connect to; may be repeated (default: every running container)")
+    target.add_argument("--containers", type=int, default=20, help="Containers the started fake daemon serves")
+    target.add_argument("--stats-interval-ms", type=float, default=1000.0, help="Stats rate of the fake daemon")
+    target.add_argument("--log-rate", type=float, default=50.0, help="Log lines a second per fake container")
+
+    sessions = parser.add_argument_group("sessions")
+    sessions.add_argument("--terminals", type=int, default=50, help="Concurrent terminal sessions")
+    sessions.add_argument("--stats", type=int, default=50, help="Concurrent stats sessions")
+    sessions.add_argument("--logs", type=int, default=0, help="Concurrent log sessions")
+    sessions.add_argument("--ramp", type=float, default=5.0, help="Seconds over which sessions are opened")
+    sessions.add_argument("--duration", type=float, default=30.0, help="Seconds to hold them open after that")
+    sessions.add_argument("--keystroke-interval", type=float, default=30.0, help="Milliseconds between keys")
+    sessions.add_argument("--think-time", type=float, default=500.0, help="Milliseconds between commands")
+    sessions.add_argument("--flood-every", type=int, default=10, help="Every nth command floods output; 0 never")
+    sessions.add_argument("--flood-bytes", type=int, default=1024 * 1024, help="Output written by each flood")
+    sessions.add_argument("--flood-command", default="flood {bytes}",
+                          help="Shell command writing {bytes} bytes; against real containers try "
+                               "\"head -c {bytes} /dev/zero | tr '\\\\0' x\"")
+    sessions.add_argument("--timeout", type=float, default=10.0, help="Seconds to wait for an echo")
+    sessions.add_argument("--probe-interval", type=float, default=100.0, help="Milliseconds between health probes")
+
+    limits = parser.add_argument_group("limits", "Exit with status 1 when the run breaks any of these")
+    limits.add_argument("--max-errors", type=int, default=0)
+    limits.add_argument("--max-echo-p99-ms", type=float)
+    limits.add_argument("--max-log-delay-p99-ms", type=float)
+    limits.add_argument("--max-probe-p99-ms", type=float)
+    limits.add_argument("--max-rss-per-connection-kb", type=float)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    options = parser.parse_args()
+
+    # Every session is a socket; the default soft limit of 1024 is too few
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = options.terminals + options.stats + options.logs + 256
+    if soft < wanted:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(wanted, hard), hard))
+
+    started_at = datetime.now(timezone.utc).isoformat()
+    workdir = None
+    processes: List[subprocess.Popen] = []
+    try:
+        if options.url:
+            base_url, server_pid = options.url.rstrip("/"), options.server_pid
+        else:
+            workdir = tempfile.mkdtemp(prefix="snappods-load-")
+            base_url, server_pid, processes = spawn(options, workdir)
+        report = asyncio.run(load(options, base_url, server_pid))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait(10)
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    failures = check(report, options)
+    output = json.dumps({
+        "meta": {
+            "commit": git_commit(),
+            "target": options.url or "spawned",
+            "started_at": started_at,
+            "options": vars(options),
+        },
+        "results": report,
+        "failures": failures,
+    }, indent=2)
+    if options.output:
+        with open(options.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import asyncio
+import tarfile
+from benchmarks.fake_docker import FakeDockerDaemon
+from app.compose_engine import ComposeEngine, _context_archive, load_project
+from app.docker_client import DockerClient
+
+
+COMPOSE = """
+services:
+  db:
+    image: {db_image}
+    healthcheck:
+      test: ["CMD", "pg_isready"]
+      interval: 1s
+  web:
+    build: .
+    environment:
+      MODE: {mode}
+    depends_on:
+      db:
+        condition: service_healthy
+  worker:
+    image: busybox
+    depends_on: [web]
+"""
+
+
+def write_project(path, db_image="postgres:15", mode="production"):
+    path.mkdir(exist_ok=True)
+    (path / "docker-compose.yml").write_text(COMPOSE.format(db_image=db_image, mode=mode))
+    (path / "Dockerfile").write_text("FROM busybox\n")
+    (path / "app.py").write_text("print('hello')\n")
+    return load_project(str(path))
+
+
+def run(tmp_path, scenario):
+    """Run scenario(engine, daemon) against a fake daemon on a Unix socket"""
+    async def main():
+        daemon = FakeDockerDaemon(containers=0)
+        socket_path = str(tmp_path / "docker.sock")
+        await daemon.start(socket_path)
+        client = DockerClient()
+        client._socket_path = socket_path
+        try:
+            return await scenario(ComposeEngine(client, wait_timeout=5, poll_interval=0.01), daemon)
+        finally:
+            await client.close()
+            await daemon.stop()
+    return asyncio.run(main())
+
+
+def by_service(results):
+    return {result["service"]: result for result in results}
+
+
+def test_services_start_after_their_dependencies(tmp_path):
+    project = write_project(tmp_path / "proj")
+
+    async def scenario(engine, daemon):
+        results = by_service(await engine.up(project))
+        assert {name: result["status"] for name, result in results.items()} == {
+            "db": "created", "web": "created", "worker": "created",
+        }
+        created = [call for call in daemon.calls if call.startswith(("POST /containers/create", "GET /containers/"))]
+        # web waited for db to report healthy, and worker for web to start
+        db_inspects = [i for i, call in enumerate(created) if call == f"GET /containers/{results['db']['container_id']}/json"]
+        assert len(db_inspects) >= 2
+        assert created.index("POST /containers/create") < db_inspects[0]
+        assert created.count("POST /containers/create") == 3
+        assert "proj_web:latest" in daemon.tags
+        assert {network for network in daemon.networks} == {"proj_default"}
+
+    run(tmp_path, scenario)
+
+
+def test_unhealthy_dependency_skips_dependents(tmp_path):
+    project = write_project(tmp_path / "proj")
+    project.services["db"].config["Healthcheck"]["Test"] = ["CMD", "false"]
+
+    async def scenario(engine, daemon):
+        results = by_service(await engine.up(project))
+        assert results["db"]["status"] == "created"
+        assert results["web"]["status"] == "skipped"
+        assert results["web"]["error"] == "Dependency db not healthy: it is unhealthy"
+        assert results["worker"]["status"] == "skipped"
+        assert results["worker"]["error"] == "Dependency web skipped"
+
+    run(tmp_path, scenario)
+
+
+def test_failed_dependency_skips_dependents(tmp_path):
+    project = write_project(tmp_path / "proj", db_image="missing/postgres:15")
+
+    async def scenario(engine, daemon):
+        results = by_service(await engine.up(project))
+        assert results["db"]["status"] == "failed"
+        assert "pull access denied" in results["db"]["error"]
+        assert results["web"]["status"] == "skipped"
+        assert results["web"]["error"] == "Dependency db failed"
+        assert results["worker"]["status"] == "skipped"
+        assert not [call for call in daemon.calls if call == "POST /containers/create"]
+
+    run(tmp_path, scenario)
+
+
+def test_unchanged_containers_are_left_running(tmp_path):
+    project = write_project(tmp_path / "proj")
+
+    async def scenario(engine, daemon):
+        first = by_service(await engine.up(project))
+        daemon.calls.clear()
+        second = by_service(await engine.up(project))
+        assert {name: result["status"] for name, result in second.items()} == {
+            "db": "running", "web": "running", "worker": "running",
+        }
+        assert {name: result["container_id"] for name, result in second.items()} == {
+            name: result["container_id"] for name, result in first.items()
+        }
+        assert not [call for call in daemon.calls if call.startswith(("POST /containers/", "DELETE /containers/"))]
+        assert len(daemon.builds) == 1
+
+        changed = write_project(tmp_path / "proj", mode="debug")
+        third = by_service(await engine.up(changed))
+        assert {name: result["status"] for name, result in third.items()} == {
+            "db": "running", "web": "recreated", "worker": "running",
+        }
+        assert len(daemon.builds) == 1
+
+    run(tmp_path, scenario)
+
+
+def test_named_services_are_rebuilt(tmp_path):
+    project = write_project(tmp_path / "proj")
+
+    async def scenario(engine, daemon):
+        await engine.up(project)
+        results = by_service(await engine.up(project, build={"web"}))
+        assert len(daemon.builds) == 2
+        # The new image means a new container
+        assert results["web"]["status"] == "recreated"
+        assert results["db"]["status"] == "running"
+
+    run(tmp_path, scenario)
+
+
+def test_context_archive_applies_dockerignore_exceptions(tmp_path):
+    (tmp_path / "app" / "lib").mkdir(parents=True)
+    (tmp_path / "docker").mkdir()
+    for name in (".env", "Dockerfile", "secret.txt", "app/main.py", "app/lib/util.py", "docker/Dockerfile"):
+        (tmp_path / name).write_text("x")
+    (tmp_path / ".dockerignore").write_text("*\n!app\n!Dockerfile\napp/lib\n")
+
+    archive = _context_archive(str(tmp_path), "Dockerfile")
+    with tarfile.open(fileobj=archive) as tar:
+        names = set(tar.getnames())
+    archive.close()
+    assert names == {".dockerignore", "Dockerfile", "app", "app/main.py"}
+
+    # A Dockerfile in an excluded directory is still sent
+    archive = _context_archive(str(tmp_path), "docker/Dockerfile")
+    with tarfile.open(fileobj=archive) as tar:
+        assert "docker/Dockerfile" in tar.getnames()
+    archive.close()
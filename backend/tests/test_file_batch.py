@@ -0,0 +1,140 @@
+import os
+import pytest
+from app.file_batch import BatchError, BatchPlan, RollbackJournal
+from app.file_manager import FileManager
+
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = FileManager(str(tmp_path / "projects"))
+    project = manager.create_project_directory("demo")
+    (project / "src").mkdir()
+    (project / "src" / "main.py").write_text("print('v1')\n")
+    (project / "README.md").write_text("readme\n")
+    (project / "old").mkdir()
+    (project / "old" / "notes.txt").write_text("notes\n")
+    return manager
+
+
+def snapshot(root):
+    """{relative path: content or None for directories} for everything under root"""
+    tree = {}
+    for directory, dirs, files in os.walk(root):
+        for name in dirs:
+            tree[os.path.relpath(os.path.join(directory, name), root)] = None
+        for name in files:
+            with open(os.path.join(directory, name)) as f:
+                tree[os.path.relpath(os.path.join(directory, name), root)] = f.read()
+    return tree
+
+
+OPERATIONS = [
+    {"op": "write", "path": "src/main.py", "content": "print('v2')\n"},
+    {"op": "create", "path": "docs/guide/intro.md", "content": "intro\n"},
+    {"op": "rename", "path": "README.md", "new_path": "docs/README.md"},
+    {"op": "delete", "path": "old"},
+    {"op": "write", "path": "src/extra.py", "content": "extra\n"},
+]
+
+
+def test_batch_applies_every_operation(manager):
+    results = manager.apply_batch("demo", OPERATIONS)
+    assert [result["status"] for result in results] == ["ok"] * 5
+    assert snapshot(manager.get_project_path("demo")) == {
+        "src": None, "src/main.py": "print('v2')\n", "src/extra.py": "extra\n",
+        "docs": None, "docs/guide": None, "docs/guide/intro.md": "intro\n", "docs/README.md": "readme\n",
+    }
+    assert not os.listdir(manager.base_path / ".snappods" / "batches")
+
+
+def test_failure_partway_restores_earlier_steps(manager, monkeypatch):
+    before = snapshot(manager.get_project_path("demo"))
+    replace_with = manager._replace_with
+
+    def failing(full_path, fill):
+        if full_path.name == "extra.py":
+            raise OSError("disk full")
+        replace_with(full_path, fill)
+    monkeypatch.setattr(manager, "_replace_with", failing)
+
+    with pytest.raises(BatchError) as error:
+        manager.apply_batch("demo", OPERATIONS)
+    assert error.value.index == 4
+    assert error.value.status == 500
+    assert snapshot(manager.get_project_path("demo")) == before
+    assert not os.listdir(manager.base_path / ".snappods" / "batches")
+
+
+def test_invalid_operation_touches_nothing(manager):
+    before = snapshot(manager.get_project_path("demo"))
+    operations = OPERATIONS[:3] + [{"op": "write", "path": "README.md", "content": "gone\n"},
+                                   {"op": "delete", "path": "missing.txt"}]
+    with pytest.raises(BatchError) as error:
+        manager.apply_batch("demo", operations)
+    assert (error.value.index, error.value.status) == (4, 404)
+    assert snapshot(manager.get_project_path("demo")) == before
+
+
+def test_plan_follows_earlier_operations(tmp_path):
+    (tmp_path / "a.txt").write_text("a")
+    plan = BatchPlan()
+    plan.add(0, {"op": "rename", "path": "a.txt", "new_path": "b.txt"}, tmp_path / "a.txt", tmp_path / "b.txt")
+    assert plan.kind(str(tmp_path / "a.txt")) is None
+    assert plan.kind(str(tmp_path / "b.txt")) == "file"
+    with pytest.raises(BatchError) as error:
+        plan.add(1, {"op": "write", "path": "b.txt/c.txt", "content": ""}, tmp_path / "b.txt" / "c.txt", None)
+    assert error.value.status == 409
+    plan.add(1, {"op": "write", "path": "b.txt", "content": "new", "base_sha256":
+                 "ca978112ca1bbdcafac231b39a23dc4da786eff8147c4e72b9807785afee48bb"},
+             tmp_path / "b.txt", None)
+    assert [step[0] for step in plan.steps] == ["rename", "write"]
+
+
+def crashed_batch(manager):
+    """Start a batch by hand and stop partway, as if the process had died"""
+    project = manager.get_project_path("demo")
+    journal = RollbackJournal(manager.base_path / ".snappods" / "batches" / "crashed")
+    journal.replacing(project / "src" / "main.py")
+    # Written beside it and renamed over it, as FileManager does
+    (project / "src" / "main.py.new").write_text("print('v2')\n")
+    os.replace(project / "src" / "main.py.new", project / "src" / "main.py")
+    journal.created(project / "docs")
+    (project / "docs").mkdir()
+    journal.move(project / "README.md", project / "docs" / "README.md")
+    journal.remove(project / "old")
+    return journal
+
+
+def test_leftover_journal_is_rolled_back_on_startup(manager):
+    before = snapshot(manager.get_project_path("demo"))
+    journal = crashed_batch(manager)
+    # The dying process releases its lock on the journal
+    journal._journal.close()
+
+    restarted = FileManager(str(manager.base_path))
+    assert restarted.recover_batches() == 1
+    assert snapshot(manager.get_project_path("demo")) == before
+    assert not os.listdir(manager.base_path / ".snappods" / "batches")
+    assert restarted.recover_batches() == 0
+
+
+def test_recovery_stops_at_a_torn_record(manager):
+    project = manager.get_project_path("demo")
+    journal = RollbackJournal(manager.base_path / ".snappods" / "batches" / "crashed")
+    journal.created(project / "new.txt")
+    (project / "new.txt").write_text("new")
+    journal._journal.write('{"removed": "')
+    journal._journal.close()
+
+    assert manager.recover_batches() == 1
+    assert not (project / "new.txt").exists()
+    assert (project / "old" / "notes.txt").exists()
+
+
+def test_recovery_leaves_running_batches_alone(manager):
+    journal = crashed_batch(manager)
+    assert manager.recover_batches() == 0
+    assert (manager.get_project_path("demo") / "docs" / "README.md").exists()
+    journal.rollback()
+    assert (manager.get_project_path("demo") / "README.md").read_text() == "readme\n"
+    assert not os.listdir(manager.base_path / ".snappods" / "batches")
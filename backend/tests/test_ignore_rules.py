@@ -0,0 +1,109 @@
+import pytest
+from app.ignore_rules import IgnoreRules, ancestor_rules, default_rules, is_ignored, translate_glob
+
+
+def ignored(patterns, path, is_dir=False, base=""):
+    return is_ignored([IgnoreRules(patterns, base)], path, is_dir)
+
+
+@pytest.mark.parametrize("pattern, path, expected", [
+    ("*.log", "debug.log", True),
+    ("*.log", "logs/debug.log", True),
+    ("*.log", "debug.log.txt", False),
+    ("build", "build", True),
+    ("build", "src/build", True),
+    ("?.py", "a.py", True),
+    ("?.py", "ab.py", False),
+    ("[abc].txt", "b.txt", True),
+    ("[!abc].txt", "b.txt", False),
+    ("[!abc].txt", "d.txt", True),
+    ("\\#notes", "#notes", True),
+    ("\\!important", "!important", True),
+    ("# comment", "# comment", False),
+    ("trailing   ", "trailing", True),
+])
+def test_globs(pattern, path, expected):
+    assert ignored([pattern], path) is expected
+
+
+@pytest.mark.parametrize("pattern, path, expected", [
+    # A slash at the start or in the middle anchors the pattern
+    ("/build", "build", True),
+    ("/build", "src/build", False),
+    ("doc/*.txt", "doc/notes.txt", True),
+    ("doc/*.txt", "src/doc/notes.txt", False),
+    ("doc/*.txt", "doc/api/notes.txt", False),
+    # ** matches across directories
+    ("**/cache", "cache", True),
+    ("**/cache", "a/b/cache", True),
+    ("doc/**/*.txt", "doc/notes.txt", True),
+    ("doc/**/*.txt", "doc/api/v1/notes.txt", True),
+    ("out/**", "out/a/b.js", True),
+    ("out/**", "out", False),
+])
+def test_anchoring(pattern, path, expected):
+    assert ignored([pattern], path) is expected
+
+
+def test_directory_only_patterns():
+    assert ignored(["logs/"], "logs", is_dir=True)
+    assert ignored(["logs/"], "app/logs", is_dir=True)
+    assert not ignored(["logs/"], "logs", is_dir=False)
+    assert ignored(["/dist/"], "dist", is_dir=True)
+    assert not ignored(["/dist/"], "web/dist", is_dir=True)
+
+
+def test_negation_last_match_wins():
+    patterns = ["*.log", "!keep.log"]
+    assert ignored(patterns, "debug.log")
+    assert not ignored(patterns, "keep.log")
+    assert not ignored(patterns, "logs/keep.log")
+    assert ignored(["!keep.log", "*.log"], "keep.log")
+    # match() tells a re-inclusion apart from no pattern at all
+    rules = IgnoreRules(patterns)
+    assert rules.match("keep.log", False) is False
+    assert rules.match("main.py", False) is None
+
+
+def test_negated_directory_only_pattern():
+    patterns = ["build*", "!build/"]
+    assert not ignored(patterns, "build", is_dir=True)
+    assert ignored(patterns, "build", is_dir=False)
+    assert ignored(patterns, "build.txt")
+
+
+def test_nested_gitignore_is_relative_to_its_directory():
+    rules = IgnoreRules(["/generated", "*.tmp"], base="src")
+    assert rules.match("src/generated", True) is True
+    assert rules.match("src/lib/generated", True) is None
+    assert rules.match("src/lib/a.tmp", False) is True
+    assert rules.match("a.tmp", False) is None
+    assert rules.match("srcx/a.tmp", False) is None
+
+
+def test_inner_rules_win(tmp_path):
+    (tmp_path / ".gitignore").write_text("*.log\n/secret\n")
+    (tmp_path / "app").mkdir()
+    (tmp_path / "app" / ".gitignore").write_text("!audit.log\n")
+    rules = ancestor_rules(IgnoreRules(["node_modules"]), str(tmp_path), "app/audit.log")
+    assert [rule_set.base for rule_set in rules] == ["", "", "app"]
+    assert not is_ignored(rules, "app/audit.log", False)
+    assert is_ignored(rules, "app/debug.log", False)
+    assert is_ignored(rules, "app/node_modules", True)
+
+
+def test_default_rules(monkeypatch):
+    monkeypatch.delenv("FILE_TREE_IGNORE", raising=False)
+    assert default_rules().match("web/node_modules", True) is True
+    monkeypatch.setenv("FILE_TREE_IGNORE", " dist , *.pyc")
+    rules = default_rules()
+    assert rules.match("dist", True) is True
+    assert rules.match("a/b.pyc", False) is True
+    assert rules.match("node_modules", True) is None
+
+
+def test_translate_glob():
+    assert translate_glob("a*b") == "a[^/]*b"
+    assert translate_glob("**/x") == "(?:.*/)?x"
+    assert translate_glob("[a-z]") == "[a-z]"
+    assert translate_glob("[oops") == "\\[oops"
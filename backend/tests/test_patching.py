@@ -0,0 +1,20 @@
+import pytest
+from app.patching import PatchError, apply_unified_diff
+
+
+def test_form_feed_is_not_a_line_break():
+    patch = "@@ -1,2 +1,2 @@\n a\n-\x0cb\n+\x0cB\n"
+    assert apply_unified_diff("a\n\x0cb\nc\n", patch) == "a\n\x0cB\nc\n"
+
+
+def test_lone_carriage_return_is_not_a_line_break():
+    patch = "@@ -1,2 +1,2 @@\n x\ry\n-z\n+Z\n"
+    assert apply_unified_diff("x\ry\nz\n", patch) == "x\ry\nZ\n"
+
+
+def test_line_counts_follow_newlines_only():
+    # Split on separators, the context line would become two and not match
+    patch = "@@ -2,1 +2,1 @@\n-b\x1cc\n+bc\n"
+    assert apply_unified_diff("a\nb\x1cc\n", patch) == "a\nbc\n"
+    with pytest.raises(PatchError):
+        apply_unified_diff("a\nb\nc\n", patch)
@@ -0,0 +1,140 @@
+import os
+import pytest
+from starlette.applications import Starlette
+from starlette.routing import Route
+from starlette.testclient import TestClient
+from app.range_response import RangeFileResponse, file_etag, parse_range
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 100)),
+    ("bytes=10-19", (10, 10)),
+    ("bytes=990-", (990, 10)),
+    ("bytes=995-2000", (995, 5)),
+    ("bytes=-10", (990, 10)),
+    ("bytes=-5000", (0, 1000)),
+    ("BYTES = 5-5", (5, 1)),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", [
+    "bytes=0-10,20-30",
+    "items=0-10",
+    "bytes=-",
+    "bytes=a-10",
+    "bytes=10-5",
+    "bytes=10",
+])
+def test_parse_range_ignores(header):
+    assert parse_range(header, 1000) is None
+
+
+@pytest.mark.parametrize("header, size", [
+    ("bytes=1000-", 1000),
+    ("bytes=2000-3000", 1000),
+    ("bytes=-0", 1000),
+    ("bytes=-10", 0),
+    ("bytes=0-", 0),
+])
+def test_parse_range_unsatisfiable(header, size):
+    with pytest.raises(ValueError):
+        parse_range(header, size)
+
+
+DATA = bytes(range(256)) * 4
+
+
+@pytest.fixture
+def client(tmp_path):
+    path = tmp_path / "data.bin"
+    path.write_bytes(DATA)
+
+    async def download(request):
+        return RangeFileResponse(open(path, "rb"), request.headers, filename="data.bin")
+
+    with TestClient(Starlette(routes=[Route("/data", download, methods=["GET", "HEAD"])])) as client:
+        client.etag = file_etag(os.stat(path))
+        yield client
+
+
+def test_full_response(client):
+    response = client.get("/data")
+    assert response.status_code == 200
+    assert response.content == DATA
+    assert response.headers["etag"] == client.etag
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["content-disposition"] == "attachment; filename*=utf-8''data.bin"
+
+
+@pytest.mark.parametrize("header, start, end", [
+    ("bytes=100-199", 100, 199),
+    ("bytes=1000-", 1000, 1023),
+    ("bytes=-24", 1000, 1023),
+])
+def test_partial_response(client, header, start, end):
+    response = client.get("/data", headers={"Range": header})
+    assert response.status_code == 206
+    assert response.content == DATA[start:end + 1]
+    assert response.headers["content-range"] == f"bytes {start}-{end}/{len(DATA)}"
+    assert response.headers["content-length"] == str(end - start + 1)
+
+
+def test_unsatisfiable_range(client):
+    response = client.get("/data", headers={"Range": "bytes=5000-"})
+    assert response.status_code == 416
+    assert response.content == b""
+    assert response.headers["content-range"] == f"bytes */{len(DATA)}"
+
+
+def test_multiple_ranges_get_the_whole_file(client):
+    response = client.get("/data", headers={"Range": "bytes=0-9,20-29"})
+    assert response.status_code == 200
+    assert response.content == DATA
+    assert "content-range" not in response.headers
+
+
+def test_if_range_with_current_etag(client):
+    response = client.get("/data", headers={"Range": "bytes=0-9", "If-Range": client.etag})
+    assert response.status_code == 206
+    assert response.content == DATA[:10]
+
+
+def test_if_range_with_stale_etag_gets_the_whole_file(client):
+    response = client.get("/data", headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert response.status_code == 200
+    assert response.content == DATA
+
+
+def test_if_range_with_last_modified(client):
+    last_modified = client.get("/data").headers["last-modified"]
+    response = client.get("/data", headers={"Range": "bytes=0-9", "If-Range": last_modified})
+    assert response.status_code == 206
+    response = client.get("/data", headers={"Range": "bytes=0-9", "If-Range": "Thu, 01 Jan 1970 00:00:00 GMT"})
+    assert response.status_code == 200
+
+
+def test_if_none_match(client):
+    response = client.get("/data", headers={"If-None-Match": f'"other", {client.etag}'})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert client.get("/data", headers={"If-None-Match": f"W/{client.etag}"}).status_code == 304
+    assert client.get("/data", headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_if_modified_since(client):
+    last_modified = client.get("/data").headers["last-modified"]
+    assert client.get("/data", headers={"If-Modified-Since": last_modified}).status_code == 304
+    response = client.get("/data", headers={"If-Modified-Since": "Thu, 01 Jan 1970 00:00:00 GMT"})
+    assert response.status_code == 200
+    # If-None-Match takes precedence
+    response = client.get("/data", headers={"If-Modified-Since": last_modified, "If-None-Match": '"other"'})
+    assert response.status_code == 200
+
+
+def test_head_sends_no_body(client):
+    response = client.head("/data", headers={"Range": "bytes=0-9"})
+    assert response.status_code == 206
+    assert response.content == b""
+    assert response.headers["content-length"] == "10"
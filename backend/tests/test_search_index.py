@@ -0,0 +1,57 @@
+import re
+import pytest
+from app.search_index import _required_literals, _trigram_query
+
+
+@pytest.mark.parametrize("pattern, literals", [
+    ("hello", ["hello"]),
+    ("^import os$", ["import os"]),
+    ("foo.*bar", ["foo", "bar"]),
+    ("colou?r", ["colo", "r"]),
+    ("ab*c", ["a", "c"]),
+    ("ab+c", ["ab", "c"]),
+    ("a{2,3}bc", ["bc"]),
+    ("ab{,3}c", ["a", "c"]),
+    ("x{y", ["x{y"]),
+    (r"\.py$", [".py"]),
+    (r"\d+abc", ["abc"]),
+    (r"abc\s*def", ["abc", "def"]),
+    (r"a\(b\)c", ["a(b)c"]),
+    ("[abc]def", ["def"]),
+    ("[]x]yz", ["yz"]),
+    (r"[^\]]q", ["q"]),
+    ("(foo)bar", ["bar"]),
+    ("a(b(c)d)?e", ["a", "e"]),
+    ("(?:ab)+cd", ["cd"]),
+])
+def test_required_literals(pattern, literals):
+    assert _required_literals(pattern) == literals
+
+
+@pytest.mark.parametrize("pattern", ["foo|bar", "(a|b)cd", "(?x) a b c", ".*", r"\w+"])
+def test_no_required_literals(pattern):
+    assert _required_literals(pattern) == []
+
+
+@pytest.mark.parametrize("pattern, text", [
+    ("colou?r", "the color red"),
+    ("colou?r", "the colour red"),
+    ("ab+c", "xabbbc"),
+    ("ab*c", "ac"),
+    ("a{2,3}bc", "aaabc"),
+    ("a(b(c)d)?e", "ae"),
+    (r"def \w+\(self", "    def run(self):"),
+    (r"[]x]yz", "]yz"),
+])
+def test_every_match_contains_the_literals(pattern, text):
+    match = re.search(pattern, text)
+    assert match is not None
+    for literal in _required_literals(pattern):
+        assert literal in match.group()
+
+
+def test_trigram_query():
+    assert _trigram_query(["abcd"]) == '"abc" AND "bcd"'
+    assert _trigram_query(["abc", "abc"]) == '"abc"'
+    assert _trigram_query(['a"bc']) == '"""bc" AND "a""b"'
+    assert _trigram_query([]) == ""
@@ -0,0 +1,114 @@
+import pytest
+from app import stats_history as stats_history_module
+from app.schemas import ContainerStats
+from app.stats_history import StatsHistory, _parse_rollups
+
+
+def sample(cpu, container_id="abc123", memory_limit=1000):
+    return ContainerStats(container_id=container_id, cpu_percent=cpu, memory_usage=int(cpu) * 10,
+                          memory_limit=memory_limit, memory_percent=0.0, network_rx=0, network_tx=0)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(stats_history_module.time, "time", lambda: now[0])
+    return now
+
+
+def record_every_second(history, start, end):
+    """One sample per second with cpu_percent equal to the timestamp"""
+    for timestamp in range(start, end):
+        history.record(sample(float(timestamp)), timestamp=float(timestamp))
+
+
+def test_rollups_split_at_bucket_boundaries(clock):
+    history = StatsHistory(raw_retention=60, rollups=[(10, 600), (60, 3600)])
+    record_every_second(history, 1000, 1030)
+    clock[0] = 1030.0
+
+    series = history.query("abc123", 30, 10)
+    assert series["resolution"] == 10
+    assert series["timestamps"] == [1000, 1010, 1020]
+    cpu = series["cpu_percent"]
+    assert cpu["min"] == [1000, 1010, 1020]
+    assert cpu["avg"] == [1004.5, 1014.5, 1024.5]
+    # The last bucket is still being filled and comes from the open rollup
+    assert cpu["max"] == [1009, 1019, 1029]
+    assert series["memory_usage"]["avg"] == [10045, 10145, 10245]
+    assert series["memory_limit"] == 1000
+
+
+def test_coarser_steps_merge_rollup_rows(clock):
+    history = StatsHistory(raw_retention=60, rollups=[(10, 600), (60, 3600)])
+    record_every_second(history, 0, 240)
+    clock[0] = 240.0
+
+    series = history.query("abc123", 240, 120)
+    assert series["resolution"] == 60
+    assert series["timestamps"] == [0, 120]
+    assert series["cpu_percent"]["min"] == [0, 120]
+    assert series["cpu_percent"]["avg"] == [59.5, 179.5]
+    assert series["cpu_percent"]["max"] == [119, 239]
+
+
+def test_samples_straddling_a_boundary(clock):
+    history = StatsHistory(raw_retention=60, rollups=[(10, 600)])
+    for timestamp, cpu in [(8.0, 1.0), (9.5, 3.0), (10.0, 5.0), (19.9, 7.0)]:
+        history.record(sample(cpu), timestamp=timestamp)
+    clock[0] = 20.0
+
+    series = history.query("abc123", 20, 10)
+    assert series["timestamps"] == [0, 10]
+    assert series["cpu_percent"]["avg"] == [2.0, 6.0]
+
+
+@pytest.mark.parametrize("range_seconds, step, resolution", [
+    (60, 1, 1),        # raw samples cover the range
+    (60, 10, 10),      # coarsest tier no coarser than the step
+    (300, 1, 10),      # raw samples don't reach back far enough
+    (300, 60, 60),
+    (3000, 1, 60),     # only the 60 s rollup covers 3000 s
+    (100000, 600, 60), # nothing covers it; use the longest tier
+])
+def test_query_picks_resolution(clock, range_seconds, step, resolution):
+    history = StatsHistory(raw_retention=60, rollups=[(10, 600), (60, 3600)])
+    record_every_second(history, 0, 10)
+    clock[0] = 10.0
+    assert history.query("abc123", range_seconds, step)["resolution"] == resolution
+
+
+def test_raw_ring_wraps(clock):
+    history = StatsHistory(raw_retention=60, rollups=[(10, 600)])
+    record_every_second(history, 0, 150)
+    clock[0] = 150.0
+
+    series = history.query("abc123", 60, 1)
+    assert series["resolution"] == 1
+    assert series["timestamps"] == list(range(90, 150))
+    assert series["cpu_percent"]["avg"] == [float(t) for t in range(90, 150)]
+
+
+def test_lookup_by_prefix_and_prune(clock):
+    history = StatsHistory(raw_retention=60, forget_after=100)
+    history.record(sample(1.0, "abc123"), timestamp=0.0)
+    history.record(sample(1.0, "abd456"), timestamp=50.0)
+    clock[0] = 60.0
+    assert history.query("abc", 60, 1)["container_id"] == "abc"
+    assert history.query("ab", 60, 1) is None
+    assert history.query("zzz", 60, 1) is None
+
+    clock[0] = 120.0
+    history.prune()
+    assert history.query("abc123", 60, 1) is None
+    assert history.query("abd456", 60, 1) is not None
+
+
+def test_memory_per_container_is_fixed():
+    history = StatsHistory(raw_retention=600, rollups=[(10, 3600), (60, 86400)])
+    # 600 raw rows of 5 doubles, then 360 and 1440 rollup rows of a double and 12 floats
+    assert history.bytes_per_container() == 600 * 5 * 8 + (360 + 1440) * (8 + 12 * 4)
+
+
+def test_parse_rollups():
+    assert _parse_rollups("10:3600,60:86400") == [(10, 3600), (60, 86400)]
@@ -0,0 +1,131 @@
+import asyncio
+import hashlib
+import pytest
+from app.file_manager import file_manager
+from app.uploads import UploadError, UploadManager
+
+
+DATA = b"abcdefghijklmnopqrst"
+SHA256 = hashlib.sha256(DATA).hexdigest()
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_manager, "base_path", tmp_path / "projects")
+    monkeypatch.setattr(file_manager, "_roots", {})
+    file_manager.create_project_directory("demo")
+    return tmp_path
+
+
+def manager(project):
+    return UploadManager(project / "staging", chunk_size=8, write_buffer=3)
+
+
+async def body(*pieces, fail=False):
+    for piece in pieces:
+        yield piece
+    if fail:
+        raise ConnectionResetError("client went away")
+
+
+def put(uploads, upload_id, offset, *pieces, fail=False, sha256=None):
+    return asyncio.run(uploads.write_chunk("demo", upload_id, offset, body(*pieces, fail=fail), sha256))
+
+
+def commit(uploads, upload_id, sha256=None):
+    return asyncio.run(uploads.commit("demo", upload_id, sha256))
+
+
+def test_resume_at_the_server_offset(project):
+    uploads = manager(project)
+    upload_id = uploads.create("demo", "dir/data.bin", len(DATA), SHA256)["upload_id"]
+    assert put(uploads, upload_id, 0, DATA[:5], DATA[5:8])["offset"] == 8
+
+    # A client that lost the response asks where to carry on
+    assert uploads.status("demo", upload_id)["offset"] == 8
+    with pytest.raises(UploadError) as error:
+        put(uploads, upload_id, 0, DATA[:8])
+    assert (error.value.status, error.value.message) == (409, "Expected offset 8")
+
+    assert put(uploads, upload_id, 8, DATA[8:16])["offset"] == 16
+    assert put(uploads, upload_id, 16, DATA[16:])["offset"] == len(DATA)
+    assert commit(uploads, upload_id) == {"path": "dir/data.bin", "size": len(DATA)}
+    assert (project / "projects" / "demo" / "dir" / "data.bin").read_bytes() == DATA
+    with pytest.raises(UploadError) as error:
+        uploads.status("demo", upload_id)
+    assert error.value.status == 404
+
+
+def test_interrupted_chunk_is_discarded(project):
+    uploads = manager(project)
+    upload_id = uploads.create("demo", "data.bin", len(DATA), SHA256)["upload_id"]
+    put(uploads, upload_id, 0, DATA[:8])
+    with pytest.raises(ConnectionResetError):
+        put(uploads, upload_id, 8, DATA[8:12], fail=True)
+    assert uploads.status("demo", upload_id)["offset"] == 8
+
+    put(uploads, upload_id, 8, DATA[8:])
+    # The running hash was dropped with the partial chunk, so commit rehashes the file
+    commit(uploads, upload_id)
+    assert (project / "projects" / "demo" / "data.bin").read_bytes() == DATA
+
+
+def test_resume_after_restart(project):
+    upload_id = manager(project).create("demo", "data.bin", len(DATA), SHA256)["upload_id"]
+    put(manager(project), upload_id, 0, DATA[:8])
+
+    restarted = manager(project)
+    offset = restarted.status("demo", upload_id)["offset"]
+    assert offset == 8
+    put(restarted, upload_id, offset, DATA[offset:])
+    commit(restarted, upload_id)
+    assert (project / "projects" / "demo" / "data.bin").read_bytes() == DATA
+
+
+def test_chunk_checksum_mismatch(project):
+    uploads = manager(project)
+    upload_id = uploads.create("demo", "data.bin", len(DATA))["upload_id"]
+    put(uploads, upload_id, 0, DATA[:8], sha256=hashlib.sha256(DATA[:8]).hexdigest().upper())
+    with pytest.raises(UploadError) as error:
+        put(uploads, upload_id, 8, DATA[8:16], sha256=hashlib.sha256(b"other").hexdigest())
+    assert error.value.status == 422
+    assert uploads.status("demo", upload_id)["offset"] == 8
+
+
+def test_chunk_past_declared_size(project):
+    uploads = manager(project)
+    upload_id = uploads.create("demo", "data.bin", 10)["upload_id"]
+    with pytest.raises(UploadError) as error:
+        put(uploads, upload_id, 0, DATA[:8], DATA[8:12])
+    assert error.value.status == 413
+    assert uploads.status("demo", upload_id)["offset"] == 0
+
+
+def test_commit_checks_size_and_checksum(project):
+    uploads = manager(project)
+    upload_id = uploads.create("demo", "data.bin", len(DATA))["upload_id"]
+    put(uploads, upload_id, 0, DATA[:8])
+    with pytest.raises(UploadError) as error:
+        commit(uploads, upload_id, SHA256)
+    assert (error.value.status, error.value.message) == (409, f"Upload incomplete: 8 of {len(DATA)} bytes received")
+
+    put(uploads, upload_id, 8, DATA[8:])
+    with pytest.raises(UploadError) as error:
+        commit(uploads, upload_id, hashlib.sha256(b"other").hexdigest())
+    assert error.value.status == 422
+    # A corrupt upload is dropped rather than resumed
+    with pytest.raises(UploadError):
+        uploads.status("demo", upload_id)
+    assert not (project / "projects" / "demo" / "data.bin").exists()
+
+
+def test_sessions_belong_to_their_project(project):
+    uploads = manager(project)
+    upload_id = uploads.create("demo", "data.bin", len(DATA))["upload_id"]
+    for project_name, upload in (("other", upload_id), ("demo", "../../etc/passwd")):
+        with pytest.raises(UploadError) as error:
+            uploads.status(project_name, upload)
+        assert error.value.status == 404
+    with pytest.raises(UploadError) as error:
+        uploads.create("demo", "../escape.bin", 1)
+    assert error.value.status == 400
@@ -1,49 +1,63 @@
 import { useState, useEffect, useRef } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
-import { containersApi } from '../services/api';
+import { containersApi, LogLine } from '../services/api';
+import { LogsWebSocket } from '../services/websocket';
 import './ContainerLogs.css';
 
+// Keep the rendered log bounded while following chatty containers
+const MAX_FOLLOW_LINES = 5000;
+
 const ContainerLogs = () => {
   const { containerId } = useParams<{ containerId: string }>();
   const [logs, setLogs] = useState<string>('');
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
   const [tail, setTail] = useState(100);
-  const [autoRefresh, setAutoRefresh] = useState(true);
   const [follow, setFollow] = useState(true);
   const logsEndRef = useRef<HTMLDivElement>(null);
-  const intervalRef = useRef<number | null>(null);
+  const cursorRef = useRef<string | null>(null);
   const navigate = useNavigate();
 
   useEffect(() => {
-    if (containerId) {
-      loadLogs();
+    if (!containerId) return;
+    cursorRef.current = null;
+    setLogs('');
+    setError(null);
+    setLoading(false);
+
+    if (!follow) {
+      loadLogs(true);
+      return;
     }
-    return () => {
-      if (intervalRef.current) {
-        clearInterval(intervalRef.current);
-      }
+
+    // Stream new lines instead of re-fetching the whole tail
+    let ws = new LogsWebSocket();
+    const connect = (since: string | null) => {
+      ws = new LogsWebSocket();
+      ws.onLines((lines: LogLine[]) => {
+        const last = lines[lines.length - 1];
+        if (last?.timestamp) {
+          cursorRef.current = last.timestamp;
+        }
+        const text = lines.map((line) => line.text).join('');
+        setLogs((previous) => trimLines(previous + text, Math.max(tail, MAX_FOLLOW_LINES)));
+      });
+      ws.onClose((event: CloseEvent) => {
+        if (event.code === 1013) {
+          // Fell behind the live stream; resume from the last line received
+          connect(cursorRef.current);
+        } else if (event.code !== 1000) {
+          setError(event.reason || 'Log stream closed');
+        }
+      });
+      ws.connect(containerId, tail, since);
     };
-  }, [containerId, tail, follow]);
+    connect(null);
 
-  useEffect(() => {
-    if (autoRefresh && follow && containerId) {
-      // Auto-refresh every 2 seconds when following logs
-      intervalRef.current = window.setInterval(() => {
-        loadLogs();
-      }, 2000);
-    } else {
-      if (intervalRef.current !== null) {
-        window.clearInterval(intervalRef.current);
-        intervalRef.current = null;
-      }
-    }
     return () => {
-      if (intervalRef.current !== null) {
-        window.clearInterval(intervalRef.current);
-      }
+      ws.disconnect();
     };
-  }, [autoRefresh, follow, containerId]);
+  }, [containerId, tail, follow]);
 
   useEffect(() => {
     // Auto-scroll to bottom when logs update
@@ -52,16 +66,18 @@ const ContainerLogs = () => {
     }
   }, [logs, follow]);
 
-  const loadLogs = async () => {
+  const loadLogs = async (reset: boolean = false) => {
     if (!containerId) return;
     setLoading(false); // Don't show loading on refresh
     setError(null);
     try {
-      const response = await containersApi.logs(containerId, tail, follow);
-      setLogs(response.data.logs);
+      // After the first load only fetch lines newer than the cursor
+      const since = reset ? null : cursorRef.current;
+      const response = await containersApi.logs(containerId, tail, since);
+      cursorRef.current = response.data.cursor;
+      setLogs((previous) => (since ? previous + response.data.logs : response.data.logs));
     } catch (err: any) {
       setError(err.response?.data?.detail || 'Failed to load logs');
-      setAutoRefresh(false); // Stop auto-refresh on error
     }
   };
 
@@ -96,15 +112,7 @@ const ContainerLogs = () => {
             />
             Follow
           </label>
-          <label className="checkbox-label">
-            <input
-              type="checkbox"
-              checked={autoRefresh}
-              onChange={(e) => setAutoRefresh(e.target.checked)}
-            />
-            Auto-refresh
-          </label>
-          <button onClick={loadLogs} className="refresh-btn">
+          <button onClick={() => loadLogs()} className="refresh-btn" disabled={follow}>
             Refresh
           </button>
           <button onClick={handleClear} className="clear-btn">
@@ -131,4 +139,14 @@ const ContainerLogs = () => {
   );
 };
 
+const trimLines = (text: string, maxLines: number): string => {
+  let count = 0;
+  for (let i = text.length - 1; i >= 0; i--) {
+    if (text[i] === '\n' && ++count > maxLines) {
+      return text.slice(i + 1);
+    }
+  }
+  return text;
+};
+
 export default ContainerLogs;
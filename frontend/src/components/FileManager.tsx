@@ -1,18 +1,44 @@
 import { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
-import { filesApi, FileTreeItem, containersApi } from '../services/api';
+import { filesApi, projectsApi, FileTreeItem, SearchHit, containersApi, DeployJob, DeployLine, ProjectUsage } from '../services/api';
+import { DeployWebSocket } from '../services/websocket';
+import { createPatch } from '../services/patch';
 import { Prism as SyntaxHighlighter } from 'react-syntax-highlighter';
 import { vscDarkPlus } from 'react-syntax-highlighter/dist/cjs/styles/prism';
 import './FileManager.css';
 
+const RESUMABLE_UPLOAD_THRESHOLD = 8 * 1024 * 1024;
+// Files are opened a window at a time so huge logs don't have to load at once
+const READ_WINDOW = 1024 * 1024;
+// Most deploy output lines kept on screen
+const MAX_DEPLOY_LINES = 2000;
+const DEPLOY_POLL_INTERVAL = 2000;
+
+const formatBytes = (bytes: number): string => {
+  const units = ['B', 'KB', 'MB', 'GB', 'TB'];
+  let value = bytes;
+  let unit = 0;
+  while (value >= 1024 && unit < units.length - 1) {
+    value /= 1024;
+    unit++;
+  }
+  return `${unit === 0 ? value : value.toFixed(1)} ${units[unit]}`;
+};
+
 interface FileManagerProps {
   projectId: number;
 }
 
 const FileManager = ({ projectId }: FileManagerProps) => {
-  const [files, setFiles] = useState<FileTreeItem[]>([]);
+  // Directory listings keyed by path ('' is the project root), loaded on expand
+  const [tree, setTree] = useState<Record<string, FileTreeItem[]>>({});
+  const [cursors, setCursors] = useState<Record<string, string | null>>({});
   const [selectedFile, setSelectedFile] = useState<string | null>(null);
   const [fileContent, setFileContent] = useState<string>('');
+  const [nextOffset, setNextOffset] = useState<number | null>(null);
+  // The version last read or saved; saves send a patch against it
+  const [savedContent, setSavedContent] = useState<string>('');
+  const [savedSha, setSavedSha] = useState<string | null>(null);
   const [loading, setLoading] = useState(false);
   const [showCreateModal, setShowCreateModal] = useState(false);
   const [showRenameModal, setShowRenameModal] = useState(false);
@@ -23,22 +49,77 @@ const FileManager = ({ projectId }: FileManagerProps) => {
   const [expandedDirs, setExpandedDirs] = useState<Set<string>>(new Set());
   const [createInPath, setCreateInPath] = useState<string>('');
   const [isDragging, setIsDragging] = useState(false);
+  const [searchQuery, setSearchQuery] = useState('');
+  const [searchRegex, setSearchRegex] = useState(false);
+  // null while the tree is shown instead of search results
+  const [searchHits, setSearchHits] = useState<SearchHit[] | null>(null);
+  const [searchCursor, setSearchCursor] = useState<string | null>(null);
+  const [deployJob, setDeployJob] = useState<DeployJob | null>(null);
+  const [usage, setUsage] = useState<ProjectUsage | null>(null);
+  const [deployLines, setDeployLines] = useState<DeployLine[]>([]);
+  const deploySocketRef = useRef<DeployWebSocket | null>(null);
+  const deployJobIdRef = useRef<number | null>(null);
   const fileInputRef = useRef<HTMLInputElement>(null);
+  const archiveInputRef = useRef<HTMLInputElement>(null);
   const navigate = useNavigate();
 
   useEffect(() => {
     loadFiles();
   }, [projectId]);
 
-  const loadFiles = async () => {
+  useEffect(() => {
+    return () => closeDeploy();
+  }, []);
+
+  useEffect(() => {
+    expandedDirs.forEach((path) => {
+      if (!(path in tree)) {
+        loadDirectory(path);
+      }
+    });
+  }, [expandedDirs]);
+
+  const nextCursor = (headers: any): string | null => {
+    const cursor = headers['x-next-cursor'];
+    return cursor ? decodeURIComponent(cursor) : null;
+  };
+
+  const loadDirectory = async (path: string, cursor?: string) => {
     try {
-      const response = await filesApi.list(projectId);
-      setFiles(response.data);
+      const response = await filesApi.list(projectId, path, cursor);
+      setTree((prev) => ({
+        ...prev,
+        [path]: cursor ? [...(prev[path] || []), ...response.data] : response.data,
+      }));
+      setCursors((prev) => ({ ...prev, [path]: nextCursor(response.headers) }));
     } catch (error) {
       console.error('Failed to load files:', error);
     }
   };
 
+  const loadFiles = async () => {
+    // Refresh the root and every expanded directory; collapsed ones reload on demand
+    const paths = ['', ...Array.from(expandedDirs)];
+    const responses = await Promise.all(
+      paths.map((path) => filesApi.list(projectId, path).catch(() => null))
+    );
+    const newTree: Record<string, FileTreeItem[]> = {};
+    const newCursors: Record<string, string | null> = {};
+    responses.forEach((response, i) => {
+      if (!response) return;
+      newTree[paths[i]] = response.data;
+      newCursors[paths[i]] = nextCursor(response.headers);
+    });
+    if (!responses[0]) {
+      console.error('Failed to load files');
+    }
+    setTree(newTree);
+    setCursors(newCursors);
+    projectsApi.usage(projectId)
+      .then((response) => setUsage(response.data))
+      .catch(() => setUsage(null));
+  };
+
   const toggleDirectory = (path: string) => {
     const newExpanded = new Set(expandedDirs);
     if (newExpanded.has(path)) {
@@ -57,8 +138,11 @@ const FileManager = ({ projectId }: FileManagerProps) => {
     setSelectedFile(filePath);
     setLoading(true);
     try {
-      const response = await filesApi.read(projectId, filePath);
+      const response = await filesApi.read(projectId, filePath, 0, READ_WINDOW);
       setFileContent(response.data.content);
+      setNextOffset(response.data.next_offset);
+      setSavedContent(response.data.content);
+      setSavedSha(response.data.sha256);
     } catch (error) {
       alert('Failed to load file');
     } finally {
@@ -66,10 +150,82 @@ const FileManager = ({ projectId }: FileManagerProps) => {
     }
   };
 
+  const loadMore = async () => {
+    if (!selectedFile || nextOffset === null) return;
+    try {
+      const response = await filesApi.read(projectId, selectedFile, nextOffset, READ_WINDOW);
+      setFileContent((previous) => previous + response.data.content);
+      setNextOffset(response.data.next_offset);
+      // Pieced together from windows, so there is no version to patch against
+      setSavedSha(null);
+    } catch (error) {
+      alert('Failed to load file');
+    }
+  };
+
+  const runSearch = async (cursor?: string) => {
+    if (!searchQuery) {
+      setSearchHits(null);
+      return;
+    }
+    try {
+      const response = await filesApi.search(projectId, searchQuery, searchRegex, cursor);
+      setSearchHits((previous) => (cursor ? [...(previous || []), ...response.data.hits] : response.data.hits));
+      setSearchCursor(response.data.next_cursor);
+    } catch (error: any) {
+      alert(error.response?.data?.detail || 'Search failed');
+    }
+  };
+
+  const renderSearchHits = (hits: SearchHit[]) => (
+    <>
+      {hits.length === 0 && <div className="empty-files">No matches.</div>}
+      {hits.map((hit) => (
+        <div
+          key={`${hit.path}:${hit.line}:${hit.column}`}
+          className={`search-hit ${selectedFile === hit.path ? 'selected' : ''}`}
+          onClick={() => handleFileSelect(hit.path, false)}
+        >
+          <div className="search-hit-location">
+            {hit.path}:{hit.line}:{hit.column}
+          </div>
+          <div className="search-hit-snippet">
+            {hit.snippet.slice(0, hit.highlight[0])}
+            <mark>{hit.snippet.slice(hit.highlight[0], hit.highlight[1])}</mark>
+            {hit.snippet.slice(hit.highlight[1])}
+          </div>
+        </div>
+      ))}
+      {searchCursor && (
+        <div className="file-item load-more" onClick={() => runSearch(searchCursor)}>
+          Load more…
+        </div>
+      )}
+    </>
+  );
+
+  // Partially loaded files can't be saved without truncating them
+  const readOnly = nextOffset !== null;
+
   const handleSave = async () => {
-    if (!selectedFile) return;
+    if (!selectedFile || readOnly) return;
+    const overwrite = () => filesApi.write(projectId, selectedFile, { content: fileContent });
     try {
-      await filesApi.write(projectId, selectedFile, fileContent);
+      let response;
+      try {
+        response = savedSha
+          ? await filesApi.write(projectId, selectedFile, {
+              patch: createPatch(savedContent, fileContent),
+              base_sha256: savedSha,
+            })
+          : await overwrite();
+      } catch (error: any) {
+        if (error.response?.status !== 409) throw error;
+        if (!confirm('This file was changed by someone else since you opened it. Overwrite their changes?')) return;
+        response = await overwrite();
+      }
+      setSavedContent(fileContent);
+      setSavedSha(response.data.sha256);
       alert('File saved successfully');
     } catch (error) {
       alert('Failed to save file');
@@ -139,15 +295,79 @@ const FileManager = ({ projectId }: FileManagerProps) => {
 
   const handleDeploy = async () => {
     if (!confirm('Deploy this project using docker-compose?')) return;
+    startDeploy(false);
+  };
+
+  const startDeploy = async (force: boolean) => {
     try {
-      await containersApi.deploy(projectId);
-      alert('Deployment started! Check containers in dashboard.');
-      navigate('/');
+      const response = await containersApi.deploy(projectId, force);
+      closeDeploy();
+      setDeployJob(response.data);
+      setDeployLines([]);
+      followDeploy(response.data.id);
     } catch (error: any) {
       alert(error.response?.data?.detail || 'Failed to deploy');
     }
   };
 
+  const followDeploy = (jobId: number) => {
+    deployJobIdRef.current = jobId;
+    const socket = new DeployWebSocket();
+    socket.onLines((lines) => {
+      setDeployLines((prev) => [...prev, ...lines].slice(-MAX_DEPLOY_LINES));
+      setDeployJob((job) => (job && job.status === 'queued' ? { ...job, status: 'running' } : job));
+    });
+    socket.onJob((job) => setDeployJob(job));
+    socket.onClose((event) => {
+      // Fell behind or lost the connection: poll for the outcome instead
+      if (event.code !== 1000) {
+        pollDeploy(jobId);
+      }
+    });
+    socket.connect(jobId);
+    deploySocketRef.current = socket;
+  };
+
+  const pollDeploy = async (jobId: number) => {
+    if (deployJobIdRef.current !== jobId) return;
+    try {
+      const response = await containersApi.deployJob(jobId);
+      if (deployJobIdRef.current !== jobId) return;
+      setDeployJob(response.data);
+      if (response.data.status === 'queued' || response.data.status === 'running') {
+        setTimeout(() => pollDeploy(jobId), DEPLOY_POLL_INTERVAL);
+      }
+    } catch (error) {
+      console.error('Failed to get deploy status:', error);
+    }
+  };
+
+  const cancelDeploy = async () => {
+    if (!deployJob) return;
+    try {
+      await containersApi.cancelDeploy(deployJob.id);
+    } catch (error: any) {
+      alert(error.response?.data?.detail || 'Failed to cancel deployment');
+    }
+  };
+
+  const closeDeploy = () => {
+    deployJobIdRef.current = null;
+    if (deploySocketRef.current) {
+      deploySocketRef.current.disconnect();
+      deploySocketRef.current = null;
+    }
+    setDeployJob(null);
+  };
+
+  const uploadFile = (filePath: string, file: File) => {
+    // Large files go in resumable chunks so a dropped connection doesn't restart them
+    if (file.size > RESUMABLE_UPLOAD_THRESHOLD) {
+      return filesApi.uploadResumable(projectId, filePath, file);
+    }
+    return filesApi.upload(projectId, filePath, file);
+  };
+
   const handleDragOver = (e: React.DragEvent) => {
     e.preventDefault();
     e.stopPropagation();
@@ -169,8 +389,7 @@ const FileManager = ({ projectId }: FileManagerProps) => {
     for (const file of droppedFiles) {
       const filePath = targetPath ? `${targetPath}/${file.name}` : file.name;
       try {
-        const fileContent = await file.arrayBuffer();
-        await filesApi.upload(projectId, filePath, new File([fileContent], file.name));
+        await uploadFile(filePath, file);
       } catch (error) {
         console.error(`Failed to upload ${file.name}:`, error);
         alert(`Failed to upload ${file.name}`);
@@ -179,6 +398,22 @@ const FileManager = ({ projectId }: FileManagerProps) => {
     loadFiles();
   };
 
+  const handleArchiveInput = async (e: React.ChangeEvent<HTMLInputElement>) => {
+    const archive = e.target.files?.[0];
+    if (!archive) return;
+    try {
+      const response = await projectsApi.importArchive(projectId, archive);
+      const { files, skipped_count } = response.data;
+      alert(`Imported ${files} files${skipped_count ? `, skipped ${skipped_count}` : ''}`);
+    } catch (error: any) {
+      alert(error.response?.data?.detail || 'Failed to import archive');
+    }
+    if (archiveInputRef.current) {
+      archiveInputRef.current.value = '';
+    }
+    loadFiles();
+  };
+
   const handleFileInput = async (e: React.ChangeEvent<HTMLInputElement>) => {
     const selectedFiles = e.target.files;
     if (!selectedFiles) return;
@@ -187,7 +422,7 @@ const FileManager = ({ projectId }: FileManagerProps) => {
       const file = selectedFiles[i];
       const filePath = createInPath ? `${createInPath}/${file.name}` : file.name;
       try {
-        await filesApi.upload(projectId, filePath, file);
+        await uploadFile(filePath, file);
       } catch (error) {
         console.error(`Failed to upload ${file.name}:`, error);
         alert(`Failed to upload ${file.name}`);
@@ -200,11 +435,13 @@ const FileManager = ({ projectId }: FileManagerProps) => {
     loadFiles();
   };
 
-  const renderFileTree = (items: FileTreeItem[], level: number = 0) => {
-    return items.map((item) => {
+  const renderFileTree = (path: string, level: number = 0) => {
+    const items = tree[path] || [];
+    const cursor = cursors[path];
+    const rendered = items.map((item) => {
       const isExpanded = expandedDirs.has(item.path);
-      const hasChildren = item.children && item.children.length > 0;
-      
+      const hasChildren = (tree[item.path] || []).length > 0;
+
       return (
         <div key={item.path}>
           <div
@@ -261,12 +498,20 @@ const FileManager = ({ projectId }: FileManagerProps) => {
           </div>
           {item.is_directory && isExpanded && hasChildren && (
             <div className="file-children">
-              {renderFileTree(item.children!, level + 1)}
+              {renderFileTree(item.path, level + 1)}
             </div>
           )}
         </div>
       );
     });
+    if (cursor) {
+      rendered.push(
+        <div key={`${path}/__more`} className="file-item load-more" onClick={() => loadDirectory(path, cursor)}>
+          <span className="file-name">Load more…</span>
+        </div>
+      );
+    }
+    return rendered;
   };
 
   const getLanguage = (filename: string) => {
@@ -290,6 +535,15 @@ const FileManager = ({ projectId }: FileManagerProps) => {
     <div className="file-manager">
       <div className="file-manager-header">
         <h2>File Manager</h2>
+        {usage && (
+          <span
+            className={`project-usage${usage.quota_bytes !== null && usage.bytes > usage.quota_bytes * 0.9 ? ' near-quota' : ''}`}
+            title={`${usage.files} files`}
+          >
+            {formatBytes(usage.bytes)}
+            {usage.quota_bytes !== null && ` of ${formatBytes(usage.quota_bytes)}`}
+          </span>
+        )}
         <div className="header-actions">
           <button
             className="deploy-btn"
@@ -319,23 +573,66 @@ const FileManager = ({ projectId }: FileManagerProps) => {
             style={{ display: 'none' }}
             onChange={handleFileInput}
           />
+          <button
+            className="upload-btn"
+            onClick={() => archiveInputRef.current?.click()}
+          >
+            📦 Import Archive
+          </button>
+          <input
+            ref={archiveInputRef}
+            type="file"
+            accept=".tar,.tar.gz,.tgz,.tar.bz2,.tar.xz,.zip"
+            style={{ display: 'none' }}
+            onChange={handleArchiveInput}
+          />
+          <a className="export-btn" href={projectsApi.archiveUrl(projectId)}>
+            ⬇️ Export
+          </a>
         </div>
       </div>
       <div className="file-manager-content">
         <div className="file-tree">
           <div className="file-tree-header">Files</div>
+          <form
+            className="file-search"
+            onSubmit={(e) => {
+              e.preventDefault();
+              runSearch();
+            }}
+          >
+            <input
+              type="search"
+              placeholder="Search in files"
+              value={searchQuery}
+              onChange={(e) => {
+                setSearchQuery(e.target.value);
+                if (!e.target.value) setSearchHits(null);
+              }}
+            />
+            <label title="Regular expression">
+              <input
+                type="checkbox"
+                checked={searchRegex}
+                onChange={(e) => setSearchRegex(e.target.checked)}
+              />
+              .*
+            </label>
+          </form>
           <div
             className={`file-tree-content ${isDragging ? 'drag-over' : ''}`}
             onDragOver={handleDragOver}
             onDragLeave={handleDragLeave}
             onDrop={(e) => handleDrop(e, '')}
           >
-            {files.length === 0 ? (
+            {searchHits !== null ? (
+              renderSearchHits(searchHits)
+            ) : (tree[''] || []).length === 0 ? (
               <div className="empty-files">
                 No files yet. Create a file or drag & drop files here.
               </div>
             ) : (
-              renderFileTree(files)
+              renderFileTree('')
             )}
           </div>
         </div>
@@ -344,9 +641,22 @@ const FileManager = ({ projectId }: FileManagerProps) => {
             <>
               <div className="editor-header">
                 <span>{selectedFile}</span>
-                <button className="save-btn" onClick={handleSave}>
-                  Save
-                </button>
+                <div className="editor-actions">
+                  {readOnly && (
+                    <button className="load-more-btn" onClick={loadMore}>
+                      Load more
+                    </button>
+                  )}
+                  <a
+                    className="download-btn"
+                    href={filesApi.downloadUrl(projectId, selectedFile)}
+                  >
+                    Download
+                  </a>
+                  <button className="save-btn" onClick={handleSave} disabled={readOnly}>
+                    Save
+                  </button>
+                </div>
               </div>
               {loading ? (
                 <div className="loading">Loading file...</div>
@@ -355,6 +665,7 @@ const FileManager = ({ projectId }: FileManagerProps) => {
                   <textarea
                     value={fileContent}
                     onChange={(e) => setFileContent(e.target.value)}
+                    readOnly={readOnly}
                     className="file-textarea"
                   />
                   <div className="preview">
@@ -407,6 +718,51 @@ const FileManager = ({ projectId }: FileManagerProps) => {
         </div>
       )}
 
+      {deployJob && (
+        <div className="modal-overlay">
+          <div className="modal-content deploy-modal">
+            <h3>
+              Deployment #{deployJob.id}{' '}
+              <span className={`deploy-status ${deployJob.status}`}>{deployJob.status}</span>
+            </h3>
+            {deployJob.error && <div className="deploy-error">{deployJob.error}</div>}
+            {deployJob.services && (
+              <table className="deploy-services">
+                <tbody>
+                  {deployJob.services.map((result) => (
+                    <tr key={result.service}>
+                      <td>{result.service}</td>
+                      <td className={`deploy-service-status ${result.status}`}>{result.status}</td>
+                      <td>{result.error}</td>
+                    </tr>
+                  ))}
+                </tbody>
+              </table>
+            )}
+            <pre className="deploy-output">
+              {deployLines.map((line) => (
+                <div key={line.seq} className={`deploy-line ${line.stream}`}>
+                  {line.text}
+                </div>
+              ))}
+            </pre>
+            <div className="modal-actions">
+              {deployJob.status === 'queued' || deployJob.status === 'running' ? (
+                <button onClick={cancelDeploy}>Cancel Deployment</button>
+              ) : (
+                <button onClick={() => navigate('/')}>Go to Dashboard</button>
+              )}
+              {deployJob.status !== 'queued' && deployJob.status !== 'running' && (
+                <button className="redeploy-btn" onClick={() => startDeploy(true)}>
+                  Redeploy All
+                </button>
+              )}
+              <button onClick={closeDeploy}>Close</button>
+            </div>
+          </div>
+        </div>
+      )}
+
       {showRenameModal && (
         <div className="modal-overlay" onClick={() => setShowRenameModal(false)}>
           <div className="modal-content" onClick={(e) => e.stopPropagation()}>
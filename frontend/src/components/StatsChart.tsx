@@ -1,6 +1,6 @@
 import { useState, useEffect, useRef } from 'react';
 import { StatsWebSocket } from '../services/websocket';
-import { ContainerStats } from '../services/api';
+import { ContainerStats, containersApi } from '../services/api';
 import {
   LineChart,
   Line,
@@ -30,6 +30,27 @@ const StatsChart = ({ containerId }: StatsChartProps) => {
   const maxDataPoints = 30;
 
   useEffect(() => {
+    let cancelled = false;
+    setStatsData([]);
+
+    // Start from recorded history instead of an empty chart
+    containersApi
+      .statsHistory(containerId, maxDataPoints, 1)
+      .then((response) => {
+        if (cancelled) return;
+        const history = response.data;
+        const limit = history.memory_limit;
+        const recorded = history.timestamps.map((timestamp, i) => ({
+          time: new Date(timestamp * 1000).toLocaleTimeString(),
+          cpu: history.cpu_percent.avg[i],
+          memory: limit > 0 ? (history.memory_usage.avg[i] / limit) * 100 : 0,
+        }));
+        setStatsData((prev) => [...recorded, ...prev].slice(-maxDataPoints));
+      })
+      .catch(() => {
+        // No history yet; the chart fills from the live stream
+      });
+
     wsRef.current = new StatsWebSocket();
     const ws = wsRef.current;
 
@@ -49,6 +70,7 @@ const StatsChart = ({ containerId }: StatsChartProps) => {
     ws.connect(containerId);
 
     return () => {
+      cancelled = true;
       ws.disconnect();
     };
   }, [containerId]);
@@ -39,7 +39,7 @@ const Terminal = () => {
     const ws = new TerminalWebSocket();
     wsRef.current = ws;
 
-    ws.onMessage((data: string) => {
+    ws.onMessage((data: Uint8Array) => {
       xterm.write(data);
     });
 
@@ -51,6 +51,12 @@ const Terminal = () => {
       xterm.writeln('\r\n\x1b[33mConnection closed.\x1b[0m');
     });
 
+    // Keep the container TTY in step with the xterm viewport
+    xterm.onResize(({ cols, rows }) => {
+      ws.resize(cols, rows);
+    });
+    ws.resize(xterm.cols, xterm.rows);
+
     ws.connect(containerId);
 
     // Handle user input
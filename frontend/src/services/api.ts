@@ -16,6 +16,14 @@ export interface Project {
   created_at: string;
 }
 
+export interface ProjectUsage {
+  project_id: number;
+  bytes: number;
+  files: number;
+  quota_bytes: number | null;
+  scanned_at: string | null;
+}
+
 export interface ContainerInfo {
   id: string;
   name: string;
@@ -39,11 +47,129 @@ export interface ContainerStats {
   network_tx: number;
 }
 
+export interface StatsSeries {
+  min: number[];
+  avg: number[];
+  max: number[];
+}
+
+export interface StatsHistory {
+  container_id: string;
+  step: number;
+  resolution: number;
+  memory_limit: number;
+  timestamps: number[];
+  cpu_percent: StatsSeries;
+  memory_usage: StatsSeries;
+  network_rx: StatsSeries;
+  network_tx: StatsSeries;
+}
+
+export interface LogLine {
+  timestamp: string;
+  stream: 'stdout' | 'stderr';
+  text: string;
+}
+
+export interface DeployJob {
+  id: number;
+  project_id: number;
+  status: 'queued' | 'running' | 'succeeded' | 'failed' | 'cancelled';
+  exit_code: number | null;
+  error: string | null;
+  created_at: string | null;
+  started_at: string | null;
+  finished_at: string | null;
+  // Set when the built-in compose engine ran the deploy
+  services: ServiceResult[] | null;
+}
+
+export interface ServiceResult {
+  service: string;
+  status: 'created' | 'recreated' | 'started' | 'running' | 'failed' | 'skipped';
+  container_id: string | null;
+  image: string | null;
+  error: string | null;
+}
+
+export interface DeployLine {
+  seq: number;
+  // 'info' for the deployer's own notes; 'output' for jobs replayed from
+  // history, where the streams were merged
+  stream: 'stdout' | 'stderr' | 'info' | 'output';
+  text: string;
+}
+
+export interface FileContent {
+  path: string;
+  content: string;
+  is_directory: boolean;
+  size: number;
+  offset: number;
+  next_offset: number | null;
+  sha256: string | null;
+}
+
+export interface ArchiveImport {
+  files: number;
+  directories: number;
+  bytes: number;
+  skipped: string[];
+  skipped_count: number;
+}
+
+export interface SearchHit {
+  path: string;
+  line: number;
+  column: number;
+  snippet: string;
+  highlight: [number, number];
+}
+
+export interface SearchResults {
+  hits: SearchHit[];
+  next_cursor: string | null;
+}
+
+export interface BatchOperation {
+  op: 'create' | 'write' | 'mkdir' | 'rename' | 'delete';
+  path: string;
+  new_path?: string;
+  content?: string;
+  patch?: string;
+  base_sha256?: string;
+}
+
+export interface BatchResult {
+  index: number;
+  op: BatchOperation['op'];
+  path: string;
+  status: string;
+  new_path?: string;
+  sha256?: string;
+  size?: number;
+}
+
+export interface FileWrite {
+  content?: string;
+  patch?: string;
+  base_sha256?: string | null;
+}
+
+export interface UploadSession {
+  upload_id: string;
+  path: string;
+  size: number;
+  offset: number;
+  chunk_size: number;
+}
+
 export interface FileTreeItem {
   name: string;
   path: string;
   is_directory: boolean;
-  children?: FileTreeItem[];
+  children?: FileTreeItem[] | null;
+  next_cursor?: string | null;
 }
 
 export const projectsApi = {
@@ -51,21 +177,39 @@ export const projectsApi = {
   get: (id: number) => api.get<Project>(`/api/projects/${id}`),
   create: (name: string) => api.post<Project>('/api/projects', { name }),
   delete: (id: number) => api.delete(`/api/projects/${id}`),
+  usage: (id: number) => api.get<ProjectUsage>(`/api/projects/${id}/usage`),
+  // null falls back to the server's default quota
+  setQuota: (id: number, quotaBytes: number | null) =>
+    api.put<ProjectUsage>(`/api/projects/${id}/quota`, { quota_bytes: quotaBytes }),
+  archiveUrl: (id: number, format: 'tar.gz' | 'zip' = 'tar.gz') =>
+    `${API_BASE_URL}/api/projects/${id}/archive?format=${format}`,
+  importArchive: (id: number, archive: File) =>
+    api.post<ArchiveImport>(`/api/projects/${id}/archive`, archive, {
+      headers: { 'Content-Type': 'application/octet-stream' },
+    }),
 };
 
 export const filesApi = {
-  list: (projectId: number, subpath?: string) =>
+  list: (projectId: number, subpath?: string, cursor?: string) =>
     api.get<FileTreeItem[]>(`/api/files/project/${projectId}/tree`, {
-      params: { subpath },
+      params: { subpath, cursor },
     }),
-  read: (projectId: number, filePath: string) =>
-    api.get(`/api/files/project/${projectId}/read`, {
-      params: { file_path: filePath },
+  read: (projectId: number, filePath: string, offset?: number, length?: number) =>
+    api.get<FileContent>(`/api/files/project/${projectId}/read`, {
+      params: { file_path: filePath, offset, length },
+    }),
+  search: (projectId: number, q: string, regex: boolean = false, cursor?: string) =>
+    api.get<SearchResults>(`/api/files/project/${projectId}/search`, {
+      params: { q, regex, cursor },
     }),
-  write: (projectId: number, filePath: string, content: string) =>
-    api.post(`/api/files/project/${projectId}/write`, null, {
-      params: { file_path: filePath, content },
+  downloadUrl: (projectId: number, filePath: string) =>
+    `${API_BASE_URL}/api/files/project/${projectId}/download?file_path=${encodeURIComponent(filePath)}`,
+  write: (projectId: number, filePath: string, body: FileWrite) =>
+    api.post<{ sha256: string; size: number }>(`/api/files/project/${projectId}/write`, body, {
+      params: { file_path: filePath },
     }),
+  batch: (projectId: number, operations: BatchOperation[]) =>
+    api.post<{ results: BatchResult[] }>(`/api/files/project/${projectId}/batch`, { operations }),
   create: (projectId: number, path: string, content: string = '') =>
     api.post(`/api/files/project/${projectId}/create`, { path, content }),
   mkdir: (projectId: number, dirPath: string) =>
@@ -87,6 +231,34 @@ export const filesApi = {
       headers: { 'Content-Type': 'multipart/form-data' },
     });
   },
+  uploadResumable: async (projectId: number, filePath: string, file: File, retries: number = 5) => {
+    // Send the file in chunks, resuming from the server's offset after a failure
+    const base = `/api/files/project/${projectId}/uploads`;
+    const session = await api.post<UploadSession>(base, { path: filePath, size: file.size });
+    const { upload_id, chunk_size } = session.data;
+    let offset = 0;
+    let failures = 0;
+    while (offset < file.size) {
+      const chunk = file.slice(offset, offset + chunk_size);
+      try {
+        const response = await api.put<UploadSession>(`${base}/${upload_id}`, chunk, {
+          params: { offset },
+          headers: { 'Content-Type': 'application/octet-stream' },
+        });
+        offset = response.data.offset;
+        failures = 0;
+      } catch (error) {
+        if (++failures > retries) {
+          await api.delete(`${base}/${upload_id}`).catch(() => undefined);
+          throw error;
+        }
+        await new Promise((resolve) => setTimeout(resolve, 1000 * failures));
+        const status = await api.get<UploadSession>(`${base}/${upload_id}`);
+        offset = status.data.offset;
+      }
+    }
+    return api.post(`${base}/${upload_id}/commit`, {});
+  },
 };
 
 export const containersApi = {
@@ -94,16 +266,26 @@ export const containersApi = {
     api.get<ContainerInfo[]>('/api/containers', { params: { all } }),
   stats: (containerId: string) =>
     api.get<ContainerStats>(`/api/containers/${containerId}/stats`),
+  statsHistory: (containerId: string, range: number = 3600, step?: number) =>
+    api.get<StatsHistory>(`/api/containers/${containerId}/stats/history`, {
+      params: { range, step },
+    }),
   stop: (containerId: string) =>
     api.post(`/api/containers/${containerId}/stop`),
   start: (containerId: string) =>
     api.post(`/api/containers/${containerId}/start`),
-  logs: (containerId: string, tail: number = 100, follow: boolean = false) =>
-    api.get<{ logs: string }>(`/api/containers/${containerId}/logs`, {
-      params: { tail, follow },
+  logs: (containerId: string, tail: number = 100, since?: string | null) =>
+    api.get<{ logs: string; cursor: string | null }>(`/api/containers/${containerId}/logs`, {
+      params: { tail, since: since || undefined },
     }),
-  deploy: (projectId: number) =>
-    api.post('/api/containers/deploy', { project_id: projectId }),
+  deploy: (projectId: number, force: boolean = false) =>
+    api.post<DeployJob>('/api/containers/deploy', { project_id: projectId, force }),
+  deployJobs: (projectId?: number) =>
+    api.get<DeployJob[]>('/api/containers/deploy/jobs', { params: { project_id: projectId } }),
+  deployJob: (jobId: number) =>
+    api.get<DeployJob>(`/api/containers/deploy/jobs/${jobId}`),
+  cancelDeploy: (jobId: number) =>
+    api.post<DeployJob>(`/api/containers/deploy/jobs/${jobId}/cancel`),
 };
 
 export default api;
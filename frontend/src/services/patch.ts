@@ -0,0 +1,45 @@
+// Build a single-hunk unified diff between two versions of a text file, so
+// saving a small edit to a large file only sends the changed region.
+
+const NO_NEWLINE = '\\ No newline at end of file\n';
+
+const splitLines = (text: string): string[] => text.match(/[^\n]*\n|[^\n]+$/g) || [];
+
+const hunkLine = (tag: string, line: string): string =>
+  line.endsWith('\n') ? `${tag}${line}` : `${tag}${line}\n${NO_NEWLINE}`;
+
+export const createPatch = (oldText: string, newText: string, context: number = 3): string => {
+  const a = splitLines(oldText);
+  const b = splitLines(newText);
+
+  let prefix = 0;
+  while (prefix < a.length && prefix < b.length && a[prefix] === b[prefix]) {
+    prefix++;
+  }
+  let suffix = 0;
+  while (
+    suffix < a.length - prefix &&
+    suffix < b.length - prefix &&
+    a[a.length - 1 - suffix] === b[b.length - 1 - suffix]
+  ) {
+    suffix++;
+  }
+  if (prefix === a.length && prefix === b.length) {
+    return '';
+  }
+
+  const start = Math.max(prefix - context, 0);
+  const trailing = Math.min(suffix, context);
+  const oldCount = a.length - suffix - start + trailing;
+  const newCount = b.length - suffix - start + trailing;
+  // A zero-length range names the line before it
+  const oldStart = oldCount ? start + 1 : start;
+  const newStart = newCount ? start + 1 : start;
+
+  const lines = [`@@ -${oldStart},${oldCount} +${newStart},${newCount} @@\n`];
+  a.slice(start, prefix).forEach((line) => lines.push(hunkLine(' ', line)));
+  a.slice(prefix, a.length - suffix).forEach((line) => lines.push(hunkLine('-', line)));
+  b.slice(prefix, b.length - suffix).forEach((line) => lines.push(hunkLine('+', line)));
+  a.slice(a.length - suffix, a.length - suffix + trailing).forEach((line) => lines.push(hunkLine(' ', line)));
+  return lines.join('');
+};
@@ -1,6 +1,10 @@
+import { DeployJob, DeployLine, LogLine } from './api';
+
 export class TerminalWebSocket {
   private ws: WebSocket | null = null;
-  private onMessageCallback: ((data: string) => void) | null = null;
+  private encoder = new TextEncoder();
+  private pendingResize: { cols: number; rows: number } | null = null;
+  private onMessageCallback: ((data: Uint8Array) => void) | null = null;
   private onErrorCallback: ((error: Event) => void) | null = null;
   private onCloseCallback: (() => void) | null = null;
 
@@ -10,10 +14,21 @@ export class TerminalWebSocket {
     const url = `${protocol}//${host}/ws/terminal/${containerId}`;
     
     this.ws = new WebSocket(url);
+    // Container output arrives as raw bytes in binary frames
+    this.ws.binaryType = 'arraybuffer';
+
+    this.ws.onopen = () => {
+      if (this.pendingResize) {
+        this.resize(this.pendingResize.cols, this.pendingResize.rows);
+      }
+    };
     
     this.ws.onmessage = (event) => {
       if (this.onMessageCallback) {
-        this.onMessageCallback(event.data);
+        const data = typeof event.data === 'string'
+          ? this.encoder.encode(event.data)
+          : new Uint8Array(event.data);
+        this.onMessageCallback(data);
       }
     };
     
@@ -31,12 +46,20 @@ export class TerminalWebSocket {
   }
 
   send(data: string) {
+    // Keystrokes go as binary frames; text frames are reserved for control messages
     if (this.ws && this.ws.readyState === WebSocket.OPEN) {
-      this.ws.send(data);
+      this.ws.send(this.encoder.encode(data));
     }
   }
 
-  onMessage(callback: (data: string) => void) {
+  resize(cols: number, rows: number) {
+    this.pendingResize = { cols, rows };
+    if (this.ws && this.ws.readyState === WebSocket.OPEN) {
+      this.ws.send(JSON.stringify({ type: 'resize', cols, rows }));
+    }
+  }
+
+  onMessage(callback: (data: Uint8Array) => void) {
     this.onMessageCallback = callback;
   }
 
@@ -102,3 +125,109 @@ export class StatsWebSocket {
   }
 }
 
+export class LogsWebSocket {
+  private ws: WebSocket | null = null;
+  private onLinesCallback: ((lines: LogLine[]) => void) | null = null;
+  private onCloseCallback: ((event: CloseEvent) => void) | null = null;
+
+  connect(containerId: string, tail: number, since?: string | null) {
+    const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+    const host = window.location.host;
+    const params = new URLSearchParams({ tail: String(tail) });
+    if (since) {
+      params.set('since', since);
+    }
+    const url = `${protocol}//${host}/ws/logs/${containerId}?${params}`;
+
+    this.ws = new WebSocket(url);
+
+    this.ws.onmessage = (event) => {
+      if (this.onLinesCallback) {
+        try {
+          this.onLinesCallback(JSON.parse(event.data).lines);
+        } catch (e) {
+          console.error('Failed to parse log lines:', e);
+        }
+      }
+    };
+
+    this.ws.onclose = (event) => {
+      if (this.onCloseCallback) {
+        this.onCloseCallback(event);
+      }
+    };
+  }
+
+  onLines(callback: (lines: LogLine[]) => void) {
+    this.onLinesCallback = callback;
+  }
+
+  onClose(callback: (event: CloseEvent) => void) {
+    this.onCloseCallback = callback;
+  }
+
+  disconnect() {
+    if (this.ws) {
+      this.ws.onclose = null;
+      this.ws.close();
+      this.ws = null;
+    }
+  }
+}
+
+export class DeployWebSocket {
+  private ws: WebSocket | null = null;
+  private onLinesCallback: ((lines: DeployLine[]) => void) | null = null;
+  private onJobCallback: ((job: DeployJob) => void) | null = null;
+  private onCloseCallback: ((event: CloseEvent) => void) | null = null;
+
+  connect(jobId: number) {
+    const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+    const host = window.location.host;
+    const url = `${protocol}//${host}/ws/deploy/${jobId}`;
+
+    this.ws = new WebSocket(url);
+
+    this.ws.onmessage = (event) => {
+      try {
+        const message = JSON.parse(event.data);
+        // The finished job comes last, after all of its output
+        if (message.job) {
+          if (this.onJobCallback) {
+            this.onJobCallback(message.job);
+          }
+        } else if (this.onLinesCallback) {
+          this.onLinesCallback(message.lines);
+        }
+      } catch (e) {
+        console.error('Failed to parse deploy output:', e);
+      }
+    };
+
+    this.ws.onclose = (event) => {
+      if (this.onCloseCallback) {
+        this.onCloseCallback(event);
+      }
+    };
+  }
+
+  onLines(callback: (lines: DeployLine[]) => void) {
+    this.onLinesCallback = callback;
+  }
+
+  onJob(callback: (job: DeployJob) => void) {
+    this.onJobCallback = callback;
+  }
+
+  onClose(callback: (event: CloseEvent) => void) {
+    this.onCloseCallback = callback;
+  }
+
+  disconnect() {
+    if (this.ws) {
+      this.ws.onclose = null;
+      this.ws.close();
+      this.ws = null;
+    }
+  }
+}